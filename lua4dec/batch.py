@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import glob
+import io
+import json
+import logging
+import os
+import time
+
+from lua4dec.loader import load_stream, DEFAULT_ENGINE
+from lua4dec.stats import NULL_STATS, Stats
+from lua4dec.interning import StringTable
+from lua4dec.defaults import DEFAULT_CHUNKSIZE
+
+logger = logging.getLogger('lua4dec.batch')
+
+SOURCE_EXTENSIONS   = ('.lua', '.luac')
+OUTPUT_SUFFIX       = '.txt'
+
+class OutputConflictError(ValueError):
+    """Raised when several sources of a batch map to the same output file."""
+
+class BatchResult(object):
+    __slots__ = ('source', 'dest', 'error', 'elapsed', 'cache_hit', 'stats')
+
+    def __init__(self, source, dest, error=None, elapsed=0.0, cache_hit=None, stats=None):
+        self.source = source
+        self.dest = dest
+        self.error = error
+        self.elapsed = elapsed
+        self.cache_hit = cache_hit
+        self.stats = stats
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        result = dict((k, getattr(self, k)) for k in self.__slots__)
+        if self.stats is not None:
+            result['stats'] = self.stats.as_dict()
+        return result
+
+def _glob_root(pattern):
+    # the leading part of the pattern without any glob magic, outputs are
+    # placed relative to it
+    parts = []
+    for part in pattern.split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or os.curdir
+
+def find_sources(patterns, extensions=SOURCE_EXTENSIONS):
+    """Expand files, directories and glob patterns into a sorted list of
+    (source_path, relative_path) pairs. Directories are walked recursively
+    for files with one of `extensions`.
+    """
+    found = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for dirpath, dirnames, filenames in os.walk(pattern):
+                dirnames.sort()
+                for filename in filenames:
+                    if filename.endswith(extensions):
+                        path = os.path.join(dirpath, filename)
+                        found[path] = os.path.relpath(path, pattern)
+        elif glob.has_magic(pattern):
+            root = _glob_root(pattern)
+            for path in glob.glob(pattern, recursive=True):
+                if os.path.isfile(path):
+                    found[path] = os.path.relpath(path, root)
+        else:
+            found[pattern] = os.path.basename(pattern)
+    return sorted(found.items())
+
+def check_conflicts(sources):
+    """Raise OutputConflictError when (source_path, relative_path) pairs
+    from find_sources() give different sources the same relative path, as
+    files named on the command line keep only their basename.
+    """
+    claimed = {}
+    for source, rel_path in sources:
+        other = claimed.setdefault(os.path.normcase(rel_path), source)
+        if other != source:
+            raise OutputConflictError('{0} and {1} would both be written to {2}'.format(
+                other, source, rel_path))
+
+def decompile_file(source, dest, engine=DEFAULT_ENGINE, formatter_class=None, cache=None,
+        stats=NULL_STATS, strings=None, jobs=1, limits=None):
+    """Decompile `source` into `dest`. With a DecompileCache the output is
+    looked up by content first; returns whether that was a cache hit, or
+    None when no cache is used. Parsing and formatting report to `stats`,
+    decoded strings are interned in the StringTable `strings` if given and
+    the formatter may render on `jobs` processes. `limits` is the
+    lua4dec.fast_parser.Lua4Limits the byte code is parsed with.
+    """
+    if formatter_class is None:
+        from lua4dec.formatter import Lua4DebugFormatter as formatter_class
+    if cache is None:
+        with open(source, 'rb') as lua_file:
+            lua_obj = load_stream(lua_file, engine, stats, strings, limits)
+            with open(dest, 'w') as out_f:
+                formatter_class(stats, jobs).dump(lua_obj, out_f)
+        return None
+
+    with open(source, 'rb') as lua_file:
+        data = lua_file.read()
+    key = cache.key(data, formatter_class, limits)
+    output = cache.get(key)
+    cache_hit = output is not None
+    if not cache_hit:
+        # a model stored by an earlier run with another formatter saves
+        # parsing again
+        lua_obj = None
+        if cache.store_models:
+            model_key = cache.model_key(data, limits)
+            lua_obj = cache.get_model(model_key)
+        if lua_obj is None:
+            lua_obj = load_stream(io.BytesIO(data), engine, stats, strings, limits)
+            if cache.store_models:
+                cache.put_model(model_key, lua_obj)
+        out_buf = io.StringIO()
+        formatter_class(stats, jobs).dump(lua_obj, out_buf)
+        output = out_buf.getvalue()
+        cache.put(key, output)
+    with open(dest, 'w') as out_f:
+        out_f.write(output)
+    return cache_hit
+
+def _run_task(task):
+    source, dest, engine, formatter_class, cache, collect_stats, intern_strings, limits = task
+    # the model is dropped once its output is written, so a table per file
+    # saves as much as one shared by the whole process without growing
+    strings = StringTable() if intern_strings else None
+    stats = Stats() if collect_stats else None
+    start = time.time()
+    try:
+        dest_dir = os.path.dirname(dest)
+        if dest_dir and not os.path.isdir(dest_dir):
+            os.makedirs(dest_dir, exist_ok=True)
+        cache_hit = decompile_file(source, dest, engine, formatter_class, cache,
+            stats or NULL_STATS, strings, limits=limits)
+    except Exception as err:
+        return BatchResult(source, dest, '{0}: {1}'.format(type(err).__name__, err),
+            time.time() - start, stats=stats)
+    return BatchResult(source, dest, None, time.time() - start, cache_hit, stats)
+
+def run_batch(patterns, dest_root, engine=DEFAULT_ENGINE, formatter_class=None,
+        workers=None, chunksize=DEFAULT_CHUNKSIZE, suffix=OUTPUT_SUFFIX, cache=None,
+        stats=NULL_STATS, intern_strings=False, limits=None):
+    """Decompile every file matched by `patterns` into `dest_root`, mirroring
+    the input tree. Files are spread over a process pool of `workers`
+    processes (default: one per CPU, 1 runs in-process) and submitted in
+    chunks of `chunksize`. A failure only affects its own file; the returned
+    list has one BatchResult per input file in sorted input order. Each
+    worker collects its own Stats when `stats` is enabled and they are
+    merged into it. With `intern_strings` the strings of each file are
+    interned in a StringTable of its own. Every file is parsed
+    with `limits`. Raises OutputConflictError before doing any work when
+    two sources would be written to the same output file.
+    """
+    sources = find_sources(patterns)
+    check_conflicts(sources)
+    tasks = [(source, os.path.join(dest_root, rel_path + suffix), engine, formatter_class, cache,
+        stats.enabled, intern_strings, limits) for source, rel_path in sources]
+    if workers == 1 or len(tasks) <= 1:
+        results = [_run_task(task) for task in tasks]
+    else:
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_run_task, tasks, chunksize=max(1, chunksize)))
+    for result in results:
+        if not result.ok:
+            logger.warning('Failed to decompile %s: %s', result.source, result.error)
+        if result.stats is not None:
+            stats.merge(result.stats)
+    return results
+
+def summarize(results):
+    failed = [r for r in results if not r.ok]
+    return {
+        'total': len(results),
+        'succeeded': len(results) - len(failed),
+        'failed': len(failed),
+        'cache_hits': sum(1 for r in results if r.cache_hit is True),
+        'cache_misses': sum(1 for r in results if r.cache_hit is False),
+        'elapsed': sum(r.elapsed for r in results),
+        'failures': [r.as_dict() for r in failed],
+    }
+
+def write_report(results, report_stream):
+    json.dump(summarize(results), report_stream, indent=2, sort_keys=True)
+    report_stream.write('\n')
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import lua4dec
+from lua4dec.model import Container
+from lua4dec.defaults import DEFAULT_CACHE_SIZE
+from lua4dec.fast_parser import DEFAULT_LIMITS
+
+logger = logging.getLogger('lua4dec.cache')
+
+DEFAULT_MAX_SIZE    = DEFAULT_CACHE_SIZE
+OUTPUT_EXT          = '.out'
+MODEL_EXT           = '.model'
+# fraction of max_size that eviction shrinks the cache down to
+EVICT_TARGET        = 0.9
+
+def _to_plain(obj):
+    # construct Containers can't be pickled, store their plain dict form
+    if isinstance(obj, dict):
+        return dict((k, _to_plain(v)) for k, v in obj.items() if not k.startswith('__'))
+    if isinstance(obj, list):
+        return [_to_plain(v) for v in obj]
+    return obj
+
+def _from_plain(obj):
+    if isinstance(obj, dict):
+        return Container(**dict((k, _from_plain(v)) for k, v in obj.items()))
+    if isinstance(obj, list):
+        return [_from_plain(v) for v in obj]
+    return obj
+
+class DecompileCache(object):
+    """Content addressed on-disk cache of rendered output and optionally the
+    parsed models. Entries are keyed by a hash of the input bytes, the
+    parse limits, the lua4dec version and, for output, the formatter class;
+    models are shared by all formatters. Writes go through a temporary
+    file and an atomic rename so several processes can share a directory,
+    and the least recently used entries are evicted once the cache grows
+    past `max_size` bytes.
+    """
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE, store_models=False):
+        self.directory = directory
+        self.max_size = max_size
+        self.store_models = store_models
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+    def __getstate__(self):
+        return {'directory': self.directory, 'max_size': self.max_size,
+            'store_models': self.store_models}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['max_size'], state['store_models'])
+
+    def _digest(self, data, kind, limits):
+        # the limits decide whether a file is rejected at all, an entry
+        # stored under other limits must not be served
+        if limits is None:
+            limits = DEFAULT_LIMITS
+        digest = hashlib.sha256()
+        digest.update('{0}\0{1}\0{2}\0{3}\0{4}\0'.format(lua4dec.__version__, kind,
+            limits.max_depth, limits.max_instructions, limits.max_string_bytes).encode('utf-8'))
+        digest.update(data)
+        return digest.hexdigest()
+
+    def key(self, data, formatter_class, limits=None):
+        """Key of the output of `formatter_class` for `data` parsed under the
+        Lua4Limits `limits` (default DEFAULT_LIMITS).
+        """
+        return self._digest(data, '{0}.{1}'.format(formatter_class.__module__,
+            formatter_class.__name__), limits)
+
+    def model_key(self, data, limits=None):
+        """Key of the parsed model of `data`, the same for every formatter."""
+        return self._digest(data, 'model', limits)
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, key[:2], key + ext)
+
+    def _read(self, key, ext):
+        path = self._path(key, ext)
+        try:
+            with open(path, 'rb') as cache_f:
+                data = cache_f.read()
+        except (IOError, OSError):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def get(self, key):
+        """Rendered output for `key`, or None on a miss."""
+        data = self._read(key, OUTPUT_EXT)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data.decode('utf-8')
+
+    def get_model(self, key):
+        """Parsed model for a model_key(), or None on a miss."""
+        data = self._read(key, MODEL_EXT)
+        if data is None:
+            return None
+        try:
+            return _from_plain(pickle.loads(data))
+        except Exception as err:
+            logger.warning('Ignoring unreadable cached model %s: %s', key, err)
+            return None
+
+    def put(self, key, output):
+        self._write(key, OUTPUT_EXT, output.encode('utf-8'))
+
+    def put_model(self, key, model):
+        if hasattr(model, 'materialize'):
+            model = model.materialize()
+        self._write(key, MODEL_EXT, pickle.dumps(_to_plain(model), pickle.HIGHEST_PROTOCOL))
+
+    def _write(self, key, ext, data):
+        path = self._path(key, ext)
+        entry_dir = os.path.dirname(path)
+        if not os.path.isdir(entry_dir):
+            os.makedirs(entry_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_f:
+                tmp_f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += len(data)
+        if self._size > self.max_size:
+            self.evict()
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.startswith('.tmp-'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, target=None):
+        """Remove least recently used entries until the cache is below
+        `target` bytes (default: EVICT_TARGET of max_size).
+        """
+        if target is None:
+            target = int(self.max_size * EVICT_TARGET)
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+        return total
+
+    def clear(self):
+        return self.evict(0)
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+
+from lua4dec.lua_lang import OPCODE
+from lua4dec.opcodes import NUM_OPCODE_VALUES
+from lua4dec.decoder import DecodedInstructions, decode_instructions
+
+# Control flow graph of a chunk's instructions. Dominators and post
+# dominators use the iterative algorithm of Cooper, Harvey and Kennedy over
+# reverse postorder, which converges in a couple of passes on the reducible
+# graphs the Lua compiler produces. The dominator trees are numbered so that
+# dominance queries are O(1), and loops and two-way branches are recovered
+# from back edges and immediate post dominators.
+
+CONDITIONAL_JUMPS = frozenset(range(OPCODE.OP_JMPNE, OPCODE.OP_JMPONF + 1)) | frozenset([
+    OPCODE.OP_FORPREP, OPCODE.OP_FORLOOP, OPCODE.OP_LFORPREP, OPCODE.OP_LFORLOOP])
+TERMINATORS = frozenset([OPCODE.OP_END, OPCODE.OP_RETURN, OPCODE.OP_TAILCALL])
+# opcodes that end a basic block, indexed by the raw opcode
+ENDS_BLOCK = bytearray(1 if op in CONDITIONAL_JUMPS or op in TERMINATORS
+    or op in (OPCODE.OP_JMP, OPCODE.OP_PUSHNILJMP) else 0 for op in range(NUM_OPCODE_VALUES))
+
+LOOP_WHILE      = 'while'
+LOOP_REPEAT     = 'repeat'
+LOOP_FOR        = 'for'
+LOOP_FORIN      = 'forin'
+LOOP_INFINITE   = 'loop'
+
+class BasicBlock(object):
+    """Instructions start..end-1 of a chunk."""
+    __slots__ = ('index', 'start', 'end', 'succs', 'preds')
+
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.succs = []
+        self.preds = []
+
+    @property
+    def last(self):
+        return self.end - 1
+
+    def __repr__(self):
+        return '<BasicBlock #{0} {1}-{2} -> {3}>'.format(self.index, self.start,
+            self.last, self.succs)
+
+class Loop(object):
+    __slots__ = ('header', 'latches', 'body', 'kind', 'exit')
+
+    def __init__(self, header, latches, body, kind, exit):
+        self.header = header
+        self.latches = latches
+        self.body = body
+        self.kind = kind
+        self.exit = exit
+
+    def __repr__(self):
+        return '<Loop {0} header=#{1} latches={2} exit={3}>'.format(self.kind,
+            self.header, self.latches, self.exit)
+
+class Branch(object):
+    """Two-way branch ending `block`, both paths meet again at `merge`
+    (the immediate post dominator, None when they never do).
+    """
+    __slots__ = ('block', 'merge')
+
+    def __init__(self, block, merge):
+        self.block = block
+        self.merge = merge
+
+    def __repr__(self):
+        return '<Branch #{0} merge={1}>'.format(self.block, self.merge)
+
+def _successor_pcs(op, pc, S, count):
+    if op in TERMINATORS:
+        return ()
+    if op == OPCODE.OP_JMP:
+        return (pc + 1 + S,)
+    if op == OPCODE.OP_PUSHNILJMP:
+        return (pc + 2,)
+    if op in CONDITIONAL_JUMPS:
+        return (pc + 1, pc + 1 + S)
+    return (pc + 1,)
+
+def _reverse_postorder(count, entry, succs):
+    order = []
+    seen = bytearray(count)
+    seen[entry] = 1
+    stack = [(entry, iter(succs[entry]))]
+    while stack:
+        node, it = stack[-1]
+        for succ in it:
+            if not seen[succ]:
+                seen[succ] = 1
+                stack.append((succ, iter(succs[succ])))
+                break
+        else:
+            stack.pop()
+            order.append(node)
+    order.reverse()
+    return order
+
+def compute_dominators(count, entry, succs, preds):
+    """Immediate dominators of nodes 0..count-1 reachable from `entry`, -1 for
+    unreachable nodes and the entry maps to itself.
+    """
+    order = _reverse_postorder(count, entry, succs)
+    rpo = [-1] * count
+    for i, node in enumerate(order):
+        rpo[node] = i
+    idom = [-1] * count
+    idom[entry] = entry
+
+    def intersect(a, b):
+        while a != b:
+            while rpo[a] > rpo[b]:
+                a = idom[a]
+            while rpo[b] > rpo[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for node in order[1:]:
+            new_idom = -1
+            for pred in preds[node]:
+                if idom[pred] == -1:
+                    continue
+                new_idom = pred if new_idom == -1 else intersect(pred, new_idom)
+            if new_idom != idom[node]:
+                idom[node] = new_idom
+                changed = True
+    return idom
+
+def _number_tree(count, root, idom):
+    # pre/post order numbers of the dominator tree, a dominates b iff
+    # pre[a] <= pre[b] and post[b] <= post[a]
+    children = [[] for _ in range(count)]
+    for node, parent in enumerate(idom):
+        if parent != -1 and node != root:
+            children[parent].append(node)
+    pre = array.array('l', [-1] * count)
+    post = array.array('l', [-1] * count)
+    counter = 0
+    stack = [(root, iter(children[root]))]
+    pre[root] = counter
+    counter += 1
+    while stack:
+        node, it = stack[-1]
+        for child in it:
+            pre[child] = counter
+            counter += 1
+            stack.append((child, iter(children[child])))
+            break
+        else:
+            stack.pop()
+            post[node] = counter
+            counter += 1
+    return pre, post
+
+class ControlFlowGraph(object):
+    def __init__(self, code):
+        self.code = code
+        self.blocks = []
+        self._build()
+        count = len(self.blocks)
+        succs = [b.succs for b in self.blocks]
+        preds = [b.preds for b in self.blocks]
+
+        if count:
+            self.idom = compute_dominators(count, 0, succs, preds)
+            self._dom_pre, self._dom_post = _number_tree(count, 0, self.idom)
+        else:
+            self.idom = []
+            self._dom_pre = self._dom_post = array.array('l')
+
+        # post dominators on the reversed graph with a virtual exit node
+        exit_node = count
+        rsuccs = [list(p) for p in preds] + [[b.index for b in self.blocks if not b.succs]]
+        rpreds = [list(s) for s in succs] + [[]]
+        for node in rsuccs[exit_node]:
+            rpreds[node].append(exit_node)
+        ipdom = compute_dominators(count + 1, exit_node, rsuccs, rpreds)
+        self._pdom_pre, self._pdom_post = _number_tree(count + 1, exit_node, ipdom)
+        self.ipdom = [-1 if d == exit_node else d for d in ipdom[:count]]
+
+        self.loops = self._find_loops()
+        self.branches = self._find_branches()
+
+    def _build(self):
+        code = self.code
+        opcodes = code.opcode
+        S = code.S
+        count = len(opcodes)
+        leaders = bytearray(count + 1)
+        leaders[0] = 1
+        for pc in range(count):
+            op = opcodes[pc]
+            if ENDS_BLOCK[op]:
+                leaders[pc + 1] = 1
+                for target in _successor_pcs(op, pc, S[pc], count):
+                    if 0 <= target < count:
+                        leaders[target] = 1
+
+        block_of = array.array('l', [0] * count)
+        start = 0
+        for pc in range(1, count + 1):
+            if pc == count or leaders[pc]:
+                block = BasicBlock(len(self.blocks), start, pc)
+                self.blocks.append(block)
+                for i in range(start, pc):
+                    block_of[i] = block.index
+                start = pc
+        self.block_of = block_of
+
+        for block in self.blocks:
+            last = block.last
+            for target in _successor_pcs(opcodes[last], last, S[last], count):
+                if 0 <= target < count:
+                    succ = block_of[target]
+                    if succ not in block.succs:
+                        block.succs.append(succ)
+                        self.blocks[succ].preds.append(block.index)
+
+    def block_at(self, pc):
+        return self.blocks[self.block_of[pc]]
+
+    def dominates(self, a, b):
+        pre, post = self._dom_pre, self._dom_post
+        if pre[a] < 0 or pre[b] < 0:
+            return False
+        return pre[a] <= pre[b] and post[b] <= post[a]
+
+    def post_dominates(self, a, b):
+        pre, post = self._pdom_pre, self._pdom_post
+        if pre[a] < 0 or pre[b] < 0:
+            return False
+        return pre[a] <= pre[b] and post[b] <= post[a]
+
+    def is_back_edge(self, src, dst):
+        return dst in self.blocks[src].succs and self.dominates(dst, src)
+
+    def merge_pc(self, pc):
+        """First pc where the paths leaving the block containing `pc` join
+        again, or None.
+        """
+        merge = self.ipdom[self.block_of[pc]]
+        if merge == -1:
+            return None
+        return self.blocks[merge].start
+
+    def _find_loops(self):
+        by_header = {}
+        for block in self.blocks:
+            for succ in block.succs:
+                if self.dominates(succ, block.index):
+                    by_header.setdefault(succ, []).append(block.index)
+
+        loops = []
+        opcodes = self.code.opcode
+        for header in sorted(by_header):
+            latches = by_header[header]
+            body = set([header])
+            stack = [l for l in latches if l != header]
+            body.update(stack)
+            while stack:
+                for pred in self.blocks[stack.pop()].preds:
+                    if pred not in body:
+                        body.add(pred)
+                        stack.append(pred)
+
+            latch = self.blocks[max(latches)]
+            op = opcodes[latch.last]
+            if op == OPCODE.OP_FORLOOP:
+                kind = LOOP_FOR
+            elif op == OPCODE.OP_LFORLOOP:
+                kind = LOOP_FORIN
+            elif op in CONDITIONAL_JUMPS:
+                kind = LOOP_REPEAT
+            elif opcodes[self.blocks[header].last] in CONDITIONAL_JUMPS:
+                kind = LOOP_WHILE
+            else:
+                kind = LOOP_INFINITE
+
+            exits = sorted(set(s for b in body for s in self.blocks[b].succs if s not in body))
+            exit_block = exits[0] if exits else None
+            loops.append(Loop(header, sorted(latches), frozenset(body), kind, exit_block))
+        return loops
+
+    def _find_branches(self):
+        branches = {}
+        opcodes = self.code.opcode
+        for block in self.blocks:
+            if len(block.succs) == 2 and opcodes[block.last] in CONDITIONAL_JUMPS:
+                merge = self.ipdom[block.index]
+                branches[block.index] = Branch(block.index, None if merge == -1 else merge)
+        return branches
+
+def build_cfg(chunk_or_code):
+    """Build the ControlFlowGraph of a chunk, or of already decoded
+    instructions as returned by decode_instructions(...).tolists().
+    """
+    if isinstance(chunk_or_code, DecodedInstructions):
+        code = chunk_or_code
+    else:
+        code = decode_instructions(chunk_or_code.instruction).tolists()
+    return ControlFlowGraph(code)
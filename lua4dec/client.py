@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+import socket
+import tempfile
+
+# Client side of the decompile server in lua4dec.server. Kept to the standard
+# library so the client command starts without importing the decompiler.
+#
+# The protocol is one JSON object per line in both directions. Requests
+# carry an "op" ("decompile", "ping", "stats" or "shutdown") and an "id"
+# that is echoed back; decompile requests name a "path" readable by the
+# server or inline base64 "data", plus optional "format" and "engine".
+# Responses have "ok" and either the result fields or an "error".
+
+DEFAULT_PORT        = 7514
+DEFAULT_TIMEOUT     = 30.0
+
+class Lua4ServerError(Exception):
+    pass
+
+def default_address():
+    """Unix socket in the runtime dir where supported, localhost TCP otherwise."""
+    if hasattr(socket, 'AF_UNIX'):
+        runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+        return 'unix:' + os.path.join(runtime_dir, 'lua4dec-{0}.sock'.format(os.getuid()))
+    return '127.0.0.1:{0}'.format(DEFAULT_PORT)
+
+def parse_address(address):
+    """('unix', path) for `unix:PATH` (or anything containing a slash),
+    ('tcp', (host, port)) for `HOST:PORT` or a bare port.
+    """
+    if address is None:
+        address = default_address()
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    if os.sep in address:
+        return 'unix', address
+    host, _, port = address.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+def connect(address=None, timeout=DEFAULT_TIMEOUT):
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(target)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+def request(message, address=None, timeout=DEFAULT_TIMEOUT):
+    """Send one request and return the decoded response."""
+    sock = connect(address, timeout)
+    try:
+        sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as reader:
+            line = reader.readline()
+    finally:
+        sock.close()
+    if not line:
+        raise Lua4ServerError('connection closed by server')
+    return json.loads(line.decode('utf-8'))
+
+def decompile(path, format=None, engine=None, address=None, timeout=DEFAULT_TIMEOUT):
+    """Decompile the file at `path` on the server, returns the output text."""
+    message = {'op': 'decompile', 'id': 1, 'path': os.path.abspath(path)}
+    if format is not None:
+        message['format'] = format
+    if engine is not None:
+        message['engine'] = engine
+    response = request(message, address, timeout)
+    if not response.get('ok'):
+        raise Lua4ServerError(response.get('error', 'unknown error'))
+    return response['output']
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+
+from lua4dec.opcodes import OP_MASK, MASK_B, POS_U, POS_A, POS_B, MAXARG_S
+from lua4dec.model import UINT32_TYPECODE, INT32_TYPECODE
+
+# Batched counterparts of GET_OPCODE/GETARG_* that decode a whole chunk's
+# instructions into columns at once. With NumPy available the columns are
+# ndarrays computed in a single vectorized pass, otherwise they are
+# array.array objects filled by plain Python loops. NumPy is only imported
+# the first time a chunk big enough to benefit from it is decoded.
+
+# below this many instructions the pure Python path is used by default
+NUMPY_THRESHOLD = 2048
+
+numpy = None
+_numpy_checked = False
+
+def _get_numpy():
+    global numpy, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+class DecodedInstructions(object):
+    """Columnar view of a chunk's instructions, every column is indexed by pc.
+    All fields are decoded for every instruction regardless of the opcode's
+    argument type, so only read the columns that make sense for the opcode.
+    """
+    __slots__ = ('instruction', 'opcode', 'U', 'S', 'A', 'B')
+
+    def __init__(self, instruction, opcode, U, S, A, B):
+        self.instruction = instruction
+        self.opcode = opcode
+        self.U = U
+        self.S = S
+        self.A = A
+        self.B = B
+
+    def __len__(self):
+        return len(self.opcode)
+
+    def tolists(self):
+        """Plain lists of ints for every column, which is the fastest form to
+        index from pure Python code.
+        """
+        return DecodedInstructions(*[c.tolist() if hasattr(c, 'tolist') else list(c)
+            for c in (self.instruction, self.opcode, self.U, self.S, self.A, self.B)])
+
+def _decode_numpy(instructions):
+    if isinstance(instructions, (array.array, memoryview)):
+        words = numpy.frombuffer(instructions, dtype=numpy.uint32)
+    else:
+        words = numpy.asarray(instructions, dtype=numpy.uint32)
+    U = words >> POS_U
+    return DecodedInstructions(
+        words,
+        (words & OP_MASK).astype(numpy.uint8),
+        U,
+        U.astype(numpy.int32) - MAXARG_S,
+        words >> POS_A,
+        (words >> POS_B) & MASK_B,
+    )
+
+def _decode_python(instructions):
+    U = array.array(UINT32_TYPECODE, [i >> POS_U for i in instructions])
+    return DecodedInstructions(
+        instructions,
+        array.array('B', [i & OP_MASK for i in instructions]),
+        U,
+        array.array(INT32_TYPECODE, [u - MAXARG_S for u in U]),
+        array.array(UINT32_TYPECODE, [i >> POS_A for i in instructions]),
+        array.array(UINT32_TYPECODE, [(i >> POS_B) & MASK_B for i in instructions]),
+    )
+
+def decode_instructions(instructions, use_numpy=None):
+    """Decode a sequence of instruction words into a DecodedInstructions.
+    `use_numpy` defaults to using NumPy whenever it is importable and there
+    are at least NUMPY_THRESHOLD instructions.
+    """
+    if use_numpy is None:
+        use_numpy = len(instructions) >= NUMPY_THRESHOLD and _get_numpy() is not None
+    elif use_numpy and _get_numpy() is None:
+        raise ImportError('numpy is required for use_numpy=True')
+    if use_numpy:
+        return _decode_numpy(instructions)
+    return _decode_python(instructions)
+
+def decode_chunk(chunk, use_numpy=None):
+    return decode_instructions(chunk.instruction, use_numpy)
@@ -0,0 +1,1376 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import logging
+import re
+
+from lua4dec.lua_lang import OPCODE, INTP_DATA_TYPE, INTP_DATA_FLAG, MULT_RET, \
+    LFIELDS_PER_FLUSH
+from lua4dec.opcodes import NUM_OPCODE_VALUES
+from lua4dec.util import TO_TEXT
+from lua4dec.decoder import decode_instructions
+from lua4dec.cfg import build_cfg
+
+logger = logging.getLogger('lua4dec.decompiler')
+
+# Source reconstruction by simulating the Lua4 operand stack symbolically.
+# Every chunk is decompiled in a single forward pass over its instructions:
+# pushes create expression nodes, instructions with side effects turn the
+# nodes on the stack into statements. Numeric and generic for loops are
+# explicit in the byte code and come out nested, every other jump is kept as
+# a CondGoto/Goto to a Label. Lua4Structurer then uses the chunk's control
+# flow graph to turn those into if/while/repeat/break where it can; jumps it
+# can't place are left as goto pseudo statements.
+
+INDENT = '    '
+
+PREC_OR         = 1
+PREC_AND        = 2
+PREC_COMPARE    = 3
+PREC_CONCAT     = 4
+PREC_ADD        = 5
+PREC_MUL        = 6
+PREC_UNARY      = 7
+PREC_POW        = 8
+PREC_ATOM       = 10
+
+BINARY_PREC = {
+    'or': PREC_OR, 'and': PREC_AND,
+    '==': PREC_COMPARE, '~=': PREC_COMPARE, '<': PREC_COMPARE,
+    '<=': PREC_COMPARE, '>': PREC_COMPARE, '>=': PREC_COMPARE,
+    '+': PREC_ADD, '-': PREC_ADD, '*': PREC_MUL, '/': PREC_MUL, '^': PREC_POW,
+}
+RIGHT_ASSOC = frozenset(['^'])
+NEGATED_COMPARE = {'==': '~=', '~=': '==', '<': '>=', '>=': '<', '<=': '>', '>': '<='}
+
+COMPARE_JUMPS = {
+    OPCODE.OP_JMPNE: '~=', OPCODE.OP_JMPEQ: '==', OPCODE.OP_JMPLT: '<',
+    OPCODE.OP_JMPLE: '<=', OPCODE.OP_JMPGT: '>', OPCODE.OP_JMPGE: '>=',
+}
+ARITH_OPS = {
+    OPCODE.OP_ADD: '+', OPCODE.OP_SUB: '-', OPCODE.OP_MULT: '*',
+    OPCODE.OP_DIV: '/', OPCODE.OP_POW: '^',
+}
+
+LUA_KEYWORDS = frozenset('and break do else elseif end for function if in local '
+    'nil not or repeat return then until while'.split())
+_IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def is_identifier(name):
+    return _IDENTIFIER_RE.match(name) is not None and name not in LUA_KEYWORDS
+
+def quote_string(value):
+    """Lua string literal for a byte string, anything outside printable
+    ASCII is written as a decimal escape.
+    """
+    if not isinstance(value, (bytes, bytearray)):
+        value = value.encode('latin-1')
+    out = ['"']
+    for c in bytearray(value):
+        if c == 0x22:
+            out.append('\\"')
+        elif c == 0x5C:
+            out.append('\\\\')
+        elif c == 0x0A:
+            out.append('\\n')
+        elif 0x20 <= c < 0x7F:
+            out.append(chr(c))
+        else:
+            out.append('\\{0:03d}'.format(c))
+    out.append('"')
+    return ''.join(out)
+
+def format_number(value):
+    if value == int(value) and abs(value) < 2 ** 53:
+        return '{0:d}'.format(int(value))
+    return repr(value)
+
+def _wrap(expr, indent, min_prec):
+    text = expr.render(indent)
+    if expr.prec < min_prec:
+        return '(' + text + ')'
+    return text
+
+def render_list(exprs, indent):
+    return ', '.join(e.render(indent) for e in exprs)
+
+#
+# expressions
+#
+
+class Expr(object):
+    __slots__ = ()
+    prec = PREC_ATOM
+    data_type = None
+    data_flags = 0
+
+    def render(self, indent):
+        raise NotImplementedError()
+
+class Unknown(Expr):
+    """Stand-in for a value the simulation lost track of."""
+    __slots__ = ('note',)
+
+    def __init__(self, note='?'):
+        self.note = note
+
+    def render(self, indent):
+        return 'nil --[[ {0} ]]'.format(self.note)
+
+class Nil(Expr):
+    __slots__ = ()
+    data_type = INTP_DATA_TYPE.IDT_Nil
+
+    def render(self, indent):
+        return 'nil'
+
+NIL = Nil()
+
+class Number(Expr):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    @property
+    def data_type(self):
+        if self.value == int(self.value):
+            return INTP_DATA_TYPE.IDT_Integral
+        return INTP_DATA_TYPE.IDT_Float
+
+    @property
+    def prec(self):
+        return PREC_UNARY if self.value < 0 else PREC_ATOM
+
+    def render(self, indent):
+        return format_number(self.value)
+
+class String(Expr):
+    __slots__ = ('value',)
+    data_type = INTP_DATA_TYPE.IDT_Char
+
+    def __init__(self, value):
+        self.value = value
+
+    def render(self, indent):
+        return quote_string(self.value)
+
+class Global(Expr):
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def render(self, indent):
+        if is_identifier(self.name):
+            return self.name
+        return 'getglobal({0})'.format(quote_string(self.name))
+
+class Local(Expr):
+    __slots__ = ('name',)
+    data_type = INTP_DATA_TYPE.IDT_LocalVar
+    data_flags = INTP_DATA_FLAG.IDF_IsALocalValue
+
+    def __init__(self, name):
+        self.name = name
+
+    def render(self, indent):
+        return self.name
+
+class Upvalue(Expr):
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def render(self, indent):
+        return '%' + self.name
+
+class Index(Expr):
+    __slots__ = ('table', 'key')
+
+    def __init__(self, table, key):
+        self.table = table
+        self.key = key
+
+    def render(self, indent):
+        if isinstance(self.table, (String, Number, Table, Closure)):
+            table = '(' + self.table.render(indent) + ')'
+        else:
+            table = _wrap(self.table, indent, PREC_ATOM)
+        key = self.key
+        if isinstance(key, String) and is_identifier(TO_TEXT(key.value)):
+            return '{0}.{1}'.format(table, TO_TEXT(key.value))
+        return '{0}[{1}]'.format(table, key.render(indent))
+
+class SelfArg(Expr):
+    """The receiver pushed by OP_PUSHSELF as the implicit first argument."""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def render(self, indent):
+        return self.value.render(indent)
+
+class Call(Expr):
+    __slots__ = ('func', 'args')
+    data_flags = INTP_DATA_FLAG.IDF_FunctionReturn
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+    def render(self, indent):
+        func, args = self.func, self.args
+        if args and isinstance(args[0], SelfArg) and isinstance(func, Index) \
+                and isinstance(func.key, String) and is_identifier(TO_TEXT(func.key.value)):
+            return '{0}:{1}({2})'.format(_wrap(args[0].value, indent, PREC_ATOM),
+                TO_TEXT(func.key.value), render_list(args[1:], indent))
+        if isinstance(func, (Closure, String, Number)):
+            text = '(' + func.render(indent) + ')'
+        else:
+            text = _wrap(func, indent, PREC_ATOM)
+        return '{0}({1})'.format(text, render_list(args, indent))
+
+class CallResult(Expr):
+    """One of the results of a call adjusted to several values, only used
+    until the results are declared as locals together.
+    """
+    __slots__ = ('call', 'index', 'count')
+    data_flags = INTP_DATA_FLAG.IDF_FunctionReturn
+
+    def __init__(self, call, index, count):
+        self.call = call
+        self.index = index
+        self.count = count
+
+    def render(self, indent):
+        if self.index == 0:
+            return self.call.render(indent)
+        return Unknown('result {0} of call'.format(self.index + 1)).render(indent)
+
+class BinOp(Expr):
+    __slots__ = ('op', 'left', 'right')
+
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+    @property
+    def prec(self):
+        return BINARY_PREC[self.op]
+
+    def render(self, indent):
+        prec = BINARY_PREC[self.op]
+        if self.op in RIGHT_ASSOC:
+            left = _wrap(self.left, indent, prec + 1)
+            right = _wrap(self.right, indent, prec)
+        else:
+            left = _wrap(self.left, indent, prec)
+            right = _wrap(self.right, indent, prec + 1)
+        return '{0} {1} {2}'.format(left, self.op, right)
+
+class Unary(Expr):
+    __slots__ = ('op', 'operand')
+    prec = PREC_UNARY
+
+    def __init__(self, op, operand):
+        self.op = op
+        self.operand = operand
+
+    def render(self, indent):
+        text = _wrap(self.operand, indent, PREC_UNARY)
+        if self.op == 'not':
+            return 'not ' + text
+        if text.startswith('-'):
+            text = '(' + text + ')'
+        return self.op + text
+
+class Concat(Expr):
+    __slots__ = ('items',)
+    prec = PREC_CONCAT
+
+    def __init__(self, items):
+        self.items = items
+
+    def render(self, indent):
+        parts = []
+        last = len(self.items) - 1
+        for i, item in enumerate(self.items):
+            # right associative, so only the last item may be a bare concat
+            parts.append(_wrap(item, indent, PREC_CONCAT if i == last else PREC_CONCAT + 1))
+        return ' .. '.join(parts)
+
+class Table(Expr):
+    __slots__ = ('size', 'items', 'fields')
+    data_type = INTP_DATA_TYPE.IDT_Table
+
+    def __init__(self, size):
+        self.size = size
+        self.items = []
+        self.fields = []
+
+    def render(self, indent):
+        items = render_list(self.items, indent)
+        fields = []
+        for key, value in self.fields:
+            if isinstance(key, String) and is_identifier(TO_TEXT(key.value)):
+                fields.append('{0} = {1}'.format(TO_TEXT(key.value), value.render(indent)))
+            else:
+                fields.append('[{0}] = {1}'.format(key.render(indent), value.render(indent)))
+        fields = ', '.join(fields)
+        if items and fields:
+            return '{' + items + '; ' + fields + '}'
+        return '{' + (items or fields) + '}'
+
+class Closure(Expr):
+    __slots__ = ('chunk', 'upvalues')
+    data_type = INTP_DATA_TYPE.IDT_Closure
+
+    def __init__(self, chunk, upvalues):
+        self.chunk = chunk
+        self.upvalues = upvalues
+
+    def upvalue_names(self):
+        names = []
+        for value in self.upvalues:
+            if isinstance(value, (Local, Global, Upvalue)):
+                names.append(value.name)
+            else:
+                names.append(value.render(0))
+        return names
+
+    def params(self):
+        names = [TO_TEXT(lv.name) for lv in self.chunk.local_var[:self.chunk.num_params]]
+        while len(names) < self.chunk.num_params:
+            names.append('_arg{0}'.format(len(names)))
+        if self.chunk.is_vararg:
+            names.append('...')
+        return names
+
+    def render_function(self, indent, name=None, params=None):
+        if params is None:
+            params = self.params()
+        head = 'function{0}({1})'.format(' ' + name if name else '', ', '.join(params))
+        body = Lua4Decompiler(self.chunk, self.upvalue_names()).decompile()
+        lines = [head]
+        render_block(body, indent + 1, lines)
+        lines.append(INDENT * indent + 'end')
+        return '\n'.join(lines)
+
+    def render(self, indent):
+        return self.render_function(indent)
+
+def fold_condition(chain):
+    """Combine a chain of short-circuit jumps into one expression. `chain`
+    is a list of (cond, jumps_true) in code order, each jump is taken when
+    cond holds and decides the whole condition as jumps_true; falling
+    through the last jump gives the opposite of its outcome.
+    """
+    value = None
+    for cond, jumps_true in reversed(chain):
+        if not jumps_true:
+            cond = negate(cond)
+        if value is not None:
+            cond = BinOp('or' if jumps_true else 'and', cond, value)
+        value = cond
+    return value
+
+def negate(expr):
+    if isinstance(expr, BinOp) and expr.op in NEGATED_COMPARE:
+        return BinOp(NEGATED_COMPARE[expr.op], expr.left, expr.right)
+    if isinstance(expr, Unary) and expr.op == 'not':
+        return expr.operand
+    if isinstance(expr, BinOp) and expr.op in ('and', 'or'):
+        return BinOp('or' if expr.op == 'and' else 'and', negate(expr.left), negate(expr.right))
+    return Unary('not', expr)
+
+#
+# statements
+#
+
+class Stmt(object):
+    __slots__ = ('pc',)
+
+    def render(self, indent, lines):
+        raise NotImplementedError()
+
+class LocalStmt(Stmt):
+    __slots__ = ('names', 'values')
+
+    def __init__(self, pc, names, values):
+        self.pc = pc
+        self.names = names
+        self.values = values
+
+    def render(self, indent, lines):
+        values = list(self.values)
+        # `local a, b = f()` instead of one entry per call result
+        if values and isinstance(values[-1], CallResult):
+            call = values[-1].call
+            count = values[-1].count
+            tail = values[-count:]
+            if len(tail) == count and all(isinstance(v, CallResult) and v.call is call
+                    and v.index == i for i, v in enumerate(tail)):
+                values[-count:] = [call]
+        while values and values[-1] is NIL:
+            values.pop()
+        text = 'local ' + ', '.join(self.names)
+        if values:
+            text += ' = ' + render_list(values, indent)
+        lines.append(INDENT * indent + text)
+
+class AssignStmt(Stmt):
+    __slots__ = ('target', 'value')
+
+    def __init__(self, pc, target, value):
+        self.pc = pc
+        self.target = target
+        self.value = value
+
+    def _function_name(self):
+        target = self.target
+        if isinstance(target, Global) and is_identifier(target.name):
+            return target.name
+        if isinstance(target, Index) and isinstance(target.key, String) \
+                and is_identifier(TO_TEXT(target.key.value)):
+            table = target.table
+            if isinstance(table, (Global, Local)) and is_identifier(table.name):
+                return table.name + '.' + TO_TEXT(target.key.value)
+        return None
+
+    def render(self, indent, lines):
+        if isinstance(self.value, Closure):
+            name = self._function_name()
+            if name is not None:
+                params = self.value.params()
+                if '.' in name and params and params[0] == 'self':
+                    name = ':'.join(name.rsplit('.', 1))
+                    params = params[1:]
+                lines.append(INDENT * indent
+                    + self.value.render_function(indent, name, params))
+                return
+        if isinstance(self.target, Global) and not is_identifier(self.target.name):
+            lines.append(INDENT * indent + 'setglobal({0}, {1})'.format(
+                quote_string(self.target.name), self.value.render(indent)))
+            return
+        lines.append(INDENT * indent + '{0} = {1}'.format(
+            self.target.render(indent), self.value.render(indent)))
+
+class CallStmt(Stmt):
+    __slots__ = ('call',)
+
+    def __init__(self, pc, call):
+        self.pc = pc
+        self.call = call
+
+    def render(self, indent, lines):
+        lines.append(INDENT * indent + self.call.render(indent))
+
+class ReturnStmt(Stmt):
+    __slots__ = ('values',)
+
+    def __init__(self, pc, values):
+        self.pc = pc
+        self.values = values
+
+    def render(self, indent, lines):
+        if self.values:
+            lines.append(INDENT * indent + 'return ' + render_list(self.values, indent))
+        else:
+            lines.append(INDENT * indent + 'return')
+
+class Label(Stmt):
+    __slots__ = ()
+
+    def __init__(self, pc):
+        self.pc = pc
+
+    def render(self, indent, lines):
+        lines.append(INDENT * indent + '::L{0}::'.format(self.pc))
+
+class Goto(Stmt):
+    __slots__ = ('target',)
+
+    def __init__(self, pc, target):
+        self.pc = pc
+        self.target = target
+
+    def render(self, indent, lines):
+        lines.append(INDENT * indent + 'goto L{0}'.format(self.target))
+
+class CondGoto(Stmt):
+    """Jump to `target` when `cond` holds."""
+    __slots__ = ('cond', 'target')
+
+    def __init__(self, pc, cond, target):
+        self.pc = pc
+        self.cond = cond
+        self.target = target
+
+    def render(self, indent, lines):
+        lines.append(INDENT * indent + 'if {0} then goto L{1} end'.format(
+            self.cond.render(indent), self.target))
+
+class NumericFor(Stmt):
+    __slots__ = ('var', 'start', 'limit', 'step', 'body', 'end_pc')
+
+    def __init__(self, pc, var, start, limit, step):
+        self.pc = pc
+        self.var = var
+        self.start = start
+        self.limit = limit
+        self.step = step
+        self.body = []
+        self.end_pc = None
+
+    def render(self, indent, lines):
+        head = 'for {0} = {1}, {2}'.format(self.var, self.start.render(indent),
+            self.limit.render(indent))
+        if not (isinstance(self.step, Number) and self.step.value == 1):
+            head += ', ' + self.step.render(indent)
+        lines.append(INDENT * indent + head + ' do')
+        render_block(self.body, indent + 1, lines)
+        lines.append(INDENT * indent + 'end')
+
+class GenericFor(Stmt):
+    __slots__ = ('key', 'value', 'table', 'body', 'end_pc')
+
+    def __init__(self, pc, key, value, table):
+        self.pc = pc
+        self.key = key
+        self.value = value
+        self.table = table
+        self.body = []
+        self.end_pc = None
+
+    def render(self, indent, lines):
+        lines.append(INDENT * indent + 'for {0}, {1} in {2} do'.format(
+            self.key, self.value, self.table.render(indent)))
+        render_block(self.body, indent + 1, lines)
+        lines.append(INDENT * indent + 'end')
+
+class IfStmt(Stmt):
+    __slots__ = ('cond', 'then_body', 'else_body')
+
+    def __init__(self, pc, cond, then_body, else_body=None):
+        self.pc = pc
+        self.cond = cond
+        self.then_body = then_body
+        self.else_body = else_body or []
+
+    def render(self, indent, lines):
+        # an else branch that is a single if statement continues the chain
+        # as elseif, walked in a loop since chains can be very long
+        stmt = self
+        keyword = 'if'
+        while True:
+            lines.append(INDENT * indent + '{0} {1} then'.format(keyword, stmt.cond.render(indent)))
+            render_block(stmt.then_body, indent + 1, lines)
+            else_body = stmt.else_body
+            if len(else_body) != 1 or not isinstance(else_body[0], IfStmt):
+                break
+            stmt = else_body[0]
+            keyword = 'elseif'
+        if else_body:
+            lines.append(INDENT * indent + 'else')
+            render_block(else_body, indent + 1, lines)
+        lines.append(INDENT * indent + 'end')
+
+class WhileStmt(Stmt):
+    __slots__ = ('cond', 'body')
+
+    def __init__(self, pc, cond, body):
+        self.pc = pc
+        self.cond = cond
+        self.body = body
+
+    def render(self, indent, lines):
+        lines.append(INDENT * indent + 'while {0} do'.format(self.cond.render(indent)))
+        render_block(self.body, indent + 1, lines)
+        lines.append(INDENT * indent + 'end')
+
+class RepeatStmt(Stmt):
+    __slots__ = ('body', 'cond')
+
+    def __init__(self, pc, body, cond):
+        self.pc = pc
+        self.body = body
+        self.cond = cond
+
+    def render(self, indent, lines):
+        lines.append(INDENT * indent + 'repeat')
+        render_block(self.body, indent + 1, lines)
+        lines.append(INDENT * indent + 'until ' + self.cond.render(indent))
+
+class BreakStmt(Stmt):
+    __slots__ = ()
+
+    def __init__(self, pc):
+        self.pc = pc
+
+    def render(self, indent, lines):
+        lines.append(INDENT * indent + 'break')
+
+class UnknownStmt(Stmt):
+    __slots__ = ('opcode',)
+
+    def __init__(self, pc, opcode):
+        self.pc = pc
+        self.opcode = opcode
+
+    def render(self, indent, lines):
+        lines.append(INDENT * indent + '-- unknown opcode {0} at pc {1}'.format(self.opcode,
+            self.pc))
+
+def render_block(stmts, indent, lines):
+    last = len(stmts) - 1
+    for i, stmt in enumerate(stmts):
+        if i != last and isinstance(stmt, (ReturnStmt, BreakStmt)):
+            # both have to end a block in Lua
+            lines.append(INDENT * indent + 'do')
+            stmt.render(indent + 1, lines)
+            lines.append(INDENT * indent + 'end')
+        else:
+            stmt.render(indent, lines)
+    return lines
+
+def _child_blocks(stmt):
+    if isinstance(stmt, IfStmt):
+        return (stmt.then_body, stmt.else_body)
+    if isinstance(stmt, (WhileStmt, RepeatStmt, NumericFor, GenericFor)):
+        return (stmt.body,)
+    return ()
+
+def _label_index(stmts):
+    # every pc has at most one Label in a chunk
+    return dict((stmt.pc, i) for i, stmt in enumerate(stmts) if isinstance(stmt, Label))
+
+class _IfElseMatch(object):
+    """An if statement with an else branch found by
+    Lua4Structurer._match_condition(), as index ranges of its branches.
+    """
+    __slots__ = ('pc', 'cond', 'then_start', 'then_stop', 'else_start', 'else_stop', 'block_end')
+
+    def __init__(self, pc, cond, then_start, then_stop, else_start, else_stop, block_end):
+        self.pc = pc
+        self.cond = cond
+        self.then_start = then_start
+        self.then_stop = then_stop
+        self.else_start = else_start
+        self.else_stop = else_stop
+        self.block_end = block_end
+
+class Lua4Structurer(object):
+    """Rebuild if/while/repeat/break statements from the CondGoto, Goto and
+    Label statements of a decompiled chunk, guided by its ControlFlowGraph:
+    if statements end at the immediate post dominator of their branch and
+    loops are only formed over real back edges.
+    """
+    def __init__(self, cfg):
+        self.cfg = cfg
+
+    def structure(self, stmts):
+        body = self._structure(stmts, None)
+        targets = set()
+        self._collect_targets(body, targets)
+        self._prune_labels(body, targets)
+        return body
+
+    # the tree walks use explicit stacks, the else branches of an elseif
+    # chain nest as deep as the chain is long
+
+    def _collect_targets(self, stmts, targets):
+        pending = [stmts]
+        while pending:
+            for stmt in pending.pop():
+                if isinstance(stmt, (Goto, CondGoto)):
+                    targets.add(stmt.target)
+                pending.extend(_child_blocks(stmt))
+
+    def _prune_labels(self, stmts, targets):
+        pending = [stmts]
+        while pending:
+            block = pending.pop()
+            block[:] = [s for s in block if not isinstance(s, Label) or s.pc in targets]
+            for stmt in block:
+                pending.extend(_child_blocks(stmt))
+
+    def _convert_breaks(self, stmts, loop_exit):
+        pending = [stmts]
+        while pending:
+            block = pending.pop()
+            for i, stmt in enumerate(block):
+                if isinstance(stmt, Goto) and stmt.target == loop_exit:
+                    block[i] = BreakStmt(stmt.pc)
+                elif isinstance(stmt, IfStmt):
+                    pending.append(stmt.then_body)
+                    pending.append(stmt.else_body)
+
+    def _is_back_edge(self, src_pc, dst_pc):
+        block_of = self.cfg.block_of
+        return self.cfg.is_back_edge(block_of[src_pc], block_of[dst_pc])
+
+    def _structure(self, stmts, loop_exit, block_end=None, start=0, stop=None, labels=None):
+        # structures stmts[start:stop] without copying it, `labels` is the
+        # _label_index() of `stmts`; `block_end` is where control goes when
+        # falling off the end of the range, a jump there from the last
+        # statement does nothing
+        if stop is None:
+            stop = len(stmts)
+        if labels is None:
+            labels = _label_index(stmts)
+        out = []
+        # indexes of the labels in `out`, entries go stale when a loop takes
+        # over the end of `out`
+        out_labels = {}
+        i = start
+        while i < stop:
+            stmt = stmts[i]
+            if isinstance(stmt, (NumericFor, GenericFor)):
+                stmt.body = self._structure(stmt.body, stmt.end_pc + 1, stmt.end_pc)
+            elif isinstance(stmt, CondGoto):
+                matched = self._match_condition(stmts, labels, i, stop, out, out_labels,
+                    loop_exit, block_end)
+                if matched is not None:
+                    stmt, i = matched
+                    if isinstance(stmt, _IfElseMatch):
+                        stmt = self._if_chain(stmts, labels, stmt, loop_exit)
+                    out.append(stmt)
+                    continue
+            elif isinstance(stmt, Goto):
+                if stmt.target == loop_exit:
+                    stmt = BreakStmt(stmt.pc)
+                elif stmt.target == block_end and i == stop - 1:
+                    i += 1
+                    continue
+                elif stmt.target <= stmt.pc:
+                    loop = self._match_infinite_loop(stmt, out, out_labels)
+                    if loop is not None:
+                        stmt = loop
+            elif isinstance(stmt, Label):
+                out_labels[stmt.pc] = len(out)
+            out.append(stmt)
+            i += 1
+        return out
+
+    def _find_label(self, labels, pc, start, stop):
+        j = labels.get(pc)
+        if j is not None and start <= j < stop:
+            return j
+        return None
+
+    def _rfind_label(self, out, out_labels, pc):
+        j = out_labels.get(pc)
+        if j is not None and j < len(out) and isinstance(out[j], Label) and out[j].pc == pc:
+            return j
+        return None
+
+    def _match_infinite_loop(self, goto, out, out_labels):
+        j = self._rfind_label(out, out_labels, goto.target)
+        if j is None or not self._is_back_edge(goto.pc, goto.target):
+            return None
+        body = out[j + 1:]
+        del out[j + 1:]
+        self._convert_breaks(body, goto.pc + 1)
+        return WhileStmt(goto.target, Number(1), body)
+
+    def _match_condition(self, stmts, labels, i, stop, out, out_labels, loop_exit, block_end):
+        # (statement, next index) for the condition starting at stmts[i], if
+        # statements with an else branch come back as an _IfElseMatch
+        k = i
+        while k + 1 < stop and isinstance(stmts[k + 1], CondGoto):
+            k += 1
+        # the longest run of jumps that forms one short-circuit condition
+        for k in range(k, i - 1, -1):
+            chain = stmts[i:k + 1]
+            last = chain[-1]
+            after = last.pc + 1
+            if last.target <= last.pc:
+                if all(c.target in (last.target, after) for c in chain):
+                    return self._match_repeat(chain, out, out_labels, k + 1)
+            elif all(c.target in (after, last.target) for c in chain):
+                break
+        else:
+            return None
+
+        end = last.target
+        cond = fold_condition([(c.cond, c.target == after) for c in chain])
+        j = self._find_label(labels, end, k + 1, stop)
+        if j is None:
+            if end == block_end:
+                j = stop
+            elif loop_exit is not None and end == loop_exit and len(chain) == 1:
+                return IfStmt(last.pc, last.cond, [BreakStmt(last.pc)]), k + 1
+            else:
+                return None
+
+        tail = stmts[j - 1] if j > k + 1 else None
+        if isinstance(tail, Goto) and tail.target <= chain[0].pc and out \
+                and isinstance(out[-1], Label) and out[-1].pc == tail.target \
+                and self._is_back_edge(tail.pc, tail.target):
+            # while: the condition starts at the loop label, the body jumps back
+            body = self._structure(stmts, end, tail.target, k + 1, j - 1, labels)
+            return WhileStmt(tail.target, cond, body), j
+
+        if isinstance(tail, Goto) and tail.target > end and tail.target != loop_exit \
+                and j < stop:
+            merge = self.cfg.merge_pc(last.pc)
+            m = self._find_label(labels, tail.target, j + 1, stop)
+            if m is None and tail.target == block_end:
+                m = stop
+            if m is not None and (merge is None or merge == tail.target):
+                return _IfElseMatch(last.pc, cond, k + 1, j - 1, j + 1, m, tail.target), m
+
+        return IfStmt(last.pc, cond, self._structure(stmts, loop_exit, end, k + 1, j, labels)), j
+
+    def _if_chain(self, stmts, labels, match, loop_exit):
+        # an if/elseif/else chain: as long as an else branch is exactly one
+        # more if statement with an else branch it is taken apart here in a
+        # loop instead of by structuring the branch recursively
+        matches = []
+        while True:
+            matches.append(match)
+            start, stop, block_end = match.else_start, match.else_stop, match.block_end
+            else_body = None
+            if start < stop and isinstance(stmts[start], CondGoto):
+                # what _structure() of the else branch would match first
+                matched = self._match_condition(stmts, labels, start, stop, [], {},
+                    loop_exit, block_end)
+                if matched is not None:
+                    stmt, next_index = matched
+                    if isinstance(stmt, _IfElseMatch):
+                        if next_index == stop:
+                            match = stmt
+                            continue
+                        stmt = self._if_chain(stmts, labels, stmt, loop_exit)
+                    else_body = [stmt] + self._structure(stmts, loop_exit, block_end,
+                        next_index, stop, labels)
+            if else_body is None:
+                else_body = self._structure(stmts, loop_exit, block_end, start, stop, labels)
+            break
+
+        for match in reversed(matches):
+            then_body = self._structure(stmts, loop_exit, match.block_end, match.then_start,
+                match.then_stop, labels)
+            else_body = [IfStmt(match.pc, match.cond, then_body, else_body)]
+        return else_body[0]
+
+    def _match_repeat(self, chain, out, out_labels, next_index):
+        start = chain[-1].target
+        after = chain[-1].pc + 1
+        if any(c.target not in (start, after) for c in chain):
+            return None
+        j = self._rfind_label(out, out_labels, start)
+        if j is None or not self._is_back_edge(chain[-1].pc, start):
+            return None
+        body = out[j + 1:]
+        del out[j + 1:]
+        self._convert_breaks(body, after)
+        # the chain jumps back while the loop should go on
+        cond = fold_condition([(c.cond, c.target == start) for c in chain])
+        return RepeatStmt(start, body, negate(cond)), next_index
+
+#
+# the stack simulation
+#
+
+class _LocalSlot(object):
+    """Stack entry that holds a declared local variable."""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+class Lua4Decompiler(object):
+    """Decompile one chunk into a list of statements. `upvalue_names` are
+    the names of the values the enclosing OP_CLOSURE captured, in order.
+    With `structure` off the raw goto form is returned.
+    """
+    def __init__(self, chunk, upvalue_names=(), structure=True):
+        self.chunk = chunk
+        self.upvalue_names = list(upvalue_names)
+        self.structure = structure
+
+    def decompile(self):
+        chunk = self.chunk
+        code = decode_instructions(chunk.instruction).tolists()
+        self._code = code
+        self._strings = [TO_TEXT(s) for s in chunk.constants.string]
+        self._local_vars = chunk.local_var
+        self._next_local = 0
+        self._stack = []
+        self._block = []
+        self._blocks = []
+        self._pending_logic = {}
+        self._pending_values = {}
+        self._labels, self._value_jumps = self._scan_jumps(code)
+
+        # parameters (and `arg` for vararg functions) are live on entry
+        params = chunk.num_params + (1 if chunk.is_vararg else 0)
+        for _ in range(params):
+            self._stack.append(_LocalSlot(self._claim_local()))
+
+        handlers = self._handlers
+        opcodes = code.opcode
+        pc = 0
+        count = len(opcodes)
+        while pc < count:
+            self._enter_pc(pc)
+            pc = handlers[opcodes[pc]](self, pc)
+        while self._blocks:
+            # unterminated loop in corrupt code, close it anyway
+            self._close_block()
+        if self.structure:
+            return Lua4Structurer(build_cfg(code)).structure(self._block)
+        return self._block
+
+    def _scan_jumps(self, code):
+        labels = set()
+        value_jumps = {}
+        opcodes = code.opcode
+        S = code.S
+        count = len(opcodes)
+        # `PUSHNILJMP; PUSHINT 1` turns pending comparison jumps into a value
+        for pc in range(count - 1):
+            if opcodes[pc] == OPCODE.OP_PUSHNILJMP and opcodes[pc + 1] == OPCODE.OP_PUSHINT \
+                    and S[pc + 1] == 1:
+                value_jumps[pc] = (pc, False)
+                value_jumps[pc + 1] = (pc, True)
+        for pc in range(count):
+            op = opcodes[pc]
+            if OPCODE.OP_JMPNE <= op <= OPCODE.OP_JMPF or op == OPCODE.OP_JMP:
+                target = pc + 1 + S[pc]
+                if op != OPCODE.OP_JMP and target in value_jumps:
+                    continue
+                labels.add(target)
+        return labels, value_jumps
+
+    def _claim_local(self):
+        local_vars = self._local_vars
+        if self._next_local < len(local_vars):
+            name = TO_TEXT(local_vars[self._next_local].name)
+            self._next_local += 1
+            return name
+        self._next_local += 1
+        return '_local{0}'.format(self._next_local)
+
+    def _locals_starting(self, pc):
+        count = 0
+        local_vars = self._local_vars
+        i = self._next_local
+        while i < len(local_vars) and local_vars[i].start_pc <= pc:
+            count += 1
+            i += 1
+        return count
+
+    def _enter_pc(self, pc):
+        pending = self._pending_logic.pop(pc, None)
+        if pending:
+            for left, op in reversed(pending):
+                right = self._pop()
+                self._stack.append(BinOp(op, left, right))
+        new_locals = self._locals_starting(pc)
+        if new_locals:
+            self._declare_locals(pc, new_locals)
+        if pc in self._labels:
+            self._block.append(Label(pc))
+
+    def _declare_locals(self, pc, count):
+        stack = self._stack
+        while len(stack) < count:
+            stack.insert(0, NIL)
+        values = [Local(v.name) if isinstance(v, _LocalSlot) else v for v in stack[-count:]]
+        names = [self._claim_local() for _ in range(count)]
+        stack[-count:] = [_LocalSlot(name) for name in names]
+        self._block.append(LocalStmt(pc, names, values))
+
+    def _pop(self):
+        if not self._stack:
+            return Unknown('stack underflow')
+        value = self._stack.pop()
+        if isinstance(value, _LocalSlot):
+            return Local(value.name)
+        return value
+
+    def _pop_n(self, n):
+        values = [self._pop() for _ in range(n)]
+        values.reverse()
+        return values
+
+    def _take_from(self, base):
+        # all values from absolute stack position `base` to the top
+        values = self._pop_n(max(0, len(self._stack) - base))
+        return values
+
+    def _peek(self, depth):
+        stack = self._stack
+        if depth > len(stack) or depth <= 0:
+            return Unknown('stack underflow')
+        value = stack[-depth]
+        if isinstance(value, _LocalSlot):
+            return Local(value.name)
+        return value
+
+    def _local_name(self, slot):
+        stack = self._stack
+        if slot < len(stack) and isinstance(stack[slot], _LocalSlot):
+            return stack[slot].name
+        return '_slot{0}'.format(slot)
+
+    def _emit(self, stmt):
+        self._block.append(stmt)
+
+    def _open_block(self, stmt):
+        self._emit(stmt)
+        self._blocks.append((self._block, stmt))
+        self._block = stmt.body
+
+    def _close_block(self):
+        self._block, stmt = self._blocks.pop()
+        return stmt
+
+    #
+    # opcode handlers, each returns the next pc
+    #
+
+    def _op_end(self, pc):
+        return pc + 1
+
+    def _op_unknown(self, pc):
+        # an opcode Lua 4 does not define, from a corrupt file or another build
+        self._emit(UnknownStmt(pc, self._code.opcode[pc]))
+        return pc + 1
+
+    def _op_return(self, pc):
+        self._emit(ReturnStmt(pc, self._take_from(self._code.U[pc])))
+        return pc + 1
+
+    def _call(self, pc):
+        args = self._take_from(self._code.A[pc] + 1)
+        func = self._pop()
+        return Call(func, args)
+
+    def _op_call(self, pc):
+        call = self._call(pc)
+        results = self._code.B[pc]
+        if results == 0:
+            self._emit(CallStmt(pc, call))
+        elif results == 1 or results == MULT_RET:
+            self._stack.append(call)
+        elif self._locals_starting(pc + 1) >= results:
+            self._stack.extend(CallResult(call, i, results) for i in range(results))
+        else:
+            names = ['_r{0}_{1}'.format(pc, i + 1) for i in range(results)]
+            self._emit(LocalStmt(pc, names, [call]))
+            self._stack.extend(Local(name) for name in names)
+        return pc + 1
+
+    def _op_tailcall(self, pc):
+        # returns everything from B up, the values pushed below the called
+        # function come first
+        call = self._call(pc)
+        self._emit(ReturnStmt(pc, self._take_from(self._code.B[pc]) + [call]))
+        return pc + 1
+
+    def _op_pushnil(self, pc):
+        self._stack.extend([NIL] * max(1, self._code.U[pc]))
+        return pc + 1
+
+    def _op_pop(self, pc):
+        for value in self._pop_n(self._code.U[pc]):
+            if isinstance(value, Call):
+                self._emit(CallStmt(pc, value))
+        return pc + 1
+
+    def _op_pushint(self, pc):
+        self._stack.append(Number(self._code.S[pc]))
+        return pc + 1
+
+    def _op_pushstring(self, pc):
+        self._stack.append(String(self.chunk.constants.string[self._code.U[pc]]))
+        return pc + 1
+
+    def _op_pushnum(self, pc):
+        self._stack.append(Number(self.chunk.constants.number[self._code.U[pc]]))
+        return pc + 1
+
+    def _op_pushnegnum(self, pc):
+        self._stack.append(Number(-self.chunk.constants.number[self._code.U[pc]]))
+        return pc + 1
+
+    def _op_pushupvalue(self, pc):
+        u = self._code.U[pc]
+        names = self.upvalue_names
+        self._stack.append(Upvalue(names[u] if u < len(names) else '_upvalue{0}'.format(u)))
+        return pc + 1
+
+    def _op_getlocal(self, pc):
+        self._stack.append(Local(self._local_name(self._code.U[pc])))
+        return pc + 1
+
+    def _op_getglobal(self, pc):
+        self._stack.append(Global(self._strings[self._code.U[pc]]))
+        return pc + 1
+
+    def _op_gettable(self, pc):
+        key = self._pop()
+        self._stack.append(Index(self._pop(), key))
+        return pc + 1
+
+    def _op_getdotted(self, pc):
+        key = String(self.chunk.constants.string[self._code.U[pc]])
+        self._stack.append(Index(self._pop(), key))
+        return pc + 1
+
+    def _op_getindexed(self, pc):
+        key = Local(self._local_name(self._code.U[pc]))
+        self._stack.append(Index(self._pop(), key))
+        return pc + 1
+
+    def _op_pushself(self, pc):
+        receiver = self._pop()
+        key = String(self.chunk.constants.string[self._code.U[pc]])
+        self._stack.append(Index(receiver, key))
+        self._stack.append(SelfArg(receiver))
+        return pc + 1
+
+    def _op_createtable(self, pc):
+        self._stack.append(Table(self._code.U[pc]))
+        return pc + 1
+
+    def _op_setlocal(self, pc):
+        value = self._pop()
+        self._emit(AssignStmt(pc, Local(self._local_name(self._code.U[pc])), value))
+        return pc + 1
+
+    def _op_setglobal(self, pc):
+        self._emit(AssignStmt(pc, Global(self._strings[self._code.U[pc]]), self._pop()))
+        return pc + 1
+
+    def _op_settable(self, pc):
+        depth = self._code.A[pc]
+        table = self._peek(depth)
+        key = self._peek(depth - 1)
+        value = self._peek(1)
+        self._pop_n(self._code.B[pc])
+        self._emit(AssignStmt(pc, Index(table, key), value))
+        return pc + 1
+
+    def _op_setlist(self, pc):
+        values = self._pop_n(self._code.B[pc])
+        table = self._peek(1)
+        if isinstance(table, Table) and len(table.items) == self._code.A[pc] * LFIELDS_PER_FLUSH:
+            table.items.extend(values)
+        else:
+            base = self._code.A[pc] * LFIELDS_PER_FLUSH
+            for i, value in enumerate(values):
+                self._emit(AssignStmt(pc, Index(table, Number(base + i + 1)), value))
+        return pc + 1
+
+    def _op_setmap(self, pc):
+        values = self._pop_n(2 * self._code.U[pc])
+        table = self._peek(1)
+        pairs = list(zip(values[0::2], values[1::2]))
+        if isinstance(table, Table):
+            table.fields.extend(pairs)
+        else:
+            for key, value in pairs:
+                self._emit(AssignStmt(pc, Index(table, key), value))
+        return pc + 1
+
+    def _op_arith(self, pc):
+        right = self._pop()
+        left = self._pop()
+        self._stack.append(BinOp(ARITH_OPS[self._code.opcode[pc]], left, right))
+        return pc + 1
+
+    def _op_addi(self, pc):
+        value = self._code.S[pc]
+        left = self._pop()
+        if value < 0:
+            self._stack.append(BinOp('-', left, Number(-value)))
+        else:
+            self._stack.append(BinOp('+', left, Number(value)))
+        return pc + 1
+
+    def _op_concat(self, pc):
+        items = []
+        for value in self._pop_n(self._code.U[pc]):
+            if isinstance(value, Concat):
+                items.extend(value.items)
+            else:
+                items.append(value)
+        self._stack.append(Concat(items))
+        return pc + 1
+
+    def _op_minus(self, pc):
+        self._stack.append(Unary('-', self._pop()))
+        return pc + 1
+
+    def _op_not(self, pc):
+        self._stack.append(Unary('not', self._pop()))
+        return pc + 1
+
+    def _jump(self, pc, cond):
+        target = pc + 1 + self._code.S[pc]
+        value_jump = self._value_jumps.get(target)
+        if value_jump is not None:
+            pattern_pc, is_true = value_jump
+            self._pending_values.setdefault(pattern_pc, []).append((cond, is_true))
+        else:
+            self._emit(CondGoto(pc, cond, target))
+        return pc + 1
+
+    def _op_compare_jump(self, pc):
+        right = self._pop()
+        left = self._pop()
+        return self._jump(pc, BinOp(COMPARE_JUMPS[self._code.opcode[pc]], left, right))
+
+    def _op_jmpt(self, pc):
+        return self._jump(pc, self._pop())
+
+    def _op_jmpf(self, pc):
+        return self._jump(pc, negate(self._pop()))
+
+    def _op_jmpon(self, pc):
+        # `x and y` / `x or y`: x stays on the stack if the jump is taken,
+        # otherwise y replaces it, both paths meet at the jump target
+        op = 'or' if self._code.opcode[pc] == OPCODE.OP_JMPONT else 'and'
+        target = pc + 1 + self._code.S[pc]
+        self._pending_logic.setdefault(target, []).append((self._pop(), op))
+        return pc + 1
+
+    def _op_jmp(self, pc):
+        self._emit(Goto(pc, pc + 1 + self._code.S[pc]))
+        return pc + 1
+
+    def _op_pushniljmp(self, pc):
+        pending = self._pending_values.pop(pc, None)
+        if pending is None:
+            self._stack.append(NIL)
+            return pc + 1
+        self._stack.append(fold_condition(pending))
+        # skip the PUSHINT 1 of the true branch
+        return pc + 2
+
+    def _op_forprep(self, pc):
+        step = self._pop()
+        limit = self._pop()
+        start = self._pop()
+        var = self._claim_local()
+        self._claim_local()
+        self._claim_local()
+        self._stack.extend([_LocalSlot(var), _LocalSlot('(limit)'), _LocalSlot('(step)')])
+        self._open_block(NumericFor(pc, var, start, limit, step))
+        return pc + 1
+
+    def _op_lforprep(self, pc):
+        table = self._pop()
+        self._claim_local()
+        key = self._claim_local()
+        value = self._claim_local()
+        self._stack.extend([_LocalSlot('(table)'), _LocalSlot(key), _LocalSlot(value)])
+        self._open_block(GenericFor(pc, key, value, table))
+        return pc + 1
+
+    def _op_forloop(self, pc):
+        if self._blocks:
+            stmt = self._close_block()
+            stmt.end_pc = pc
+        del self._stack[-3:]
+        return pc + 1
+
+    def _op_closure(self, pc):
+        upvalues = self._pop_n(self._code.B[pc])
+        functions = self.chunk.constants.function
+        A = self._code.A[pc]
+        if A < len(functions):
+            self._stack.append(Closure(functions[A], upvalues))
+        else:
+            self._stack.append(Unknown('missing function {0}'.format(A)))
+        return pc + 1
+
+_HANDLERS = {
+    OPCODE.OP_END: Lua4Decompiler._op_end,
+    OPCODE.OP_RETURN: Lua4Decompiler._op_return,
+    OPCODE.OP_CALL: Lua4Decompiler._op_call,
+    OPCODE.OP_TAILCALL: Lua4Decompiler._op_tailcall,
+    OPCODE.OP_PUSHNIL: Lua4Decompiler._op_pushnil,
+    OPCODE.OP_POP: Lua4Decompiler._op_pop,
+    OPCODE.OP_PUSHINT: Lua4Decompiler._op_pushint,
+    OPCODE.OP_PUSHSTRING: Lua4Decompiler._op_pushstring,
+    OPCODE.OP_PUSHNUM: Lua4Decompiler._op_pushnum,
+    OPCODE.OP_PUSHNEGNUM: Lua4Decompiler._op_pushnegnum,
+    OPCODE.OP_PUSHUPVALUE: Lua4Decompiler._op_pushupvalue,
+    OPCODE.OP_GETLOCAL: Lua4Decompiler._op_getlocal,
+    OPCODE.OP_GETGLOBAL: Lua4Decompiler._op_getglobal,
+    OPCODE.OP_GETTABLE: Lua4Decompiler._op_gettable,
+    OPCODE.OP_GETDOTTED: Lua4Decompiler._op_getdotted,
+    OPCODE.OP_GETINDEXED: Lua4Decompiler._op_getindexed,
+    OPCODE.OP_PUSHSELF: Lua4Decompiler._op_pushself,
+    OPCODE.OP_CREATETABLE: Lua4Decompiler._op_createtable,
+    OPCODE.OP_SETLOCAL: Lua4Decompiler._op_setlocal,
+    OPCODE.OP_SETGLOBAL: Lua4Decompiler._op_setglobal,
+    OPCODE.OP_SETTABLE: Lua4Decompiler._op_settable,
+    OPCODE.OP_SETLIST: Lua4Decompiler._op_setlist,
+    OPCODE.OP_SETMAP: Lua4Decompiler._op_setmap,
+    OPCODE.OP_ADD: Lua4Decompiler._op_arith,
+    OPCODE.OP_ADDI: Lua4Decompiler._op_addi,
+    OPCODE.OP_SUB: Lua4Decompiler._op_arith,
+    OPCODE.OP_MULT: Lua4Decompiler._op_arith,
+    OPCODE.OP_DIV: Lua4Decompiler._op_arith,
+    OPCODE.OP_POW: Lua4Decompiler._op_arith,
+    OPCODE.OP_CONCAT: Lua4Decompiler._op_concat,
+    OPCODE.OP_MINUS: Lua4Decompiler._op_minus,
+    OPCODE.OP_NOT: Lua4Decompiler._op_not,
+    OPCODE.OP_JMPNE: Lua4Decompiler._op_compare_jump,
+    OPCODE.OP_JMPEQ: Lua4Decompiler._op_compare_jump,
+    OPCODE.OP_JMPLT: Lua4Decompiler._op_compare_jump,
+    OPCODE.OP_JMPLE: Lua4Decompiler._op_compare_jump,
+    OPCODE.OP_JMPGT: Lua4Decompiler._op_compare_jump,
+    OPCODE.OP_JMPGE: Lua4Decompiler._op_compare_jump,
+    OPCODE.OP_JMPT: Lua4Decompiler._op_jmpt,
+    OPCODE.OP_JMPF: Lua4Decompiler._op_jmpf,
+    OPCODE.OP_JMPONT: Lua4Decompiler._op_jmpon,
+    OPCODE.OP_JMPONF: Lua4Decompiler._op_jmpon,
+    OPCODE.OP_JMP: Lua4Decompiler._op_jmp,
+    OPCODE.OP_PUSHNILJMP: Lua4Decompiler._op_pushniljmp,
+    OPCODE.OP_FORPREP: Lua4Decompiler._op_forprep,
+    OPCODE.OP_FORLOOP: Lua4Decompiler._op_forloop,
+    OPCODE.OP_LFORPREP: Lua4Decompiler._op_lforprep,
+    OPCODE.OP_LFORLOOP: Lua4Decompiler._op_forloop,
+    OPCODE.OP_CLOSURE: Lua4Decompiler._op_closure,
+}
+# indexed by the raw opcode
+Lua4Decompiler._handlers = [_HANDLERS.get(op, Lua4Decompiler._op_unknown)
+    for op in range(NUM_OPCODE_VALUES)]
+
+def decompile_chunk(chunk, upvalue_names=()):
+    return Lua4Decompiler(chunk, upvalue_names).decompile()
+
+def render_chunk(chunk, indent=0):
+    return render_block(decompile_chunk(chunk), indent, [])
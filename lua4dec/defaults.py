@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Default settings shared by the library and the command line tools, with no
+# imports so lua4dec.scripts can build their argument parsers without
+# loading the modules that use them.
+
+# files handed to a worker process at a time by batch jobs
+DEFAULT_CHUNKSIZE           = 16
+
+# Lua4Limits: generous bounds for real byte code that still stop hostile
+# files early
+DEFAULT_MAX_DEPTH           = 200
+DEFAULT_MAX_INSTRUCTIONS    = 1 << 26
+DEFAULT_MAX_STRING_BYTES    = 1 << 30
+
+# DecompileCache
+DEFAULT_CACHE_SIZE          = 512 * 1024 * 1024
+
+# lua4dec.export output formats
+FORMAT_CSV                  = 'csv'
+FORMAT_JSONL                = 'jsonl'
+FORMAT_PARQUET              = 'parquet'
+FORMAT_ARROW                = 'arrow'
+EXPORT_FORMATS              = (FORMAT_CSV, FORMAT_JSONL, FORMAT_PARQUET, FORMAT_ARROW)
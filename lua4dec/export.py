@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import csv
+import io
+import json
+import os
+
+from lua4dec.decoder import decode_instructions
+from lua4dec.opcodes import OPCODE_FIELD_NAMES, NUM_OPCODES, NUM_OPCODE_VALUES, S_OPCODES, \
+    AB_OPCODES, OP_END, OP_GETTABLE, OP_ADD, OP_SUB, OP_MULT, OP_DIV, OP_POW, OP_MINUS, \
+    OP_NOT, OP_PUSHNILJMP, OP_PUSHSTRING, OP_GETGLOBAL, OP_SETGLOBAL, OP_GETDOTTED, \
+    OP_PUSHSELF, OP_PUSHNUM, OP_PUSHNEGNUM, OP_GETLOCAL, OP_SETLOCAL, OP_GETINDEXED
+from lua4dec.stats import NULL_STATS, PHASE_DECODE, PHASE_FORMAT
+from lua4dec.util import TO_TEXT
+from lua4dec.defaults import FORMAT_CSV, FORMAT_JSONL, FORMAT_PARQUET, FORMAT_ARROW, EXPORT_FORMATS
+
+# Columnar export of the disassembly for analytics. Every file turns into
+# rows of four tables, all keyed by the file name and the chunk path (see
+# lua4dec.incremental.format_path):
+#
+#   chunks          one row per prototype with its header fields and counts
+#   instructions    one row per instruction, with the operands that apply to
+#                   its opcode, the source line and the resolved constant
+#   constants       string and number constants by chunk and index
+#   locals          local variable names and pc ranges by chunk and index
+#
+# Rows are produced a chunk at a time as column lists and collected by a
+# table writer until `batch_rows` of them are pending, which are then
+# written in one block: CSV and JSON Lines with the standard library,
+# Parquet and Arrow IPC files through pyarrow when it is installed.
+
+TABLE_CHUNKS        = 'chunks'
+TABLE_INSTRUCTIONS  = 'instructions'
+TABLE_CONSTANTS     = 'constants'
+TABLE_LOCALS        = 'locals'
+TABLES              = (TABLE_CHUNKS, TABLE_INSTRUCTIONS, TABLE_CONSTANTS, TABLE_LOCALS)
+
+# (column, type) of every table, the types are 'str', 'int', 'float' and
+# 'bool' and every column may be empty
+SCHEMAS = {
+    TABLE_CHUNKS: (
+        ('file', 'str'), ('chunk', 'str'), ('source', 'str'), ('line_number', 'int'),
+        ('num_params', 'int'), ('is_vararg', 'bool'), ('max_stack_size', 'int'),
+        ('locals', 'int'), ('strings', 'int'), ('numbers', 'int'), ('functions', 'int'),
+        ('instructions', 'int'),
+    ),
+    TABLE_INSTRUCTIONS: (
+        ('file', 'str'), ('chunk', 'str'), ('pc', 'int'), ('line', 'int'), ('opcode', 'str'),
+        ('A', 'int'), ('B', 'int'), ('U', 'int'), ('S', 'int'), ('constant', 'str'),
+        ('instruction', 'int'),
+    ),
+    TABLE_CONSTANTS: (
+        ('file', 'str'), ('chunk', 'str'), ('kind', 'str'), ('index', 'int'), ('string', 'str'),
+        ('number', 'float'),
+    ),
+    TABLE_LOCALS: (
+        ('file', 'str'), ('chunk', 'str'), ('index', 'int'), ('name', 'str'),
+        ('start_pc', 'int'), ('end_pc', 'int'),
+    ),
+}
+
+DEFAULT_BATCH_ROWS  = 65536
+
+MAX_INT             = 0x7FFFFFFF
+
+ARGS_NONE           = 0
+ARGS_U              = 1
+ARGS_S              = 2
+ARGS_AB             = 3
+
+_NO_ARGS = (OP_END, OP_GETTABLE, OP_ADD, OP_SUB, OP_MULT, OP_DIV, OP_POW, OP_MINUS, OP_NOT,
+    OP_PUSHNILJMP)
+# argument type of every value of the opcode field, see the table in
+# lua4dec.lua_lang; the opcodes Lua 4 does not define have none
+ARG_TYPES = tuple(ARGS_AB if op in AB_OPCODES else ARGS_S if op in S_OPCODES else
+    ARGS_NONE if op in _NO_ARGS or op >= NUM_OPCODES else ARGS_U
+    for op in range(NUM_OPCODE_VALUES))
+
+# what the U argument of an opcode refers to, for the constant column
+_REF_NONE       = 0
+_REF_STRING     = 1
+_REF_NUMBER     = 2
+_REF_NEGNUMBER  = 3
+_REF_LOCAL      = 4
+
+_REFS = [_REF_NONE] * NUM_OPCODE_VALUES
+for _op in (OP_PUSHSTRING, OP_GETGLOBAL, OP_SETGLOBAL, OP_GETDOTTED, OP_PUSHSELF):
+    _REFS[_op] = _REF_STRING
+_REFS[OP_PUSHNUM] = _REF_NUMBER
+_REFS[OP_PUSHNEGNUM] = _REF_NEGNUMBER
+for _op in (OP_GETLOCAL, OP_SETLOCAL, OP_GETINDEXED):
+    _REFS[_op] = _REF_LOCAL
+_REFS = tuple(_REFS)
+
+def pc_lines(chunk):
+    """Source line of every instruction of `chunk`, decoded from its line
+    info the way luaG_getline() does, or None for all of them when the chunk
+    has no line info.
+    """
+    count = len(chunk.instruction)
+    lines = [None] * count
+    line = 0
+    pc = 0
+    current = None
+    for entry in chunk.line_info:
+        if entry < 0:
+            # a run of lines without code
+            line -= entry
+        elif entry < MAX_INT:
+            line += 1
+            start = min(entry, count)
+            if start > pc:
+                lines[pc:start] = [current] * (start - pc)
+                pc = start
+            current = line
+    if pc < count:
+        lines[pc:] = [current] * (count - pc)
+    return lines
+
+def _resolve_constants(chunk, opcodes, U):
+    # the referenced values are converted to text once per chunk
+    tables = {
+        _REF_STRING:    [TO_TEXT(v) for v in chunk.constants.string],
+        _REF_NUMBER:    [str(v) for v in chunk.constants.number],
+        _REF_NEGNUMBER: [str(-v) for v in chunk.constants.number],
+        _REF_LOCAL:     [TO_TEXT(lv.name) for lv in chunk.local_var],
+    }
+    refs = _REFS
+    constant = [None] * len(opcodes)
+    for pc, op in enumerate(opcodes):
+        ref = refs[op]
+        if ref:
+            values = tables[ref]
+            k = U[pc]
+            if k < len(values):
+                constant[pc] = values[k]
+    return constant
+
+def chunk_batches(chunk, file_name, chunk_name, stats=NULL_STATS):
+    """(table, columns) for the rows of one chunk's own data, not including
+    its nested chunks, `columns` being one list per column of the table's
+    schema. Tables without rows for the chunk are left out.
+    """
+    constants = chunk.constants
+    instruction = chunk.instruction
+    count = len(instruction)
+    yield TABLE_CHUNKS, [[file_name], [chunk_name], [TO_TEXT(chunk.source)], [chunk.line_number],
+        [chunk.num_params], [bool(chunk.is_vararg)], [chunk.max_stack_size],
+        [len(chunk.local_var)], [len(constants.string)], [len(constants.number)],
+        [len(constants.function)], [count]]
+
+    if count:
+        with stats.phase(PHASE_DECODE):
+            code = decode_instructions(instruction).tolists()
+            stats.opcodes(code.opcode)
+        opcodes = code.opcode
+        arg_types = [ARG_TYPES[op] for op in opcodes]
+        yield TABLE_INSTRUCTIONS, [
+            [file_name] * count,
+            [chunk_name] * count,
+            list(range(count)),
+            pc_lines(chunk),
+            [OPCODE_FIELD_NAMES[op] for op in opcodes],
+            [a if t == ARGS_AB else None for a, t in zip(code.A, arg_types)],
+            [b if t == ARGS_AB else None for b, t in zip(code.B, arg_types)],
+            [u if t == ARGS_U else None for u, t in zip(code.U, arg_types)],
+            [s if t == ARGS_S else None for s, t in zip(code.S, arg_types)],
+            _resolve_constants(chunk, opcodes, code.U),
+            code.instruction,
+        ]
+
+    strings = constants.string
+    numbers = constants.number
+    total = len(strings) + len(numbers)
+    if total:
+        yield TABLE_CONSTANTS, [
+            [file_name] * total,
+            [chunk_name] * total,
+            ['string'] * len(strings) + ['number'] * len(numbers),
+            list(range(len(strings))) + list(range(len(numbers))),
+            [TO_TEXT(s) for s in strings] + [None] * len(numbers),
+            [None] * len(strings) + list(numbers),
+        ]
+
+    local_var = chunk.local_var
+    if local_var:
+        yield TABLE_LOCALS, [
+            [file_name] * len(local_var),
+            [chunk_name] * len(local_var),
+            list(range(len(local_var))),
+            [TO_TEXT(lv.name) for lv in local_var],
+            [lv.start_pc for lv in local_var],
+            [lv.end_pc for lv in local_var],
+        ]
+
+def file_batches(lua_file, file_name=None, stats=NULL_STATS):
+    """chunk_batches() of every chunk of `lua_file` in listing order.
+    `file_name` defaults to the main chunk's source.
+    """
+    from lua4dec.incremental import format_path
+
+    code_chunk = lua_file.code_chunk
+    if file_name is None:
+        file_name = TO_TEXT(code_chunk.source)
+    pending = [(code_chunk, ())]
+    while pending:
+        chunk, path = pending.pop()
+        for batch in chunk_batches(chunk, file_name, format_path(path), stats):
+            yield batch
+        functions = chunk.constants.function
+        for i in range(len(functions) - 1, -1, -1):
+            pending.append((functions[i], path + (i,)))
+
+class TableWriter(object):
+    """Collects column batches of one table and hands them to _write() in
+    blocks of at least `batch_rows` rows.
+    """
+    def __init__(self, table, batch_rows=DEFAULT_BATCH_ROWS):
+        self.table = table
+        self.columns = [name for name, _ in SCHEMAS[table]]
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self._pending = [[] for _ in self.columns]
+        self._pending_rows = 0
+
+    def write_batch(self, columns):
+        for pending, column in zip(self._pending, columns):
+            pending.extend(column)
+        count = len(columns[0])
+        self._pending_rows += count
+        self.rows += count
+        if self._pending_rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if self._pending_rows:
+            pending = self._pending
+            self._pending = [[] for _ in self.columns]
+            self._pending_rows = 0
+            self._write(pending)
+
+    def close(self):
+        self.flush()
+
+    def _write(self, columns):
+        raise NotImplementedError()
+
+class CSVTableWriter(TableWriter):
+    """CSV with a header line, empty fields for missing values."""
+    def __init__(self, table, out_stream, batch_rows=DEFAULT_BATCH_ROWS, header=True):
+        super(CSVTableWriter, self).__init__(table, batch_rows)
+        self.out_stream = out_stream
+        self._header = header
+
+    def _write(self, columns):
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        if self._header:
+            writer.writerow(self.columns)
+            self._header = False
+        writer.writerows(zip(*columns))
+        self.out_stream.write(buf.getvalue())
+
+class JSONLinesTableWriter(TableWriter):
+    """One JSON object per row. With `tag` every object also gets a "table"
+    member so several tables can share one stream.
+    """
+    def __init__(self, table, out_stream, batch_rows=DEFAULT_BATCH_ROWS, tag=False):
+        super(JSONLinesTableWriter, self).__init__(table, batch_rows)
+        self.out_stream = out_stream
+        self._tag = tag
+        self._encode = json.JSONEncoder(separators=(',', ':')).encode
+
+    def _write(self, columns):
+        names = self.columns
+        encode = self._encode
+        if self._tag:
+            names = ['table'] + names
+            columns = [[self.table] * len(columns[0])] + columns
+        self.out_stream.write(''.join(encode(dict(zip(names, row))) + '\n'
+            for row in zip(*columns)))
+
+def dump_table(lua_file, out_stream, table=TABLE_INSTRUCTIONS, export_format=FORMAT_CSV,
+        stats=NULL_STATS, batch_rows=DEFAULT_BATCH_ROWS):
+    """Write one table of a single file to `out_stream` as CSV or JSON Lines."""
+    if export_format == FORMAT_CSV:
+        writer = CSVTableWriter(table, out_stream, batch_rows)
+    else:
+        writer = JSONLinesTableWriter(table, out_stream, batch_rows)
+    with stats.phase(PHASE_FORMAT):
+        for batch_table, columns in file_batches(lua_file, None, stats):
+            if batch_table == table:
+                writer.write_batch(columns)
+        writer.close()
+
+def dump_tables(lua_file, out_stream, stats=NULL_STATS, batch_rows=DEFAULT_BATCH_ROWS):
+    """Write every table of a single file to `out_stream` as JSON Lines, each
+    object tagged with its table.
+    """
+    writers = dict((table, JSONLinesTableWriter(table, out_stream, batch_rows, tag=True))
+        for table in TABLES)
+    with stats.phase(PHASE_FORMAT):
+        for table, columns in file_batches(lua_file, None, stats):
+            writers[table].write_batch(columns)
+        for table in TABLES:
+            writers[table].close()
+
+_pyarrow = None
+
+def _get_pyarrow():
+    global _pyarrow
+    if _pyarrow is None:
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('pyarrow is required for the parquet and arrow export formats')
+        _pyarrow = pyarrow
+    return _pyarrow
+
+def arrow_schema(table):
+    pa = _get_pyarrow()
+    types = {'str': pa.string(), 'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_()}
+    return pa.schema([(name, types[kind]) for name, kind in SCHEMAS[table]])
+
+class ArrowTableWriter(TableWriter):
+    """Parquet file, or with `ipc` an Arrow IPC file, written one record
+    batch (row group) per block.
+    """
+    def __init__(self, table, path, batch_rows=DEFAULT_BATCH_ROWS, ipc=False):
+        super(ArrowTableWriter, self).__init__(table, batch_rows)
+        pa = _get_pyarrow()
+        self.schema = arrow_schema(table)
+        if ipc:
+            self._writer = pa.ipc.new_file(path, self.schema)
+        else:
+            self._writer = pa.parquet.ParquetWriter(path, self.schema)
+
+    def _write(self, columns):
+        pa = _get_pyarrow()
+        self._writer.write_table(pa.Table.from_arrays(
+            [pa.array(c, type=f.type) for c, f in zip(columns, self.schema)], schema=self.schema))
+
+    def close(self):
+        try:
+            super(ArrowTableWriter, self).close()
+        finally:
+            self._writer.close()
+
+_EXTENSIONS = {
+    FORMAT_CSV:         '.csv',
+    FORMAT_JSONL:       '.jsonl',
+    FORMAT_PARQUET:     '.parquet',
+    FORMAT_ARROW:       '.arrow',
+}
+
+class Lua4Exporter(object):
+    """Writes the tables of any number of files into `dest_dir`, one file
+    per table named after it, e.g. instructions.csv. Use add() for every
+    file and close() (or a with block) at the end.
+    """
+    def __init__(self, dest_dir, export_format=FORMAT_CSV, batch_rows=DEFAULT_BATCH_ROWS,
+            stats=NULL_STATS):
+        if export_format not in _EXTENSIONS:
+            raise ValueError('unknown export format: {0!r}'.format(export_format))
+        if export_format in (FORMAT_PARQUET, FORMAT_ARROW):
+            # fail before creating anything
+            _get_pyarrow()
+        self.dest_dir = dest_dir
+        self.export_format = export_format
+        self.batch_rows = batch_rows
+        self.stats = stats
+        self.files = 0
+        self._writers = {}
+        self._streams = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def path(self, table):
+        return os.path.join(self.dest_dir, table + _EXTENSIONS[self.export_format])
+
+    def _writer(self, table):
+        writer = self._writers.get(table)
+        if writer is None:
+            if not os.path.isdir(self.dest_dir):
+                os.makedirs(self.dest_dir, exist_ok=True)
+            path = self.path(table)
+            if self.export_format in (FORMAT_PARQUET, FORMAT_ARROW):
+                writer = ArrowTableWriter(table, path, self.batch_rows,
+                    self.export_format == FORMAT_ARROW)
+            else:
+                out_f = open(path, 'w', newline='', encoding='utf-8')
+                self._streams.append(out_f)
+                if self.export_format == FORMAT_CSV:
+                    writer = CSVTableWriter(table, out_f, self.batch_rows)
+                else:
+                    writer = JSONLinesTableWriter(table, out_f, self.batch_rows)
+            self._writers[table] = writer
+        return writer
+
+    def add(self, lua_file, file_name=None):
+        with self.stats.phase(PHASE_FORMAT):
+            for table, columns in file_batches(lua_file, file_name, self.stats):
+                self._writer(table).write_batch(columns)
+        self.files += 1
+
+    def rows(self):
+        """Rows written so far by table."""
+        return dict((table, writer.rows) for table, writer in self._writers.items())
+
+    def close(self):
+        try:
+            for writer in self._writers.values():
+                writer.close()
+        finally:
+            for out_f in self._streams:
+                out_f.close()
+            self._streams = []
+
+def export_corpus(patterns, dest_dir, export_format=FORMAT_CSV, engine=None, stats=NULL_STATS,
+        limits=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """Export every file matched by `patterns` (see batch.find_sources())
+    into the tables in `dest_dir`. Files that fail to parse are skipped;
+    returns the Lua4Exporter and a list of (source, error) for them.
+    """
+    from lua4dec.batch import find_sources
+    from lua4dec.loader import load_file, DEFAULT_ENGINE
+
+    failures = []
+    with Lua4Exporter(dest_dir, export_format, batch_rows, stats) as exporter:
+        for source, rel_path in find_sources(patterns):
+            try:
+                lua_file = load_file(source, engine or DEFAULT_ENGINE, stats, limits=limits)
+            except Exception as err:
+                failures.append((source, '{0}: {1}'.format(type(err).__name__, err)))
+                continue
+            exporter.add(lua_file, source)
+    return exporter, failures
@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+import struct
+import sys
+
+from lua4dec.model import Container, Lua4Chunk, Lua4Constants, Lua4LocalVar
+from lua4dec.variant import Lua4Variant, Lua4VariantError, DEFAULT_VARIANT, get_decoder
+
+from lua4dec.stats import NULL_STATS, PHASE_HEADER, PHASE_CHUNK, COUNT_BYTES, \
+    COUNT_CHUNKS, COUNT_INSTRUCTIONS
+from lua4dec.defaults import DEFAULT_MAX_DEPTH, DEFAULT_MAX_INSTRUCTIONS, DEFAULT_MAX_STRING_BYTES
+
+# struct/memoryview based parser that produces the same logical model as the
+# construct definitions in lua4dec.parser, minus the per-element overhead.
+# Instructions, line info and number constants are read in bulk into
+# array.array objects and chunks are built from the compact lua4dec.model
+# classes; only the header and self check stay Containers. The self check
+# selects the lua4dec.variant decoder every later read goes through.
+#
+# Nothing in the input is trusted: every length prefix is checked against
+# the bytes that are left before anything is allocated or looped over, using
+# the smallest size an element of that array can have, and a Lua4Limits caps
+# the nesting depth and the total instructions and string bytes of a file.
+# Both fail with a Lua4FormatError pointing at the offending field.
+
+LUA4_SIGNATURE      = b'\x1bLua'
+
+_HEADER             = struct.Struct('<4sBB')
+# the self check up to the test number, whose size and byte order it gives
+_SELF_CHECK_SIZES   = struct.Struct('<BBBBBBB')
+
+class Lua4FormatError(ValueError):
+    """Raised when the byte code does not match the Lua4 file layout. `offset`
+    is the position in the input where the problem was found.
+    """
+    def __init__(self, message, offset):
+        super(Lua4FormatError, self).__init__(
+            '{0} (at offset 0x{1:X})'.format(message, offset))
+        self.message = message
+        self.offset = offset
+
+    def __reduce__(self):
+        # args only holds the formatted text, rebuild from the parts so the
+        # error survives being sent back from a worker process
+        return type(self), (self.message, self.offset)
+
+class Lua4LimitError(Lua4FormatError):
+    """Raised when a file is well formed so far but exceeds a Lua4Limits."""
+
+class Lua4Limits(object):
+    """Resource limits for parsing one file: the deepest chunk nesting and
+    the total number of instructions and string bytes over all chunks. None
+    disables a limit.
+    """
+    __slots__ = ('max_depth', 'max_instructions', 'max_string_bytes')
+
+    def __init__(self, max_depth=DEFAULT_MAX_DEPTH, max_instructions=DEFAULT_MAX_INSTRUCTIONS,
+            max_string_bytes=DEFAULT_MAX_STRING_BYTES):
+        self.max_depth = max_depth
+        self.max_instructions = max_instructions
+        self.max_string_bytes = max_string_bytes
+
+    def __repr__(self):
+        return 'Lua4Limits(max_depth={0!r}, max_instructions={1!r}, max_string_bytes={2!r})'.format(
+            self.max_depth, self.max_instructions, self.max_string_bytes)
+
+DEFAULT_LIMITS  = Lua4Limits()
+NO_LIMITS       = Lua4Limits(None, None, None)
+
+def _limit(value):
+    return sys.maxsize if value is None else value
+
+class Lua4ChunkLayout(object):
+    """Byte offsets of the sections of one chunk, as recorded by
+    Lua4FastParser.scan_chunk(). Each section offset points at the section's
+    length prefix. Chunks are numbered in file (pre-)order and `path` is the
+    list of indexes into constants.function leading to this chunk.
+    """
+    __slots__ = ('index', 'path', 'parent', 'children', 'start', 'local_var',
+        'line_info', 'string', 'number', 'function', 'instruction', 'end')
+
+    def __init__(self, index, path, parent, start):
+        self.index = index
+        self.path = path
+        self.parent = parent
+        self.children = []
+        self.start = start
+
+    def __repr__(self):
+        return '<Lua4ChunkLayout #{0} path={1} 0x{2:X}-0x{3:X}>'.format(
+            self.index, list(self.path), self.start, self.end)
+
+class Lua4FastParser(object):
+    def __init__(self, data, stats=NULL_STATS, strings=None, limits=None):
+        self._view = memoryview(data)
+        self._size = len(self._view)
+        self.offset = 0
+        self.stats = stats
+        self._depth = 0
+        self.set_limits(limits)
+        # optional lua4dec.interning.StringTable every decoded string goes through
+        self._intern = strings.intern if strings is not None else None
+        self._little_endian = True
+        self.use_variant(DEFAULT_VARIANT)
+
+    def use_variant(self, variant):
+        """Read everything after the self check as the given Lua4Variant."""
+        self.variant = variant
+        decoder = self._decoder = get_decoder(variant)
+        self._int = decoder.int
+        self._size_t = decoder.size_t
+        self._chunk_info = decoder.chunk_info
+        self._local_var_pcs = decoder.local_var_pcs
+        # smallest possible encoding of an element of each array
+        self._min_local_var = variant.size_t + decoder.local_var_pcs.size
+        self._min_chunk = variant.size_t + decoder.chunk_info.size + 6 * variant.size_int
+
+    def set_limits(self, limits=None):
+        """Enforce a Lua4Limits (default DEFAULT_LIMITS) from here on, with
+        fresh instruction and string byte budgets.
+        """
+        self.limits = limits = DEFAULT_LIMITS if limits is None else limits
+        self._max_depth = _limit(limits.max_depth)
+        self._instruction_budget = _limit(limits.max_instructions)
+        self._string_budget = _limit(limits.max_string_bytes)
+
+    def _check_depth(self, depth):
+        if depth > self._max_depth:
+            raise Lua4LimitError('chunk nesting deeper than {0}'.format(self._max_depth),
+                self.offset)
+
+    def _charge_instructions(self, count, offset):
+        self._instruction_budget -= count
+        if self._instruction_budget < 0:
+            raise Lua4LimitError('more than {0} instructions'.format(
+                self.limits.max_instructions), offset)
+
+    def release(self):
+        self._view.release()
+
+    def parse(self):
+        self.offset = 0
+        stats = self.stats
+        with stats.phase(PHASE_HEADER):
+            header = self.read_header()
+            self_check = self.read_self_check()
+        with stats.phase(PHASE_CHUNK):
+            code_chunk = self.read_chunk()
+        stats.count(COUNT_BYTES, self.offset)
+        return Container(header=header, self_check=self_check, code_chunk=code_chunk)
+
+    def _require(self, length):
+        end = self.offset + length
+        if length < 0 or end > self._size:
+            raise Lua4FormatError('unexpected end of data reading {0} bytes'.format(length),
+                self.offset)
+        return end
+
+    def _unpack(self, st):
+        self._require(st.size)
+        value = st.unpack_from(self._view, self.offset)
+        self.offset += st.size
+        return value
+
+    def _read_int(self):
+        return self._unpack(self._int)[0]
+
+    def _read_size(self):
+        return self._unpack(self._size_t)[0]
+
+    def _read_count(self, item_size=1):
+        """Read an array length, making sure `item_size` bytes per element
+        are left.
+        """
+        offset = self.offset
+        count = self._read_int()
+        if count < 0:
+            raise Lua4FormatError('negative array length {0}'.format(count), offset)
+        if count * item_size > self._size - self.offset:
+            raise Lua4FormatError('array length {0} needs at least {1} bytes, {2} left'.format(
+                count, count * item_size, self._size - self.offset), offset)
+        return count
+
+    def _read_array(self, typecode, count):
+        value = array.array(typecode)
+        end = self._require(count * value.itemsize)
+        value.frombytes(self._view[self.offset:end])
+        if self._decoder.byteswap:
+            value.byteswap()
+        self.offset = end
+        return value
+
+    def _skip_fixed(self, item_size):
+        count = self._read_count(item_size)
+        self.offset += count * item_size
+        return count
+
+    def _read_string_length(self):
+        # size_t is signed in the definitions, 0 is the NULL string
+        offset = self.offset
+        length = self._read_size()
+        if length < 0:
+            raise Lua4FormatError('negative string length {0}'.format(length), offset)
+        return length
+
+    def _skip_string(self):
+        length = self._read_string_length()
+        if length > 0:
+            self.offset = self._require(length)
+        return length
+
+    def _scan_string(self):
+        # _skip_string() charged to the string byte budget
+        offset = self.offset
+        length = self._skip_string()
+        if length > 0:
+            self._string_budget -= length
+            if self._string_budget < 0:
+                raise Lua4LimitError('more than {0} string bytes'.format(
+                    self.limits.max_string_bytes), offset)
+
+    def read_string(self):
+        offset = self.offset
+        length = self._read_string_length()
+        if length == 0:
+            return b''
+        end = self._require(length)
+        self._string_budget -= length
+        if self._string_budget < 0:
+            raise Lua4LimitError('more than {0} string bytes'.format(
+                self.limits.max_string_bytes), offset)
+        value = self._view[self.offset:end - 1].tobytes()
+        self.offset = end
+        if self._intern is not None:
+            return self._intern(value)
+        return value
+
+    def read_header(self):
+        signature, version, little_endian = self._unpack(_HEADER)
+        if signature != LUA4_SIGNATURE:
+            raise Lua4FormatError('bad signature {0!r}'.format(signature), 0)
+        self._little_endian = bool(little_endian)
+        return Container(
+            format_id=0x1B,
+            version=version,
+            little_endian=bool(little_endian),
+        )
+
+    def read_self_check(self):
+        """Read the self check and switch to the variant it describes."""
+        offset = self.offset
+        fields = self._unpack(_SELF_CHECK_SIZES)
+        self_check = Container(
+            size_int=fields[0],
+            size_t=fields[1],
+            size_instruction=fields[2],
+            test_size_instruction=fields[3],
+            test_size_op=fields[4],
+            test_size_b=fields[5],
+            size_number=fields[6],
+        )
+        try:
+            variant = Lua4Variant.from_header(Container(little_endian=self._little_endian),
+                self_check)
+        except Lua4VariantError as err:
+            raise Lua4FormatError(str(err), offset)
+        self.use_variant(variant)
+        self_check.test_fp_number = self._unpack(self._decoder.number)[0]
+        return self_check
+
+    def read_chunk_info(self):
+        """Source and the fixed size fields that start a chunk, as a tuple of
+        (source, line_number, num_params, is_vararg, max_stack_size).
+        """
+        source = self.read_string()
+        line_number, num_params, is_vararg, max_stack_size = self._unpack(self._chunk_info)
+        return source, line_number, num_params, bool(is_vararg), max_stack_size
+
+    def read_local_vars(self):
+        local_var = []
+        for _ in range(self._read_count(self._min_local_var)):
+            name = self.read_string()
+            start_pc, end_pc = self._unpack(self._local_var_pcs)
+            local_var.append(Lua4LocalVar(name, start_pc, end_pc))
+        return local_var
+
+    def read_line_info(self):
+        decoder = self._decoder
+        line_info = self._read_array(decoder.int_typecode,
+            self._read_count(self.variant.size_int))
+        if decoder.widen_ints is not None:
+            return decoder.widen_ints(line_info)
+        return line_info
+
+    def read_strings(self):
+        return [self.read_string() for _ in range(self._read_count(self.variant.size_t))]
+
+    def read_numbers(self):
+        decoder = self._decoder
+        numbers = self._read_array(decoder.number_typecode,
+            self._read_count(self.variant.size_number))
+        if decoder.widen_numbers is not None:
+            return decoder.widen_numbers(numbers)
+        return numbers
+
+    def read_instructions(self):
+        decoder = self._decoder
+        offset = self.offset
+        count = self._read_count(self.variant.size_instruction)
+        self._charge_instructions(count, offset)
+        instruction = self._read_array(decoder.instruction_typecode, count)
+        if decoder.normalize_instructions is not None:
+            return decoder.normalize_instructions(instruction)
+        return instruction
+
+    def read_chunk(self):
+        self._check_depth(self._depth)
+        source, line_number, num_params, is_vararg, max_stack_size = self.read_chunk_info()
+        local_var = self.read_local_vars()
+        line_info = self.read_line_info()
+        strings = self.read_strings()
+        numbers = self.read_numbers()
+        self.stats.depth(self._depth)
+        self._depth += 1
+        functions = [self.read_chunk() for _ in range(self._read_count(self._min_chunk))]
+        self._depth -= 1
+        instruction = self.read_instructions()
+        self.stats.count(COUNT_CHUNKS)
+        self.stats.count(COUNT_INSTRUCTIONS, len(instruction))
+
+        return Lua4Chunk(
+            source,
+            line_number,
+            num_params,
+            is_vararg,
+            max_stack_size,
+            local_var,
+            line_info,
+            Lua4Constants(strings, numbers, functions),
+            instruction,
+        )
+
+    def skip_chunk(self, depth=0, instructions=None):
+        """Move past the chunk at the current offset, nested chunks included,
+        without decoding anything. `depth` is its nesting level for the depth
+        limit. A dict passed as `instructions` maps the start offset of the
+        chunk and of every chunk in it to the offset of its instruction count.
+        """
+        self._check_depth(depth)
+        start = self.offset
+        variant = self.variant
+        self._skip_string()
+        self.offset = self._require(self._chunk_info.size)
+        for _ in range(self._read_count(self._min_local_var)):
+            self._skip_string()
+            self.offset = self._require(self._local_var_pcs.size)
+        self._skip_fixed(variant.size_int)
+        for _ in range(self._read_count(variant.size_t)):
+            self._skip_string()
+        self._skip_fixed(variant.size_number)
+        for _ in range(self._read_count(self._min_chunk)):
+            self.skip_chunk(depth + 1, instructions)
+        if instructions is not None:
+            instructions[start] = self.offset
+        self._skip_fixed(variant.size_instruction)
+
+    def scan_chunk(self, layouts=None, path=(), parent=None):
+        """Walk the chunk at the current offset without decoding anything,
+        appending a Lua4ChunkLayout for it and every nested chunk to `layouts`.
+        Lengths and limits are checked just like when reading.
+        """
+        self._check_depth(len(path))
+        if layouts is None:
+            layouts = []
+        layout = Lua4ChunkLayout(len(layouts), path, parent, self.offset)
+        layouts.append(layout)
+        self.stats.count(COUNT_CHUNKS)
+        self.stats.depth(len(path))
+
+        variant = self.variant
+        self._scan_string()
+        self.offset = self._require(self._chunk_info.size)
+        layout.local_var = self.offset
+        for _ in range(self._read_count(self._min_local_var)):
+            self._scan_string()
+            self.offset = self._require(self._local_var_pcs.size)
+        layout.line_info = self.offset
+        self._skip_fixed(variant.size_int)
+        layout.string = self.offset
+        for _ in range(self._read_count(variant.size_t)):
+            self._scan_string()
+        layout.number = self.offset
+        self._skip_fixed(variant.size_number)
+        layout.function = self.offset
+        for i in range(self._read_count(self._min_chunk)):
+            layout.children.append(len(layouts))
+            self.scan_chunk(layouts, path + (i,), layout.index)
+        layout.instruction = self.offset
+        count = self._skip_fixed(variant.size_instruction)
+        self._charge_instructions(count, layout.instruction)
+        self.stats.count(COUNT_INSTRUCTIONS, count)
+        layout.end = self.offset
+        return layouts
+
+def parse_bytes(data, stats=NULL_STATS, strings=None, limits=None):
+    return Lua4FastParser(data, stats, strings, limits).parse()
+
+def parse_stream(stream, stats=NULL_STATS, strings=None, limits=None):
+    return parse_bytes(stream.read(), stats, strings, limits)
+
+def validate_bytes(data, stats=NULL_STATS, limits=None):
+    """Check that `data` is a complete Lua4 file within `limits` without
+    building a model, raising Lua4FormatError otherwise. Returns the number
+    of bytes the file takes up.
+    """
+    parser = Lua4FastParser(data, stats, None, limits)
+    try:
+        with stats.phase(PHASE_HEADER):
+            parser.read_header()
+            parser.read_self_check()
+        with stats.phase(PHASE_CHUNK):
+            parser.scan_chunk()
+        stats.count(COUNT_BYTES, parser.offset)
+        return parser.offset
+    finally:
+        parser.release()
@@ -22,35 +22,106 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+
 import logging
 
 from lua4dec.lua_lang import *
+from lua4dec.opcodes import NUM_OPCODE_VALUES, OPCODE_FIELD_NAMES
+from lua4dec.util import TO_TEXT
+from lua4dec.decoder import decode_instructions
+from lua4dec.stats import NULL_STATS, PHASE_DECODE, PHASE_FORMAT
 
 logger = logging.getLogger('lua4dec.formatter')
 
+def opcode_handler(*opcodes):
+    """Mark a formatter method as the handler for the given opcodes. Handlers
+    are called as handler(chunk, code, pc) with `code` being the chunk's
+    DecodedInstructions and return the formatted instruction.
+    """
+    def decorator(func):
+        func.opcodes = opcodes
+        return func
+    return decorator
+
 class Lua4Formatter(object):
+    """Base of the output formats. `jobs` is the number of processes a
+    formatter may spread the prototypes of one file over (None for one per
+    CPU), formatters that can't split their work ignore it.
+    """
+    def __init__(self, stats=NULL_STATS, jobs=1):
+        self.stats = stats
+        self.jobs = jobs
+
     def dump(self, lua_file, out_stream):
-        raise NotImplemented()
+        raise NotImplementedError()
 
 class Lua4DebugFormatter(Lua4Formatter):
     INDENT_SPACE = 4
+    OP_FMT = '-- 0x%08X => [{0:02d}] {1:16s}'
+
+    _handler_tables = {}
+
+    def __init__(self, stats=NULL_STATS, jobs=1):
+        super(Lua4DebugFormatter, self).__init__(stats, jobs)
+        self._handlers = list(self._get_handler_table())
+        self._templates = [self.OP_FMT.format(op, name)
+            for op, name in enumerate(OPCODE_FIELD_NAMES)]
+
+    @classmethod
+    def _get_handler_table(cls):
+        # table of unbound handlers indexed by the raw opcode, built once per
+        # class with subclasses overriding their parents
+        table = cls._handler_tables.get(cls)
+        if table is None:
+            table = [cls._format_generic] * NUM_OPCODE_VALUES
+            for klass in reversed(cls.__mro__):
+                for attr in vars(klass).values():
+                    for op in getattr(attr, 'opcodes', ()):
+                        table[op] = attr
+            cls._handler_tables[cls] = table
+        return table
+
+    def set_handler(self, opcode, handler):
+        """Override the handler for one opcode on this formatter instance,
+        `handler` is called as handler(formatter, chunk, code, pc).
+        """
+        self._handlers[opcode] = handler
 
     def dump(self, lua_file, out_stream):
-        out_stream.write('-- %r\n' % lua_file.header)
-        out_stream.write('-- %r\n' % lua_file.self_check)
-        self._dump_chunk(lua_file.code_chunk, out_stream)
+        with self.stats.phase(PHASE_FORMAT):
+            out_stream.write('-- %r\n' % lua_file.header)
+            out_stream.write('-- %r\n' % lua_file.self_check)
+            if self.jobs != 1:
+                from lua4dec.parallel import dump_parallel
+                dump_parallel(self, lua_file.code_chunk, out_stream)
+            else:
+                self._dump_chunk(lua_file.code_chunk, out_stream)
 
     def _dump_chunk(self, lua_chunk, out_stream, level=0):
         SPACE = ' ' * (level * self.INDENT_SPACE)
-        write_line = lambda s: out_stream.write(SPACE + s + '\n')
+        for line in self._chunk_lines(lua_chunk):
+            out_stream.write(SPACE + line + '\n')
+
+        for f in lua_chunk.constants.function:
+            self._dump_chunk(f, out_stream, level + 1)
+            out_stream.write('\n')
 
-        write_line('-- @source {0:s}:{1:d}'.format(lua_chunk.source, lua_chunk.line_number))
+    def _chunk_lines(self, lua_chunk):
+        """Unindented lines of one chunk's own section, everything up to and
+        including the function constants heading but not the nested chunks.
+        """
+        lines = []
+        write_line = lines.append
+
+        write_line('-- @source {0:s}:{1:d}'.format(TO_TEXT(lua_chunk.source),
+            lua_chunk.line_number))
         write_line('-- #params={0:d} var_arg={1} max_stack_size={2:d}'.format(
             lua_chunk.num_params, lua_chunk.is_vararg, lua_chunk.max_stack_size))
 
         write_line('-- Local Vars (%d) --' % len(lua_chunk.local_var))
         for i, lv in enumerate(lua_chunk.local_var):
-            write_line(' [{3}] => {0} ({1}-{2})'.format(lv.name, lv.start_pc, lv.end_pc, i))
+            write_line(' [{3}] => {0} ({1}-{2})'.format(TO_TEXT(lv.name), lv.start_pc,
+                lv.end_pc, i))
 
         write_line('-- Line Info (%d) --' % len(lua_chunk.line_info))
         for i, l in enumerate(lua_chunk.line_info):
@@ -59,76 +130,166 @@ class Lua4DebugFormatter(Lua4Formatter):
         strings = lua_chunk.constants.string
         write_line('-- String Constants (%d) --' % len(strings))
         for i, s in enumerate(strings):
-            write_line(' [{1}] => "{0}"'.format(s, i))
+            write_line(' [{1}] => "{0}"'.format(TO_TEXT(s), i))
 
         numbers = lua_chunk.constants.number
         write_line('-- Number Constants (%d) --' % len(numbers))
-        for n in numbers:
+        for i, n in enumerate(numbers):
             write_line(' [{0}] => {1}'.format(i, n))
 
-        write_line('-- Instructions (%d) -- ' % len(lua_chunk.instruction))
-        for instruction in lua_chunk.instruction:
-            write_line(' ' + self._format_instruction(lua_chunk, instruction))
+        with self.stats.phase(PHASE_DECODE):
+            code = decode_instructions(lua_chunk.instruction).tolists()
+            self.stats.opcodes(code.opcode)
+        handlers = self._handlers
+        opcodes = code.opcode
+        write_line('-- Instructions (%d) -- ' % len(opcodes))
+        for pc in range(len(opcodes)):
+            write_line(' ' + handlers[opcodes[pc]](self, lua_chunk, code, pc))
 
-        functions = lua_chunk.constants.function
-        write_line('-- Function Constants (%d) --' % len(functions))
-        for f in functions:
-            self._dump_chunk(f, out_stream, level + 1)
-            out_stream.write('\n')
+        write_line('-- Function Constants (%d) --' % len(lua_chunk.constants.function))
+        return lines
+
+    def _prefix(self, code, pc):
+        return self._templates[code.opcode[pc]] % code.instruction[pc]
+
+    def _string(self, chunk, k):
+        strings = chunk.constants.string
+        if k < len(strings):
+            return TO_TEXT(strings[k])
+        return '#{0}'.format(k)
+
+    def _number(self, chunk, n, negate=False):
+        numbers = chunk.constants.number
+        if n < len(numbers):
+            return str(-numbers[n] if negate else numbers[n])
+        return '#{0}'.format(n)
+
+    def _local_name(self, chunk, l):
+        local_var = chunk.local_var
+        if l < len(local_var):
+            return TO_TEXT(local_var[l].name)
+        return '#{0}'.format(l)
+
+    def _format_generic(self, chunk, code, pc):
+        return self._prefix(code, pc)
+
+    @opcode_handler(OPCODE.OP_END)
+    def _format_end(self, chunk, code, pc):
+        return '-- end --'
 
-    def _format_instruction(self, chunk, i):
-        op_fmt = '-- 0x{0:08X} => [{1:02d}] {2:16s}'
-        op = self._get_op(i)
-
-        if op is OPCODE.OP_END:
-            return '-- end --'
-        if op is OPCODE.OP_RETURN:
-            return 'return'
-
-        if op is OPCODE.OP_CALL:
-            A = GETARG_A(i)
-            B = GETARG_B(i)
-            op_fmt += 'A: {0} B: {1}'.format(A, B)
-
-        if op is OPCODE.OP_PUSHINT:
-            S = GETARG_S(i)
-            return str(S)
-        if op is OPCODE.OP_PUSHSTRING:
-            K = GETARG_U(i)
-            return '"%s"' % chunk.constants.string[K]
-        if op in (OPCODE.OP_PUSHNUM, OPCODE.OP_PUSHNEGNUM):
-            N = GETARG_U(i)
-            num = chunk.constants.number[N]
-            if op is OPCODE.OP_PUSHNEGNUM:
-                num = -num
-            return str(num)
-
-        if op is OPCODE.OP_GETLOCAL:
-            L = GETARG_U(i)
-            return 'LOCAL[{0}]'.format(chunk.local_var[L].name)
-        if op is OPCODE.OP_GETGLOBAL:
-            U = GETARG_U(i)
-            return 'GLOBAL[{0}]'.format(chunk.constants.string[U])
-
-        if op is OPCODE.OP_SETLOCAL:
-            L = GETARG_U(i)
-            return 'LOCAL[{0}]='.format(chunk.local_var[L].name)
-        if op is OPCODE.OP_SETGLOBAL:
-            U = GETARG_U(i)
-            return 'GLOBAL[{0}]='.format(chunk.constants.string[U])
-
-        if op is OPCODE.OP_CLOSURE:
-            A = GETARG_A(i)
-            B = GETARG_B(i)
-            op_fmt += 'A: {0} B: {1}'.format(A, B)
-
-        return op_fmt.format(i, op.value, op.name)
-
-    def _get_op(self, i):
-        return OPCODE(GET_OPCODE(i))
+    @opcode_handler(OPCODE.OP_RETURN)
+    def _format_return(self, chunk, code, pc):
+        return 'return'
+
+    @opcode_handler(OPCODE.OP_CALL, OPCODE.OP_TAILCALL, OPCODE.OP_SETTABLE,
+        OPCODE.OP_SETLIST, OPCODE.OP_CLOSURE)
+    def _format_ab(self, chunk, code, pc):
+        return self._prefix(code, pc) + 'A: {0} B: {1}'.format(code.A[pc], code.B[pc])
+
+    @opcode_handler(OPCODE.OP_PUSHNIL, OPCODE.OP_POP, OPCODE.OP_PUSHUPVALUE,
+        OPCODE.OP_CREATETABLE, OPCODE.OP_SETMAP, OPCODE.OP_CONCAT)
+    def _format_u(self, chunk, code, pc):
+        return self._prefix(code, pc) + 'U: {0}'.format(code.U[pc])
+
+    @opcode_handler(OPCODE.OP_ADDI)
+    def _format_s(self, chunk, code, pc):
+        return self._prefix(code, pc) + 'S: {0}'.format(code.S[pc])
+
+    @opcode_handler(OPCODE.OP_JMPNE, OPCODE.OP_JMPEQ, OPCODE.OP_JMPLT, OPCODE.OP_JMPLE,
+        OPCODE.OP_JMPGT, OPCODE.OP_JMPGE, OPCODE.OP_JMPT, OPCODE.OP_JMPF,
+        OPCODE.OP_JMPONT, OPCODE.OP_JMPONF, OPCODE.OP_JMP, OPCODE.OP_FORPREP,
+        OPCODE.OP_FORLOOP, OPCODE.OP_LFORPREP, OPCODE.OP_LFORLOOP)
+    def _format_jump(self, chunk, code, pc):
+        S = code.S[pc]
+        return self._prefix(code, pc) + 'J: {0:+d} (=> {1})'.format(S, pc + 1 + S)
+
+    @opcode_handler(OPCODE.OP_GETDOTTED, OPCODE.OP_PUSHSELF)
+    def _format_k(self, chunk, code, pc):
+        return self._prefix(code, pc) + 'K: "{0}"'.format(self._string(chunk, code.U[pc]))
+
+    @opcode_handler(OPCODE.OP_GETINDEXED)
+    def _format_l(self, chunk, code, pc):
+        return self._prefix(code, pc) + 'L: {0}'.format(self._local_name(chunk, code.U[pc]))
+
+    @opcode_handler(OPCODE.OP_GETTABLE, OPCODE.OP_ADD, OPCODE.OP_SUB, OPCODE.OP_MULT,
+        OPCODE.OP_DIV, OPCODE.OP_POW, OPCODE.OP_MINUS, OPCODE.OP_NOT,
+        OPCODE.OP_PUSHNILJMP)
+    def _format_no_args(self, chunk, code, pc):
+        return self._prefix(code, pc)
+
+    @opcode_handler(OPCODE.OP_PUSHINT)
+    def _format_pushint(self, chunk, code, pc):
+        return str(code.S[pc])
+
+    @opcode_handler(OPCODE.OP_PUSHSTRING)
+    def _format_pushstring(self, chunk, code, pc):
+        return '"%s"' % self._string(chunk, code.U[pc])
+
+    @opcode_handler(OPCODE.OP_PUSHNUM)
+    def _format_pushnum(self, chunk, code, pc):
+        return self._number(chunk, code.U[pc])
+
+    @opcode_handler(OPCODE.OP_PUSHNEGNUM)
+    def _format_pushnegnum(self, chunk, code, pc):
+        return self._number(chunk, code.U[pc], True)
+
+    @opcode_handler(OPCODE.OP_GETLOCAL)
+    def _format_getlocal(self, chunk, code, pc):
+        return 'LOCAL[{0}]'.format(self._local_name(chunk, code.U[pc]))
+
+    @opcode_handler(OPCODE.OP_GETGLOBAL)
+    def _format_getglobal(self, chunk, code, pc):
+        return 'GLOBAL[{0}]'.format(self._string(chunk, code.U[pc]))
+
+    @opcode_handler(OPCODE.OP_SETLOCAL)
+    def _format_setlocal(self, chunk, code, pc):
+        return 'LOCAL[{0}]='.format(self._local_name(chunk, code.U[pc]))
+
+    @opcode_handler(OPCODE.OP_SETGLOBAL)
+    def _format_setglobal(self, chunk, code, pc):
+        return 'GLOBAL[{0}]='.format(self._string(chunk, code.U[pc]))
 
 
 class Lua4PrettyFormatter(Lua4Formatter):
     def dump(self, lua_file, out_stream):
-        pass
+        stats = self.stats
+        if stats.enabled:
+            # the decompiler decodes internally, decode again only to fill
+            # the opcode histogram
+            with stats.phase(PHASE_DECODE):
+                pending = [lua_file.code_chunk]
+                while pending:
+                    chunk = pending.pop()
+                    stats.opcodes(decode_instructions(chunk.instruction).tolists().opcode)
+                    pending.extend(chunk.constants.function)
+        # the decompiler is only needed for pretty output, import it here to
+        # keep it off the debug formatter's startup path
+        from lua4dec.decompiler import render_chunk
+        with stats.phase(PHASE_FORMAT):
+            lines = render_chunk(lua_file.code_chunk)
+            lines.append('')
+            out_stream.write('\n'.join(lines))
+
+class Lua4CSVFormatter(Lua4Formatter):
+    """Instruction table of lua4dec.export as CSV, a Lua4Exporter writes the
+    other tables too.
+    """
+    def dump(self, lua_file, out_stream):
+        from lua4dec.export import dump_table
+        dump_table(lua_file, out_stream, stats=self.stats)
+
+class Lua4JSONLinesFormatter(Lua4Formatter):
+    """All tables of lua4dec.export as JSON Lines, each object has a "table"
+    member naming its table.
+    """
+    def dump(self, lua_file, out_stream):
+        from lua4dec.export import dump_tables
+        dump_tables(lua_file, out_stream, stats=self.stats)
 
+FORMATTERS = {
+    'debug':    Lua4DebugFormatter,
+    'pretty':   Lua4PrettyFormatter,
+    'csv':      Lua4CSVFormatter,
+    'jsonl':    Lua4JSONLinesFormatter,
+}
+DEFAULT_FORMATTER = 'debug'
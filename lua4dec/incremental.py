@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+import lua4dec
+from lua4dec.formatter import Lua4DebugFormatter
+from lua4dec.loader import load_stream, DEFAULT_ENGINE
+from lua4dec.stats import NULL_STATS, COUNT_REUSED
+from lua4dec.util import TO_TEXT
+
+# Incremental re-decompilation. Every prototype gets a content hash over the
+# fields the debug listing shows for it (header fields, locals, line info,
+# constants and instructions), the "own" hash, and a Merkle style "tree"
+# hash that also covers its nested prototypes. A Lua4Manifest keeps the
+# rendered section of every prototype keyed by its own hash, so the next run
+# of Lua4IncrementalFormatter only renders prototypes whose hash it has not
+# seen and splices the stored lines for the rest. diff_hashes() compares the
+# hashes of two versions of a file prototype by prototype.
+
+MANIFEST_FORMAT     = 1
+
+STATUS_CHANGED      = 'changed'
+STATUS_ADDED        = 'added'
+STATUS_REMOVED      = 'removed'
+
+_CHUNK_FIELDS       = struct.Struct('<iiBiIIIIII')
+_LOCAL_FIELDS       = struct.Struct('<iiI')
+_LENGTH             = struct.Struct('<I')
+
+def own_digest(chunk):
+    """Hex digest of one prototype, not including its nested prototypes
+    beyond their number.
+    """
+    constants = chunk.constants
+    digest = hashlib.sha256()
+    update = digest.update
+    update(_CHUNK_FIELDS.pack(chunk.line_number, chunk.num_params, bool(chunk.is_vararg),
+        chunk.max_stack_size, len(chunk.local_var), len(chunk.line_info),
+        len(constants.string), len(constants.number), len(constants.function),
+        len(chunk.instruction)))
+    update(_LENGTH.pack(len(chunk.source)))
+    update(chunk.source)
+    for local in chunk.local_var:
+        update(_LOCAL_FIELDS.pack(local.start_pc, local.end_pc, len(local.name)))
+        update(local.name)
+    for value in constants.string:
+        update(_LENGTH.pack(len(value)))
+        update(value)
+    update(struct.pack('<{0:d}i'.format(len(chunk.line_info)), *chunk.line_info))
+    update(struct.pack('<{0:d}d'.format(len(constants.number)), *constants.number))
+    update(struct.pack('<{0:d}I'.format(len(chunk.instruction)), *chunk.instruction))
+    return digest.hexdigest()
+
+class ChunkHash(object):
+    """Hashes of the prototype at `path`, the indexes into
+    constants.function leading to it from the main chunk.
+    """
+    __slots__ = ('path', 'own', 'tree', 'source', 'line_number')
+
+    def __init__(self, path, own, tree, source, line_number):
+        self.path = path
+        self.own = own
+        self.tree = tree
+        self.source = source
+        self.line_number = line_number
+
+    @property
+    def name(self):
+        return format_path(self.path)
+
+    def as_dict(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+    @classmethod
+    def from_dict(cls, value):
+        return cls(tuple(value['path']), value['own'], value['tree'], value['source'],
+            value['line_number'])
+
+def format_path(path):
+    return '.'.join(['main'] + [str(i) for i in path])
+
+def hash_chunks(chunk):
+    """ChunkHash of every prototype in the tree below `chunk`, main chunk
+    first and nested prototypes in the order the debug listing shows them.
+    """
+    hashes = []
+    _hash_tree(chunk, (), hashes)
+    return hashes
+
+def _hash_tree(chunk, path, hashes):
+    entry = ChunkHash(path, own_digest(chunk), None, TO_TEXT(chunk.source), chunk.line_number)
+    hashes.append(entry)
+    digest = hashlib.sha256(entry.own.encode('ascii'))
+    for i, f in enumerate(chunk.constants.function):
+        digest.update(_hash_tree(f, path + (i,), hashes).encode('ascii'))
+    entry.tree = digest.hexdigest()
+    return entry.tree
+
+def diff_hashes(old, new):
+    """(status, old, new) for every prototype whose own hash differs between
+    two lists of ChunkHash, matched by path; `old` or `new` is None for
+    added and removed prototypes. Unchanged prototypes are left out.
+    """
+    old_paths = dict((h.path, h) for h in old)
+    new_paths = dict((h.path, h) for h in new)
+    changes = []
+    for h in new:
+        before = old_paths.get(h.path)
+        if before is None:
+            changes.append((STATUS_ADDED, None, h))
+        elif before.own != h.own:
+            changes.append((STATUS_CHANGED, before, h))
+    for h in old:
+        if h.path not in new_paths:
+            changes.append((STATUS_REMOVED, h, None))
+    return changes
+
+def diff_files(old_path, new_path, engine=DEFAULT_ENGINE):
+    hashes = []
+    for path in (old_path, new_path):
+        with open(path, 'rb') as lua_file:
+            hashes.append(hash_chunks(load_stream(lua_file, engine).code_chunk))
+    return diff_hashes(*hashes)
+
+def format_changes(changes):
+    lines = []
+    for status, old, new in changes:
+        h = new or old
+        lines.append('{0:8s} {1:24s} {2}:{3:d}'.format(status, h.name, h.source, h.line_number))
+    return lines
+
+def _formatter_id(formatter_class):
+    return '{0}\0{1}.{2}'.format(lua4dec.__version__, formatter_class.__module__,
+        formatter_class.__name__)
+
+class Lua4Manifest(object):
+    """Hashes and rendered sections of every prototype of one run. The
+    sections only apply to the formatter and lua4dec version that rendered
+    them, load() returns an empty manifest for any other.
+    """
+    def __init__(self, formatter_class, chunks=None, sections=None):
+        self.formatter = _formatter_id(formatter_class)
+        self.chunks = chunks or []
+        self.sections = sections or {}
+
+    @classmethod
+    def load(cls, path, formatter_class):
+        manifest = cls(formatter_class)
+        try:
+            with open(path) as manifest_f:
+                data = json.load(manifest_f)
+        except (IOError, OSError, ValueError):
+            return manifest
+        if data.get('format') != MANIFEST_FORMAT or data.get('formatter') != manifest.formatter:
+            return manifest
+        manifest.chunks = [ChunkHash.from_dict(h) for h in data['chunks']]
+        manifest.sections = data['sections']
+        return manifest
+
+    def save(self, path):
+        data = {
+            'format':       MANIFEST_FORMAT,
+            'formatter':    self.formatter,
+            'chunks':       [h.as_dict() for h in self.chunks],
+            'sections':     self.sections,
+        }
+        # written next to the target and renamed over it, like the cache
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or os.curdir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w') as tmp_f:
+                json.dump(data, tmp_f, sort_keys=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+class Lua4IncrementalFormatter(Lua4DebugFormatter):
+    """Debug formatter that takes the section of every prototype whose own
+    hash is in the `previous` manifest from there instead of rendering it.
+    After dump() the manifest of this run is in `manifest`, and `reused` and
+    `rendered` count the prototypes taken from the old one or rendered.
+    """
+    def __init__(self, previous=None, stats=NULL_STATS):
+        super(Lua4IncrementalFormatter, self).__init__(stats)
+        self.previous = previous
+        self.manifest = None
+        self.reused = 0
+        self.rendered = 0
+        self._own = {}
+
+    def dump(self, lua_file, out_stream):
+        hashes = hash_chunks(lua_file.code_chunk)
+        self.manifest = Lua4Manifest(type(self), hashes)
+        self._own = dict(zip(self._chunk_ids(lua_file.code_chunk), (h.own for h in hashes)))
+        self.reused = self.rendered = 0
+        try:
+            super(Lua4IncrementalFormatter, self).dump(lua_file, out_stream)
+        finally:
+            self._own = {}
+
+    def _chunk_ids(self, chunk):
+        # ids of the chunks in the same order as hash_chunks()
+        yield id(chunk)
+        for f in chunk.constants.function:
+            for chunk_id in self._chunk_ids(f):
+                yield chunk_id
+
+    def _chunk_lines(self, lua_chunk):
+        own = self._own[id(lua_chunk)]
+        sections = self.manifest.sections
+        # identical prototypes within one file share a section too
+        lines = sections.get(own)
+        if lines is None and self.previous is not None:
+            lines = self.previous.sections.get(own)
+        if lines is None:
+            lines = super(Lua4IncrementalFormatter, self)._chunk_lines(lua_chunk)
+            self.rendered += 1
+        else:
+            self.reused += 1
+            self.stats.count(COUNT_REUSED)
+        sections[own] = lines
+        return lines
+
+def decompile_incremental(source, dest, manifest_path, engine=DEFAULT_ENGINE, stats=NULL_STATS,
+        strings=None, limits=None):
+    """Decompile `source` into `dest` with the debug formatter, reusing the
+    sections stored in `manifest_path` by an earlier run and replacing it
+    with this run's manifest. Returns the formatter, see its `reused` and
+    `rendered` counts.
+    """
+    formatter = Lua4IncrementalFormatter(Lua4Manifest.load(manifest_path,
+        Lua4IncrementalFormatter), stats)
+    with open(source, 'rb') as lua_file:
+        lua_obj = load_stream(lua_file, engine, stats, strings, limits)
+        with open(dest, 'w') as out_f:
+            formatter.dump(lua_obj, out_f)
+    formatter.manifest.save(manifest_path)
+    return formatter
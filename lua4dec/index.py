@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+
+from lua4dec.batch import find_sources, DEFAULT_CHUNKSIZE
+from lua4dec.decoder import decode_instructions
+from lua4dec.incremental import format_path
+from lua4dec.loader import load_stream, ENGINE_FAST
+from lua4dec.opcodes import OP_GETGLOBAL, OP_SETGLOBAL, OP_PUSHSTRING, OP_GETDOTTED, \
+    OP_PUSHSELF
+from lua4dec.util import TO_TEXT
+
+logger = logging.getLogger('lua4dec.index')
+
+# On-disk inverted index from the names and strings a corpus of byte code
+# files uses to where it uses them, kept in an SQLite database. Every
+# operand of the opcodes in KIND_OPCODES and every entry of
+# constants.string is recorded as a (symbol, file, chunk path, pc, kind)
+# reference; pc is NULL for constants.string entries. Files are re-indexed
+# only when their size, mtime and then content hash changed, and files that
+# disappeared are dropped on the next update. An index written with another
+# INDEX_FORMAT is dropped and rebuilt.
+
+INDEX_FORMAT        = 1
+
+KIND_CONSTANT       = 0
+KIND_GET_GLOBAL     = 1
+KIND_SET_GLOBAL     = 2
+KIND_STRING         = 3
+KIND_FIELD          = 4
+KIND_METHOD         = 5
+KIND_NAMES          = ('constant', 'get_global', 'set_global', 'string', 'field', 'method')
+
+KIND_OPCODES        = {
+    OP_GETGLOBAL:   KIND_GET_GLOBAL,
+    OP_SETGLOBAL:   KIND_SET_GLOBAL,
+    OP_PUSHSTRING:  KIND_STRING,
+    OP_GETDOTTED:   KIND_FIELD,
+    OP_PUSHSELF:    KIND_METHOD,
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id          INTEGER PRIMARY KEY,
+    path        TEXT NOT NULL UNIQUE,
+    size        INTEGER NOT NULL,
+    mtime       REAL NOT NULL,
+    digest      TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS refs (
+    symbol_id   INTEGER NOT NULL,
+    file_id     INTEGER NOT NULL,
+    chunk       TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    pc          INTEGER,
+    kind        INTEGER NOT NULL
+);
+'''
+# created after the first bulk load, maintaining them row by row while
+# filling an empty index is several times slower
+INDEXES = '''
+CREATE INDEX IF NOT EXISTS refs_symbol ON refs (symbol_id, kind);
+CREATE INDEX IF NOT EXISTS refs_file ON refs (file_id);
+'''
+DROP = '''
+DROP TABLE IF EXISTS refs;
+DROP TABLE IF EXISTS symbols;
+DROP TABLE IF EXISTS files;
+'''
+
+def extract_refs(chunk):
+    """(symbol, chunk path, chunk index, pc, kind) of every reference in the
+    tree below `chunk`, symbols are text with the bytes mapped 1:1 like the
+    formatters. The chunk index numbers the prototypes in the order the
+    debug listing shows them, main chunk first.
+    """
+    refs = []
+    pending = [(chunk, ())]
+    index = 0
+    while pending:
+        chunk, path = pending.pop()
+        name = format_path(path)
+        strings = [TO_TEXT(s) for s in chunk.constants.string]
+        refs.extend((s, name, index, None, KIND_CONSTANT) for s in strings)
+        code = decode_instructions(chunk.instruction).tolists()
+        U = code.U
+        for pc, op in enumerate(code.opcode):
+            kind = KIND_OPCODES.get(op)
+            if kind is not None and U[pc] < len(strings):
+                refs.append((strings[U[pc]], name, index, pc, kind))
+        index += 1
+        # reversed, the stack pops the first nested prototype next
+        functions = chunk.constants.function
+        pending.extend((functions[i], path + (i,)) for i in reversed(range(len(functions))))
+    return refs
+
+def _index_task(task):
+    # runs in a worker: returns the digest and the references of one file,
+    # or no references when the content still matches `known_digest`
+    path, engine, known_digest = task
+    try:
+        with open(path, 'rb') as lua_file:
+            data = lua_file.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == known_digest:
+            return path, digest, None, None
+        lua_file = load_stream(io.BytesIO(data), engine)
+        return path, digest, extract_refs(lua_file.code_chunk), None
+    except Exception as err:
+        return path, None, None, '{0}: {1}'.format(type(err).__name__, err)
+
+class IndexHit(object):
+    __slots__ = ('symbol', 'path', 'chunk', 'pc', 'kind')
+
+    def __init__(self, symbol, path, chunk, pc, kind):
+        self.symbol = symbol
+        self.path = path
+        self.chunk = chunk
+        self.pc = pc
+        self.kind = kind
+
+    @property
+    def kind_name(self):
+        return KIND_NAMES[self.kind]
+
+    def as_dict(self):
+        result = dict((k, getattr(self, k)) for k in self.__slots__)
+        result['kind'] = self.kind_name
+        return result
+
+class Lua4Index(object):
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != INDEX_FORMAT:
+            self.db.executescript(DROP)
+            self.db.execute('PRAGMA user_version = {0:d}'.format(INDEX_FORMAT))
+        self.db.executescript(SCHEMA)
+        if self.db.execute('SELECT 1 FROM files LIMIT 1').fetchone() is not None:
+            self.db.executescript(INDEXES)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, patterns, engine=ENGINE_FAST, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+        """Bring the index up to date with the files matched by `patterns`
+        (see lua4dec.batch.find_sources), parsing new and changed files in
+        a pool of `workers` processes. Returns counts of indexed, unchanged,
+        removed and failed files.
+        """
+        db = self.db
+        known = dict((path, (file_id, size, mtime, digest)) for file_id, path, size, mtime, digest
+            in db.execute('SELECT id, path, size, mtime, digest FROM files'))
+        counts = {'indexed': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+
+        tasks = []
+        stat = {}
+        for source, _ in find_sources(patterns):
+            path = os.path.abspath(source)
+            st = os.stat(path)
+            stat[path] = (st.st_size, st.st_mtime)
+            entry = known.get(path)
+            if entry is not None and entry[1:3] == stat[path]:
+                counts['unchanged'] += 1
+                continue
+            tasks.append((path, engine, entry[3] if entry else None))
+
+        if workers == 1 or len(tasks) <= 1:
+            results = map(_index_task, tasks)
+            executor = None
+        else:
+            import concurrent.futures
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            results = executor.map(_index_task, tasks, chunksize=max(1, chunksize))
+        symbols = dict((name, symbol_id) for symbol_id, name
+            in db.execute('SELECT id, name FROM symbols'))
+        try:
+            with db:
+                for path, digest, refs, error in results:
+                    entry = known.get(path)
+                    if error is not None:
+                        logger.warning('Failed to index %s: %s', path, error)
+                        counts['failed'] += 1
+                        # the old references no longer match the file, and
+                        # without its row the next update tries it again
+                        if entry is not None:
+                            db.execute('DELETE FROM refs WHERE file_id = ?', (entry[0],))
+                            db.execute('DELETE FROM files WHERE id = ?', (entry[0],))
+                        continue
+                    size, mtime = stat[path]
+                    if refs is None:
+                        db.execute('UPDATE files SET size = ?, mtime = ? WHERE id = ?',
+                            (size, mtime, entry[0]))
+                        counts['unchanged'] += 1
+                        continue
+                    if entry is not None:
+                        file_id = entry[0]
+                        db.execute('DELETE FROM refs WHERE file_id = ?', (file_id,))
+                        db.execute('UPDATE files SET size = ?, mtime = ?, digest = ? WHERE id = ?',
+                            (size, mtime, digest, file_id))
+                    else:
+                        file_id = db.execute('INSERT INTO files (path, size, mtime, digest) '
+                            'VALUES (?, ?, ?, ?)', (path, size, mtime, digest)).lastrowid
+                    for symbol, _, _, _, _ in refs:
+                        if symbol not in symbols:
+                            symbols[symbol] = db.execute('INSERT INTO symbols (name) VALUES (?)',
+                                (symbol,)).lastrowid
+                    db.executemany('INSERT INTO refs (symbol_id, file_id, chunk, chunk_index, '
+                        'pc, kind) VALUES (?, ?, ?, ?, ?, ?)', [(symbols[symbol], file_id, chunk,
+                            index, pc, kind) for symbol, chunk, index, pc, kind in refs])
+                    counts['indexed'] += 1
+
+                for path, entry in known.items():
+                    if path not in stat and not os.path.exists(path):
+                        db.execute('DELETE FROM refs WHERE file_id = ?', (entry[0],))
+                        db.execute('DELETE FROM files WHERE id = ?', (entry[0],))
+                        counts['removed'] += 1
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            db.executescript(INDEXES)
+        return counts
+
+    def query(self, symbol, kinds=None, glob=False, limit=None):
+        """IndexHits for `symbol`, or with `glob` every symbol matching it as
+        an SQLite GLOB pattern, optionally only of the given kinds. Sorted
+        by file, then chunk in listing order and pc.
+        """
+        sql = ['SELECT s.name, f.path, r.chunk, r.pc, r.kind FROM symbols s',
+            'JOIN refs r ON r.symbol_id = s.id JOIN files f ON f.id = r.file_id',
+            'WHERE s.name GLOB ?' if glob else 'WHERE s.name = ?']
+        params = [symbol]
+        if kinds:
+            sql.append('AND r.kind IN ({0})'.format(', '.join('?' * len(kinds))))
+            params.extend(kinds)
+        sql.append('ORDER BY f.path, r.chunk_index, r.pc')
+        if limit is not None:
+            sql.append('LIMIT ?')
+            params.append(limit)
+        return [IndexHit(*row) for row in self.db.execute(' '.join(sql), params)]
+
+    def stats(self):
+        return dict((table, self.db.execute('SELECT COUNT(*) FROM ' + table).fetchone()[0])
+            for table in ('files', 'symbols', 'refs'))
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Interning of decoded Lua strings. A StringTable shared by the parsers of a
+# file or session makes equal strings the same bytes object, so global names
+# and source paths repeated across prototypes are stored once, and hands out
+# stable integer IDs, which lua4dec.snapshot writes in place of the strings.
+
+class StringTable(object):
+    def __init__(self):
+        self._ids = {}
+        self.strings = []
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __contains__(self, value):
+        return value in self._ids
+
+    def intern(self, value):
+        """The canonical object for `value`, adding it if it is new."""
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = self._ids[value] = len(self.strings)
+            self.strings.append(value)
+        return self.strings[string_id]
+
+    def id_of(self, value):
+        """Integer ID of `value`, adding it if it is new."""
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = self._ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+    def lookup(self, string_id):
+        return self.strings[string_id]
+
+    def intern_chunk(self, chunk):
+        """Intern the strings of an already parsed chunk tree in place, for
+        engines that do not intern while parsing.
+        """
+        pending = [chunk]
+        while pending:
+            chunk = pending.pop()
+            chunk.source = self.intern(chunk.source)
+            for local in chunk.local_var:
+                local.name = self.intern(local.name)
+            strings = chunk.constants.string
+            for i, value in enumerate(strings):
+                strings[i] = self.intern(value)
+            pending.extend(chunk.constants.function)
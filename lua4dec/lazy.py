@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import mmap
+import os
+
+from lua4dec.fast_parser import Lua4FastParser, NO_LIMITS
+from lua4dec.model import Container, Lua4Chunk, Lua4Constants
+from lua4dec.stats import NULL_STATS, PHASE_HEADER, PHASE_CHUNK, COUNT_BYTES
+from lua4dec.util import has_fileno
+
+class Lua4LazyFile(object):
+    """Memory-mapped Lua4 file. Opening it decodes the header and self check
+    and does one skip-scan over the chunk tree to record where every chunk's
+    sections are; the chunks themselves are only decoded when their
+    attributes are accessed through a Lua4LazyChunk.
+    """
+    def __init__(self, source, stats=NULL_STATS, strings=None, limits=None):
+        if hasattr(source, 'read') and not has_fileno(source):
+            source = source.read()
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._map = None
+            self._parser = Lua4FastParser(source, stats, strings, limits)
+        else:
+            if not hasattr(source, 'fileno'):
+                source = open(source, 'rb')
+                owned = True
+            else:
+                owned = False
+            try:
+                if os.fstat(source.fileno()).st_size == 0:
+                    # empty files cannot be mapped, the header read below
+                    # reports them like any other truncated input
+                    self._map = None
+                else:
+                    self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            finally:
+                if owned:
+                    source.close()
+            self._parser = Lua4FastParser(b'' if self._map is None else self._map, stats,
+                strings, limits)
+
+        try:
+            with stats.phase(PHASE_HEADER):
+                self.header = self._parser.read_header()
+                self.self_check = self._parser.read_self_check()
+            with stats.phase(PHASE_CHUNK):
+                self.chunks = self._parser.scan_chunk()
+        except BaseException:
+            self.close()
+            raise
+        stats.count(COUNT_BYTES, self._parser.offset)
+        # the scan has checked the whole file against the limits, the budgets
+        # must not be charged a second time as sections are decoded
+        self._parser.set_limits(NO_LIMITS)
+        self.code_chunk = Lua4LazyChunk(self, self.chunks[0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._parser is not None:
+            self._parser.release()
+            self._parser = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def materialize(self):
+        """Fully decode the file into the same tree the fast engine
+        returns.
+        """
+        return Container(
+            header=self.header,
+            self_check=self.self_check,
+            code_chunk=self.code_chunk.materialize(),
+        )
+
+    def chunk(self, path=()):
+        """Return the chunk reached by following `path`, a sequence of indexes
+        into constants.function starting from the main chunk.
+        """
+        layout = self.chunks[0]
+        for i in path:
+            layout = self.chunks[layout.children[i]]
+        return Lua4LazyChunk(self, layout)
+
+    def iter_chunks(self):
+        for layout in self.chunks:
+            yield Lua4LazyChunk(self, layout)
+
+    def _read(self, offset, reader):
+        if self._parser is None:
+            raise ValueError('I/O operation on closed Lua4LazyFile')
+        self._parser.offset = offset
+        return reader(self._parser)
+
+class Lua4LazyConstants(object):
+    __slots__ = ('_chunk', '_string', '_number', '_function')
+
+    def __init__(self, chunk):
+        self._chunk = chunk
+        self._string = None
+        self._number = None
+        self._function = None
+
+    @property
+    def string(self):
+        if self._string is None:
+            chunk = self._chunk
+            self._string = chunk._file._read(chunk.layout.string, Lua4FastParser.read_strings)
+        return self._string
+
+    @property
+    def number(self):
+        if self._number is None:
+            chunk = self._chunk
+            self._number = chunk._file._read(chunk.layout.number, Lua4FastParser.read_numbers)
+        return self._number
+
+    @property
+    def function(self):
+        if self._function is None:
+            lua_file = self._chunk._file
+            self._function = [Lua4LazyChunk(lua_file, lua_file.chunks[i])
+                for i in self._chunk.layout.children]
+        return self._function
+
+class Lua4LazyChunk(object):
+    """Proxy with the same attributes as a parsed Lua4Chunk, each section is
+    decoded on first access and kept afterwards.
+    """
+    __slots__ = ('_file', 'layout', '_info', '_local_var', '_line_info',
+        '_constants', '_instruction')
+
+    def __init__(self, lua_file, layout):
+        self._file = lua_file
+        self.layout = layout
+        self._info = None
+        self._local_var = None
+        self._line_info = None
+        self._constants = None
+        self._instruction = None
+
+    def __repr__(self):
+        return '<Lua4LazyChunk #{0} path={1}>'.format(self.layout.index, list(self.layout.path))
+
+    def _get_info(self):
+        if self._info is None:
+            self._info = self._file._read(self.layout.start, Lua4FastParser.read_chunk_info)
+        return self._info
+
+    source          = property(lambda self: self._get_info()[0])
+    line_number     = property(lambda self: self._get_info()[1])
+    num_params      = property(lambda self: self._get_info()[2])
+    is_vararg       = property(lambda self: self._get_info()[3])
+    max_stack_size  = property(lambda self: self._get_info()[4])
+
+    @property
+    def path(self):
+        return self.layout.path
+
+    @property
+    def local_var(self):
+        if self._local_var is None:
+            self._local_var = self._file._read(self.layout.local_var,
+                Lua4FastParser.read_local_vars)
+        return self._local_var
+
+    @property
+    def line_info(self):
+        if self._line_info is None:
+            self._line_info = self._file._read(self.layout.line_info,
+                Lua4FastParser.read_line_info)
+        return self._line_info
+
+    @property
+    def constants(self):
+        if self._constants is None:
+            self._constants = Lua4LazyConstants(self)
+        return self._constants
+
+    @property
+    def instruction(self):
+        if self._instruction is None:
+            self._instruction = self._file._read(self.layout.instruction,
+                Lua4FastParser.read_instructions)
+        return self._instruction
+
+    def materialize(self):
+        """Fully decode this chunk and its nested chunks into the model the
+        fast engine returns.
+        """
+        return Lua4Chunk(
+            self.source,
+            self.line_number,
+            self.num_params,
+            self.is_vararg,
+            self.max_stack_size,
+            self.local_var,
+            self.line_info,
+            Lua4Constants(
+                self.constants.string,
+                self.constants.number,
+                [f.materialize() for f in self.constants.function],
+            ),
+            self.instruction,
+        )
+
+def open_lazy(source, stats=NULL_STATS, strings=None, limits=None):
+    return Lua4LazyFile(source, stats, strings, limits)
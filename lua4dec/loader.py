@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Entry point for turning byte code into the Lua4File model. The construct
+# engine is the reference implementation, the fast engine is the struct and
+# memoryview based one from lua4dec.fast_parser and the lazy engine mmaps the
+# file and only decodes chunks as they are accessed (lua4dec.lazy). The
+# snapshot engine loads the flat format written by lua4dec.snapshot.
+#
+# The byte code engines enforce a lua4dec.fast_parser.Lua4Limits. The
+# construct definitions trust every length prefix and would read or loop
+# over whatever a corrupt count says, so the construct engine only runs on
+# input a validate_bytes() pre-scan has accepted. They also recurse about
+# six Python frames per chunk nesting level, so the construct engine caps
+# the depth at CONSTRUCT_MAX_DEPTH whatever the limits say and raises the
+# recursion limit while it parses; deeper files need the fast or lazy
+# engine.
+
+import sys
+
+from lua4dec.defaults import DEFAULT_MAX_DEPTH
+from lua4dec.stats import NULL_STATS, PHASE_HEADER, PHASE_CHUNK, COUNT_BYTES, \
+    COUNT_CHUNKS, COUNT_INSTRUCTIONS
+
+ENGINE_CONSTRUCT    = 'construct'
+ENGINE_FAST         = 'fast'
+ENGINE_LAZY         = 'lazy'
+ENGINE_SNAPSHOT     = 'snapshot'
+PARSER_ENGINES      = (ENGINE_CONSTRUCT, ENGINE_FAST, ENGINE_LAZY, ENGINE_SNAPSHOT)
+# the engines that read compiled Lua files rather than snapshots
+BYTECODE_ENGINES    = (ENGINE_CONSTRUCT, ENGINE_FAST, ENGINE_LAZY)
+DEFAULT_ENGINE      = ENGINE_CONSTRUCT
+
+CONSTRUCT_MAX_DEPTH         = DEFAULT_MAX_DEPTH
+# Python frames reserved per nesting level, with some room to spare
+_CONSTRUCT_FRAMES_PER_LEVEL = 10
+
+def _load_construct(stream, stats):
+    # parse the sections one at a time so they can be timed separately and
+    # the chunk definitions can be picked for the variant in the self check,
+    # the result is the same Container Lua4File.parse_stream returns
+    from construct import Container
+    from lua4dec.parser import Lua4Header, Lua4SelfCheckSizes, variant_structs
+    from lua4dec.variant import Lua4Variant, get_decoder
+
+    start = stream.tell()
+    with stats.phase(PHASE_HEADER):
+        header = Lua4Header.parse_stream(stream)
+        self_check = Lua4SelfCheckSizes.parse_stream(stream)
+        variant = Lua4Variant.from_header(header, self_check)
+        structs = variant_structs(variant)
+        self_check.test_fp_number = structs.test_number.parse_stream(stream)
+    with stats.phase(PHASE_CHUNK):
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(recursion_limit +
+            _CONSTRUCT_FRAMES_PER_LEVEL * (CONSTRUCT_MAX_DEPTH + 1))
+        try:
+            code_chunk = structs.chunk.parse_stream(stream)
+        finally:
+            sys.setrecursionlimit(recursion_limit)
+
+    normalize = get_decoder(variant).normalize_instructions
+    if normalize is not None or stats.enabled:
+        stats.count(COUNT_BYTES, stream.tell() - start)
+        pending = [(code_chunk, 0)]
+        while pending:
+            chunk, depth = pending.pop()
+            if normalize is not None:
+                chunk.instruction = list(normalize(chunk.instruction))
+            stats.count(COUNT_CHUNKS)
+            stats.count(COUNT_INSTRUCTIONS, len(chunk.instruction))
+            stats.depth(depth)
+            pending.extend((f, depth + 1) for f in chunk.constants.function)
+    return Container(header=header, self_check=self_check, code_chunk=code_chunk)
+
+def load_stream(stream, engine=DEFAULT_ENGINE, stats=NULL_STATS, strings=None, limits=None):
+    """Parse a Lua4 file with the given engine. Decoded strings are interned
+    in `strings`, a lua4dec.interning.StringTable, when one is given. Byte
+    code that is malformed or exceeds `limits` (default DEFAULT_LIMITS)
+    raises a lua4dec.fast_parser.Lua4FormatError.
+    """
+    if engine == ENGINE_CONSTRUCT:
+        import io
+        from lua4dec.fast_parser import validate_bytes, Lua4Limits, DEFAULT_LIMITS
+
+        limits = DEFAULT_LIMITS if limits is None else limits
+        if limits.max_depth is None or limits.max_depth > CONSTRUCT_MAX_DEPTH:
+            limits = Lua4Limits(CONSTRUCT_MAX_DEPTH, limits.max_instructions,
+                limits.max_string_bytes)
+        data = stream.read()
+        with stats.phase(PHASE_HEADER):
+            validate_bytes(data, limits=limits)
+        lua_file = _load_construct(io.BytesIO(data), stats)
+        if strings is not None:
+            strings.intern_chunk(lua_file.code_chunk)
+        return lua_file
+    if engine == ENGINE_FAST:
+        from lua4dec.fast_parser import parse_stream
+        return parse_stream(stream, stats, strings, limits)
+    if engine == ENGINE_LAZY:
+        from lua4dec.lazy import open_lazy
+        return open_lazy(stream, stats, strings, limits)
+    if engine == ENGINE_SNAPSHOT:
+        # strings in a snapshot are already stored once, nothing to intern
+        from lua4dec.snapshot import load_snapshot
+        with stats.phase(PHASE_HEADER):
+            return load_snapshot(stream)
+    raise ValueError('unknown parser engine: {0!r}'.format(engine))
+
+def load_file(filename, engine=DEFAULT_ENGINE, stats=NULL_STATS, strings=None, limits=None):
+    with open(filename, 'rb') as lua_file:
+        return load_stream(lua_file, engine, stats, strings, limits)
@@ -23,18 +23,10 @@
 # SOFTWARE.
 
 from lua4dec.util import C_Enum, CAST_TO_UINT32
-
-SIZE_INSTRUCTION    = 32
-SIZE_B              =  9
-SIZE_OP             =  6
-SIZE_U              = SIZE_INSTRUCTION - SIZE_OP
-POS_U               = SIZE_OP
-POS_B               = SIZE_OP
-POS_A               = SIZE_OP + SIZE_B
-SIZE_A              = SIZE_INSTRUCTION - POS_A
-
-MAXARG_U            = (1 << SIZE_U) - 1
-MAXARG_S            = MAXARG_U >> 1
+# the layout constants are precomputed in lua4dec.opcodes
+from lua4dec.opcodes import SIZE_INSTRUCTION, SIZE_B, SIZE_OP, SIZE_U, POS_U, POS_B, \
+    POS_A, SIZE_A, MAXARG_U, MAXARG_S, MULT_RET, LFIELDS_PER_FLUSH, OP_MASK, MASK_B, \
+    NUM_OPCODES
 
 class OPCODE(C_Enum):
     # We assume that instructions are unsigned numbers.
@@ -151,14 +143,11 @@ class OPERATOR:
 
 
 
-NUM_OPCODES     = len(OPCODE)
 ISJUMP          = lambda op: (OPCODE.OP_JMPNE <= op) and (op <= OPCODE.OP_JMP)
 
 MASK1           = lambda n, p: CAST_TO_UINT32((~(0xFFFFFFFF << n)) << p)
 MASK0           = lambda n, p: CAST_TO_UINT32(~MASK1(n, p))
 
-OP_MASK         = MASK1(SIZE_OP, 0)
-
 GET_OPCODE      = lambda i: i & OP_MASK
 SET_OPCODE      = lambda i, o: (i & MASK0(SIZE_OP, 0)) | o
 
@@ -167,7 +156,7 @@ GETARG_U        = lambda i: i >> POS_U
 SETARG_U        = lambda i, u: (i & MASK0(SIZE_U, POS_U)) | (u << POS_U)
 
 # these are probably all wrong due to not overflowing as expected
-CREATE_S        = lambda o, u: CREATE_U(o, s + MAXARG_S)
+CREATE_S        = lambda o, s: CREATE_U(o, s + MAXARG_S)
 GETARG_S        = lambda i: GETARG_U(i) - MAXARG_S
 SETARG_S        = lambda i, s: SETARG_U(i, s + MAXARG_S)
 
@@ -175,4 +164,6 @@ CREATE_AB       = lambda o, a, b: o | (a << POS_A) | (b << POS_B)
 
 GETARG_A        = lambda i: i >> POS_A
 
-GETARG_B        = lambda i: (i >> POS_B) & MASK1(SIZE_B, 0)
+GETARG_B        = lambda i: (i >> POS_B) & MASK_B
+
+assert NUM_OPCODES == len(OPCODE)
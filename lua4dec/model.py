@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+
+# Compact in-memory model of a parsed Lua4 file, used by the fast and lazy
+# engines. Chunks, local vars and constants are __slots__ classes and the
+# numeric sections (instructions, line info, number constants) are
+# array.array, so a chunk costs a handful of objects instead of a dict per
+# entry and a boxed int per instruction. The attribute names match the
+# construct definitions in lua4dec.parser, so code written against the
+# construct Containers (the formatters, the decompiler) works unchanged.
+
+UINT32_TYPECODE     = 'I' if array.array('I').itemsize == 4 else 'L'
+INT32_TYPECODE      = 'i' if array.array('i').itemsize == 4 else 'l'
+DOUBLE_TYPECODE     = 'd'
+
+class Container(dict):
+    """Attribute access dict with the same repr as construct's Container,
+    for the header and self check, without importing construct.
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return 'Container({0})'.format(dict.__repr__(self))
+
+    def __reduce__(self):
+        return (Container, (dict(self),))
+
+class _Model(object):
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, *args, **kwargs):
+        for name, value in zip(self.FIELDS, args):
+            setattr(self, name, value)
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    # dict style access, for code written against construct Containers
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def keys(self):
+        return list(self.FIELDS)
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.FIELDS)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return tuple(getattr(self, f) for f in self.FIELDS)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.FIELDS, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, ', '.join(
+            '{0}={1!r}'.format(f, getattr(self, f)) for f in self.FIELDS))
+
+class Lua4LocalVar(_Model):
+    __slots__ = FIELDS = ('name', 'start_pc', 'end_pc')
+
+class Lua4Constants(_Model):
+    __slots__ = FIELDS = ('string', 'number', 'function')
+
+class Lua4Chunk(_Model):
+    __slots__ = FIELDS = ('source', 'line_number', 'num_params', 'is_vararg',
+        'max_stack_size', 'local_var', 'line_info', 'constants', 'instruction')
+
+    def __repr__(self):
+        return '<Lua4Chunk {0!r}:{1} {2} instructions>'.format(self.source,
+            self.line_number, len(self.instruction))
+
+def to_model(chunk):
+    """Convert a chunk from any engine (e.g. construct Containers) into the
+    compact model, nested chunks included.
+    """
+    if isinstance(chunk, Lua4Chunk):
+        return chunk
+    constants = chunk.constants
+    return Lua4Chunk(
+        chunk.source,
+        chunk.line_number,
+        chunk.num_params,
+        bool(chunk.is_vararg),
+        chunk.max_stack_size,
+        [Lua4LocalVar(l.name, l.start_pc, l.end_pc) for l in chunk.local_var],
+        array.array(INT32_TYPECODE, chunk.line_info),
+        Lua4Constants(
+            list(constants.string),
+            array.array(DOUBLE_TYPECODE, constants.number),
+            [to_model(f) for f in constants.function],
+        ),
+        array.array(UINT32_TYPECODE, chunk.instruction),
+    )
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Opcode numbers and instruction field layout as plain int constants, with
+# no imports, for code on the startup path and in hot loops. These mirror
+# the OPCODE enum and the SIZE_/POS_/MASK helpers in lua4dec.lua_lang, which
+# take their values from here.
+
+SIZE_INSTRUCTION    = 32
+SIZE_B              =  9
+SIZE_OP             =  6
+SIZE_U              = 26
+POS_U               =  6
+POS_B               =  6
+POS_A               = 15
+SIZE_A              = 17
+
+MAXARG_U            = 0x3FFFFFF
+MAXARG_S            = 0x1FFFFFF
+MAXARG_A            = 0x001FFFF
+MAXARG_B            = 0x1FF
+
+OP_MASK             = 0x3F
+MASK_B              = 0x1FF
+
+MULT_RET            = 255   # OP_CALL B value for "all results"
+LFIELDS_PER_FLUSH   = 64    # list items stored per OP_SETLIST
+
+OP_END              =  0
+OP_RETURN           =  1
+OP_CALL             =  2
+OP_TAILCALL         =  3
+OP_PUSHNIL          =  4
+OP_POP              =  5
+OP_PUSHINT          =  6
+OP_PUSHSTRING       =  7
+OP_PUSHNUM          =  8
+OP_PUSHNEGNUM       =  9
+OP_PUSHUPVALUE      = 10
+OP_GETLOCAL         = 11
+OP_GETGLOBAL        = 12
+OP_GETTABLE         = 13
+OP_GETDOTTED        = 14
+OP_GETINDEXED       = 15
+OP_PUSHSELF         = 16
+OP_CREATETABLE      = 17
+OP_SETLOCAL         = 18
+OP_SETGLOBAL        = 19
+OP_SETTABLE         = 20
+OP_SETLIST          = 21
+OP_SETMAP           = 22
+OP_ADD              = 23
+OP_ADDI             = 24
+OP_SUB              = 25
+OP_MULT             = 26
+OP_DIV              = 27
+OP_POW              = 28
+OP_CONCAT           = 29
+OP_MINUS            = 30
+OP_NOT              = 31
+OP_JMPNE            = 32
+OP_JMPEQ            = 33
+OP_JMPLT            = 34
+OP_JMPLE            = 35
+OP_JMPGT            = 36
+OP_JMPGE            = 37
+OP_JMPT             = 38
+OP_JMPF             = 39
+OP_JMPONT           = 40
+OP_JMPONF           = 41
+OP_JMP              = 42
+OP_PUSHNILJMP       = 43
+OP_FORPREP          = 44
+OP_FORLOOP          = 45
+OP_LFORPREP         = 46
+OP_LFORLOOP         = 47
+OP_CLOSURE          = 48
+
+NUM_OPCODES         = 49
+
+# opcodes whose argument is the signed S (jump offsets included) and the A
+# and B pair, every other opcode has a U argument or none
+S_OPCODES           = frozenset((OP_PUSHINT, OP_ADDI, OP_JMPNE, OP_JMPEQ, OP_JMPLT, OP_JMPLE,
+    OP_JMPGT, OP_JMPGE, OP_JMPT, OP_JMPF, OP_JMPONT, OP_JMPONF, OP_JMP, OP_FORPREP, OP_FORLOOP,
+    OP_LFORPREP, OP_LFORLOOP))
+AB_OPCODES          = frozenset((OP_CALL, OP_TAILCALL, OP_SETTABLE, OP_SETLIST, OP_CLOSURE))
+OPCODE_NAMES        = (
+    'OP_END',
+    'OP_RETURN',
+    'OP_CALL',
+    'OP_TAILCALL',
+    'OP_PUSHNIL',
+    'OP_POP',
+    'OP_PUSHINT',
+    'OP_PUSHSTRING',
+    'OP_PUSHNUM',
+    'OP_PUSHNEGNUM',
+    'OP_PUSHUPVALUE',
+    'OP_GETLOCAL',
+    'OP_GETGLOBAL',
+    'OP_GETTABLE',
+    'OP_GETDOTTED',
+    'OP_GETINDEXED',
+    'OP_PUSHSELF',
+    'OP_CREATETABLE',
+    'OP_SETLOCAL',
+    'OP_SETGLOBAL',
+    'OP_SETTABLE',
+    'OP_SETLIST',
+    'OP_SETMAP',
+    'OP_ADD',
+    'OP_ADDI',
+    'OP_SUB',
+    'OP_MULT',
+    'OP_DIV',
+    'OP_POW',
+    'OP_CONCAT',
+    'OP_MINUS',
+    'OP_NOT',
+    'OP_JMPNE',
+    'OP_JMPEQ',
+    'OP_JMPLT',
+    'OP_JMPLE',
+    'OP_JMPGT',
+    'OP_JMPGE',
+    'OP_JMPT',
+    'OP_JMPF',
+    'OP_JMPONT',
+    'OP_JMPONF',
+    'OP_JMP',
+    'OP_PUSHNILJMP',
+    'OP_FORPREP',
+    'OP_FORLOOP',
+    'OP_LFORPREP',
+    'OP_LFORLOOP',
+    'OP_CLOSURE',
+)
+
+# every value the opcode field can hold, corrupt files and other Lua builds
+# can use the ones past NUM_OPCODES; tables indexed by the raw opcode are
+# this long and name the extra ones with OPCODE_FIELD_NAMES
+NUM_OPCODE_VALUES   = 1 << SIZE_OP
+OPCODE_FIELD_NAMES  = OPCODE_NAMES + tuple('OP_UNKNOWN_{0}'.format(op)
+    for op in range(NUM_OPCODES, NUM_OPCODE_VALUES))
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import array
+import concurrent.futures
+import os
+
+from lua4dec.model import Lua4Chunk, Lua4Constants, Lua4LocalVar, UINT32_TYPECODE, \
+    INT32_TYPECODE, DOUBLE_TYPECODE
+from lua4dec.stats import Stats
+
+# Rendering of the prototypes of one file on a process pool. Every chunk's
+# own section (see Lua4DebugFormatter._chunk_lines) only depends on that
+# chunk, so the chunks are sent to the workers as shallow copies in the
+# compact model, without their nested prototypes, in batches of about equal
+# instruction counts. The parent stitches the returned lines together in
+# the original order and indentation. Handlers set on the formatter instance
+# with set_handler() are not seen by the workers, they use a fresh instance
+# of the same class.
+
+# below this many instructions in total a file is rendered in-process, the
+# pool costs more than it saves
+PARALLEL_MIN_INSTRUCTIONS   = 20000
+BATCHES_PER_WORKER          = 4
+
+def _shallow(chunk):
+    # the chunk without its nested prototypes, only their number is kept
+    constants = chunk.constants
+    return Lua4Chunk(
+        chunk.source,
+        chunk.line_number,
+        chunk.num_params,
+        bool(chunk.is_vararg),
+        chunk.max_stack_size,
+        [Lua4LocalVar(l.name, l.start_pc, l.end_pc) for l in chunk.local_var],
+        array.array(INT32_TYPECODE, chunk.line_info),
+        Lua4Constants(
+            list(constants.string),
+            array.array(DOUBLE_TYPECODE, constants.number),
+            [None] * len(constants.function),
+        ),
+        array.array(UINT32_TYPECODE, chunk.instruction),
+    )
+
+def _flatten(chunk):
+    # (chunk, level) in the order the debug listing shows them
+    chunks = []
+    pending = [(chunk, 0)]
+    while pending:
+        chunk, level = pending.pop()
+        chunks.append((chunk, level))
+        pending.extend((f, level + 1) for f in reversed(chunk.constants.function))
+    return chunks
+
+def _batches(chunks, count):
+    # consecutive runs of chunks with about the same number of instructions
+    sizes = [len(chunk.instruction) + 1 for chunk in chunks]
+    target = sum(sizes) / float(count)
+    batches = [[]]
+    total = 0
+    for chunk, size in zip(chunks, sizes):
+        if total >= target and batches[-1]:
+            batches.append([])
+            total = 0
+        batches[-1].append(chunk)
+        total += size
+    return batches
+
+# formatter of a worker process by class
+_worker_formatters = {}
+
+def _render_task(task):
+    formatter_class, chunks, collect_stats = task
+    formatter = _worker_formatters.get(formatter_class)
+    if formatter is None:
+        formatter = _worker_formatters[formatter_class] = formatter_class()
+    formatter.stats = stats = Stats() if collect_stats else formatter.stats
+    lines = [formatter._chunk_lines(chunk) for chunk in chunks]
+    return lines, stats if collect_stats else None
+
+def dump_parallel(formatter, code_chunk, out_stream):
+    """Write the chunk tree like formatter._dump_chunk() does, rendering the
+    chunks on `formatter.jobs` processes.
+    """
+    chunks = _flatten(code_chunk)
+    workers = formatter.jobs or os.cpu_count() or 1
+    total = sum(len(chunk.instruction) for chunk, _ in chunks)
+    if workers <= 1 or len(chunks) < 2 or total < PARALLEL_MIN_INSTRUCTIONS:
+        formatter._dump_chunk(code_chunk, out_stream)
+        return
+
+    stats = formatter.stats
+    batches = _batches([_shallow(chunk) for chunk, _ in chunks],
+        workers * BATCHES_PER_WORKER)
+    tasks = [(type(formatter), batch, stats.enabled) for batch in batches]
+    sections = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        for lines, worker_stats in executor.map(_render_task, tasks):
+            sections.extend(lines)
+            if worker_stats is not None:
+                stats.merge(worker_stats)
+
+    # a nested chunk's section is followed by its own nested chunks and then
+    # an empty line, which is written once the next chunk is at the same or
+    # an outer level
+    indent = formatter.INDENT_SPACE
+    open_levels = 0
+    for (chunk, level), lines in zip(chunks, sections):
+        while open_levels >= level and open_levels > 0:
+            out_stream.write('\n')
+            open_levels -= 1
+        space = ' ' * (level * indent)
+        out_stream.write(''.join(space + line + '\n' for line in lines))
+        open_levels = level
+    out_stream.write('\n' * open_levels)
@@ -33,20 +33,31 @@ class Lua4StringAdapter(Adapter):
         return obj[:len(obj)-1]
 
     def _encode(self, obj, context):
-        return obj + '\x00'
-
-Lua4String = lambda name: Lua4StringAdapter(PascalString(name, length_field=SLInt32('length')))
-Lua4Array = lambda subcon: PrefixedArray(subcon, length_field=SLInt32('length'))
+        return obj + b'\x00'
 
+# integer and float constructs by (size, little endian)
+_SIGNED = {
+    (2, True):  SLInt16,    (4, True):  SLInt32,    (8, True):  SLInt64,
+    (2, False): SBInt16,    (4, False): SBInt32,    (8, False): SBInt64,
+}
+_UNSIGNED = {
+    (2, True):  ULInt16,    (4, True):  ULInt32,
+    (2, False): UBInt16,    (4, False): UBInt32,
+}
+_FLOAT = {
+    (4, True):  LFloat32,   (8, True):  LFloat64,
+    (4, False): BFloat32,   (8, False): BFloat64,
+}
 
 Lua4Header = Struct('header',
     Const(ULInt8('format_id'), 0x1B),
-    Magic('Lua'),
+    Magic(b'Lua'),
     ULInt8('version'),
     Flag('little_endian', default=True)
 )
 
-Lua4SelfCheck = Struct('self_check',
+# the self check up to the test number, whose size and byte order it gives
+Lua4SelfCheckSizes = Struct('self_check',
     ULInt8('size_int'),
     ULInt8('size_t'),
     ULInt8('size_instruction'),
@@ -54,36 +65,83 @@ Lua4SelfCheck = Struct('self_check',
     ULInt8('test_size_op'),
     ULInt8('test_size_b'),
     ULInt8('size_number'),
-    LFloat64('test_fp_number')
 )
 
-Lua4LocalVar        = Struct('local_var',
-    Lua4String('name'),
-    SLInt32('start_pc'),
-    SLInt32('end_pc')
-)
-Lua4LineInfo        = SLInt32('line_info')
-Lua4ChunkConstants  = Struct('constants',
-    Lua4Array(Lua4String('string')),
-    Lua4Array(LFloat64('number')),
-    Lua4Array(LazyBound('function', lambda: Lua4Chunk))
-)
-Lua4Instruction     = ULInt32('instruction')
-
-Lua4Chunk = Struct('code_chunk',
-    Lua4String('source'),
-    SLInt32('line_number'),
-    SLInt32('num_params'),
-    Flag('is_vararg'),
-    SLInt32('max_stack_size'),
-    Lua4Array(Lua4LocalVar),
-    Lua4Array(Lua4LineInfo),
-    Lua4ChunkConstants,
-    Lua4Array(Lua4Instruction)
-)
+def lua4_structs(little_endian=True, size_int=4, size_t=4, size_instruction=4, size_number=8):
+    """Constructs for one build variant (see lua4dec.variant) as a Container
+    of the pieces below, `file` being the whole Lua4File. Instructions are
+    read as they are stored, in that variant's field layout.
+    """
+    Int = _SIGNED[size_int, little_endian]
+    Size = _SIGNED[size_t, little_endian]
+    Number = _FLOAT[size_number, little_endian]
 
-Lua4File = Struct('lua_file',
-    Lua4Header,
-    Lua4SelfCheck,
-    Lua4Chunk
-)
+    string = lambda name: Lua4StringAdapter(PascalString(name, length_field=Size('length')))
+    array = lambda subcon: PrefixedArray(subcon, length_field=Int('length'))
+
+    self_check = Struct('self_check',
+        ULInt8('size_int'),
+        ULInt8('size_t'),
+        ULInt8('size_instruction'),
+        ULInt8('test_size_instruction'),
+        ULInt8('test_size_op'),
+        ULInt8('test_size_b'),
+        ULInt8('size_number'),
+        Number('test_fp_number')
+    )
+
+    local_var       = Struct('local_var',
+        string('name'),
+        Int('start_pc'),
+        Int('end_pc')
+    )
+    line_info       = Int('line_info')
+    constants       = Struct('constants',
+        array(string('string')),
+        array(Number('number')),
+        array(LazyBound('function', lambda: chunk))
+    )
+    instruction     = _UNSIGNED[size_instruction, little_endian]('instruction')
+
+    chunk = Struct('code_chunk',
+        string('source'),
+        Int('line_number'),
+        Int('num_params'),
+        Flag('is_vararg'),
+        Int('max_stack_size'),
+        array(local_var),
+        array(line_info),
+        constants,
+        array(instruction)
+    )
+
+    lua_file = Struct('lua_file',
+        Lua4Header,
+        self_check,
+        chunk
+    )
+    return Container(string=string, array=array, test_number=Number('test_fp_number'),
+        self_check=self_check, local_var=local_var, line_info=line_info, constants=constants,
+        instruction=instruction, chunk=chunk, file=lua_file)
+
+_DEFAULT            = lua4_structs()
+
+Lua4String          = _DEFAULT.string
+Lua4Array           = _DEFAULT.array
+Lua4SelfCheck       = _DEFAULT.self_check
+Lua4LocalVar        = _DEFAULT.local_var
+Lua4LineInfo        = _DEFAULT.line_info
+Lua4ChunkConstants  = _DEFAULT.constants
+Lua4Instruction     = _DEFAULT.instruction
+Lua4Chunk           = _DEFAULT.chunk
+Lua4File            = _DEFAULT.file
+
+_variant_structs = {}
+
+def variant_structs(variant):
+    """lua4_structs() of a lua4dec.variant.Lua4Variant, built once."""
+    structs = _variant_structs.get(variant)
+    if structs is None:
+        structs = _variant_structs[variant] = lua4_structs(variant.little_endian,
+            variant.size_int, variant.size_t, variant.size_instruction, variant.size_number)
+    return structs
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import bisect
+import io
+import mmap
+import os
+import struct
+
+from lua4dec.fast_parser import Lua4FastParser
+from lua4dec.util import has_fileno
+
+# Patch-and-rebuild writer. A Lua4Patcher scans the chunk layout of the
+# original file once (see Lua4FastParser.scan_chunk) and records edits as
+# replacements of byte ranges of it. Lua4 files have no byte length fields,
+# only element counts in front of each array, so an edit never touches the
+# bytes around it: the new file is the untouched ranges of the original,
+# copied without decoding (os.sendfile() when both ends are files), with
+# the re-encoded ranges in between. Edits are encoded for the file's own
+# variant (see lua4dec.variant) and instruction words are taken as they
+# are stored, in that variant's instruction layout.
+
+SENDFILE_CHUNK      = 64 * 1024 * 1024
+
+class Lua4PatchError(ValueError):
+    pass
+
+class Lua4Patcher(object):
+    """Edits to one Lua4 file. `source` is a filename, a file object or the
+    file's bytes; files are memory-mapped. Chunks are addressed by their
+    path, the indexes into constants.function leading to them.
+    """
+    def __init__(self, source):
+        self._file = None
+        self._map = None
+        self._fd = None
+        if hasattr(source, 'read') and not has_fileno(source):
+            source = source.read()
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            data = source
+        else:
+            if not hasattr(source, 'fileno'):
+                source = self._file = open(source, 'rb')
+            data = self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            self._fd = source.fileno()
+        self._view = memoryview(data)
+        parser = self._parser = Lua4FastParser(self._view)
+        self.header = parser.read_header()
+        self.self_check = parser.read_self_check()
+        self.chunks = parser.scan_chunk()
+        self.variant = parser.variant
+        self._decoder = parser._decoder
+        self._size = len(self._view)
+        # sorted start offsets of the edits and (start, end, data) by start
+        self._starts = []
+        self._edits = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._view is None:
+            return
+        self._starts = []
+        self._edits = {}
+        self._parser.release()
+        self._view.release()
+        self._view = None
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+
+    def layout(self, path=()):
+        layout = self.chunks[0]
+        for i in path:
+            if not 0 <= i < len(layout.children):
+                raise Lua4PatchError('no function constant {0} in chunk {1}'.format(i,
+                    list(layout.path)))
+            layout = self.chunks[layout.children[i]]
+        return layout
+
+    def chunk_bytes(self, path=()):
+        """The encoded chunk at `path` as a memoryview of the original, e.g.
+        to replace_chunk() it into a file of the same variant.
+        """
+        layout = self.layout(path)
+        return self._view[layout.start:layout.end]
+
+    @property
+    def edits(self):
+        return len(self._starts)
+
+    def _count_at(self, offset):
+        self._parser.offset = offset
+        return self._parser._read_count()
+
+    def _replace(self, start, end, data):
+        i = bisect.bisect_left(self._starts, start)
+        if i < len(self._starts) and self._starts[i] == start and self._edits[start][0] == end:
+            # the same range again, the later edit wins
+            self._edits[start] = (end, data)
+            return
+        if (i > 0 and self._edits[self._starts[i - 1]][0] > start) or \
+                (i < len(self._starts) and self._starts[i] < end):
+            raise Lua4PatchError('edit of 0x{0:X}-0x{1:X} overlaps an earlier edit'.format(
+                start, end))
+        self._starts.insert(i, start)
+        self._edits[start] = (end, data)
+
+    def _encode_string(self, value):
+        # same encoding as parser.Lua4StringAdapter, the length includes the
+        # terminating null byte
+        return self._decoder.size_t.pack(len(value) + 1) + value + b'\x00'
+
+    def set_instruction(self, path, pc, instruction):
+        layout = self.layout(path)
+        count = self._count_at(layout.instruction)
+        if not 0 <= pc < count:
+            raise Lua4PatchError('pc {0} out of range for {1} instructions'.format(pc, count))
+        size = self.variant.size_instruction
+        start = layout.instruction + self.variant.size_int + pc * size
+        self._replace(start, start + size, struct.pack(self._decoder.order +
+            self._decoder.instruction_code, instruction))
+
+    def set_instructions(self, path, instructions):
+        layout = self.layout(path)
+        decoder = self._decoder
+        self._replace(layout.instruction, layout.end, decoder.int.pack(len(instructions)) +
+            struct.pack('{0}{1:d}{2}'.format(decoder.order, len(instructions),
+                decoder.instruction_code), *instructions))
+
+    def set_string(self, path, index, value):
+        layout = self.layout(path)
+        parser = self._parser
+        count = self._count_at(layout.string)
+        if not 0 <= index < count:
+            raise Lua4PatchError('string constant {0} out of range for {1} strings'.format(
+                index, count))
+        for _ in range(index):
+            parser._skip_string()
+        start = parser.offset
+        parser._skip_string()
+        self._replace(start, parser.offset, self._encode_string(value))
+
+    def set_strings(self, path, values):
+        layout = self.layout(path)
+        self._replace(layout.string, layout.number, self._decoder.int.pack(len(values)) +
+            b''.join(self._encode_string(v) for v in values))
+
+    def replace_chunk(self, path, chunk):
+        """Swap the chunk at `path` for another one, either already encoded
+        for this file's variant (bytes or a memoryview such as another
+        Lua4Patcher's chunk_bytes()) or a model chunk, which is encoded with
+        the construct definitions.
+        """
+        layout = self.layout(path)
+        if not isinstance(chunk, (bytes, bytearray, memoryview)):
+            if not self.variant.default_layout:
+                raise Lua4PatchError('model chunks can only be encoded for the default '
+                    'instruction layout')
+            from lua4dec.parser import variant_structs
+            chunk = variant_structs(self.variant).chunk.build(chunk)
+        elif isinstance(chunk, memoryview):
+            # a copy, so the patcher it came from can be closed first
+            chunk = chunk.tobytes()
+        self._replace(layout.start, layout.end, chunk)
+
+    def segments(self):
+        """The new file in order, as (start, end) ranges of the original and
+        bytes-like objects of replaced data.
+        """
+        offset = 0
+        for start in self._starts:
+            end, data = self._edits[start]
+            if start > offset:
+                yield (offset, start)
+            yield data
+            offset = end
+        if offset < self._size:
+            yield (offset, self._size)
+
+    def write(self, stream):
+        """Write the patched file to `stream`, returns its size."""
+        view = self._view
+        out_fd = stream.fileno() if self._map is not None and has_fileno(stream) else None
+        if out_fd is not None:
+            stream.flush()
+        total = 0
+        for segment in self.segments():
+            if isinstance(segment, tuple):
+                start, end = segment
+                if out_fd is not None:
+                    _sendfile(out_fd, self._fd, start, end - start)
+                else:
+                    stream.write(view[start:end])
+                total += end - start
+            else:
+                if out_fd is not None:
+                    _write_fd(out_fd, segment)
+                else:
+                    stream.write(segment)
+                total += len(segment)
+        return total
+
+    def to_bytes(self):
+        out = io.BytesIO()
+        self.write(out)
+        return out.getvalue()
+
+    def save(self, filename):
+        with open(filename, 'wb') as out_f:
+            return self.write(out_f)
+
+def _write_fd(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def _sendfile(out_fd, in_fd, offset, count):
+    sendfile = getattr(os, 'sendfile', None)
+    while count > 0:
+        if sendfile is not None:
+            try:
+                sent = sendfile(out_fd, in_fd, offset, min(count, SENDFILE_CHUNK))
+            except OSError:
+                sendfile = None
+                continue
+        else:
+            sent = os.write(out_fd, os.pread(in_fd, min(count, SENDFILE_CHUNK), offset))
+        if sent == 0:
+            raise Lua4PatchError('unexpected end of the original file')
+        offset += sent
+        count -= sent
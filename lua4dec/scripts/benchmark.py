@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import lua4dec
+from lua4dec.loader import BYTECODE_ENGINES, load_stream
+from lua4dec.formatter import Lua4DebugFormatter
+from lua4dec.synth import generate_file, count_instructions, DEFAULT_DEPTH, \
+    DEFAULT_FANOUT, DEFAULT_STRINGS, DEFAULT_SEED
+from lua4dec.parser import Lua4File
+
+PHASES          = ('parse', 'format')
+DEFAULT_SIZES   = (1000, 10000, 100000)
+DEFAULT_REPEAT  = 3
+# module whose import is the CLI's cold start cost
+STARTUP_MODULE  = 'lua4dec.scripts.decompile'
+
+class _NullWriter(object):
+    def write(self, data):
+        pass
+
+def peak_rss_kb():
+    # VmHWM only covers this process image and can be reset, ru_maxrss
+    # also counts the process it was forked from before an exec
+    try:
+        with open('/proc/self/status') as status_f:
+            for line in status_f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB everywhere else
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def reset_peak_rss():
+    """Lower the peak RSS to the current RSS where the OS allows it (Linux)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as refs_f:
+            refs_f.write('5')
+    except (IOError, OSError):
+        pass
+
+def write_input(directory, instructions, depth, fanout, strings, seed):
+    """Generate the byte code for a case into `directory`, returns its path
+    and the number of instructions it holds.
+    """
+    lua_file = generate_file(instructions, depth, fanout, strings, seed)
+    path = os.path.join(directory, 'i{0}-d{1}-f{2}-s{3}-r{4}.luac'.format(instructions, depth,
+        fanout, strings, seed))
+    with open(path, 'wb') as out_f:
+        out_f.write(Lua4File.build(lua_file))
+    return path, count_instructions(lua_file.code_chunk)
+
+def run_case(case):
+    """Time one (phase, engine, input) case, returns its result dict. Meant
+    to run in a fresh process so the peak RSS belongs to this case alone;
+    `rss_growth_kb` is how far the measured runs raised it above what
+    reading the input (and for 'format' parsing it) took.
+    """
+    name, phase, engine, path, total, repeat = case
+    with open(path, 'rb') as in_f:
+        data = in_f.read()
+    lua_file = None
+    if phase == 'format':
+        lua_file = load_stream(io.BytesIO(data), engine)
+    reset_peak_rss()
+    rss_before = peak_rss_kb()
+
+    timings = []
+    for _ in range(repeat):
+        if phase == 'parse':
+            start = time.perf_counter()
+            load_stream(io.BytesIO(data), engine)
+            timings.append(time.perf_counter() - start)
+        else:
+            start = time.perf_counter()
+            Lua4DebugFormatter().dump(lua_file, _NullWriter())
+            timings.append(time.perf_counter() - start)
+    peak_rss = peak_rss_kb()
+
+    best = min(timings)
+    return {
+        'case':                 name,
+        'phase':                phase,
+        'engine':               engine,
+        'instructions':         total,
+        'bytes':                len(data),
+        'seconds':              best,
+        'seconds_all':          timings,
+        'instructions_per_sec': total / best if best else None,
+        'rss_before_kb':        rss_before,
+        'peak_rss_kb':          peak_rss,
+        'rss_growth_kb':        None if peak_rss is None else peak_rss - rss_before,
+    }
+
+def run_suite(cases, isolate=True):
+    """Run (phase, engine, instructions, depth, fanout, strings, seed, repeat)
+    cases. The inputs are generated here beforehand and each case runs in a
+    newly spawned process unless `isolate` is false, so neither generating
+    the input nor earlier cases count towards a case's peak RSS.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='lua4dec-bench-')
+    inputs = {}
+    results = []
+    try:
+        context = multiprocessing.get_context('spawn')
+        for phase, engine, instructions, depth, fanout, strings, seed, repeat in cases:
+            key = (instructions, depth, fanout, strings, seed)
+            if key not in inputs:
+                inputs[key] = write_input(tmp_dir, *key)
+            path, total = inputs[key]
+            case = ('{0}/{1}/i={2},d={3},f={4},s={5}'.format(phase, engine, instructions, depth,
+                fanout, strings), phase, engine, path, total, repeat)
+            if isolate:
+                pool = context.Pool(1, maxtasksperchild=1)
+                try:
+                    results.append(pool.apply(run_case, (case,)))
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results.append(run_case(case))
+    finally:
+        shutil.rmtree(tmp_dir)
+    return results
+
+def _time_python(code):
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, '-c', code])
+    return time.perf_counter() - start
+
+def measure_startup(repeat=DEFAULT_REPEAT, module=STARTUP_MODULE):
+    """Milliseconds a fresh interpreter spends importing `module`, the best
+    of `repeat` runs minus the best of the same number of bare interpreter
+    starts.
+    """
+    baseline = min(_time_python('pass') for _ in range(repeat))
+    startup = min(_time_python('import ' + module) for _ in range(repeat))
+    return {
+        'module':       module,
+        'import_ms':    max(0.0, startup - baseline) * 1000,
+        'python_ms':    baseline * 1000,
+    }
+
+def compare(results, baseline):
+    """Lines describing the change of every case also present in `baseline`."""
+    old = dict((r['case'], r) for r in baseline['results'])
+    lines = []
+    for result in results:
+        before = old.get(result['case'])
+        if before is None or not before['seconds']:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        lines.append('{0:48s} {1:9.4f}s -> {2:9.4f}s  x{3:.2f}'.format(result['case'],
+            before['seconds'], result['seconds'], ratio))
+    return lines
+
+def lua4_benchmark():
+    parser = argparse.ArgumentParser(prog='lua4dec-bench',
+        description='Benchmark parsing and formatting of synthetic Lua 4 byte code')
+    parser.add_argument('-i', '--instructions', type=int, nargs='+', default=list(DEFAULT_SIZES),
+        help='instructions per chunk, one case per value (default: %(default)s)')
+    parser.add_argument('-d', '--depth', type=int, default=DEFAULT_DEPTH,
+        help='nesting depth of constants.function (default: %(default)s)')
+    parser.add_argument('-f', '--fanout', type=int, default=DEFAULT_FANOUT,
+        help='nested functions per chunk (default: %(default)s)')
+    parser.add_argument('-s', '--strings', type=int, default=DEFAULT_STRINGS,
+        help='string constants per chunk (default: %(default)s)')
+    parser.add_argument('--engine', choices=BYTECODE_ENGINES, nargs='+',
+        default=list(BYTECODE_ENGINES), help='parser engines to measure (default: all)')
+    parser.add_argument('--phase', choices=PHASES, nargs='+', default=list(PHASES),
+        help='what to measure (default: all)')
+    parser.add_argument('-r', '--repeat', type=int, default=DEFAULT_REPEAT,
+        help='runs per case, the fastest is reported (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED,
+        help='generator seed (default: %(default)s)')
+    parser.add_argument('--no-isolate', action='store_true',
+        help='run all cases in this process, peak RSS is then cumulative')
+    parser.add_argument('-o', '--output', default='-',
+        help='write JSON results to this file (default: stdout)')
+    parser.add_argument('--compare', default=None,
+        help='JSON results of an earlier run to compare against')
+    parser.add_argument('--import-budget', type=float, default=None, metavar='MS',
+        help='fail when importing the lua4dec CLI takes longer than MS milliseconds')
+    parser.add_argument('--startup-only', action='store_true',
+        help='only measure the CLI import time, skip the parse and format cases')
+    args = parser.parse_args()
+
+    startup = measure_startup(max(args.repeat, 1))
+    results = []
+    if not args.startup_only:
+        cases = [(phase, engine, size, args.depth, args.fanout, args.strings, args.seed,
+            args.repeat) for size in args.instructions for engine in args.engine
+            for phase in args.phase]
+        results = run_suite(cases, not args.no_isolate)
+
+    report = {
+        'version':  lua4dec.__version__,
+        'python':   platform.python_version(),
+        'platform': platform.platform(),
+        'config':   {
+            'depth':    args.depth,
+            'fanout':   args.fanout,
+            'strings':  args.strings,
+            'seed':     args.seed,
+            'repeat':   args.repeat,
+        },
+        'startup':  startup,
+        'results':  results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as out_f:
+            out_f.write(text + '\n')
+
+    if args.compare:
+        with open(args.compare) as in_f:
+            for line in compare(results, json.load(in_f)):
+                sys.stderr.write(line + '\n')
+
+    if args.import_budget is not None and startup['import_ms'] > args.import_budget:
+        sys.stderr.write('lua4dec-bench: importing {0} took {1:.1f}ms, over the {2:.1f}ms '
+            'budget\n'.format(startup['module'], startup['import_ms'], args.import_budget))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    lua4_benchmark()
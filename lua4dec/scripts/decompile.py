@@ -24,23 +24,243 @@
 # SOFTWARE.
 
 import argparse
+import sys
 
-from lua4dec.parser import Lua4File
-from lua4dec.formatter import Lua4DebugFormatter
+from lua4dec.loader import PARSER_ENGINES, DEFAULT_ENGINE, ENGINE_FAST
+from lua4dec.formatter import FORMATTERS, DEFAULT_FORMATTER
+from lua4dec.stats import Stats, NULL_STATS
+# batch, cache and interning pull in the process pool, hashing and pickling
+# machinery and are imported in _run so that --help and argument errors
+# return without loading them, their defaults come from lua4dec.defaults
+from lua4dec.defaults import DEFAULT_CHUNKSIZE, DEFAULT_CACHE_SIZE, DEFAULT_MAX_DEPTH, \
+    DEFAULT_MAX_INSTRUCTIONS, DEFAULT_MAX_STRING_BYTES, EXPORT_FORMATS
+
+DEFAULT_CACHE_MIB   = DEFAULT_CACHE_SIZE >> 20
 
 def lua4_decompile():
     parser = argparse.ArgumentParser(prog='lua4dec',
         description='Decompile Lua 4 bytecode files')
-    parser.add_argument('source')
-    parser.add_argument('dest')
+    parser.add_argument('source', nargs='+',
+        help='byte code file, or with --batch files, directories and glob patterns')
+    parser.add_argument('dest',
+        help='output file, or with --batch the output directory')
+    parser.add_argument('--engine', choices=PARSER_ENGINES, default=None,
+        help='byte code parser implementation (default: {0})'.format(DEFAULT_ENGINE))
+    parser.add_argument('--format', choices=sorted(FORMATTERS), default=DEFAULT_FORMATTER,
+        help='output format, a disassembly listing or Lua source (default: %(default)s)')
+    parser.add_argument('--batch', action='store_true',
+        help='decompile many files into a directory mirroring the input tree')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of worker processes in batch mode (default: one per CPU)')
+    parser.add_argument('--render-jobs', type=int, default=1, metavar='N',
+        help='render the prototypes of a single large file on N processes, 0 for one per CPU '
+            '(default: %(default)s)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+        help='files handed to a worker at a time in batch mode (default: %(default)s)')
+    parser.add_argument('--report', default=None,
+        help='write a JSON summary of the batch run to this file (- for stdout)')
+    parser.add_argument('--cache-dir', default=None,
+        help='reuse output of previous runs for unchanged input files from this directory')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_MIB,
+        help='maximum cache size in MiB (default: %(default)s)')
+    parser.add_argument('--cache-models', action='store_true',
+        help='also cache the parsed model, other formats of the same file then skip parsing')
+    parser.add_argument('--manifest', default=None, metavar='FILE',
+        help='only re-render prototypes that changed since the run that wrote FILE and '
+            'update it (debug format only, not with --batch)')
+    parser.add_argument('--stream', action='store_true',
+        help='render each prototype as soon as it is read and drop it, memory use follows the '
+            'nesting depth instead of the file size (debug format only, not with --batch)')
+    parser.add_argument('--diff', action='store_true',
+        help='list the prototypes that differ between two byte code files (source OLD NEW) '
+            'instead of decompiling, dest is the report file (- for stdout)')
+    parser.add_argument('--export', choices=EXPORT_FORMATS, default=None, metavar='FORMAT',
+        help='write the chunk, instruction, constant and local tables of all sources (files, '
+            'directories and glob patterns) into dest as one file per table; one of '
+            '%(choices)s, parquet and arrow need pyarrow')
+    parser.add_argument('--validate', action='store_true',
+        help='only check that the sources (files, directories and glob patterns) are well formed '
+            'and within the limits, dest is the report file (- for stdout)')
+    parser.add_argument('--max-depth', type=int, default=DEFAULT_MAX_DEPTH, metavar='N',
+        help='reject files with prototypes nested deeper than N, 0 for no limit; the '
+            'construct engine never goes beyond the default (default: %(default)s)')
+    parser.add_argument('--max-instructions', type=int, default=DEFAULT_MAX_INSTRUCTIONS,
+        metavar='N', help='reject files with more than N instructions in total, 0 for no limit '
+            '(default: %(default)s)')
+    parser.add_argument('--max-string-bytes', type=int, default=DEFAULT_MAX_STRING_BYTES,
+        metavar='N', help='reject files with more than N bytes of strings in total, 0 for no '
+            'limit (default: %(default)s)')
+    parser.add_argument('--intern-strings', action='store_true',
+        help='store repeated decoded strings of a file once')
+    parser.add_argument('--stats', action='store_true',
+        help='print per-phase timings, counters and an opcode histogram to stderr')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+        help='run under cProfile and save the profile to FILE (- to print the top entries); '
+            'only covers this process, use -j 1 in batch mode')
 
     args = parser.parse_args()
+    if args.engine is None:
+        # --stream reads with the fast parser, only an explicit other engine
+        # is an error there
+        args.engine = ENGINE_FAST if args.stream else DEFAULT_ENGINE
+
+    stats = Stats() if args.stats else NULL_STATS
+    if args.profile:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        try:
+            status = profiler.runcall(_run, parser, args, stats)
+        finally:
+            if args.profile == '-':
+                pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+            else:
+                profiler.dump_stats(args.profile)
+    else:
+        status = _run(parser, args, stats)
+    if stats.enabled:
+        sys.stderr.write('\n'.join(stats.report()) + '\n')
+    if status:
+        sys.exit(status)
+
+def _limits(args):
+    from lua4dec.fast_parser import Lua4Limits
+
+    return Lua4Limits(args.max_depth or None, args.max_instructions or None,
+        args.max_string_bytes or None)
+
+def _run(parser, args, stats):
+    from lua4dec.batch import decompile_file, run_batch, summarize, write_report, \
+        OutputConflictError
+    from lua4dec.cache import DecompileCache
+    from lua4dec.interning import StringTable
+
+    if args.validate:
+        return _run_validate(parser, args, stats)
+    if args.export:
+        return _run_export(parser, args, stats)
+    if args.diff:
+        return _run_diff(parser, args)
+    if args.manifest:
+        return _run_incremental(parser, args, stats)
+    if args.stream:
+        return _run_stream(parser, args, stats)
+    limits = _limits(args)
+
+    formatter_class = FORMATTERS[args.format]
+    cache = None
+    if args.cache_dir:
+        cache = DecompileCache(args.cache_dir, args.cache_size * 1024 * 1024,
+            store_models=args.cache_models)
+
+    if not args.batch:
+        if len(args.source) != 1:
+            parser.error('multiple sources require --batch')
+        cache_hit = decompile_file(args.source[0], args.dest, args.engine,
+            formatter_class, cache, stats, StringTable() if args.intern_strings else None,
+            args.render_jobs or None, limits)
+        if cache is not None:
+            sys.stderr.write('lua4dec: cache {0}\n'.format('hit' if cache_hit else 'miss'))
+        return 0
+
+    if args.render_jobs != 1:
+        parser.error('--render-jobs only applies to a single source, use -j in batch mode')
+    try:
+        results = run_batch(args.source, args.dest, engine=args.engine,
+            formatter_class=formatter_class, workers=args.jobs, chunksize=args.chunksize,
+            cache=cache, stats=stats, intern_strings=args.intern_strings, limits=limits)
+    except OutputConflictError as err:
+        parser.error(str(err))
+    summary = summarize(results)
+    sys.stderr.write('lua4dec: {succeeded}/{total} files decompiled, {failed} failed\n'.format(
+        **summary))
+    if cache is not None:
+        sys.stderr.write('lua4dec: cache {cache_hits} hits, {cache_misses} misses\n'.format(
+            **summary))
+    if args.report == '-':
+        write_report(results, sys.stdout)
+    elif args.report:
+        with open(args.report, 'w') as report_f:
+            write_report(results, report_f)
+    return 1 if summary['failed'] else 0
+
+def _run_validate(parser, args, stats):
+    from lua4dec.validate import validate_corpus, format_results
 
-    with open(args.source, 'rb') as lua_file:
-        lua_obj = Lua4File.parse_stream(lua_file)
-        formatter = Lua4DebugFormatter()
+    results = validate_corpus(args.source, _limits(args), args.jobs, args.chunksize, stats)
+    lines = format_results(results)
+    text = ''.join(line + '\n' for line in lines)
+    if args.dest == '-':
+        sys.stdout.write(text)
+    else:
         with open(args.dest, 'w') as out_f:
-            formatter.dump(lua_obj, out_f)
+            out_f.write(text)
+    sys.stderr.write('lua4dec: {0}/{1} files valid\n'.format(len(results) - len(lines),
+        len(results)))
+    return 1 if lines else 0
+
+def _run_export(parser, args, stats):
+    from lua4dec.export import export_corpus
+
+    try:
+        exporter, failures = export_corpus(args.source, args.dest, args.export, args.engine,
+            stats, _limits(args))
+    except ImportError as err:
+        parser.error(str(err))
+    for source, error in failures:
+        sys.stderr.write('lua4dec: failed to export {0}: {1}\n'.format(source, error))
+    rows = exporter.rows()
+    sys.stderr.write('lua4dec: {0} files exported, {1} failed ({2})\n'.format(exporter.files,
+        len(failures), ', '.join('{0} {1}'.format(rows[t], t) for t in sorted(rows))))
+    return 1 if failures else 0
+
+def _run_diff(parser, args):
+    from lua4dec.incremental import diff_files, format_changes
+
+    if len(args.source) != 2:
+        parser.error('--diff needs exactly two sources, the old and new file')
+    lines = format_changes(diff_files(args.source[0], args.source[1], args.engine))
+    text = ''.join(line + '\n' for line in lines)
+    if args.dest == '-':
+        sys.stdout.write(text)
+    else:
+        with open(args.dest, 'w') as out_f:
+            out_f.write(text)
+    # like diff(1), 1 means the files differ
+    return 1 if lines else 0
+
+def _run_incremental(parser, args, stats):
+    from lua4dec.incremental import decompile_incremental
+    from lua4dec.interning import StringTable
+
+    if args.batch or len(args.source) != 1:
+        parser.error('--manifest only works on a single source')
+    if args.format != 'debug':
+        parser.error('--manifest only supports the debug format')
+    if args.cache_dir:
+        parser.error('--manifest cannot be combined with --cache-dir')
+    formatter = decompile_incremental(args.source[0], args.dest, args.manifest, args.engine,
+        stats, StringTable() if args.intern_strings else None, _limits(args))
+    sys.stderr.write('lua4dec: {0} prototypes reused, {1} rendered\n'.format(
+        formatter.reused, formatter.rendered))
+    return 0
+
+def _run_stream(parser, args, stats):
+    from lua4dec.stream import decompile_stream
+    from lua4dec.interning import StringTable
+
+    if args.batch or len(args.source) != 1:
+        parser.error('--stream only works on a single source')
+    if args.format != 'debug':
+        parser.error('--stream only supports the debug format')
+    if args.cache_dir or args.render_jobs != 1:
+        parser.error('--stream cannot be combined with --cache-dir or --render-jobs')
+    if args.engine != ENGINE_FAST:
+        parser.error('--stream always reads with the {0} parser, --engine {1} does not '
+            'apply'.format(ENGINE_FAST, args.engine))
+    decompile_stream(args.source[0], args.dest, stats,
+        StringTable() if args.intern_strings else None, limits=_limits(args))
+    return 0
 
 if __name__ == '__main__':
     lua4_decompile()
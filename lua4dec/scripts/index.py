@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from lua4dec.loader import BYTECODE_ENGINES, ENGINE_FAST
+from lua4dec.index import Lua4Index, KIND_NAMES
+from lua4dec.batch import DEFAULT_CHUNKSIZE
+
+def lua4_index():
+    parser = argparse.ArgumentParser(prog='lua4dec-index',
+        description='Index and search the globals and strings used by Lua 4 bytecode files')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    build = commands.add_parser('build', help='create or update an index')
+    build.add_argument('index', help='index database file')
+    build.add_argument('source', nargs='+', help='files, directories and glob patterns')
+    build.add_argument('--engine', choices=BYTECODE_ENGINES,
+        default=ENGINE_FAST, help='byte code parser implementation (default: %(default)s)')
+    build.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: one per CPU)')
+    build.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+        help='files handed to a worker at a time (default: %(default)s)')
+
+    query = commands.add_parser('query', help='find the uses of a symbol')
+    query.add_argument('index', help='index database file')
+    query.add_argument('symbol', help='global name or string constant')
+    query.add_argument('--kind', choices=KIND_NAMES, action='append', default=None,
+        help='only this kind of use, may be repeated (default: all)')
+    query.add_argument('--glob', action='store_true',
+        help='treat the symbol as a glob pattern (* ? [...])')
+    query.add_argument('--limit', type=int, default=None, help='at most this many results')
+    query.add_argument('--files', action='store_true', help='only list the matching files')
+    query.add_argument('--json', action='store_true', help='print results as JSON lines')
+
+    args = parser.parse_args()
+    if args.command == 'query' and not os.path.exists(args.index):
+        parser.error('no index at {0}, create it with the build command'.format(args.index))
+
+    with Lua4Index(args.index) as index:
+        if args.command == 'build':
+            start = time.time()
+            counts = index.update(args.source, args.engine, args.jobs, args.chunksize)
+            sys.stderr.write('lua4dec-index: {indexed} indexed, {unchanged} unchanged, '
+                '{removed} removed, {failed} failed in {elapsed:.2f}s\n'.format(
+                    elapsed=time.time() - start, **counts))
+            if counts['failed']:
+                sys.exit(1)
+            return
+
+        kinds = [KIND_NAMES.index(k) for k in args.kind] if args.kind else None
+        hits = index.query(args.symbol, kinds, args.glob, args.limit)
+        if args.files:
+            for path in sorted(set(hit.path for hit in hits)):
+                print(path)
+        elif args.json:
+            for hit in hits:
+                print(json.dumps(hit.as_dict(), sort_keys=True))
+        else:
+            for hit in hits:
+                print('{0}:{1}:{2} {3} {4}'.format(hit.path, hit.chunk,
+                    '-' if hit.pc is None else hit.pc, hit.kind_name, hit.symbol))
+        if not hits:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    lua4_index()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import base64
+import logging
+import os
+import sys
+
+from lua4dec.client import request, default_address, Lua4ServerError, DEFAULT_TIMEOUT
+
+# The client entry point only imports lua4dec.client, the server side is
+# imported when the server actually starts.
+
+def lua4_server():
+    from lua4dec.loader import PARSER_ENGINES, ENGINE_FAST
+    from lua4dec.formatter import FORMATTERS, DEFAULT_FORMATTER
+    from lua4dec.server import Lua4DecompileServer, DEFAULT_MAX_PENDING
+
+    parser = argparse.ArgumentParser(prog='lua4dec-server',
+        description='Run a persistent Lua 4 decompile server')
+    parser.add_argument('--address', default=default_address(),
+        help='unix:PATH or HOST:PORT to listen on (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+        help='requests allowed to wait for a worker before rejecting (default: %(default)s)')
+    parser.add_argument('--engine', choices=PARSER_ENGINES, default=ENGINE_FAST,
+        help='default byte code parser implementation (default: %(default)s)')
+    parser.add_argument('--format', choices=sorted(FORMATTERS), default=DEFAULT_FORMATTER,
+        help='default output format (default: %(default)s)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='lua4dec-server: %(message)s')
+    server = Lua4DecompileServer(args.address, args.jobs, args.timeout, args.max_pending,
+        args.engine, args.format)
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+
+def lua4_client():
+    parser = argparse.ArgumentParser(prog='lua4dec-client',
+        description='Decompile through a running lua4dec-server')
+    parser.add_argument('source', nargs='?', help='byte code file')
+    parser.add_argument('dest', nargs='?', help='output file (default: stdout)')
+    parser.add_argument('--address', default=default_address(),
+        help='server address (default: %(default)s)')
+    parser.add_argument('--format', default=None, help='output format (default: server default)')
+    parser.add_argument('--engine', default=None, help='parser engine (default: server default)')
+    parser.add_argument('--send-data', action='store_true',
+        help='send the file contents instead of its path, for servers on another machine')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+        help='seconds to wait for the server (default: %(default)s)')
+    parser.add_argument('--ping', action='store_true', help='check that the server is up')
+    parser.add_argument('--stats', action='store_true', help='print server counters')
+    parser.add_argument('--shutdown', action='store_true', help='stop the server')
+    args = parser.parse_args()
+
+    try:
+        for op, wanted in (('ping', args.ping), ('stats', args.stats), ('shutdown', args.shutdown)):
+            if wanted:
+                response = request({'op': op}, args.address, args.timeout)
+                if op == 'stats':
+                    for name in sorted(response):
+                        if name != 'ok':
+                            print('{0}: {1}'.format(name, response[name]))
+                return
+        if args.source is None:
+            parser.error('a source file is required')
+
+        message = {'op': 'decompile', 'id': 1}
+        if args.send_data:
+            with open(args.source, 'rb') as lua_file:
+                message['data'] = base64.b64encode(lua_file.read()).decode('ascii')
+        else:
+            message['path'] = os.path.abspath(args.source)
+        if args.format:
+            message['format'] = args.format
+        if args.engine:
+            message['engine'] = args.engine
+        response = request(message, args.address, args.timeout)
+        if not response.get('ok'):
+            raise Lua4ServerError(response.get('error', 'unknown error'))
+    except (OSError, Lua4ServerError) as err:
+        sys.stderr.write('lua4dec-client: {0}\n'.format(err))
+        sys.exit(1)
+
+    if args.dest:
+        with open(args.dest, 'w') as out_f:
+            out_f.write(response['output'])
+    else:
+        sys.stdout.write(response['output'])
+
+if __name__ == '__main__':
+    lua4_client()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+
+from lua4dec.loader import BYTECODE_ENGINES, DEFAULT_ENGINE, load_file
+from lua4dec.snapshot import save_snapshot
+
+def lua4_snapshot():
+    parser = argparse.ArgumentParser(prog='lua4dec-snapshot',
+        description='Convert Lua 4 bytecode into a fast loading lua4dec snapshot')
+    parser.add_argument('source', help='byte code file')
+    parser.add_argument('dest', help='snapshot file to write')
+    parser.add_argument('--engine', choices=BYTECODE_ENGINES,
+        default=DEFAULT_ENGINE, help='byte code parser implementation (default: %(default)s)')
+    args = parser.parse_args()
+
+    save_snapshot(load_file(args.source, args.engine), args.dest)
+
+if __name__ == '__main__':
+    lua4_snapshot()
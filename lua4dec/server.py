@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import base64
+import concurrent.futures
+import io
+import json
+import logging
+import os
+import socket
+import time
+
+from lua4dec.client import parse_address, DEFAULT_TIMEOUT
+from lua4dec.loader import load_stream, PARSER_ENGINES, ENGINE_FAST, ENGINE_SNAPSHOT
+
+logger = logging.getLogger('lua4dec.server')
+
+# Long running decompile server. Connections are handled by asyncio, the
+# decompiling itself happens in a pool of worker processes that import
+# everything and run a warm-up file once at start, so a request only pays
+# for parsing and formatting its own file. Requests wait for a free worker
+# (at most `max_pending` of them, further ones are rejected as busy) and
+# each one fails with a timeout error after `timeout` seconds, although its
+# worker stays busy with it until the job is done. A pool whose worker died
+# is replaced. See lua4dec.client for the protocol.
+
+DEFAULT_MAX_PENDING     = 256
+# asyncio's default 64 KiB line limit is too small for inline file data
+MAX_REQUEST_SIZE        = 64 * 1024 * 1024
+
+def _warm_worker():
+    from lua4dec.formatter import FORMATTERS
+    from lua4dec.synth import generate_bytes
+    data = generate_bytes(64, depth=1)
+    for engine in PARSER_ENGINES:
+        if engine == ENGINE_SNAPSHOT:
+            continue
+        lua_file = load_stream(io.BytesIO(data), engine)
+        for formatter_class in FORMATTERS.values():
+            formatter_class().dump(lua_file, io.StringIO())
+
+def _decompile_task(path, data, engine, format_name):
+    # (output, None) or (None, error text); errors are caught here, like in
+    # batch._run_task, so that no exception has to travel back through the
+    # pool
+    from lua4dec.formatter import FORMATTERS
+    try:
+        if data is None:
+            with open(path, 'rb') as lua_file:
+                data = lua_file.read()
+        lua_file = load_stream(io.BytesIO(data), engine)
+        out_buf = io.StringIO()
+        FORMATTERS[format_name]().dump(lua_file, out_buf)
+    except Exception as err:
+        return None, '{0}: {1}'.format(type(err).__name__, err)
+    return out_buf.getvalue(), None
+
+class Lua4DecompileServer(object):
+    def __init__(self, address=None, workers=None, timeout=DEFAULT_TIMEOUT,
+            max_pending=DEFAULT_MAX_PENDING, engine=ENGINE_FAST, format_name=None,
+            executor=None):
+        from lua4dec.formatter import DEFAULT_FORMATTER
+        self.address = address
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.engine = engine
+        self.format_name = format_name or DEFAULT_FORMATTER
+        self._executor = executor
+        self._owns_executor = executor is None
+        self.counters = {'requests': 0, 'errors': 0, 'timeouts': 0, 'busy': 0}
+        self._pending = 0
+        self._slots = None
+        self._stopped = None
+        self._server = None
+        self._connections = {}
+
+    def _start_executor(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_warm_worker)
+
+    def _restart_executor(self, broken):
+        # a worker died (killed, out of memory), which leaves the whole pool
+        # unusable; replace it unless it was handed in or already replaced
+        if not self._owns_executor:
+            return False
+        if self._executor is broken:
+            logger.warning('Worker pool broke, starting a new one')
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._start_executor()
+        return True
+
+    def _submit(self, *args):
+        executor = self._executor
+        try:
+            return executor.submit(_decompile_task, *args)
+        except concurrent.futures.BrokenExecutor:
+            if not self._restart_executor(executor):
+                raise
+            return self._executor.submit(_decompile_task, *args)
+
+    async def start(self):
+        self._start_executor()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._stopped = asyncio.Event()
+        kind, target = parse_address(self.address)
+        if kind == 'unix':
+            self._remove_stale_socket(target)
+            self._server = await asyncio.start_unix_server(self._handle_connection, target,
+                limit=MAX_REQUEST_SIZE)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, *target,
+                limit=MAX_REQUEST_SIZE)
+        logger.info('Listening on %s with %d workers', self.address, self.workers)
+
+    def _remove_stale_socket(self, path):
+        if not os.path.exists(path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+        else:
+            raise RuntimeError('a server is already listening on {0}'.format(path))
+        finally:
+            probe.close()
+
+    async def serve(self):
+        await self.start()
+        try:
+            await self._stopped.wait()
+        finally:
+            await self.close()
+
+    def stop(self):
+        self._stopped.set()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # idle connections see EOF and their handlers return
+            for writer in list(self._connections.values()):
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+            kind, target = parse_address(self.address)
+            if kind == 'unix' and os.path.exists(target):
+                os.unlink(target)
+        if self._executor is not None and self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def _handle_connection(self, reader, writer):
+        write_lock = asyncio.Lock()
+        tasks = set()
+        connection = asyncio.current_task()
+        self._connections[connection] = writer
+
+        async def respond(line):
+            response = await self._handle_line(line)
+            async with write_lock:
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    writer.write(json.dumps({'ok': False, 'error': 'request too large'})
+                        .encode('utf-8') + b'\n')
+                    break
+                if not line:
+                    break
+                # requests on one connection run concurrently, responses are
+                # matched up by id
+                task = asyncio.ensure_future(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            del self._connections[connection]
+            writer.close()
+
+    async def _handle_line(self, line):
+        try:
+            message = json.loads(line.decode('utf-8'))
+            if not isinstance(message, dict):
+                raise ValueError('request must be a JSON object')
+        except ValueError as err:
+            self.counters['errors'] += 1
+            return {'ok': False, 'error': 'bad request: {0}'.format(err)}
+        response = await self.handle_request(message)
+        if 'id' in message:
+            response['id'] = message['id']
+        return response
+
+    async def handle_request(self, message):
+        op = message.get('op', 'decompile')
+        if op == 'ping':
+            return {'ok': True}
+        if op == 'stats':
+            return dict(self.counters, ok=True, pending=self._pending, workers=self.workers)
+        if op == 'shutdown':
+            self.stop()
+            return {'ok': True}
+        if op != 'decompile':
+            self.counters['errors'] += 1
+            return {'ok': False, 'error': 'unknown op {0!r}'.format(op)}
+
+        self.counters['requests'] += 1
+        if self._pending >= self.max_pending:
+            self.counters['busy'] += 1
+            return {'ok': False, 'error': 'server busy'}
+        self._pending += 1
+        start = time.time()
+        try:
+            output, error = await asyncio.wait_for(self._decompile(message), self.timeout)
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            return {'ok': False, 'error': 'timed out after {0}s'.format(self.timeout)}
+        except Exception as err:
+            self.counters['errors'] += 1
+            return {'ok': False, 'error': '{0}: {1}'.format(type(err).__name__, err)}
+        finally:
+            self._pending -= 1
+        if error is not None:
+            self.counters['errors'] += 1
+            return {'ok': False, 'error': error}
+        return {'ok': True, 'output': output, 'elapsed': time.time() - start}
+
+    async def _decompile(self, message):
+        from lua4dec.formatter import FORMATTERS
+        engine = message.get('engine', self.engine)
+        if engine not in PARSER_ENGINES:
+            raise ValueError('unknown parser engine: {0!r}'.format(engine))
+        format_name = message.get('format', self.format_name)
+        if format_name not in FORMATTERS:
+            raise ValueError('unknown format: {0!r}'.format(format_name))
+        path = message.get('path')
+        data = message.get('data')
+        if data is not None:
+            data = base64.b64decode(data)
+        elif path is None:
+            raise ValueError('decompile needs a path or data')
+
+        await self._slots.acquire()
+        try:
+            future = self._submit(path, data, engine, format_name)
+        except BaseException:
+            self._slots.release()
+            raise
+        # a timed out request still finishes in its worker and its result is
+        # dropped, the slot is only given back then so the pool never has
+        # more jobs than workers
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda f: self._release_slot(loop))
+        executor = self._executor
+        try:
+            return await asyncio.wrap_future(future)
+        except concurrent.futures.BrokenExecutor:
+            self._restart_executor(executor)
+            raise
+
+    def _release_slot(self, loop):
+        # called from the executor's thread
+        try:
+            loop.call_soon_threadsafe(self._slots.release)
+        except RuntimeError:
+            # the loop is already closed
+            pass
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+import io
+import mmap
+import struct
+import sys
+
+from lua4dec.model import Container, Lua4Chunk, Lua4Constants, Lua4LocalVar, UINT32_TYPECODE, \
+    INT32_TYPECODE, DOUBLE_TYPECODE
+from lua4dec.interning import StringTable
+
+# Flat binary snapshot of a parsed Lua4 file, for tools that load the same
+# byte code over and over. Everything lives in fixed size records and
+# contiguous little-endian sections addressed by offsets in the file header:
+#
+#   header          magic, counts and the offset of every section
+#   chunks          one _CHUNK record per prototype, in pre-order (the same
+#                   numbering as Lua4LazyFile.chunks), pointing into:
+#   locals          _LOCAL records (name id, start_pc, end_pc)
+#   children        chunk indexes of every chunk's constants.function
+#   kstrings        string ids of every chunk's constants.string
+#   numbers         doubles of every chunk's constants.number
+#   instructions    instruction words
+#   line_info       line info entries
+#   string index    offsets of the strings, n + 1 entries
+#   string data     every distinct string once
+#
+# Lua4Snapshot mmaps a snapshot and builds chunks on demand, with
+# instruction, line info and number constants as memoryviews straight
+# into the mapping, so any prototype can be loaded without touching the
+# rest of the file.
+
+SNAPSHOT_MAGIC      = b'L4SNAP\x00\x00'
+SNAPSHOT_VERSION    = 1
+SNAPSHOT_EXTENSION  = '.l4s'
+
+# magic, version, header (format_id, version, little_endian), self check
+# (7 sizes, test number), 8 counts, 9 section offsets
+_FILE_HEADER        = struct.Struct('<8sI BBB 7B d 8I 9Q')
+_CHUNK              = struct.Struct('<IiiBiiIIIIIIIIIIII')
+_LOCAL              = struct.Struct('<Iii')
+_ALIGN              = 8
+
+_NEED_BYTESWAP      = sys.byteorder != 'little'
+
+class SnapshotError(ValueError):
+    pass
+
+def _pad(length):
+    return -length % _ALIGN
+
+def _array_bytes(values):
+    if _NEED_BYTESWAP:
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def snapshot_bytes(lua_file):
+    """Serialize a parsed file (any engine) into snapshot bytes."""
+    strings = StringTable()
+    chunk_records = []
+    locals_ = array.array('B')
+    local_count = 0
+    children = array.array(UINT32_TYPECODE)
+    kstrings = array.array(UINT32_TYPECODE)
+    numbers = array.array(DOUBLE_TYPECODE)
+    instructions = array.array(UINT32_TYPECODE)
+    line_info = array.array(INT32_TYPECODE)
+
+    # pre-order numbering, then one record per chunk in that order
+    order = []
+    pending = [(lua_file.code_chunk, -1)]
+    while pending:
+        chunk, parent = pending.pop()
+        index = len(order)
+        order.append((chunk, parent))
+        for f in reversed(list(chunk.constants.function)):
+            pending.append((f, index))
+    child_lists = [[] for _ in order]
+    for index, (chunk, parent) in enumerate(order):
+        if parent >= 0:
+            child_lists[parent].append(index)
+
+    for index, (chunk, parent) in enumerate(order):
+        local_start = local_count
+        for local in chunk.local_var:
+            locals_.frombytes(_LOCAL.pack(strings.id_of(local.name), local.start_pc,
+                local.end_pc))
+            local_count += 1
+        line_start = len(line_info)
+        line_info.extend(chunk.line_info)
+        kstr_start = len(kstrings)
+        kstrings.extend(strings.id_of(s) for s in chunk.constants.string)
+        num_start = len(numbers)
+        numbers.extend(chunk.constants.number)
+        child_start = len(children)
+        children.extend(child_lists[index])
+        instr_start = len(instructions)
+        instructions.extend(chunk.instruction)
+        chunk_records.append(_CHUNK.pack(
+            strings.id_of(chunk.source), chunk.line_number, chunk.num_params,
+            1 if chunk.is_vararg else 0, chunk.max_stack_size, parent,
+            local_start, local_count - local_start,
+            line_start, len(line_info) - line_start,
+            kstr_start, len(kstrings) - kstr_start,
+            num_start, len(numbers) - num_start,
+            child_start, len(children) - child_start,
+            instr_start, len(instructions) - instr_start))
+
+    string_index = array.array('Q', [0])
+    string_data = bytearray()
+    for value in strings.strings:
+        string_data += value
+        string_index.append(len(string_data))
+
+    sections = [
+        b''.join(chunk_records),
+        locals_.tobytes(),
+        _array_bytes(children),
+        _array_bytes(kstrings),
+        _array_bytes(numbers),
+        _array_bytes(instructions),
+        _array_bytes(line_info),
+        _array_bytes(string_index),
+        bytes(string_data),
+    ]
+    offsets = []
+    position = _FILE_HEADER.size + _pad(_FILE_HEADER.size)
+    for data in sections:
+        offsets.append(position)
+        position += len(data) + _pad(len(data))
+
+    header, check = lua_file.header, lua_file.self_check
+    out = bytearray(_FILE_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+        header.format_id, header.version, 1 if header.little_endian else 0,
+        check.size_int, check.size_t, check.size_instruction, check.test_size_instruction,
+        check.test_size_op, check.test_size_b, check.size_number, check.test_fp_number,
+        len(order), local_count, len(children), len(kstrings), len(numbers),
+        len(instructions), len(line_info), len(strings), *offsets))
+    for data in sections:
+        out += b'\x00' * _pad(len(out))
+        out += data
+    return bytes(out)
+
+def write_snapshot(lua_file, stream):
+    stream.write(snapshot_bytes(lua_file))
+
+def save_snapshot(lua_file, filename):
+    with open(filename, 'wb') as out_f:
+        write_snapshot(lua_file, out_f)
+
+class _Children(object):
+    """constants.function of a snapshot chunk, building nested chunks only
+    when they are accessed.
+    """
+    __slots__ = ('_snapshot', '_indexes')
+
+    def __init__(self, snapshot, indexes):
+        self._snapshot = snapshot
+        self._indexes = indexes
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._snapshot.chunk(index) for index in self._indexes[i]]
+        return self._snapshot.chunk(self._indexes[i])
+
+    def __iter__(self):
+        for index in self._indexes:
+            yield self._snapshot.chunk(index)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    __hash__ = None
+
+class Lua4Snapshot(object):
+    """A snapshot opened from bytes, a file object or a path. `code_chunk`
+    and chunk(index) return Lua4Chunk objects built on first access.
+    """
+    def __init__(self, source):
+        self._map = None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            data = source
+        else:
+            owned = not hasattr(source, 'read')
+            stream = open(source, 'rb') if owned else source
+            try:
+                try:
+                    data = self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+                except (AttributeError, io.UnsupportedOperation, ValueError):
+                    data = stream.read()
+            finally:
+                if owned:
+                    stream.close()
+        self._view = memoryview(data)
+        if len(self._view) < _FILE_HEADER.size:
+            raise SnapshotError('truncated snapshot header')
+        fields = _FILE_HEADER.unpack_from(self._view, 0)
+        if fields[0] != SNAPSHOT_MAGIC:
+            raise SnapshotError('not a lua4dec snapshot')
+        if fields[1] != SNAPSHOT_VERSION:
+            raise SnapshotError('unsupported snapshot version {0}'.format(fields[1]))
+
+        self.header = Container(format_id=fields[2], version=fields[3],
+            little_endian=bool(fields[4]))
+        self.self_check = Container(size_int=fields[5], size_t=fields[6],
+            size_instruction=fields[7], test_size_instruction=fields[8],
+            test_size_op=fields[9], test_size_b=fields[10], size_number=fields[11],
+            test_fp_number=fields[12])
+        (self.chunk_count, local_count, child_count, kstr_count, number_count,
+            instruction_count, line_info_count, string_count) = fields[13:21]
+        (self._chunks_at, self._locals_at, children_at, kstrings_at, numbers_at,
+            instructions_at, line_info_at, string_index_at, self._string_data_at) = fields[21:30]
+
+        self._children = self._section(children_at, UINT32_TYPECODE, child_count)
+        self._kstrings = self._section(kstrings_at, UINT32_TYPECODE, kstr_count)
+        self._numbers = self._section(numbers_at, DOUBLE_TYPECODE, number_count)
+        self._instructions = self._section(instructions_at, UINT32_TYPECODE, instruction_count)
+        self._line_info = self._section(line_info_at, INT32_TYPECODE, line_info_count)
+        self._string_index = self._section(string_index_at, 'Q', string_count + 1)
+        self._strings = [None] * string_count
+        self._built = {}
+
+    def _section(self, offset, typecode, count):
+        size = array.array(typecode).itemsize
+        if offset + count * size > len(self._view):
+            raise SnapshotError('truncated snapshot section at 0x{0:X}'.format(offset))
+        view = self._view[offset:offset + count * size]
+        if _NEED_BYTESWAP:
+            values = array.array(typecode, view.tobytes())
+            values.byteswap()
+            return values
+        return view.cast(typecode)
+
+    def string(self, string_id):
+        value = self._strings[string_id]
+        if value is None:
+            start = self._string_data_at + self._string_index[string_id]
+            end = self._string_data_at + self._string_index[string_id + 1]
+            value = self._strings[string_id] = self._view[start:end].tobytes()
+        return value
+
+    def chunk(self, index=0):
+        """The chunk with the given pre-order index, 0 being the main chunk."""
+        chunk = self._built.get(index)
+        if chunk is not None:
+            return chunk
+        if not 0 <= index < self.chunk_count:
+            raise IndexError('chunk index {0} out of range'.format(index))
+        (source, line_number, num_params, is_vararg, max_stack_size, parent,
+            local_start, local_len, line_start, line_len, kstr_start, kstr_len,
+            num_start, num_len, child_start, child_len, instr_start, instr_len) = \
+            _CHUNK.unpack_from(self._view, self._chunks_at + index * _CHUNK.size)
+
+        local_var = []
+        offset = self._locals_at + local_start * _LOCAL.size
+        for _ in range(local_len):
+            name, start_pc, end_pc = _LOCAL.unpack_from(self._view, offset)
+            local_var.append(Lua4LocalVar(self.string(name), start_pc, end_pc))
+            offset += _LOCAL.size
+
+        string = self.string
+        chunk = self._built[index] = Lua4Chunk(
+            string(source),
+            line_number,
+            num_params,
+            bool(is_vararg),
+            max_stack_size,
+            local_var,
+            self._line_info[line_start:line_start + line_len],
+            Lua4Constants(
+                [string(k) for k in self._kstrings[kstr_start:kstr_start + kstr_len]],
+                self._numbers[num_start:num_start + num_len],
+                _Children(self, self._children[child_start:child_start + child_len].tolist()),
+            ),
+            self._instructions[instr_start:instr_start + instr_len],
+        )
+        return chunk
+
+    @property
+    def code_chunk(self):
+        return self.chunk(0)
+
+    def chunk_at(self, path=()):
+        """The chunk reached by following `path`, indexes into
+        constants.function starting from the main chunk.
+        """
+        chunk = self.chunk(0)
+        for i in path:
+            chunk = chunk.constants.function[i]
+        return chunk
+
+    def materialize(self):
+        """Copy the whole tree out of the mapping into a plain model."""
+        def copy(chunk):
+            return Lua4Chunk(
+                chunk.source, chunk.line_number, chunk.num_params, chunk.is_vararg,
+                chunk.max_stack_size, list(chunk.local_var),
+                array.array(INT32_TYPECODE, chunk.line_info),
+                Lua4Constants(list(chunk.constants.string),
+                    array.array(DOUBLE_TYPECODE, chunk.constants.number),
+                    [copy(f) for f in chunk.constants.function]),
+                array.array(UINT32_TYPECODE, chunk.instruction))
+        return Container(header=self.header, self_check=self.self_check,
+            code_chunk=copy(self.code_chunk))
+
+    def close(self):
+        """Drop this snapshot's references to the mapping. Chunks handed out
+        keep views into it, so the mapping itself goes away once they do.
+        """
+        self._built.clear()
+        self._children = self._kstrings = self._numbers = None
+        self._instructions = self._line_info = self._string_index = None
+        self._view = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def load_snapshot(source):
+    return Lua4Snapshot(source)
+
+def is_snapshot(data):
+    return data[:len(SNAPSHOT_MAGIC)] == SNAPSHOT_MAGIC
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+
+from lua4dec.opcodes import OPCODE_FIELD_NAMES, NUM_OPCODE_VALUES
+
+# Instrumentation hooks. Parsers and formatters take a `stats` object and
+# report phases, counters and decoded opcodes to it; by default they get
+# NULL_STATS whose methods do nothing, so the disabled path costs a few
+# no-op calls per file or chunk and nothing per instruction.
+#
+# Phase times are exclusive: entering a nested phase pauses the enclosing
+# one, so the phases of a run add up to its total.
+
+PHASE_HEADER    = 'header'
+PHASE_CHUNK     = 'chunk'
+PHASE_DECODE    = 'decode'
+PHASE_FORMAT    = 'format'
+PHASES          = (PHASE_HEADER, PHASE_CHUNK, PHASE_DECODE, PHASE_FORMAT)
+
+COUNT_BYTES         = 'bytes'
+COUNT_CHUNKS        = 'chunks'
+COUNT_INSTRUCTIONS  = 'instructions'
+COUNT_REUSED        = 'reused_chunks'
+
+class _NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+class NullStats(object):
+    """Stats hook that records nothing."""
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def count(self, name, value=1):
+        pass
+
+    def depth(self, depth):
+        pass
+
+    def opcodes(self, opcodes):
+        pass
+
+NULL_STATS = NullStats()
+
+class _Phase(object):
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        stack = self.stats._stack
+        now = time.perf_counter()
+        if stack:
+            stack[-1]._charge(now)
+        self.start = now
+        stack.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        stack = self.stats._stack
+        now = time.perf_counter()
+        self._charge(now)
+        stack.pop()
+        if stack:
+            stack[-1].start = now
+        self.stats.calls[self.name] = self.stats.calls.get(self.name, 0) + 1
+        return False
+
+    def _charge(self, now):
+        timings = self.stats.timings
+        timings[self.name] = timings.get(self.name, 0.0) + (now - self.start)
+
+class Stats(object):
+    """Collects exclusive per-phase timings, counters, a per-opcode histogram
+    and the deepest chunk nesting seen. Instances can be pickled and merged,
+    which is how batch workers report back.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.timings = {}
+        self.calls = {}
+        self.counters = {}
+        self.histogram = [0] * NUM_OPCODE_VALUES
+        self.max_depth = 0
+        self._stack = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_stack'] = []
+        return state
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def depth(self, depth):
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def opcodes(self, opcodes):
+        histogram = self.histogram
+        for op in opcodes:
+            histogram[op] += 1
+
+    def merge(self, other):
+        for name, value in other.timings.items():
+            self.timings[name] = self.timings.get(name, 0.0) + value
+        for name, value in other.calls.items():
+            self.calls[name] = self.calls.get(name, 0) + value
+        for name, value in other.counters.items():
+            self.count(name, value)
+        for op, value in enumerate(other.histogram):
+            self.histogram[op] += value
+        self.depth(other.max_depth)
+
+    def as_dict(self):
+        return {
+            'timings':      dict(self.timings),
+            'calls':        dict(self.calls),
+            'counters':     dict(self.counters),
+            'histogram':    dict((OPCODE_FIELD_NAMES[op], n)
+                for op, n in enumerate(self.histogram) if n),
+            'max_depth':    self.max_depth,
+        }
+
+    def report(self):
+        """Human readable summary as a list of lines."""
+        lines = ['-- phases --']
+        total = sum(self.timings.values())
+        for name in PHASES + tuple(sorted(set(self.timings) - set(PHASES))):
+            if name in self.timings:
+                seconds = self.timings[name]
+                lines.append('{0:12s} {1:10.4f}s {2:6.1f}% ({3} calls)'.format(name, seconds,
+                    100.0 * seconds / total if total else 0.0, self.calls.get(name, 0)))
+        lines.append('-- counters --')
+        for name in sorted(self.counters):
+            lines.append('{0:12s} {1:d}'.format(name, self.counters[name]))
+        lines.append('{0:12s} {1:d}'.format('max_depth', self.max_depth))
+        lines.append('-- opcodes --')
+        ranked = sorted(((n, op) for op, n in enumerate(self.histogram) if n), reverse=True)
+        for n, op in ranked:
+            lines.append('{0:16s} {1:d}'.format(OPCODE_FIELD_NAMES[op], n))
+        return lines
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import mmap
+
+from lua4dec.fast_parser import Lua4FastParser
+from lua4dec.model import Lua4Chunk, Lua4Constants
+from lua4dec.stats import NULL_STATS, PHASE_HEADER, PHASE_CHUNK, PHASE_FORMAT, COUNT_BYTES, \
+    COUNT_CHUNKS, COUNT_INSTRUCTIONS
+from lua4dec.util import has_fileno
+
+# Streaming parse and emit for files too big to hold as a model. The event
+# parser walks the chunk tree depth-first in the order the debug listing
+# shows it and yields (event, depth, value) tuples:
+#
+#   EVENT_HEADER        (header, self_check)
+#   EVENT_ENTER         (source, line_number, num_params, is_vararg, max_stack_size)
+#   EVENT_LOCALS        list of Lua4LocalVar
+#   EVENT_LINE_INFO     array of line info
+#   EVENT_CONSTANTS     (strings, numbers, number of nested functions)
+#   EVENT_INSTRUCTIONS  array of instruction words
+#   ... the events of the nested chunks, one level deeper ...
+#   EVENT_EXIT          None
+#
+# A chunk's nested functions come before its instructions in the file, so
+# the parser skips over them to read the instructions first and comes back
+# for them afterwards. The skip notes where the instructions of every chunk
+# it passes start, so each subtree is only walked once, and otherwise only
+# the offsets of the open chunks are kept. stream_dump() renders each chunk
+# as soon as its instructions arrive and drops it, so memory follows the
+# nesting depth and a couple of ints per chunk still to come instead of the
+# file size.
+# The input is memory-mapped (or an in-memory buffer).
+
+EVENT_HEADER        = 'header'
+EVENT_ENTER         = 'enter'
+EVENT_LOCALS        = 'locals'
+EVENT_LINE_INFO     = 'line_info'
+EVENT_CONSTANTS     = 'constants'
+EVENT_INSTRUCTIONS  = 'instructions'
+EVENT_EXIT          = 'exit'
+
+# characters collected before a write to the output stream
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+class Lua4EventParser(Lua4FastParser):
+    def events(self):
+        stats = self.stats
+        self.offset = 0
+        with stats.phase(PHASE_HEADER):
+            header = self.read_header()
+            self_check = self.read_self_check()
+        yield EVENT_HEADER, 0, (header, self_check)
+
+        # per open chunk: [offset of the next nested chunk, nested chunks
+        # left, end of the chunk]
+        open_chunks = []
+        # start offset -> offset of the instruction count, for the chunks
+        # skipped over but not visited yet
+        skipped = {}
+        offset = self.offset
+        while True:
+            depth = len(open_chunks)
+            with stats.phase(PHASE_CHUNK):
+                self.offset = offset
+                self._check_depth(depth)
+                info = self.read_chunk_info()
+                local_var = self.read_local_vars()
+                line_info = self.read_line_info()
+                strings = self.read_strings()
+                numbers = self.read_numbers()
+                count = self._read_count(self._min_chunk)
+                functions = self.offset
+                instructions = skipped.pop(offset, None)
+                if instructions is None:
+                    for _ in range(count):
+                        self.skip_chunk(depth + 1, skipped)
+                else:
+                    self.offset = instructions
+                instruction = self.read_instructions()
+            stats.count(COUNT_CHUNKS)
+            stats.count(COUNT_INSTRUCTIONS, len(instruction))
+            stats.depth(depth)
+            yield EVENT_ENTER, depth, info
+            yield EVENT_LOCALS, depth, local_var
+            yield EVENT_LINE_INFO, depth, line_info
+            yield EVENT_CONSTANTS, depth, (strings, numbers, count)
+            yield EVENT_INSTRUCTIONS, depth, instruction
+            del info, local_var, line_info, strings, numbers, instruction
+            open_chunks.append([functions, count, self.offset])
+
+            while open_chunks:
+                current = open_chunks[-1]
+                if current[1]:
+                    offset = current[0]
+                    current[1] -= 1
+                    break
+                open_chunks.pop()
+                yield EVENT_EXIT, len(open_chunks), None
+                if open_chunks:
+                    # the next sibling starts where this chunk ends
+                    open_chunks[-1][0] = current[2]
+            else:
+                stats.count(COUNT_BYTES, current[2])
+                return
+
+def iter_events(data, stats=NULL_STATS, strings=None, limits=None):
+    return Lua4EventParser(data, stats, strings, limits).events()
+
+def iter_chunks(events):
+    """(depth, chunk) for every chunk of an event sequence, as a model chunk
+    whose constants.function only has the right length. The header event
+    is passed through as (None, (header, self_check)) and every exit event
+    as (depth, None).
+    """
+    for event, depth, value in events:
+        if event == EVENT_ENTER:
+            info = value
+        elif event == EVENT_LOCALS:
+            local_var = value
+        elif event == EVENT_LINE_INFO:
+            line_info = value
+        elif event == EVENT_CONSTANTS:
+            constants = Lua4Constants(value[0], value[1], [None] * value[2])
+        elif event == EVENT_INSTRUCTIONS:
+            yield depth, Lua4Chunk(info[0], info[1], info[2], info[3], info[4], local_var,
+                line_info, constants, value)
+            info = local_var = line_info = constants = None
+        elif event == EVENT_EXIT:
+            yield depth, None
+        elif event == EVENT_HEADER:
+            yield None, value
+
+def iter_listing(formatter, events):
+    """Text of the debug listing of an event sequence, one piece per chunk,
+    rendered with a Lua4DebugFormatter.
+    """
+    indent = formatter.INDENT_SPACE
+    for depth, chunk in iter_chunks(events):
+        if depth is None:
+            header, self_check = chunk
+            yield '-- %r\n-- %r\n' % (header, self_check)
+        elif chunk is None:
+            if depth > 0:
+                # the empty line after every nested chunk
+                yield '\n'
+        else:
+            space = ' ' * (depth * indent)
+            yield ''.join(space + line + '\n' for line in formatter._chunk_lines(chunk))
+
+def write_buffered(pieces, out_stream, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Write text pieces to `out_stream` in writes of about `buffer_size`
+    characters.
+    """
+    buffered = []
+    size = 0
+    for piece in pieces:
+        buffered.append(piece)
+        size += len(piece)
+        if size >= buffer_size:
+            out_stream.write(''.join(buffered))
+            buffered = []
+            size = 0
+    if buffered:
+        out_stream.write(''.join(buffered))
+
+def stream_dump(source, out_stream, formatter=None, stats=NULL_STATS, strings=None,
+        buffer_size=DEFAULT_BUFFER_SIZE, limits=None):
+    """Write the debug listing of `source` (a filename, file object or
+    bytes) to `out_stream` without building the whole model.
+    """
+    if formatter is None:
+        from lua4dec.formatter import Lua4DebugFormatter
+        formatter = Lua4DebugFormatter(stats)
+    owned = None
+    data = source
+    if hasattr(source, 'read') and not has_fileno(source):
+        data = source.read()
+    elif not isinstance(source, (bytes, bytearray, memoryview)):
+        if not hasattr(source, 'fileno'):
+            source = owned = open(source, 'rb')
+        try:
+            data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            if owned is not None:
+                owned.close()
+    parser = Lua4EventParser(data, stats, strings, limits)
+    try:
+        with stats.phase(PHASE_FORMAT):
+            write_buffered(iter_listing(formatter, parser.events()), out_stream, buffer_size)
+    finally:
+        parser.release()
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+def decompile_stream(source, dest, stats=NULL_STATS, strings=None,
+        buffer_size=DEFAULT_BUFFER_SIZE, limits=None):
+    """Decompile `source` into `dest` with the debug formatter through
+    stream_dump().
+    """
+    with open(dest, 'w', buffering=buffer_size) as out_f:
+        stream_dump(source, out_f, stats=stats, strings=strings, buffer_size=buffer_size,
+            limits=limits)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import random
+
+from construct import Container
+
+from lua4dec.lua_lang import OPCODE, CREATE_U, CREATE_S, CREATE_AB, SET_OPCODE
+from lua4dec.parser import Lua4File
+
+# Generator for synthetic, structurally valid Lua4 files of a given size,
+# used by the benchmark script. Chunks are built from a few statement
+# templates (global arithmetic, calls, branches, table constructors) picked
+# by a seeded RNG, so the same arguments always produce the same bytes.
+
+DEFAULT_INSTRUCTIONS    = 1000
+DEFAULT_DEPTH           = 0
+DEFAULT_FANOUT          = 1
+DEFAULT_STRINGS         = 64
+DEFAULT_SEED            = 0
+
+SYNTH_SOURCE            = b'@synthetic.lua'
+MAX_STACK_SIZE          = 8
+MAX_INT                 = 0x7FFFFFFF
+NUMBERS                 = [0.5, 3.25, 1e10, 2.0 ** 40, -7.125, 1.0 / 3]
+
+def _header():
+    return Container(format_id=0x1B, version=0x40, little_endian=True)
+
+def _self_check():
+    return Container(size_int=4, size_t=4, size_instruction=4,
+        test_size_instruction=32, test_size_op=6, test_size_b=9, size_number=8,
+        test_fp_number=3.14159265358979323846E8)
+
+class _ChunkBuilder(object):
+    def __init__(self, rng, strings):
+        self.rng = rng
+        self.strings = strings
+        self.code = []
+
+    def k(self):
+        return self.rng.randrange(len(self.strings))
+
+    def emit_assign(self):
+        # g_b = g_a + n
+        self.code.extend([
+            CREATE_U(OPCODE.OP_GETGLOBAL, self.k()),
+            CREATE_S(OPCODE.OP_PUSHINT, self.rng.randint(-1000, 1000)),
+            CREATE_U(OPCODE.OP_ADD, 0),
+            CREATE_U(OPCODE.OP_SETGLOBAL, self.k()),
+        ])
+
+    def emit_call(self):
+        # g_f("...", n)
+        self.code.extend([
+            CREATE_U(OPCODE.OP_GETGLOBAL, self.k()),
+            CREATE_U(OPCODE.OP_PUSHSTRING, self.k()),
+            CREATE_U(OPCODE.OP_PUSHNUM, self.rng.randrange(len(NUMBERS))),
+            CREATE_AB(OPCODE.OP_CALL, 0, 0),
+        ])
+
+    def emit_branch(self):
+        # if g_a < n then g_b = g_b + 1 end
+        self.code.extend([
+            CREATE_U(OPCODE.OP_GETGLOBAL, self.k()),
+            CREATE_S(OPCODE.OP_PUSHINT, self.rng.randint(0, 100)),
+            CREATE_S(OPCODE.OP_JMPGE, 3),
+            CREATE_U(OPCODE.OP_GETGLOBAL, self.k()),
+            SET_OPCODE(CREATE_S(0, 1), OPCODE.OP_ADDI),
+            CREATE_U(OPCODE.OP_SETGLOBAL, self.k()),
+        ])
+
+    def emit_table(self):
+        # g = {n, "..."}
+        self.code.extend([
+            CREATE_U(OPCODE.OP_CREATETABLE, 2),
+            CREATE_S(OPCODE.OP_PUSHINT, self.rng.randint(0, 100)),
+            CREATE_U(OPCODE.OP_PUSHSTRING, self.k()),
+            CREATE_AB(OPCODE.OP_SETLIST, 0, 2),
+            CREATE_U(OPCODE.OP_SETGLOBAL, self.k()),
+        ])
+
+    def fill(self, count):
+        """Emit statements until exactly `count` - 1 instructions are used,
+        leaving room for the closing END.
+        """
+        templates = (self.emit_assign, self.emit_call, self.emit_branch, self.emit_table)
+        limit = count - 1
+        while limit - len(self.code) >= 6:
+            self.rng.choice(templates)()
+        while limit - len(self.code) >= 2:
+            self.code.extend([CREATE_U(OPCODE.OP_PUSHNIL, 1), CREATE_U(OPCODE.OP_POP, 1)])
+        if len(self.code) < limit:
+            self.code.append(CREATE_U(OPCODE.OP_POP, 0))
+        self.code.append(CREATE_U(OPCODE.OP_END, 0))
+
+def generate_chunk(rng, instructions=DEFAULT_INSTRUCTIONS, depth=DEFAULT_DEPTH,
+        fanout=DEFAULT_FANOUT, strings=DEFAULT_STRINGS):
+    """A chunk of `instructions` instructions with `fanout` nested functions
+    per level down to `depth` levels, each with its own `strings` entry
+    string table.
+    """
+    string_table = [('name_{0:05d}'.format(i)).encode('ascii') for i in range(max(1, strings))]
+    builder = _ChunkBuilder(rng, string_table)
+    functions = []
+    if depth > 0:
+        for i in range(fanout):
+            functions.append(generate_chunk(rng, instructions, depth - 1, fanout, strings))
+            builder.code.extend([
+                CREATE_AB(OPCODE.OP_CLOSURE, i, 0),
+                CREATE_U(OPCODE.OP_SETGLOBAL, builder.k()),
+            ])
+    builder.fill(max(instructions, len(builder.code) + 1))
+
+    return Container(
+        source=SYNTH_SOURCE,
+        line_number=0,
+        num_params=0,
+        is_vararg=False,
+        max_stack_size=MAX_STACK_SIZE,
+        local_var=[],
+        line_info=[0, MAX_INT],
+        constants=Container(string=string_table, number=list(NUMBERS), function=functions),
+        instruction=builder.code,
+    )
+
+def generate_file(instructions=DEFAULT_INSTRUCTIONS, depth=DEFAULT_DEPTH,
+        fanout=DEFAULT_FANOUT, strings=DEFAULT_STRINGS, seed=DEFAULT_SEED):
+    rng = random.Random(seed)
+    return Container(
+        header=_header(),
+        self_check=_self_check(),
+        code_chunk=generate_chunk(rng, instructions, depth, fanout, strings),
+    )
+
+def generate_bytes(instructions=DEFAULT_INSTRUCTIONS, depth=DEFAULT_DEPTH,
+        fanout=DEFAULT_FANOUT, strings=DEFAULT_STRINGS, seed=DEFAULT_SEED):
+    return Lua4File.build(generate_file(instructions, depth, fanout, strings, seed))
+
+def count_instructions(chunk):
+    return len(chunk.instruction) + sum(count_instructions(f) for f in chunk.constants.function)
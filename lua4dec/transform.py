@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+
+from lua4dec.lua_lang import OPCODE, MAXARG_S, CREATE_U, SETARG_S
+from lua4dec.decoder import decode_instructions
+from lua4dec.cfg import build_cfg
+from lua4dec.model import Container, Lua4Chunk, Lua4Constants, Lua4LocalVar, UINT32_TYPECODE, \
+    INT32_TYPECODE
+
+# Composable rewrites of chunk bytecode. A PassManager runs a list of
+# BytecodePass objects over a chunk; passes read analyses (decoded fields,
+# jump targets, the CFG) through an AnalysisManager which caches them per
+# chunk. When a pass changes a chunk only the analyses it does not list in
+# `preserves` are dropped, so later passes reuse everything else.
+#
+# Passes never delete instructions directly, they overwrite them with NOP
+# (`POP 0`, which the VM executes as a no-op) so pcs stay stable. StripNops
+# then removes them in one go, remapping jumps, local ranges and line info.
+
+NOP                 = CREATE_U(OPCODE.OP_POP, 0)
+MAX_INT             = 0x7FFFFFFF
+
+ANALYSIS_DECODED    = 'decoded'
+ANALYSIS_TARGETS    = 'jump_targets'
+ANALYSIS_CFG        = 'cfg'
+
+JUMP_OPCODES = frozenset(range(OPCODE.OP_JMPNE, OPCODE.OP_JMP + 1)) | frozenset([
+    OPCODE.OP_FORPREP, OPCODE.OP_FORLOOP, OPCODE.OP_LFORPREP, OPCODE.OP_LFORLOOP])
+COMPARE_OPCODES = frozenset(range(OPCODE.OP_JMPNE, OPCODE.OP_JMPGE + 1))
+INVERTED_COMPARE = {
+    OPCODE.OP_JMPNE: OPCODE.OP_JMPEQ,
+    OPCODE.OP_JMPEQ: OPCODE.OP_JMPNE,
+    OPCODE.OP_JMPLT: OPCODE.OP_JMPGE,
+    OPCODE.OP_JMPGE: OPCODE.OP_JMPLT,
+    OPCODE.OP_JMPLE: OPCODE.OP_JMPGT,
+    OPCODE.OP_JMPGT: OPCODE.OP_JMPLE,
+}
+
+def _jump_targets(chunk, analyses):
+    """Map of pc -> list of pcs that can jump to it."""
+    code = analyses.get(chunk, ANALYSIS_DECODED)
+    targets = {}
+    for pc, op in enumerate(code.opcode):
+        if op in JUMP_OPCODES:
+            targets.setdefault(pc + 1 + code.S[pc], []).append(pc)
+        elif op == OPCODE.OP_PUSHNILJMP:
+            targets.setdefault(pc + 2, []).append(pc)
+    return targets
+
+ANALYSES = {
+    ANALYSIS_DECODED:   lambda chunk, analyses: decode_instructions(chunk.instruction).tolists(),
+    ANALYSIS_TARGETS:   _jump_targets,
+    ANALYSIS_CFG:       lambda chunk, analyses: build_cfg(analyses.get(chunk, ANALYSIS_DECODED)),
+}
+
+class AnalysisManager(object):
+    """Per chunk cache of analysis results. `computed` counts how many times
+    each analysis actually ran.
+    """
+    def __init__(self, analyses=None):
+        self.analyses = dict(ANALYSES if analyses is None else analyses)
+        self.computed = dict((name, 0) for name in self.analyses)
+        self._cache = {}
+
+    def get(self, chunk, name):
+        entry = self._cache.get(id(chunk))
+        if entry is None:
+            # keep the chunk alive so its id is not reused while cached
+            entry = self._cache[id(chunk)] = (chunk, {})
+        results = entry[1]
+        if name not in results:
+            results[name] = self.analyses[name](chunk, self)
+            self.computed[name] += 1
+        return results[name]
+
+    def invalidate(self, chunk, preserves=()):
+        entry = self._cache.get(id(chunk))
+        if entry is not None:
+            results = entry[1]
+            for name in list(results):
+                if name not in preserves:
+                    del results[name]
+
+    def forget(self, chunk):
+        self._cache.pop(id(chunk), None)
+
+    def clear(self):
+        self._cache.clear()
+
+def copy_chunk(chunk):
+    """Shallow copy of a chunk from any engine with its own instruction,
+    local_var and line_info so passes can rewrite them in place.
+    Nested chunks are shared with the original.
+    """
+    return Lua4Chunk(
+        chunk.source,
+        chunk.line_number,
+        chunk.num_params,
+        chunk.is_vararg,
+        chunk.max_stack_size,
+        [Lua4LocalVar(l.name, l.start_pc, l.end_pc) for l in chunk.local_var],
+        array.array(INT32_TYPECODE, chunk.line_info),
+        chunk.constants,
+        array.array(UINT32_TYPECODE, chunk.instruction),
+    )
+
+#
+# byte code transforms
+#
+
+class ByteCodeTransform(object):
+    """Hook to rewrite chunks before the VM decodes them. transform() gets a
+    chunk and returns the chunk to execute.
+    """
+    def transform(self, chunk):
+        raise NotImplementedError()
+
+    def transform_file(self, lua_file):
+        """Transformed copy of a whole parsed file, nested chunks included."""
+        return Container(
+            header=lua_file.header,
+            self_check=lua_file.self_check,
+            code_chunk=self._transform_tree(lua_file.code_chunk),
+        )
+
+    def _transform_tree(self, chunk):
+        result = self.transform(chunk)
+        if result is chunk:
+            # the nested chunks are replaced below, leave the caller's model alone
+            result = copy_chunk(chunk)
+        constants = result.constants
+        result.constants = Lua4Constants(
+            constants.string,
+            constants.number,
+            [self._transform_tree(f) for f in constants.function],
+        )
+        return result
+
+class NoopTransform(ByteCodeTransform):
+    def transform(self, chunk):
+        return chunk
+
+class BytecodePass(object):
+    """A single rewrite. run() edits chunk.instruction in place and returns
+    True if anything changed; `preserves` names the analyses that are still
+    valid after a change.
+    """
+    name = None
+    preserves = ()
+
+    def run(self, chunk, analyses):
+        raise NotImplementedError()
+
+class PassManager(ByteCodeTransform):
+    def __init__(self, passes, analyses=None):
+        self.passes = list(passes)
+        self.analyses = analyses if analyses is not None else AnalysisManager()
+        self.changes = dict((p.name, 0) for p in self.passes)
+
+    def transform(self, chunk):
+        chunk = copy_chunk(chunk)
+        analyses = self.analyses
+        try:
+            for bytecode_pass in self.passes:
+                if bytecode_pass.run(chunk, analyses):
+                    self.changes[bytecode_pass.name] += 1
+                    analyses.invalidate(chunk, bytecode_pass.preserves)
+        finally:
+            analyses.forget(chunk)
+        return chunk
+
+#
+# passes
+#
+
+class PushNilJmpPeephole(BytecodePass):
+    """Branch directly on a comparison that is only materialized as a value
+    to be tested:
+
+        JMPcc L; PUSHNILJMP; L: PUSHINT 1; JMPT/JMPF target
+
+    becomes `JMPcc target` (JMPT) or the inverted comparison (JMPF).
+    """
+    name = 'pushniljmp'
+    preserves = ()
+
+    def run(self, chunk, analyses):
+        code = analyses.get(chunk, ANALYSIS_DECODED)
+        targets = analyses.get(chunk, ANALYSIS_TARGETS)
+        opcodes, S = code.opcode, code.S
+        instruction = chunk.instruction
+        changed = False
+        for pc in range(len(opcodes) - 3):
+            op = opcodes[pc]
+            if op not in COMPARE_OPCODES or S[pc] != 1:
+                continue
+            if opcodes[pc + 1] != OPCODE.OP_PUSHNILJMP or \
+                    opcodes[pc + 2] != OPCODE.OP_PUSHINT or S[pc + 2] != 1 or \
+                    opcodes[pc + 3] not in (OPCODE.OP_JMPT, OPCODE.OP_JMPF):
+                continue
+            if pc + 1 in targets or targets.get(pc + 2) != [pc] or \
+                    targets.get(pc + 3) != [pc + 1]:
+                continue
+            target = pc + 4 + S[pc + 3]
+            if opcodes[pc + 3] == OPCODE.OP_JMPF:
+                op = INVERTED_COMPARE[op]
+            instruction[pc] = CREATE_U(op, target - (pc + 1) + MAXARG_S)
+            instruction[pc + 1] = instruction[pc + 2] = instruction[pc + 3] = NOP
+            changed = True
+        return changed
+
+class ConstantFolding(BytecodePass):
+    """Fold `PUSHINT a; ADDI b` and `PUSHINT a; MINUS` into a single PUSHINT,
+    and `PUSHNUM k; MINUS` into PUSHNEGNUM (and back). Only straight-line
+    code is touched so the CFG and jump targets survive.
+    """
+    name = 'fold'
+    preserves = (ANALYSIS_TARGETS, ANALYSIS_CFG)
+
+    def run(self, chunk, analyses):
+        code = analyses.get(chunk, ANALYSIS_DECODED)
+        targets = analyses.get(chunk, ANALYSIS_TARGETS)
+        opcodes, S, U = code.opcode, code.S, code.U
+        instruction = chunk.instruction
+        count = len(opcodes)
+        changed = False
+        pc = 0
+        while pc < count:
+            op = opcodes[pc]
+            if op not in (OPCODE.OP_PUSHINT, OPCODE.OP_PUSHNUM, OPCODE.OP_PUSHNEGNUM):
+                pc += 1
+                continue
+            value = S[pc] if op == OPCODE.OP_PUSHINT else U[pc]
+            nxt = pc + 1
+            while nxt < count and nxt not in targets:
+                next_op = opcodes[nxt]
+                if instruction[nxt] == NOP:
+                    nxt += 1
+                    continue
+                if next_op == OPCODE.OP_ADDI and op == OPCODE.OP_PUSHINT and \
+                        abs(value + S[nxt]) <= MAXARG_S:
+                    value += S[nxt]
+                elif next_op == OPCODE.OP_MINUS and op == OPCODE.OP_PUSHINT:
+                    # S reaches one further up than down
+                    if abs(value) > MAXARG_S:
+                        break
+                    value = -value
+                elif next_op == OPCODE.OP_MINUS:
+                    op = OPCODE.OP_PUSHNUM if op == OPCODE.OP_PUSHNEGNUM else OPCODE.OP_PUSHNEGNUM
+                else:
+                    break
+                instruction[nxt] = NOP
+                nxt += 1
+            if nxt > pc + 1:
+                if op == OPCODE.OP_PUSHINT:
+                    instruction[pc] = CREATE_U(op, value + MAXARG_S)
+                else:
+                    instruction[pc] = CREATE_U(op, value)
+                changed = True
+            pc = nxt
+        return changed
+
+class DeadCodeElimination(BytecodePass):
+    """NOP out blocks that cannot be reached from the entry, such as code
+    following a RETURN. A trailing END is kept.
+    """
+    name = 'dead-code'
+    preserves = ()
+
+    def run(self, chunk, analyses):
+        cfg = analyses.get(chunk, ANALYSIS_CFG)
+        if not cfg.blocks:
+            return False
+        reached = set([0])
+        stack = [0]
+        while stack:
+            for succ in cfg.blocks[stack.pop()].succs:
+                if succ not in reached:
+                    reached.add(succ)
+                    stack.append(succ)
+
+        instruction = chunk.instruction
+        last = len(instruction) - 1
+        changed = False
+        for block in cfg.blocks:
+            if block.index in reached:
+                continue
+            for pc in range(block.start, block.end):
+                if pc == last and cfg.code.opcode[pc] == OPCODE.OP_END:
+                    continue
+                if instruction[pc] != NOP:
+                    instruction[pc] = NOP
+                    changed = True
+        return changed
+
+class StripNops(BytecodePass):
+    """Delete NOPs, remapping jump offsets, local variable ranges and line
+    info to the new pcs.
+    """
+    name = 'strip-nops'
+    preserves = ()
+
+    def run(self, chunk, analyses):
+        instruction = chunk.instruction
+        count = len(instruction)
+        # new_pc[pc] is the position of the first kept instruction at or after pc
+        new_pc = [0] * (count + 1)
+        kept = 0
+        for pc in range(count):
+            new_pc[pc] = kept
+            if instruction[pc] != NOP:
+                kept += 1
+        new_pc[count] = kept
+        if kept == count:
+            return False
+        # pcs outside the chunk are clamped to its ends
+        remap = lambda pc: new_pc[max(0, min(pc, count))]
+
+        code = analyses.get(chunk, ANALYSIS_DECODED)
+        result = array.array(UINT32_TYPECODE)
+        for pc in range(count):
+            i = instruction[pc]
+            if i == NOP:
+                continue
+            op = code.opcode[pc]
+            if op in JUMP_OPCODES:
+                target = remap(pc + 1 + code.S[pc])
+                i = SETARG_S(i, target - (len(result) + 1))
+            result.append(i)
+        chunk.instruction = result
+
+        for local in chunk.local_var:
+            local.start_pc = remap(local.start_pc)
+            local.end_pc = remap(local.end_pc)
+        chunk.line_info = array.array(INT32_TYPECODE, [remap(l)
+            if 0 <= l < MAX_INT else l for l in chunk.line_info])
+        return True
+
+def default_passes():
+    return [PushNilJmpPeephole(), ConstantFolding(), DeadCodeElimination(), StripNops()]
+
+def default_pipeline(analyses=None):
+    return PassManager(default_passes(), analyses)
@@ -23,9 +23,22 @@
 # SOFTWARE.
 
 import enum
+import io
 
 @enum.unique
 class C_Enum(enum.IntEnum):
     pass
 
 CAST_TO_UINT32 = lambda value: value & 0xFFFFFFFF
+# Lua strings are raw bytes, latin-1 maps them 1:1 onto text for output
+TO_TEXT = lambda value: value if isinstance(value, str) else value.decode('latin-1')
+
+def has_fileno(stream):
+    """Whether `stream` is backed by a file descriptor, BytesIO and the like
+    have a fileno() that raises.
+    """
+    try:
+        stream.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return False
+    return True
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import mmap
+import os
+
+from lua4dec.batch import find_sources, DEFAULT_CHUNKSIZE
+from lua4dec.fast_parser import Lua4FormatError, validate_bytes
+from lua4dec.stats import NULL_STATS
+
+# Pre-scan of whole corpora: every file is memory-mapped and walked by
+# validate_bytes(), which checks each length prefix against the remaining
+# bytes and the Lua4Limits without decoding strings, numbers or
+# instructions, so a bad file costs about as much as reading its length
+# fields and a good one is never turned into a model.
+
+class ValidationResult(object):
+    """Outcome for one file: `error` is None when it is valid, `offset` is
+    where a format error was found and `size` how many bytes a valid file
+    takes up.
+    """
+    __slots__ = ('source', 'error', 'offset', 'size')
+
+    def __init__(self, source, error=None, offset=None, size=None):
+        self.source = source
+        self.error = error
+        self.offset = offset
+        self.size = size
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+def validate_file(path, limits=None, stats=NULL_STATS):
+    try:
+        with open(path, 'rb') as lua_file:
+            if os.fstat(lua_file.fileno()).st_size == 0:
+                # empty files cannot be mapped
+                data = b''
+            else:
+                data = mmap.mmap(lua_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            size = validate_bytes(data, stats, limits)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    except Lua4FormatError as err:
+        return ValidationResult(path, str(err), err.offset)
+    except (IOError, OSError) as err:
+        return ValidationResult(path, '{0}: {1}'.format(type(err).__name__, err))
+    return ValidationResult(path, size=size)
+
+def _validate_task(task):
+    path, limits = task
+    return validate_file(path, limits)
+
+def validate_corpus(patterns, limits=None, workers=None, chunksize=DEFAULT_CHUNKSIZE,
+        stats=NULL_STATS):
+    """Validate every file matched by `patterns` (see batch.find_sources()),
+    on a process pool of `workers` processes like run_batch(). Returns one
+    ValidationResult per file in sorted order; `stats` only covers files
+    validated in this process.
+    """
+    tasks = [(source, limits) for source, rel_path in find_sources(patterns)]
+    if workers == 1 or len(tasks) <= 1:
+        return [validate_file(path, limits, stats) for path, limits in tasks]
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_validate_task, tasks, chunksize=max(1, chunksize)))
+
+def format_results(results, verbose=False):
+    lines = []
+    for result in results:
+        if not result.ok:
+            lines.append('{0}: {1}'.format(result.source, result.error))
+        elif verbose:
+            lines.append('{0}: ok, {1:d} bytes'.format(result.source, result.size))
+    return lines
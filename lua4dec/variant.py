@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import array
+import struct
+import sys
+
+from lua4dec.opcodes import SIZE_INSTRUCTION, SIZE_OP, SIZE_B, SIZE_A, SIZE_U, POS_U, POS_A, \
+    POS_B, MAXARG_S, MULT_RET, NUM_OPCODES, OP_CALL, S_OPCODES, AB_OPCODES
+from lua4dec.model import UINT32_TYPECODE, INT32_TYPECODE, DOUBLE_TYPECODE
+
+# Build variants of the byte code format. The header and self check of a
+# Lua4 file record the byte order and the sizes of int, size_t, Instruction
+# and Number plus the instruction field layout the compiler used; the rest
+# of lua4dec is written for the common little endian, 32 bit int/size_t,
+# 32 bit instruction, double Number build. A Lua4Variant describes one
+# build and get_decoder() returns the struct formats and array typecodes to
+# read it with, generated once per variant and cached. Files of another
+# variant are decoded into the same model as the default one: ints and
+# numbers are widened to int32 and double arrays and instructions are
+# re-encoded into the default 32 bit layout, so the formatters, the
+# decompiler and the VM never see the difference.
+
+INT_SIZES           = (2, 4, 8)
+INSTRUCTION_SIZES   = (2, 4)
+NUMBER_SIZES        = (4, 8)
+
+class Lua4VariantError(ValueError):
+    pass
+
+def _typecode(codes, size):
+    for code in codes:
+        if array.array(code).itemsize == size:
+            return code
+    raise Lua4VariantError('no array type with {0} byte items'.format(size))
+
+class Lua4Variant(object):
+    __slots__ = ('little_endian', 'size_int', 'size_t', 'size_instruction', 'size_op',
+        'size_b', 'size_number')
+
+    def __init__(self, little_endian=True, size_int=4, size_t=4, size_instruction=4,
+            size_op=SIZE_OP, size_b=SIZE_B, size_number=8):
+        self.little_endian = bool(little_endian)
+        self.size_int = size_int
+        self.size_t = size_t
+        self.size_instruction = size_instruction
+        self.size_op = size_op
+        self.size_b = size_b
+        self.size_number = size_number
+
+    @classmethod
+    def from_header(cls, header, self_check):
+        """Variant of a file from its header and self check Containers,
+        raises Lua4VariantError for ones that can't be decoded.
+        """
+        if self_check.test_size_instruction != self_check.size_instruction * 8:
+            raise Lua4VariantError('instruction size {0} does not match its {1} bits'.format(
+                self_check.size_instruction, self_check.test_size_instruction))
+        variant = cls(header.little_endian, self_check.size_int, self_check.size_t,
+            self_check.size_instruction, self_check.test_size_op, self_check.test_size_b,
+            self_check.size_number)
+        variant.check()
+        return variant
+
+    def _key(self):
+        return tuple(getattr(self, k) for k in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, Lua4Variant) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return 'Lua4Variant({0})'.format(', '.join('{0}={1!r}'.format(k, getattr(self, k))
+            for k in self.__slots__))
+
+    @property
+    def bits_instruction(self):
+        return self.size_instruction * 8
+
+    @property
+    def size_u(self):
+        return self.bits_instruction - self.size_op
+
+    @property
+    def size_a(self):
+        return self.size_u - self.size_b
+
+    @property
+    def maxarg_s(self):
+        return ((1 << self.size_u) - 1) >> 1
+
+    @property
+    def default_layout(self):
+        """Whether instructions already use the default 32 bit layout."""
+        return (self.bits_instruction, self.size_op, self.size_b) == \
+            (SIZE_INSTRUCTION, SIZE_OP, SIZE_B)
+
+    def check(self):
+        for name, sizes in (('size_int', INT_SIZES), ('size_t', INT_SIZES),
+                ('size_instruction', INSTRUCTION_SIZES), ('size_number', NUMBER_SIZES)):
+            if getattr(self, name) not in sizes:
+                raise Lua4VariantError('unsupported {0} {1}'.format(name, getattr(self, name)))
+        if (1 << self.size_op) < NUM_OPCODES:
+            raise Lua4VariantError('{0} bit opcodes can not hold every opcode'.format(
+                self.size_op))
+        # the fields have to fit the default layout they are re-encoded into
+        if self.size_u > SIZE_U or self.size_b > SIZE_B or self.size_a > SIZE_A or \
+                self.size_a <= 0:
+            raise Lua4VariantError('unsupported instruction layout op={0} b={1} in {2} '
+                'bits'.format(self.size_op, self.size_b, self.bits_instruction))
+
+DEFAULT_VARIANT = Lua4Variant()
+
+class Lua4VariantDecoder(object):
+    """struct formats and array typecodes for reading one variant. Reads of
+    the bulk arrays give `int_typecode`, `number_typecode` and
+    `instruction_typecode` arrays that need a byteswap when `byteswap` is
+    set and then go through widen_ints(), widen_numbers() and
+    normalize_instructions() when the variant differs from the default.
+    """
+    def __init__(self, variant):
+        self.variant = variant
+        order = self.order = '<' if variant.little_endian else '>'
+        int_code = {2: 'h', 4: 'i', 8: 'q'}[variant.size_int]
+        size_code = {2: 'h', 4: 'i', 8: 'q'}[variant.size_t]
+        number_code = {4: 'f', 8: 'd'}[variant.size_number]
+
+        self.int = struct.Struct(order + int_code)
+        self.size_t = struct.Struct(order + size_code)
+        self.number = struct.Struct(order + number_code)
+        self.chunk_info = struct.Struct(order + int_code * 2 + 'B' + int_code)
+        self.local_var_pcs = struct.Struct(order + int_code * 2)
+
+        self.byteswap = variant.little_endian != (sys.byteorder == 'little')
+        self.int_typecode = _typecode('hilq', variant.size_int)
+        self.number_typecode = _typecode('fd', variant.size_number)
+        self.instruction_typecode = _typecode('HILQ', variant.size_instruction)
+        self.instruction_code = {2: 'H', 4: 'I'}[variant.size_instruction]
+
+        self.widen_ints = None
+        if self.int_typecode != INT32_TYPECODE:
+            self.widen_ints = lambda values: array.array(INT32_TYPECODE, values)
+        self.widen_numbers = None
+        if self.number_typecode != DOUBLE_TYPECODE:
+            self.widen_numbers = lambda values: array.array(DOUBLE_TYPECODE, values)
+        self.normalize_instructions = None
+        if not variant.default_layout:
+            self.normalize_instructions = _make_normalizer(variant)
+        elif self.instruction_typecode != UINT32_TYPECODE:
+            self.normalize_instructions = lambda values: array.array(UINT32_TYPECODE, values)
+
+def _make_normalizer(variant):
+    op_mask = (1 << variant.size_op) - 1
+    mask_b = (1 << variant.size_b) - 1
+    pos_u = pos_b = variant.size_op
+    pos_a = pos_b + variant.size_b
+    bias = MAXARG_S - variant.maxarg_s
+    # every opcode maps to the function re-encoding its argument
+    encode_u = lambda op, i: op | ((i >> pos_u) << POS_U)
+    encode_s = lambda op, i: op | (((i >> pos_u) + bias) << POS_U)
+    encode_ab = lambda op, i: op | ((i >> pos_a) << POS_A) | (((i >> pos_b) & mask_b) << POS_B)
+    encoders = [encode_u] * (op_mask + 1)
+    for op in S_OPCODES:
+        encoders[op] = encode_s
+    for op in AB_OPCODES:
+        encoders[op] = encode_ab
+    if mask_b < MULT_RET:
+        # MULT_RET does not fit a narrower B, such builds use the largest B
+        def encode_call(op, i):
+            b = (i >> pos_b) & mask_b
+            return op | ((i >> pos_a) << POS_A) | ((MULT_RET if b == mask_b else b) << POS_B)
+        encoders[OP_CALL] = encode_call
+
+    def normalize_instructions(values):
+        return array.array(UINT32_TYPECODE, [encoders[i & op_mask](i & op_mask, i)
+            for i in values])
+    return normalize_instructions
+
+_DECODERS = {}
+
+def get_decoder(variant):
+    decoder = _DECODERS.get(variant)
+    if decoder is None:
+        decoder = _DECODERS[variant] = Lua4VariantDecoder(variant)
+    return decoder
@@ -22,13 +22,806 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import math
+import sys
+import time
 
-class Lua4VirtualMachine(object):
-    def __init__(self, transform=None):
-        pass
+from lua4dec.lua_lang import OPCODE, NUM_OPCODES, MULT_RET, LFIELDS_PER_FLUSH
+from lua4dec.opcodes import NUM_OPCODE_VALUES
+from lua4dec.util import TO_TEXT
+from lua4dec.decoder import decode_instructions
+from lua4dec.transform import ByteCodeTransform, NoopTransform, PassManager
+
+# Interpreter for parsed Lua4 chunks. Every prototype is decoded once into a
+# list of (opcode, x, y) tuples with the operands already resolved (constants
+# looked up, jump offsets turned into absolute pcs) and executed by a loop
+# that dispatches through a list of handlers indexed by the raw opcode.
+#
+# Values: nil is None, numbers are floats, strings are bytes, tables are
+# LuaTable and functions are LuaClosure or any Python callable taking the
+# VM and a list of arguments and returning a list of results.
+
+DEFAULT_MAX_CALL_DEPTH  = 200
+# instructions executed between two budget checks
+BUDGET_SLICE            = 1024
 
-class ByteCodeTransform(object):
+class Lua4RuntimeError(Exception):
     pass
 
-class NoopTransform(ByteCodeTransformer):
+class Lua4BudgetExceeded(Lua4RuntimeError):
     pass
+
+class LuaTable(object):
+    __slots__ = ('hash',)
+
+    def __init__(self, hash=None):
+        self.hash = hash if hash is not None else {}
+
+    def get(self, key):
+        return self.hash.get(key)
+
+    def set(self, key, value):
+        if key is None:
+            raise Lua4RuntimeError('table index is nil')
+        if value is None:
+            self.hash.pop(key, None)
+        else:
+            self.hash[key] = value
+
+    def getn(self):
+        n = self.hash.get(b'n')
+        if isinstance(n, float):
+            return int(n)
+        count = 0
+        while (count + 1.0) in self.hash:
+            count += 1
+        return count
+
+    def __repr__(self):
+        return '<LuaTable 0x{0:x}>'.format(id(self))
+
+class LuaClosure(object):
+    __slots__ = ('proto', 'upvalues')
+
+    def __init__(self, proto, upvalues):
+        self.proto = proto
+        self.upvalues = upvalues
+
+    def __repr__(self):
+        return '<LuaClosure {0}:{1}>'.format(TO_TEXT(self.proto.chunk.source),
+            self.proto.chunk.line_number)
+
+class Lua4Prototype(object):
+    """A chunk pre-decoded for execution."""
+    __slots__ = ('chunk', 'code', 'num_params', 'is_vararg', 'protos')
+
+    def __init__(self, chunk, transform=None):
+        if transform is not None:
+            chunk = transform.transform(chunk)
+        self.chunk = chunk
+        self.num_params = chunk.num_params
+        self.is_vararg = chunk.is_vararg
+        self.protos = [Lua4Prototype(f, transform) for f in chunk.constants.function]
+        self.code = self._predecode(chunk)
+
+    def _predecode(self, chunk):
+        d = decode_instructions(chunk.instruction).tolists()
+        code = []
+        for pc in range(len(d.opcode)):
+            op = d.opcode[pc]
+            kind = _OPERANDS[op]
+            if kind == 'U':
+                code.append((op, d.U[pc], 0))
+            elif kind == 'S':
+                code.append((op, float(d.S[pc]), 0))
+            elif kind == 'J':
+                code.append((op, pc + 1 + d.S[pc], 0))
+            elif kind in ('K', 'N', 'P'):
+                code.append(self._predecode_constant(op, kind, d, pc))
+            elif kind == 'AB':
+                code.append((op, d.A[pc], d.B[pc]))
+            elif kind == '?':
+                # only fails when it is executed, like the Lua VM
+                code.append((op, op, 0))
+            else:
+                code.append((op, 0, 0))
+        return code
+
+    def _predecode_constant(self, op, kind, d, pc):
+        constants = self.chunk.constants
+        try:
+            if kind == 'K':
+                return (op, constants.string[d.U[pc]], 0)
+            if kind == 'N':
+                value = constants.number[d.U[pc]]
+                return (op, -value if op == OPCODE.OP_PUSHNEGNUM else value, 0)
+            return (op, self.protos[d.A[pc]], d.B[pc])
+        except IndexError:
+            raise Lua4RuntimeError('constant index out of range at pc {0}'.format(pc))
+
+# operand kind by raw opcode, '?' for the values Lua 4 does not define
+_OPERANDS = ['-'] * NUM_OPCODES + ['?'] * (NUM_OPCODE_VALUES - NUM_OPCODES)
+for _ops, _kind in (
+        ((OPCODE.OP_RETURN, OPCODE.OP_PUSHNIL, OPCODE.OP_POP, OPCODE.OP_PUSHUPVALUE,
+            OPCODE.OP_GETLOCAL, OPCODE.OP_GETINDEXED, OPCODE.OP_CREATETABLE,
+            OPCODE.OP_SETLOCAL, OPCODE.OP_SETMAP, OPCODE.OP_CONCAT), 'U'),
+        ((OPCODE.OP_PUSHINT, OPCODE.OP_ADDI), 'S'),
+        ((OPCODE.OP_PUSHSTRING, OPCODE.OP_GETGLOBAL, OPCODE.OP_GETDOTTED,
+            OPCODE.OP_PUSHSELF, OPCODE.OP_SETGLOBAL), 'K'),
+        ((OPCODE.OP_PUSHNUM, OPCODE.OP_PUSHNEGNUM), 'N'),
+        ((OPCODE.OP_CALL, OPCODE.OP_TAILCALL, OPCODE.OP_SETTABLE, OPCODE.OP_SETLIST), 'AB'),
+        ((OPCODE.OP_CLOSURE,), 'P'),
+        (tuple(range(OPCODE.OP_JMPNE, OPCODE.OP_JMP + 1)) + (OPCODE.OP_FORPREP,
+            OPCODE.OP_FORLOOP, OPCODE.OP_LFORPREP, OPCODE.OP_LFORLOOP), 'J')):
+    for _op in _ops:
+        _OPERANDS[_op] = _kind
+del _ops, _kind, _op
+
+#
+# value helpers
+#
+
+def lua_type(value):
+    if value is None:
+        return 'nil'
+    if isinstance(value, float):
+        return 'number'
+    if isinstance(value, bytes):
+        return 'string'
+    if isinstance(value, LuaTable):
+        return 'table'
+    return 'function'
+
+def to_number(value):
+    if isinstance(value, float):
+        return value
+    if isinstance(value, bytes):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return None
+    return None
+
+def number_to_bytes(value):
+    return ('%.16g' % value).encode('ascii')
+
+def to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, float):
+        return number_to_bytes(value)
+    return None
+
+def tostring(value):
+    if value is None:
+        return b'nil'
+    text = to_bytes(value)
+    if text is not None:
+        return text
+    return '{0}: 0x{1:08x}'.format(lua_type(value), id(value) & 0xFFFFFFFF).encode('ascii')
+
+def _arith_operands(x, y, what):
+    a = to_number(x)
+    b = to_number(y)
+    if a is None or b is None:
+        bad = x if a is None else y
+        raise Lua4RuntimeError('attempt to perform arithmetic on a {0} value ({1})'.format(
+            lua_type(bad), what))
+    return a, b
+
+def _less_than(x, y):
+    if isinstance(x, float) and isinstance(y, float):
+        return x < y
+    if isinstance(x, bytes) and isinstance(y, bytes):
+        return x < y
+    raise Lua4RuntimeError('attempt to compare {0} with {1}'.format(lua_type(x), lua_type(y)))
+
+def _equals(x, y):
+    if type(x) is not type(y):
+        return False
+    if isinstance(x, (float, bytes)) or x is None:
+        return x == y
+    return x is y
+
+def _get_table(value, key):
+    if isinstance(value, LuaTable):
+        return value.hash.get(key)
+    raise Lua4RuntimeError('attempt to index a {0} value'.format(lua_type(value)))
+
+def _set_table(table, key, value):
+    if not isinstance(table, LuaTable):
+        raise Lua4RuntimeError('attempt to index a {0} value'.format(lua_type(table)))
+    table.set(key, value)
+
+#
+# opcode handlers: handler(vm, frame, x, y), a non-None return value ends
+# the frame with that list of results
+#
+
+class _Frame(object):
+    __slots__ = ('stack', 'pc', 'upvalues')
+
+    def __init__(self, stack, upvalues):
+        self.stack = stack
+        self.pc = 0
+        self.upvalues = upvalues
+
+class _ForInState(object):
+    # lives in the hidden `(table)` slot of a for-in loop
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items
+
+def _op_end(vm, f, x, y):
+    return []
+
+def _op_return(vm, f, x, y):
+    return f.stack[x:]
+
+def _adjust(results, wanted):
+    if wanted == MULT_RET:
+        return results
+    if len(results) >= wanted:
+        return results[:wanted]
+    return results + [None] * (wanted - len(results))
+
+def _op_call(vm, f, x, y):
+    stack = f.stack
+    func = stack[x]
+    args = stack[x + 1:]
+    del stack[x:]
+    stack.extend(_adjust(vm.call(func, args), y))
+
+def _op_tailcall(vm, f, x, y):
+    # returns everything from y up, the values below the function first
+    stack = f.stack
+    return stack[y:x] + vm.call(stack[x], stack[x + 1:])
+
+def _op_pushnil(vm, f, x, y):
+    f.stack.extend([None] * max(1, x))
+
+def _op_pop(vm, f, x, y):
+    if x:
+        del f.stack[-x:]
+
+def _op_pushconst(vm, f, x, y):
+    f.stack.append(x)
+
+def _op_pushupvalue(vm, f, x, y):
+    f.stack.append(f.upvalues[x])
+
+def _op_getlocal(vm, f, x, y):
+    f.stack.append(f.stack[x])
+
+def _op_getglobal(vm, f, x, y):
+    f.stack.append(vm.globals.hash.get(x))
+
+def _op_gettable(vm, f, x, y):
+    stack = f.stack
+    key = stack.pop()
+    stack[-1] = _get_table(stack[-1], key)
+
+def _op_getdotted(vm, f, x, y):
+    stack = f.stack
+    stack[-1] = _get_table(stack[-1], x)
+
+def _op_getindexed(vm, f, x, y):
+    stack = f.stack
+    stack[-1] = _get_table(stack[-1], stack[x])
+
+def _op_pushself(vm, f, x, y):
+    stack = f.stack
+    receiver = stack[-1]
+    stack[-1] = _get_table(receiver, x)
+    stack.append(receiver)
+
+def _op_createtable(vm, f, x, y):
+    f.stack.append(LuaTable())
+
+def _op_setlocal(vm, f, x, y):
+    stack = f.stack
+    stack[x] = stack.pop()
+
+def _op_setglobal(vm, f, x, y):
+    vm.globals.set(x, f.stack.pop())
+
+def _op_settable(vm, f, x, y):
+    stack = f.stack
+    _set_table(stack[-x], stack[-x + 1], stack[-1])
+    del stack[-y:]
+
+def _op_setlist(vm, f, x, y):
+    stack = f.stack
+    table = stack[-y - 1]
+    base = x * LFIELDS_PER_FLUSH + 1
+    for i, value in enumerate(stack[-y:] if y else ()):
+        table.set(float(base + i), value)
+    if y:
+        del stack[-y:]
+
+def _op_setmap(vm, f, x, y):
+    stack = f.stack
+    n = 2 * x
+    table = stack[-n - 1]
+    values = stack[-n:] if n else []
+    for i in range(0, n, 2):
+        table.set(values[i], values[i + 1])
+    if n:
+        del stack[-n:]
+
+def _binary(func, what):
+    def handler(vm, f, x, y):
+        stack = f.stack
+        b = stack.pop()
+        a = stack[-1]
+        if isinstance(a, float) and isinstance(b, float):
+            stack[-1] = func(a, b)
+        else:
+            stack[-1] = func(*_arith_operands(a, b, what))
+    return handler
+
+def _lua_div(a, b):
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a == 0 or a != a:
+            return float('nan')
+        return math.copysign(float('inf'), a) * math.copysign(1.0, b)
+
+def _lua_pow(a, b):
+    try:
+        return math.pow(a, b)
+    except (OverflowError, ValueError):
+        return float('nan')
+
+def _op_addi(vm, f, x, y):
+    stack = f.stack
+    a = stack[-1]
+    if not isinstance(a, float):
+        a = _arith_operands(a, x, 'add')[0]
+    stack[-1] = a + x
+
+def _op_concat(vm, f, x, y):
+    stack = f.stack
+    parts = []
+    for value in stack[-x:]:
+        text = to_bytes(value)
+        if text is None:
+            raise Lua4RuntimeError('attempt to concat a {0} value'.format(lua_type(value)))
+        parts.append(text)
+    del stack[-x:]
+    stack.append(b''.join(parts))
+
+def _op_minus(vm, f, x, y):
+    stack = f.stack
+    a = to_number(stack[-1])
+    if a is None:
+        raise Lua4RuntimeError('attempt to perform arithmetic on a {0} value (unm)'.format(
+            lua_type(stack[-1])))
+    stack[-1] = -a
+
+def _op_not(vm, f, x, y):
+    stack = f.stack
+    stack[-1] = 1.0 if stack[-1] is None else None
+
+def _compare_jump(test):
+    def handler(vm, f, x, y):
+        stack = f.stack
+        b = stack.pop()
+        a = stack.pop()
+        if test(a, b):
+            f.pc = x
+    return handler
+
+def _op_jmpt(vm, f, x, y):
+    if f.stack.pop() is not None:
+        f.pc = x
+
+def _op_jmpf(vm, f, x, y):
+    if f.stack.pop() is None:
+        f.pc = x
+
+def _op_jmpont(vm, f, x, y):
+    if f.stack[-1] is None:
+        f.stack.pop()
+    else:
+        f.pc = x
+
+def _op_jmponf(vm, f, x, y):
+    if f.stack[-1] is not None:
+        f.stack.pop()
+    else:
+        f.pc = x
+
+def _op_jmp(vm, f, x, y):
+    f.pc = x
+
+def _op_pushniljmp(vm, f, x, y):
+    f.stack.append(None)
+    f.pc += 1
+
+def _op_forprep(vm, f, x, y):
+    stack = f.stack
+    for offset, what in ((-1, 'step'), (-2, 'limit'), (-3, 'initial value')):
+        value = to_number(stack[offset])
+        if value is None:
+            raise Lua4RuntimeError('`for\' {0} must be a number'.format(what))
+        stack[offset] = value
+    step, limit, index = stack[-1], stack[-2], stack[-3]
+    if (index > limit) if step > 0 else (index < limit):
+        del stack[-3:]
+        f.pc = x
+
+def _op_forloop(vm, f, x, y):
+    stack = f.stack
+    step, limit = stack[-1], stack[-2]
+    index = stack[-3]
+    if not isinstance(index, float):
+        raise Lua4RuntimeError('`for\' index must be a number')
+    index += step
+    if (index > limit) if step > 0 else (index < limit):
+        del stack[-3:]
+    else:
+        stack[-3] = index
+        f.pc = x
+
+def _op_lforprep(vm, f, x, y):
+    stack = f.stack
+    table = stack[-1]
+    if not isinstance(table, LuaTable):
+        raise Lua4RuntimeError('`for\' table must be a table')
+    items = iter(list(table.hash.items()))
+    first = next(items, None)
+    if first is None:
+        stack.pop()
+        f.pc = x
+        return
+    stack[-1] = _ForInState(items)
+    stack.extend(first)
+
+def _op_lforloop(vm, f, x, y):
+    stack = f.stack
+    item = next(stack[-3].items, None)
+    if item is None:
+        del stack[-3:]
+    else:
+        stack[-2], stack[-1] = item
+        f.pc = x
+
+def _op_unknown(vm, f, x, y):
+    raise Lua4RuntimeError('unknown opcode {0} at pc {1}'.format(x, f.pc - 1))
+
+def _op_closure(vm, f, x, y):
+    stack = f.stack
+    upvalues = tuple(stack[-y:]) if y else ()
+    if y:
+        del stack[-y:]
+    stack.append(LuaClosure(x, upvalues))
+
+_HANDLERS = {
+    OPCODE.OP_END: _op_end,
+    OPCODE.OP_RETURN: _op_return,
+    OPCODE.OP_CALL: _op_call,
+    OPCODE.OP_TAILCALL: _op_tailcall,
+    OPCODE.OP_PUSHNIL: _op_pushnil,
+    OPCODE.OP_POP: _op_pop,
+    OPCODE.OP_PUSHINT: _op_pushconst,
+    OPCODE.OP_PUSHSTRING: _op_pushconst,
+    OPCODE.OP_PUSHNUM: _op_pushconst,
+    OPCODE.OP_PUSHNEGNUM: _op_pushconst,
+    OPCODE.OP_PUSHUPVALUE: _op_pushupvalue,
+    OPCODE.OP_GETLOCAL: _op_getlocal,
+    OPCODE.OP_GETGLOBAL: _op_getglobal,
+    OPCODE.OP_GETTABLE: _op_gettable,
+    OPCODE.OP_GETDOTTED: _op_getdotted,
+    OPCODE.OP_GETINDEXED: _op_getindexed,
+    OPCODE.OP_PUSHSELF: _op_pushself,
+    OPCODE.OP_CREATETABLE: _op_createtable,
+    OPCODE.OP_SETLOCAL: _op_setlocal,
+    OPCODE.OP_SETGLOBAL: _op_setglobal,
+    OPCODE.OP_SETTABLE: _op_settable,
+    OPCODE.OP_SETLIST: _op_setlist,
+    OPCODE.OP_SETMAP: _op_setmap,
+    OPCODE.OP_ADD: _binary(lambda a, b: a + b, 'add'),
+    OPCODE.OP_ADDI: _op_addi,
+    OPCODE.OP_SUB: _binary(lambda a, b: a - b, 'sub'),
+    OPCODE.OP_MULT: _binary(lambda a, b: a * b, 'mul'),
+    OPCODE.OP_DIV: _binary(_lua_div, 'div'),
+    OPCODE.OP_POW: _binary(_lua_pow, 'pow'),
+    OPCODE.OP_CONCAT: _op_concat,
+    OPCODE.OP_MINUS: _op_minus,
+    OPCODE.OP_NOT: _op_not,
+    OPCODE.OP_JMPNE: _compare_jump(lambda a, b: not _equals(a, b)),
+    OPCODE.OP_JMPEQ: _compare_jump(_equals),
+    OPCODE.OP_JMPLT: _compare_jump(_less_than),
+    OPCODE.OP_JMPLE: _compare_jump(lambda a, b: not _less_than(b, a)),
+    OPCODE.OP_JMPGT: _compare_jump(lambda a, b: _less_than(b, a)),
+    OPCODE.OP_JMPGE: _compare_jump(lambda a, b: not _less_than(a, b)),
+    OPCODE.OP_JMPT: _op_jmpt,
+    OPCODE.OP_JMPF: _op_jmpf,
+    OPCODE.OP_JMPONT: _op_jmpont,
+    OPCODE.OP_JMPONF: _op_jmponf,
+    OPCODE.OP_JMP: _op_jmp,
+    OPCODE.OP_PUSHNILJMP: _op_pushniljmp,
+    OPCODE.OP_FORPREP: _op_forprep,
+    OPCODE.OP_FORLOOP: _op_forloop,
+    OPCODE.OP_LFORPREP: _op_lforprep,
+    OPCODE.OP_LFORLOOP: _op_lforloop,
+    OPCODE.OP_CLOSURE: _op_closure,
+}
+HANDLERS = [_HANDLERS.get(op, _op_unknown) for op in range(NUM_OPCODE_VALUES)]
+
+#
+# the VM
+#
+
+class Lua4VirtualMachine(object):
+    """Execute parsed Lua4 files. `max_instructions` and `max_time` (seconds)
+    bound a run, exceeding either raises Lua4BudgetExceeded. The optional
+    `transform` (a ByteCodeTransform) is applied to every chunk before it
+    is decoded for execution.
+    """
+    def __init__(self, transform=None, max_instructions=None, max_time=None,
+            max_call_depth=DEFAULT_MAX_CALL_DEPTH, stdout=None):
+        self.transform = transform
+        self.max_instructions = max_instructions
+        self.max_time = max_time
+        self.max_call_depth = max_call_depth
+        self.stdout = stdout if stdout is not None else sys.stdout
+        self.globals = LuaTable()
+        self.instruction_count = 0
+        self._depth = 0
+        self._deadline = None
+        install_builtins(self)
+
+    def load(self, lua_file):
+        """Closure for the main chunk of a parsed file."""
+        return LuaClosure(Lua4Prototype(lua_file.code_chunk, self.transform), ())
+
+    def run(self, lua_file, args=()):
+        return self.execute(self.load(lua_file), args)
+
+    def execute(self, func, args=()):
+        """Call `func` as the outermost call, with the budgets starting now."""
+        self.instruction_count = 0
+        self._deadline = None if self.max_time is None else time.time() + self.max_time
+        return self.call(func, list(args))
+
+    def call(self, func, args):
+        if isinstance(func, LuaClosure):
+            self._depth += 1
+            try:
+                if self._depth > self.max_call_depth:
+                    raise Lua4RuntimeError('stack overflow')
+                # short frames never finish a slice, count them on entry
+                self._check_budget(0)
+                return self._execute(func, args)
+            finally:
+                self._depth -= 1
+        if callable(func):
+            return list(func(self, args) or [])
+        raise Lua4RuntimeError('attempt to call a {0} value'.format(lua_type(func)))
+
+    def _check_budget(self, executed):
+        self.instruction_count += executed
+        if self.max_instructions is not None and self.instruction_count > self.max_instructions:
+            raise Lua4BudgetExceeded('instruction budget of {0} exceeded'.format(
+                self.max_instructions))
+        if self._deadline is not None and time.time() > self._deadline:
+            raise Lua4BudgetExceeded('time budget of {0}s exceeded'.format(self.max_time))
+
+    def _execute(self, closure, args):
+        proto = closure.proto
+        nparams = proto.num_params
+        stack = args[:nparams]
+        if len(stack) < nparams:
+            stack.extend([None] * (nparams - len(stack)))
+        if proto.is_vararg:
+            extra = args[nparams:]
+            arg = LuaTable(dict((float(i + 1), v) for i, v in enumerate(extra) if v is not None))
+            arg.hash[b'n'] = float(len(extra))
+            stack.append(arg)
+
+        frame = _Frame(stack, closure.upvalues)
+        code = proto.code
+        handlers = HANDLERS
+        budget = BUDGET_SLICE
+        count = len(code)
+        try:
+            while True:
+                pc = frame.pc
+                if pc >= count:
+                    return []
+                op, x, y = code[pc]
+                frame.pc = pc + 1
+                result = handlers[op](self, frame, x, y)
+                if result is not None:
+                    return result
+                budget -= 1
+                if not budget:
+                    self._check_budget(BUDGET_SLICE)
+                    budget = BUDGET_SLICE
+        finally:
+            self.instruction_count += BUDGET_SLICE - budget
+
+#
+# builtins
+#
+
+def _arg(args, i):
+    return args[i] if i < len(args) else None
+
+def _check_number(args, i, name):
+    value = to_number(_arg(args, i))
+    if value is None:
+        raise Lua4RuntimeError('bad argument #{0} to `{1}\' (number expected)'.format(i + 1, name))
+    return value
+
+def _check_string(args, i, name):
+    value = to_bytes(_arg(args, i))
+    if value is None:
+        raise Lua4RuntimeError('bad argument #{0} to `{1}\' (string expected)'.format(i + 1, name))
+    return value
+
+def _check_table(args, i, name):
+    value = _arg(args, i)
+    if not isinstance(value, LuaTable):
+        raise Lua4RuntimeError('bad argument #{0} to `{1}\' (table expected)'.format(i + 1, name))
+    return value
+
+def _builtin_print(vm, args):
+    vm.stdout.write('\t'.join(TO_TEXT(tostring(v)) for v in args) + '\n')
+
+def _builtin_error(vm, args):
+    raise Lua4RuntimeError(TO_TEXT(tostring(_arg(args, 0))))
+
+def _builtin_assert(vm, args):
+    if _arg(args, 0) is None:
+        raise Lua4RuntimeError('assertion failed!  ' + TO_TEXT(tostring(_arg(args, 1)))
+            if len(args) > 1 else 'assertion failed!')
+
+def _builtin_tonumber(vm, args):
+    value = _arg(args, 0)
+    base = int(to_number(_arg(args, 1)) or 10)
+    if base == 10:
+        return [to_number(value)]
+    try:
+        return [float(int(to_bytes(value), base))]
+    except (TypeError, ValueError):
+        return [None]
+
+def _builtin_next(vm, args):
+    table = _check_table(args, 0, 'next')
+    key = _arg(args, 1)
+    keys = list(table.hash)
+    if key is None:
+        index = 0
+    else:
+        try:
+            index = keys.index(key) + 1
+        except ValueError:
+            raise Lua4RuntimeError('invalid key for `next\'')
+    if index >= len(keys):
+        return [None]
+    return [keys[index], table.hash[keys[index]]]
+
+def _builtin_tinsert(vm, args):
+    table = _check_table(args, 0, 'tinsert')
+    n = table.getn()
+    if len(args) < 3:
+        pos, value = n + 1, _arg(args, 1)
+    else:
+        pos, value = int(_check_number(args, 1, 'tinsert')), args[2]
+        for i in range(n, pos - 1, -1):
+            table.set(float(i + 1), table.get(float(i)))
+    table.set(float(pos), value)
+    if b'n' in table.hash:
+        table.hash[b'n'] = float(n + 1)
+
+def _builtin_tremove(vm, args):
+    table = _check_table(args, 0, 'tremove')
+    n = table.getn()
+    if n <= 0:
+        return [None]
+    pos = int(_check_number(args, 1, 'tremove')) if len(args) > 1 else n
+    value = table.get(float(pos))
+    for i in range(pos, n):
+        table.set(float(i), table.get(float(i + 1)))
+    table.set(float(n), None)
+    if b'n' in table.hash:
+        table.hash[b'n'] = float(n - 1)
+    return [value]
+
+def _builtin_strsub(vm, args):
+    s = _check_string(args, 0, 'strsub')
+    length = len(s)
+    start = int(_check_number(args, 1, 'strsub'))
+    end = int(to_number(_arg(args, 2)) if _arg(args, 2) is not None else -1)
+    if start < 0:
+        start = max(length + start + 1, 1)
+    elif start == 0:
+        start = 1
+    if end < 0:
+        end = length + end + 1
+    end = min(end, length)
+    return [s[start - 1:end] if start <= end else b'']
+
+def _builtin_format(vm, args):
+    fmt = _check_string(args, 0, 'format')
+    values = []
+    i = 1
+    pos = 0
+    while True:
+        pos = fmt.find(b'%', pos)
+        if pos == -1 or pos + 1 >= len(fmt):
+            break
+        if fmt[pos + 1:pos + 2] == b'%':
+            pos += 2
+            continue
+        end = pos + 1
+        while end < len(fmt) and fmt[end:end + 1] in b'-+ #0123456789.':
+            end += 1
+        conv = fmt[end:end + 1]
+        if conv in (b'd', b'i', b'c', b'o', b'x', b'X'):
+            values.append(int(_check_number(args, i, 'format')))
+        elif conv in (b'e', b'E', b'f', b'g', b'G'):
+            values.append(_check_number(args, i, 'format'))
+        elif conv == b'q':
+            fmt = fmt[:end] + b's' + fmt[end + 1:]
+            values.append(b'"' + _check_string(args, i, 'format').replace(b'\\', b'\\\\')
+                .replace(b'"', b'\\"').replace(b'\n', b'\\\n') + b'"')
+        else:
+            values.append(_check_string(args, i, 'format'))
+        i += 1
+        pos = end + 1
+    return [fmt % tuple(values)]
+
+def _builtin_dostring(vm, args):
+    raise Lua4RuntimeError('dostring is not supported without a compiler')
+
+BUILTINS = {
+    'print':        _builtin_print,
+    'error':        _builtin_error,
+    'assert':       _builtin_assert,
+    'type':         lambda vm, args: [lua_type(_arg(args, 0)).encode('ascii')],
+    'tostring':     lambda vm, args: [tostring(_arg(args, 0))],
+    'tonumber':     _builtin_tonumber,
+    'getglobal':    lambda vm, args: [vm.globals.get(_arg(args, 0))],
+    'setglobal':    lambda vm, args: vm.globals.set(_arg(args, 0), _arg(args, 1)),
+    'globals':      lambda vm, args: [vm.globals],
+    'rawget':       lambda vm, args: [_check_table(args, 0, 'rawget').get(_arg(args, 1))],
+    'rawset':       lambda vm, args: _check_table(args, 0, 'rawset').set(_arg(args, 1),
+                        _arg(args, 2)),
+    'next':         _builtin_next,
+    'call':         lambda vm, args: vm.call(_arg(args, 0), [
+                        _check_table(args, 1, 'call').get(float(i + 1))
+                        for i in range(args[1].getn())]),
+    'getn':         lambda vm, args: [float(_check_table(args, 0, 'getn').getn())],
+    'tinsert':      _builtin_tinsert,
+    'tremove':      _builtin_tremove,
+    'strlen':       lambda vm, args: [float(len(_check_string(args, 0, 'strlen')))],
+    'strsub':       _builtin_strsub,
+    'strupper':     lambda vm, args: [_check_string(args, 0, 'strupper').upper()],
+    'strlower':     lambda vm, args: [_check_string(args, 0, 'strlower').lower()],
+    'strrep':       lambda vm, args: [_check_string(args, 0, 'strrep')
+                        * max(0, int(_check_number(args, 1, 'strrep')))],
+    'strbyte':      lambda vm, args: [float(bytearray(_check_string(args, 0, 'strbyte'))[
+                        int(to_number(_arg(args, 1)) or 1) - 1])],
+    'strchar':      lambda vm, args: [bytes(bytearray(int(_check_number(args, i, 'strchar'))
+                        for i in range(len(args))))],
+    'format':       _builtin_format,
+    'abs':          lambda vm, args: [abs(_check_number(args, 0, 'abs'))],
+    'floor':        lambda vm, args: [float(math.floor(_check_number(args, 0, 'floor')))],
+    'ceil':         lambda vm, args: [float(math.ceil(_check_number(args, 0, 'ceil')))],
+    'sqrt':         lambda vm, args: [math.sqrt(_check_number(args, 0, 'sqrt'))],
+    'mod':          lambda vm, args: [math.fmod(_check_number(args, 0, 'mod'),
+                        _check_number(args, 1, 'mod'))],
+    'min':          lambda vm, args: [min(_check_number(args, i, 'min') for i in range(len(args)))],
+    'max':          lambda vm, args: [max(_check_number(args, i, 'max') for i in range(len(args)))],
+    'dostring':     _builtin_dostring,
+}
+
+def install_builtins(vm):
+    for name, func in BUILTINS.items():
+        vm.globals.set(name.encode('ascii'), func)
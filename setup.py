@@ -45,6 +45,10 @@ SETUP_ARGS = {
     'license':          'MIT',
     'platforms':        'any',
     'install_requires': requirements,
+    'extras_require':   {
+        'numpy':            ['numpy'],
+        'arrow':            ['pyarrow'],
+    },
     'classifiers':      [
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',
@@ -60,6 +64,11 @@ SETUP_ARGS = {
     'entry_points':     {
         'console_scripts': [
             'lua4dec            = lua4dec.scripts.decompile:lua4_decompile',
+            'lua4dec-bench      = lua4dec.scripts.benchmark:lua4_benchmark',
+            'lua4dec-snapshot   = lua4dec.scripts.snapshot:lua4_snapshot',
+            'lua4dec-server     = lua4dec.scripts.server:lua4_server',
+            'lua4dec-client     = lua4dec.scripts.server:lua4_client',
+            'lua4dec-index      = lua4dec.scripts.index:lua4_index',
         ],
     },
     'test_suite':       'tests',
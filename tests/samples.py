@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Sample byte code for the tests, built with lua4dec.synth plus the parts
+# the synthetic chunks leave empty (local variables and real line info).
+
+from construct import Container
+
+from lua4dec.lua_lang import OPCODE, CREATE_U, CREATE_S, CREATE_AB
+from lua4dec.parser import Lua4File
+from lua4dec.synth import generate_file, MAX_INT
+
+def sample_file(instructions=40, depth=2, fanout=2, strings=8, seed=0):
+    lua_file = generate_file(instructions, depth, fanout, strings, seed)
+    pending = [lua_file.code_chunk]
+    while pending:
+        chunk = pending.pop()
+        count = len(chunk.instruction)
+        chunk.local_var = [Container(name=b'local_0', start_pc=0, end_pc=count),
+            Container(name=b'(for limit)', start_pc=1, end_pc=count // 2)]
+        # line 3 from pc 0, lines 4 and 7 from the middle on
+        chunk.line_info = [-2, 0, count // 2, -2, count // 2, MAX_INT]
+        pending.extend(chunk.constants.function)
+    return lua_file
+
+def sample_bytes(*args, **kwargs):
+    return Lua4File.build(sample_file(*args, **kwargs))
+
+def chunk_fields(chunk):
+    """Everything a chunk holds as plain values, nested chunks included, so
+    the models of the different engines can be compared.
+    """
+    constants = chunk.constants
+    return (
+        bytes(chunk.source),
+        chunk.line_number,
+        chunk.num_params,
+        bool(chunk.is_vararg),
+        chunk.max_stack_size,
+        [(bytes(lv.name), lv.start_pc, lv.end_pc) for lv in chunk.local_var],
+        list(chunk.line_info),
+        [bytes(s) for s in constants.string],
+        list(constants.number),
+        list(chunk.instruction),
+        [chunk_fields(f) for f in constants.function],
+    )
+
+# argument kinds for assemble(), opcodes not listed take a plain U
+_S_OPCODES      = frozenset(['PUSHINT', 'ADDI'])
+_JUMP_OPCODES   = frozenset(['JMPNE', 'JMPEQ', 'JMPLT', 'JMPLE', 'JMPGT', 'JMPGE', 'JMPT',
+    'JMPF', 'JMPONT', 'JMPONF', 'JMP', 'FORPREP', 'FORLOOP', 'LFORPREP', 'LFORLOOP'])
+_AB_OPCODES     = frozenset(['CALL', 'TAILCALL', 'SETTABLE', 'SETLIST', 'CLOSURE'])
+_K_OPCODES      = frozenset(['PUSHSTRING', 'GETGLOBAL', 'GETDOTTED', 'PUSHSELF', 'SETGLOBAL'])
+
+def assemble(program, strings):
+    """Instruction words for `program`, a list of label strings and
+    (opcode name, argument) pairs, followed by an END. Jumps take a label,
+    AB opcodes an (A, B) pair and opcodes with a string constant its bytes,
+    which are appended to the list `strings` if missing.
+    """
+    labels = {}
+    pc = 0
+    for item in program:
+        if isinstance(item, str):
+            labels[item] = pc
+        else:
+            pc += 1
+    code = []
+    for item in program:
+        if isinstance(item, str):
+            continue
+        name, arg = item
+        op = OPCODE['OP_' + name]
+        if name in _JUMP_OPCODES:
+            code.append(CREATE_S(op, labels[arg] - len(code) - 1))
+        elif name in _S_OPCODES:
+            code.append(CREATE_S(op, arg))
+        elif name in _AB_OPCODES:
+            code.append(CREATE_AB(op, *arg))
+        elif name in _K_OPCODES:
+            if arg not in strings:
+                strings.append(arg)
+            code.append(CREATE_U(op, strings.index(arg)))
+        else:
+            code.append(CREATE_U(op, arg))
+    code.append(CREATE_U(OPCODE.OP_END, 0))
+    return code
+
+def program_chunk(program, numbers=(), num_params=0, is_vararg=False, local_names=(),
+        functions=()):
+    """Chunk running the assemble()d `program`. Each of `local_names` is
+    live for the whole chunk.
+    """
+    strings = []
+    instruction = assemble(program, strings)
+    return Container(source=b'@test.lua', line_number=0, num_params=num_params,
+        is_vararg=is_vararg, max_stack_size=32,
+        local_var=[Container(name=name, start_pc=0, end_pc=len(instruction))
+            for name in local_names],
+        line_info=[],
+        constants=Container(string=strings, number=list(numbers),
+            function=list(functions)),
+        instruction=instruction)
+
+def program_file(program, **kwargs):
+    """A sample_file() with a program_chunk() as the main chunk."""
+    lua_file = sample_file(instructions=1, depth=0, fanout=0, strings=1)
+    lua_file.code_chunk = program_chunk(program, **kwargs)
+    return lua_file
+
+def nested_bytes(depth):
+    """A file whose main chunk has a chain of `depth` nested prototypes,
+    spliced together from the bytes of a one level file since building it
+    with construct recurses too deep.
+    """
+    leaf = program_chunk([])
+    leaf.source = b'@leaf.lua'
+    lua_file = program_file([])
+    lua_file.code_chunk = leaf
+    flat = Lua4File.build(lua_file)
+    lua_file.code_chunk = program_chunk([], functions=[leaf])
+    nested = Lua4File.build(lua_file)
+    # flat is header + leaf, nested is header + prefix + leaf + suffix
+    start = flat.index(leaf.source) - 4
+    leaf_start = nested.index(leaf.source) - 4
+    leaf_end = leaf_start + len(flat) - start
+    return flat[:start] + nested[start:leaf_start] * depth + flat[start:] + \
+        nested[leaf_end:] * depth
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import tempfile
+import unittest
+
+from lua4dec.batch import run_batch, OutputConflictError
+
+from tests.samples import sample_bytes
+
+class TestBatch(unittest.TestCase):
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out_f:
+            out_f.write(data)
+        return path
+
+    def test_same_basename_conflict(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            first = self._write(os.path.join(tmp_dir, 'a', 'main.luac'), sample_bytes(seed=1))
+            second = self._write(os.path.join(tmp_dir, 'b', 'main.luac'), sample_bytes(seed=2))
+            dest = os.path.join(tmp_dir, 'out')
+            with self.assertRaises(OutputConflictError):
+                run_batch([first, second], dest, workers=1)
+            self.assertFalse(os.path.exists(dest))
+
+            # walking the common directory keeps them apart
+            results = run_batch([tmp_dir], dest, workers=1)
+            self.assertEqual(sorted(os.path.relpath(r.dest, dest) for r in results),
+                [os.path.join('a', 'main.luac.txt'), os.path.join('b', 'main.luac.txt')])
+            self.assertTrue(all(r.ok for r in results))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import unittest
+
+from lua4dec.loader import load_stream, ENGINE_FAST
+from lua4dec.scripts.benchmark import run_suite, compare
+from lua4dec.synth import generate_bytes, count_instructions
+
+class TestSynth(unittest.TestCase):
+    def test_reproducible(self):
+        data = generate_bytes(200, 2, 2, 16, seed=4)
+        self.assertEqual(generate_bytes(200, 2, 2, 16, seed=4), data)
+        self.assertNotEqual(generate_bytes(200, 2, 2, 16, seed=5), data)
+
+    def test_shape(self):
+        lua_file = load_stream(io.BytesIO(generate_bytes(200, 2, 3, 16)), ENGINE_FAST)
+        chunk = lua_file.code_chunk
+        # 1 + 3 + 9 chunks of 200 instructions each
+        self.assertEqual(count_instructions(chunk), 13 * 200)
+        self.assertEqual(len(chunk.constants.function), 3)
+        self.assertEqual(len(chunk.constants.string), 16)
+        self.assertEqual(chunk.instruction[-1], 0)
+
+class TestBenchmark(unittest.TestCase):
+    def test_run_suite(self):
+        cases = [(phase, ENGINE_FAST, 300, 1, 2, 8, 0, 2) for phase in ('parse', 'format')]
+        results = run_suite(cases, isolate=False)
+        self.assertEqual([r['case'] for r in results],
+            ['parse/fast/i=300,d=1,f=2,s=8', 'format/fast/i=300,d=1,f=2,s=8'])
+        for result in results:
+            self.assertEqual(result['instructions'], 900)
+            self.assertEqual(len(result['seconds_all']), 2)
+            self.assertEqual(result['seconds'], min(result['seconds_all']))
+            if result['peak_rss_kb'] is not None:
+                self.assertEqual(result['rss_growth_kb'],
+                    result['peak_rss_kb'] - result['rss_before_kb'])
+        self.assertEqual(len(compare(results, {'results': results})), 2)
+
+if __name__ == '__main__':
+    unittest.main()
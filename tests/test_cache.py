@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from lua4dec.batch import decompile_file
+from lua4dec.cache import DecompileCache
+from lua4dec.fast_parser import Lua4Limits, Lua4LimitError, DEFAULT_LIMITS
+from lua4dec.formatter import Lua4DebugFormatter, Lua4PrettyFormatter
+
+from tests.samples import sample_bytes
+
+class TestDecompileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.source = os.path.join(self.tmp_dir, 'test.luac')
+        with open(self.source, 'wb') as out:
+            out.write(sample_bytes(depth=2))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _decompile(self, cache, formatter_class=Lua4DebugFormatter, limits=None):
+        dest = os.path.join(self.tmp_dir, 'test.out')
+        cache_hit = decompile_file(self.source, dest, 'fast', formatter_class, cache,
+            limits=limits)
+        with open(dest) as out:
+            return cache_hit, out.read()
+
+    def test_put_get(self):
+        cache = DecompileCache(self.cache_dir)
+        key = cache.key(b'data', Lua4DebugFormatter)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, 'output')
+        self.assertEqual(cache.get(key), 'output')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.clear(), 0)
+        self.assertIsNone(cache.get(key))
+
+    def test_keys(self):
+        cache = DecompileCache(self.cache_dir)
+        key = cache.key(b'data', Lua4DebugFormatter)
+        self.assertEqual(cache.key(b'data', Lua4DebugFormatter, DEFAULT_LIMITS), key)
+        others = [cache.key(b'datb', Lua4DebugFormatter),
+            cache.key(b'data', Lua4PrettyFormatter),
+            cache.key(b'data', Lua4DebugFormatter, Lua4Limits(max_depth=1)),
+            cache.key(b'data', Lua4DebugFormatter, Lua4Limits(max_instructions=1)),
+            cache.key(b'data', Lua4DebugFormatter, Lua4Limits(max_string_bytes=1)),
+            cache.model_key(b'data')]
+        self.assertEqual(len(set(others + [key])), len(others) + 1)
+
+    def test_hit(self):
+        cache = DecompileCache(self.cache_dir)
+        expected = self._decompile(None)[1]
+        self.assertEqual(self._decompile(cache), (False, expected))
+        with mock.patch('lua4dec.batch.load_stream', side_effect=AssertionError):
+            self.assertEqual(self._decompile(cache), (True, expected))
+
+    def test_limits(self):
+        cache = DecompileCache(self.cache_dir)
+        self.assertFalse(self._decompile(cache)[0])
+        with self.assertRaises(Lua4LimitError):
+            self._decompile(cache, limits=Lua4Limits(max_depth=1))
+
+    def test_models(self):
+        cache = DecompileCache(self.cache_dir, store_models=True)
+        self._decompile(cache)
+        expected = self._decompile(None, Lua4PrettyFormatter)[1]
+        # the pretty output is rendered from the model the debug run stored
+        with mock.patch('lua4dec.batch.load_stream', side_effect=AssertionError):
+            self.assertEqual(self._decompile(cache, Lua4PrettyFormatter), (False, expected))
+        # but not from one stored under other limits
+        with self.assertRaises(Lua4LimitError):
+            self._decompile(cache, Lua4PrettyFormatter, Lua4Limits(max_depth=1))
+
+    def test_eviction(self):
+        cache = DecompileCache(self.cache_dir, max_size=1000)
+        keys = [cache.key(str(i).encode('ascii'), Lua4DebugFormatter) for i in range(5)]
+        for key in keys:
+            cache.put(key, 'x' * 300)
+        self.assertLessEqual(cache.size(), 1000)
+        self.assertEqual(cache.get(keys[-1]), 'x' * 300)
+        self.assertIsNone(cache.get(keys[0]))
+
+if __name__ == '__main__':
+    unittest.main()
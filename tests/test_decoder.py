@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+import random
+import unittest
+
+from lua4dec.decoder import decode_instructions, decode_chunk, NUMPY_THRESHOLD, _get_numpy
+from lua4dec.lua_lang import GET_OPCODE, GETARG_U, GETARG_S, GETARG_A, GETARG_B
+from lua4dec.model import UINT32_TYPECODE
+
+from tests.samples import sample_file
+
+def _words(count, seed=0):
+    rng = random.Random(seed)
+    return [0, 0xFFFFFFFF, 0x3F, 0xFFFFFFC0] + \
+        [rng.getrandbits(32) for _ in range(count - 4)]
+
+def _columns(decoded):
+    decoded = decoded.tolists()
+    return [decoded.instruction, decoded.opcode, decoded.U, decoded.S, decoded.A, decoded.B]
+
+def _expected(words):
+    return [list(words),
+        [GET_OPCODE(i) for i in words],
+        [GETARG_U(i) for i in words],
+        [GETARG_S(i) for i in words],
+        [GETARG_A(i) for i in words],
+        [GETARG_B(i) for i in words]]
+
+class TestDecoder(unittest.TestCase):
+    def test_python(self):
+        words = _words(100)
+        for instructions in (words, array.array(UINT32_TYPECODE, words)):
+            decoded = decode_instructions(instructions, use_numpy=False)
+            self.assertEqual(len(decoded), len(words))
+            self.assertEqual(_columns(decoded), _expected(words))
+
+    @unittest.skipIf(_get_numpy() is None, 'numpy is not installed')
+    def test_numpy(self):
+        words = _words(NUMPY_THRESHOLD + 1, seed=1)
+        for instructions in (words, array.array(UINT32_TYPECODE, words),
+                memoryview(array.array(UINT32_TYPECODE, words))):
+            decoded = decode_instructions(instructions)
+            self.assertTrue(hasattr(decoded.opcode, 'dtype'))
+            self.assertEqual(_columns(decoded), _expected(words))
+
+    def test_chunk(self):
+        chunk = sample_file(instructions=30, depth=0).code_chunk
+        self.assertEqual(_columns(decode_chunk(chunk)), _expected(chunk.instruction))
+
+    def test_empty(self):
+        for use_numpy in (False, None):
+            self.assertEqual(_columns(decode_instructions([], use_numpy)), [[]] * 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+
+from lua4dec.decompiler import render_chunk
+
+from tests.samples import program_chunk
+
+# Expressions and statements rebuilt by lua4dec.decompiler from small hand
+# assembled chunks, compared with the source the Lua 4 compiler would have
+# turned into them.
+
+def decompile(program, **kwargs):
+    return '\n'.join(render_chunk(program_chunk(program, **kwargs)))
+
+class TestExpressions(unittest.TestCase):
+    def test_precedence(self):
+        self.assertEqual(decompile([('GETGLOBAL', b'a'), ('GETGLOBAL', b'b'),
+            ('GETGLOBAL', b'c'), ('MULT', 0), ('ADD', 0), ('PUSHINT', 2), ('POW', 0),
+            ('SETGLOBAL', b'x')]), 'x = (a + b * c) ^ 2')
+        self.assertEqual(decompile([('GETGLOBAL', b'a'), ('GETGLOBAL', b'b'), ('ADD', 0),
+            ('GETGLOBAL', b'c'), ('SUB', 0), ('GETGLOBAL', b'a'), ('GETGLOBAL', b'b'),
+            ('SUB', 0), ('DIV', 0), ('SETGLOBAL', b'x')]), 'x = (a + b - c) / (a - b)')
+        self.assertEqual(decompile([('GETGLOBAL', b'a'), ('ADDI', -3), ('SETGLOBAL', b'a')]),
+            'a = a - 3')
+
+    def test_unary_and_constants(self):
+        self.assertEqual(decompile([('GETGLOBAL', b'a'), ('MINUS', 0), ('GETGLOBAL', b'b'),
+            ('NOT', 0), ('PUSHNEGNUM', 0), ('PUSHNUM', 1), ('PUSHSTRING', b"it's\n"),
+            ('CONCAT', 2), ('CONCAT', 2), ('SETGLOBAL', b'x'), ('SETGLOBAL', b'y'),
+            ('SETGLOBAL', b'z')], numbers=[1.5, 0.25]),
+            'x = -1.5 .. 0.25 .. "it\'s\\n"\ny = not b\nz = -a')
+
+    def test_tables(self):
+        self.assertEqual(decompile([('CREATETABLE', 3), ('PUSHINT', 1), ('PUSHSTRING', b'two'),
+            ('SETLIST', (0, 2)), ('PUSHSTRING', b'k'), ('PUSHINT', 3), ('SETMAP', 1),
+            ('SETGLOBAL', b't')]), 't = {1, "two"; k = 3}')
+        self.assertEqual(decompile([('GETGLOBAL', b't'), ('GETDOTTED', b'field'),
+            ('GETGLOBAL', b'i'), ('GETTABLE', 0), ('SETGLOBAL', b'x'), ('GETLOCAL', 0),
+            ('GETINDEXED', 0), ('SETGLOBAL', b'y')], num_params=1, local_names=[b'l']),
+            'x = t.field[i]\ny = l[l]')
+        self.assertEqual(decompile([('GETGLOBAL', b't'), ('PUSHSTRING', b'k'), ('PUSHINT', 5),
+            ('SETTABLE', (3, 2)), ('POP', 2)]), 't.k = 5')
+
+    def test_calls(self):
+        self.assertEqual(decompile([('GETGLOBAL', b'print'), ('PUSHSTRING', b'hi'),
+            ('CALL', (0, 0)), ('GETGLOBAL', b'obj'), ('PUSHSELF', b'm'), ('PUSHINT', 1),
+            ('CALL', (0, 1)), ('SETGLOBAL', b'x'), ('GETGLOBAL', b'f'), ('GETGLOBAL', b'g'),
+            ('CALL', (1, 255)), ('CALL', (0, 1)), ('SETGLOBAL', b'y')]),
+            'print("hi")\nx = obj:m(1)\ny = f(g())')
+        self.assertEqual(decompile([('GETGLOBAL', b'f'), ('CALL', (0, 2)), ('SETGLOBAL', b'b'),
+            ('SETGLOBAL', b'a')]), 'local _r1_1, _r1_2 = f()\nb = _r1_2\na = _r1_1')
+
+    def test_locals_and_closures(self):
+        self.assertEqual(decompile([('GETLOCAL', 0), ('ADDI', 1), ('SETLOCAL', 0),
+            ('GETLOCAL', 0), ('PUSHINT', 2), ('RETURN', 1)], num_params=1, local_names=[b'n']),
+            'n = n + 1\nreturn n, 2')
+        inner = program_chunk([('GETLOCAL', 0), ('PUSHUPVALUE', 0), ('ADD', 0), ('RETURN', 1)],
+            num_params=1, local_names=[b'v'])
+        self.assertEqual(decompile([('GETGLOBAL', b'k'), ('CLOSURE', (0, 1)),
+            ('SETGLOBAL', b'add')], functions=[inner]),
+            'function add(v)\n    return v + %k\nend')
+
+    def test_return(self):
+        self.assertEqual(decompile([('PUSHINT', 1), ('PUSHINT', 2), ('RETURN', 0)]),
+            'return 1, 2')
+
+    def test_tailcall(self):
+        self.assertEqual(decompile([('GETGLOBAL', b'f'), ('PUSHINT', 7), ('TAILCALL', (0, 0))]),
+            'return f(7)')
+        # the values below the called function are returned first
+        self.assertEqual(decompile([('PUSHINT', 1), ('GETGLOBAL', b'f'), ('TAILCALL', (1, 0))]),
+            'return 1, f()')
+        self.assertEqual(decompile([('GETLOCAL', 0), ('PUSHSTRING', b's'), ('GETGLOBAL', b'f'),
+            ('GETLOCAL', 0), ('TAILCALL', (3, 1))], num_params=1, local_names=[b'a']),
+            'return a, "s", f(a)')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import unittest
+
+from lua4dec.formatter import Lua4DebugFormatter
+from lua4dec.loader import load_stream, ENGINE_CONSTRUCT, ENGINE_FAST, ENGINE_LAZY, \
+    ENGINE_SNAPSHOT
+from lua4dec.snapshot import snapshot_bytes
+
+from tests.samples import sample_bytes, chunk_fields
+
+# The construct engine is the reference, every other engine has to produce
+# the same model and the same listing for the same input.
+
+SAMPLES = [
+    dict(instructions=1, depth=0, fanout=0, strings=1, seed=1),
+    dict(instructions=40, depth=2, fanout=2, strings=8, seed=2),
+    dict(instructions=3000, depth=1, fanout=3, strings=300, seed=3),
+]
+
+def _listing(lua_file):
+    out_buf = io.StringIO()
+    Lua4DebugFormatter().dump(lua_file, out_buf)
+    return out_buf.getvalue()
+
+class TestEngineEquivalence(unittest.TestCase):
+    def _check(self, data):
+        reference = load_stream(io.BytesIO(data), ENGINE_CONSTRUCT)
+        expected = chunk_fields(reference.code_chunk)
+        expected_listing = _listing(reference)
+
+        fast = load_stream(io.BytesIO(data), ENGINE_FAST)
+        lazy = load_stream(io.BytesIO(data), ENGINE_LAZY)
+        snapshot = load_stream(io.BytesIO(snapshot_bytes(fast)), ENGINE_SNAPSHOT)
+        try:
+            for engine, lua_file in ((ENGINE_FAST, fast), (ENGINE_LAZY, lazy),
+                    (ENGINE_SNAPSHOT, snapshot)):
+                self.assertEqual(chunk_fields(lua_file.code_chunk), expected, engine)
+                self.assertEqual(lua_file.self_check.test_fp_number,
+                    reference.self_check.test_fp_number, engine)
+                self.assertEqual(_listing(lua_file), expected_listing, engine)
+        finally:
+            lazy.close()
+            snapshot.close()
+
+    def test_samples(self):
+        for sample in SAMPLES:
+            self._check(sample_bytes(**sample))
+
+    def test_trailing_data_ignored(self):
+        self._check(sample_bytes(**SAMPLES[1]) + b'\0' * 16)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from lua4dec.defaults import FORMAT_CSV, FORMAT_JSONL, FORMAT_PARQUET, FORMAT_ARROW
+from lua4dec.export import pc_lines, file_batches, dump_table, dump_tables, Lua4Exporter, \
+    export_corpus, SCHEMAS, TABLES, TABLE_CHUNKS, TABLE_INSTRUCTIONS, TABLE_CONSTANTS, \
+    TABLE_LOCALS
+from lua4dec.loader import load_stream
+
+from tests.samples import sample_file, sample_bytes, program_file
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+PROGRAM = [
+    ('GETLOCAL', 0),
+    ('PUSHSTRING', b'hi'),
+    ('PUSHNUM', 0),
+    ('PUSHNEGNUM', 0),
+    ('PUSHNUM', 5),
+    ('ADDI', -3),
+    ('CALL', (1, 2)),
+    ('JMP', 'end'),
+    'end',
+]
+
+def _load(data):
+    return load_stream(io.BytesIO(data), 'fast')
+
+def _rows(lua_file, table):
+    # the rows of one table as dicts
+    names = [name for name, _ in SCHEMAS[table]]
+    rows = []
+    for batch_table, columns in file_batches(lua_file, 'test'):
+        if batch_table == table:
+            rows.extend(dict(zip(names, row)) for row in zip(*columns))
+    return rows
+
+class TestBatches(unittest.TestCase):
+    def test_pc_lines(self):
+        lua_file = sample_file(instructions=20, depth=0)
+        count = len(lua_file.code_chunk.instruction)
+        half = count // 2
+        # see the line info of sample_file()
+        self.assertEqual(pc_lines(lua_file.code_chunk), [3] * half + [7] * (count - half))
+        lua_file.code_chunk.line_info = []
+        self.assertEqual(pc_lines(lua_file.code_chunk), [None] * count)
+
+    def test_instructions(self):
+        lua_file = program_file(PROGRAM, numbers=[1.5], local_names=[b'x'])
+        rows = _rows(lua_file, TABLE_INSTRUCTIONS)
+        self.assertEqual([(r['pc'], r['opcode'], r['A'], r['B'], r['U'], r['S'], r['constant'])
+            for r in rows], [
+                (0, 'OP_GETLOCAL', None, None, 0, None, 'x'),
+                (1, 'OP_PUSHSTRING', None, None, 0, None, 'hi'),
+                (2, 'OP_PUSHNUM', None, None, 0, None, '1.5'),
+                (3, 'OP_PUSHNEGNUM', None, None, 0, None, '-1.5'),
+                (4, 'OP_PUSHNUM', None, None, 5, None, None),
+                (5, 'OP_ADDI', None, None, None, -3, None),
+                (6, 'OP_CALL', 1, 2, None, None, None),
+                (7, 'OP_JMP', None, None, None, 0, None),
+                (8, 'OP_END', None, None, None, None, None),
+            ])
+        self.assertEqual([r['instruction'] for r in rows], list(lua_file.code_chunk.instruction))
+        self.assertEqual(set((r['file'], r['chunk'], r['line']) for r in rows),
+            set([('test', 'main', None)]))
+
+    def test_tables(self):
+        lua_file = program_file(PROGRAM, numbers=[1.5, 2.0], local_names=[b'x', b'y'])
+        self.assertEqual(_rows(lua_file, TABLE_CHUNKS), [dict(file='test', chunk='main',
+            source='@test.lua', line_number=0, num_params=0, is_vararg=False,
+            max_stack_size=32, locals=2, strings=1, numbers=2, functions=0, instructions=9)])
+        self.assertEqual([(r['kind'], r['index'], r['string'], r['number'])
+            for r in _rows(lua_file, TABLE_CONSTANTS)],
+            [('string', 0, 'hi', None), ('number', 0, None, 1.5), ('number', 1, None, 2.0)])
+        self.assertEqual([(r['index'], r['name'], r['start_pc'], r['end_pc'])
+            for r in _rows(lua_file, TABLE_LOCALS)], [(0, 'x', 0, 9), (1, 'y', 0, 9)])
+
+    def test_listing_order(self):
+        lua_file = sample_file(depth=2, fanout=2)
+        self.assertEqual([r['chunk'] for r in _rows(lua_file, TABLE_CHUNKS)],
+            ['main', 'main.0', 'main.0.0', 'main.0.1', 'main.1', 'main.1.0', 'main.1.1'])
+        self.assertEqual(set(r['file'] for r in _rows(lua_file, TABLE_LOCALS)),
+            set(['test']))
+        for table, columns in file_batches(lua_file):
+            self.assertEqual(len(columns), len(SCHEMAS[table]))
+            self.assertEqual(len(set(len(column) for column in columns)), 1)
+            self.assertEqual(columns[0][0], lua_file.code_chunk.source.decode('latin-1'))
+
+class TestDump(unittest.TestCase):
+    def setUp(self):
+        self.lua_file = _load(sample_bytes(depth=2, fanout=2))
+
+    def test_csv(self):
+        out = io.StringIO()
+        dump_table(self.lua_file, out)
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        expected = _rows(self.lua_file, TABLE_INSTRUCTIONS)
+        self.assertEqual(len(rows), len(expected))
+        self.assertEqual(list(rows[0]), [name for name, _ in SCHEMAS[TABLE_INSTRUCTIONS]])
+        self.assertEqual([(r['chunk'], int(r['pc']), r['opcode']) for r in rows],
+            [(r['chunk'], r['pc'], r['opcode']) for r in expected])
+        # the block size does not change the output
+        small = io.StringIO()
+        dump_table(self.lua_file, small, batch_rows=3)
+        self.assertEqual(small.getvalue(), out.getvalue())
+
+    def test_jsonl(self):
+        out = io.StringIO()
+        dump_table(self.lua_file, out, TABLE_LOCALS, FORMAT_JSONL)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), 14)
+        self.assertEqual(rows[0]['name'], 'local_0')
+
+    def test_tables(self):
+        out = io.StringIO()
+        dump_tables(self.lua_file, out, batch_rows=5)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        counts = dict((table, sum(1 for r in rows if r['table'] == table)) for table in TABLES)
+        self.assertEqual(counts[TABLE_CHUNKS], 7)
+        self.assertEqual(counts[TABLE_LOCALS], 14)
+        self.assertEqual(counts[TABLE_INSTRUCTIONS],
+            len(_rows(self.lua_file, TABLE_INSTRUCTIONS)))
+
+class TestExporter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dest = os.path.join(self.tmp_dir, 'out')
+        self.sources = os.path.join(self.tmp_dir, 'src')
+        os.mkdir(self.sources)
+        for name, seed in (('a.luac', 1), ('b.luac', 2)):
+            with open(os.path.join(self.sources, name), 'wb') as out:
+                out.write(sample_bytes(depth=1, fanout=2, seed=seed))
+        with open(os.path.join(self.sources, 'c.luac'), 'wb') as out:
+            out.write(b'\x1bLua')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_csv(self):
+        exporter, failures = export_corpus([self.sources], self.dest, FORMAT_CSV, 'fast')
+        self.assertEqual(exporter.files, 2)
+        self.assertEqual([os.path.basename(source) for source, _ in failures], ['c.luac'])
+        self.assertEqual(exporter.rows()[TABLE_CHUNKS], 6)
+        self.assertEqual(sorted(os.listdir(self.dest)),
+            sorted(table + '.csv' for table in TABLES))
+        with open(exporter.path(TABLE_CHUNKS)) as table_f:
+            rows = list(csv.DictReader(table_f))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(len(set(r['file'] for r in rows)), 2)
+
+    def test_jsonl(self):
+        with Lua4Exporter(self.dest, FORMAT_JSONL) as exporter:
+            for name in ('a.luac', 'b.luac'):
+                with open(os.path.join(self.sources, name), 'rb') as lua_file:
+                    exporter.add(load_stream(lua_file, 'fast'), name)
+        rows = exporter.rows()
+        with open(exporter.path(TABLE_INSTRUCTIONS)) as table_f:
+            lines = table_f.read().splitlines()
+        self.assertEqual(len(lines), rows[TABLE_INSTRUCTIONS])
+        self.assertEqual(set(json.loads(line)['file'] for line in lines),
+            set(['a.luac', 'b.luac']))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            Lua4Exporter(self.dest, 'xml')
+
+    @unittest.skipIf(pyarrow is not None, 'pyarrow is installed')
+    def test_no_pyarrow(self):
+        for export_format in (FORMAT_PARQUET, FORMAT_ARROW):
+            with self.assertRaises(ImportError):
+                Lua4Exporter(self.dest, export_format)
+        self.assertFalse(os.path.exists(self.dest))
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_arrow(self):
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        exporter, _ = export_corpus([self.sources], self.dest, FORMAT_PARQUET, 'fast',
+            batch_rows=4)
+        table = pyarrow.parquet.read_table(exporter.path(TABLE_CHUNKS))
+        self.assertEqual(table.num_rows, 6)
+        self.assertEqual(table.schema.names, [name for name, _ in SCHEMAS[TABLE_CHUNKS]])
+        arrow_dest = os.path.join(self.tmp_dir, 'arrow')
+        exporter, _ = export_corpus([self.sources], arrow_dest, FORMAT_ARROW, 'fast')
+        with pyarrow.ipc.open_file(exporter.path(TABLE_LOCALS)) as reader:
+            self.assertEqual(reader.read_all().num_rows, exporter.rows()[TABLE_LOCALS])
+
+if __name__ == '__main__':
+    unittest.main()
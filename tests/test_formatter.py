@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import json
+import unittest
+
+from lua4dec.loader import load_stream, ENGINE_FAST
+from lua4dec.lua_lang import OPCODE, CREATE_U
+from lua4dec.formatter import Lua4DebugFormatter, Lua4PrettyFormatter, Lua4CSVFormatter, \
+    Lua4JSONLinesFormatter
+from lua4dec.parser import Lua4File
+from lua4dec.stats import Stats
+
+from tests.samples import sample_file
+
+# opcodes Lua 4 does not define but the 6 bit opcode field can hold
+UNKNOWN_OPCODES = (49, 60, 63)
+
+def unknown_opcode_bytes():
+    lua_file = sample_file(depth=1, fanout=1)
+    instruction = lua_file.code_chunk.instruction
+    # in front of the final OP_END
+    instruction[-1:-1] = [op | (5 << 6) for op in UNKNOWN_OPCODES]
+    return Lua4File.build(lua_file)
+
+# every opcode whose U indexes a constant table, pointing past its end
+BAD_INDEX_OPCODES = (OPCODE.OP_GETDOTTED, OPCODE.OP_PUSHSELF, OPCODE.OP_PUSHSTRING,
+    OPCODE.OP_GETGLOBAL, OPCODE.OP_SETGLOBAL, OPCODE.OP_PUSHNUM, OPCODE.OP_PUSHNEGNUM,
+    OPCODE.OP_GETLOCAL, OPCODE.OP_SETLOCAL, OPCODE.OP_GETINDEXED)
+BAD_INDEX = 1000
+
+def bad_index_bytes():
+    lua_file = sample_file(depth=0, strings=2)
+    lua_file.code_chunk.instruction[-1:-1] = [CREATE_U(op, BAD_INDEX)
+        for op in BAD_INDEX_OPCODES]
+    return Lua4File.build(lua_file)
+
+class TestConstantIndexes(unittest.TestCase):
+    def test_debug(self):
+        out = io.StringIO()
+        Lua4DebugFormatter().dump(load_stream(io.BytesIO(bad_index_bytes()), ENGINE_FAST), out)
+        lines = out.getvalue().splitlines()
+        end = lines.index(' -- end --')
+        self.assertEqual(lines[end - len(BAD_INDEX_OPCODES):end], [
+            ' -- 0x{0:08X} => [{1:02d}] {2:16s}K: "#1000"'.format(CREATE_U(OPCODE.OP_GETDOTTED,
+                BAD_INDEX), OPCODE.OP_GETDOTTED, 'OP_GETDOTTED'),
+            ' -- 0x{0:08X} => [{1:02d}] {2:16s}K: "#1000"'.format(CREATE_U(OPCODE.OP_PUSHSELF,
+                BAD_INDEX), OPCODE.OP_PUSHSELF, 'OP_PUSHSELF'),
+            ' "#1000"',
+            ' GLOBAL[#1000]',
+            ' GLOBAL[#1000]=',
+            ' #1000',
+            ' #1000',
+            ' LOCAL[#1000]',
+            ' LOCAL[#1000]=',
+            ' -- 0x{0:08X} => [{1:02d}] {2:16s}L: #1000'.format(CREATE_U(OPCODE.OP_GETINDEXED,
+                BAD_INDEX), OPCODE.OP_GETINDEXED, 'OP_GETINDEXED'),
+        ])
+
+class TestUnknownOpcodes(unittest.TestCase):
+    def _dump(self, formatter):
+        out = io.StringIO()
+        formatter.dump(load_stream(io.BytesIO(unknown_opcode_bytes()), ENGINE_FAST), out)
+        return out.getvalue()
+
+    def test_debug(self):
+        stats = Stats()
+        text = self._dump(Lua4DebugFormatter(stats))
+        for op in UNKNOWN_OPCODES:
+            self.assertIn('=> [{0}] OP_UNKNOWN_{0}'.format(op), text)
+        self.assertEqual(stats.as_dict()['histogram']['OP_UNKNOWN_60'], 1)
+
+    def test_pretty(self):
+        text = self._dump(Lua4PrettyFormatter())
+        for op in UNKNOWN_OPCODES:
+            self.assertIn('-- unknown opcode {0} at pc'.format(op), text)
+
+    def test_csv(self):
+        text = self._dump(Lua4CSVFormatter())
+        for op in UNKNOWN_OPCODES:
+            self.assertIn(',OP_UNKNOWN_{0},,,,,,{1}\n'.format(op, op | (5 << 6)), text)
+
+    def test_jsonl(self):
+        rows = [json.loads(line) for line in self._dump(Lua4JSONLinesFormatter()).splitlines()]
+        unknown = [row for row in rows if row['table'] == 'instructions'
+            and row['opcode'].startswith('OP_UNKNOWN_')]
+        self.assertEqual([row['opcode'] for row in unknown],
+            ['OP_UNKNOWN_{0}'.format(op) for op in UNKNOWN_OPCODES])
+        self.assertTrue(all(row['U'] is None and row['constant'] is None for row in unknown))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from lua4dec.formatter import Lua4DebugFormatter, Lua4PrettyFormatter
+from lua4dec.incremental import hash_chunks, diff_hashes, diff_files, format_changes, \
+    decompile_incremental, Lua4Manifest, Lua4IncrementalFormatter, STATUS_CHANGED, \
+    STATUS_ADDED, STATUS_REMOVED
+from lua4dec.loader import load_stream
+from lua4dec.parser import Lua4File
+
+from tests.samples import sample_file
+
+def _nested(lua_file, *path):
+    chunk = lua_file.code_chunk
+    for i in path:
+        chunk = chunk.constants.function[i]
+    return chunk
+
+class TestHashes(unittest.TestCase):
+    def test_paths(self):
+        hashes = hash_chunks(sample_file(depth=2, fanout=2).code_chunk)
+        self.assertEqual([h.name for h in hashes],
+            ['main', 'main.0', 'main.0.0', 'main.0.1', 'main.1', 'main.1.0', 'main.1.1'])
+        self.assertEqual(hashes, sorted(hashes, key=lambda h: h.path))
+
+    def test_stable(self):
+        old = hash_chunks(sample_file().code_chunk)
+        new = hash_chunks(sample_file().code_chunk)
+        self.assertEqual([(h.own, h.tree) for h in old], [(h.own, h.tree) for h in new])
+        self.assertEqual(diff_hashes(old, new), [])
+
+    def test_changed(self):
+        old = hash_chunks(sample_file().code_chunk)
+        lua_file = sample_file()
+        _nested(lua_file, 1, 0).local_var[0].name = b'renamed'
+        new = hash_chunks(lua_file.code_chunk)
+        changes = diff_hashes(old, new)
+        self.assertEqual([(status, h.name) for status, before, h in changes],
+            [(STATUS_CHANGED, 'main.1.0')])
+        # the tree hash covers the nested prototypes, the own hash does not
+        changed = set(h.name for o, h in zip(old, new) if o.tree != h.tree)
+        self.assertEqual(changed, set(['main', 'main.1', 'main.1.0']))
+
+    def test_added_removed(self):
+        old = hash_chunks(sample_file().code_chunk)
+        lua_file = sample_file()
+        functions = _nested(lua_file, 0).constants.function
+        functions.append(functions.pop(0))
+        lua_file.code_chunk.constants.function.pop()
+        new = hash_chunks(lua_file.code_chunk)
+        changes = [(status, (before or after).name) for status, before, after in
+            diff_hashes(old, new)]
+        # main changes too, it has one nested prototype less
+        self.assertEqual(changes, [(STATUS_CHANGED, 'main'),
+            (STATUS_CHANGED, 'main.0.0'), (STATUS_CHANGED, 'main.0.1'),
+            (STATUS_REMOVED, 'main.1'), (STATUS_REMOVED, 'main.1.0'),
+            (STATUS_REMOVED, 'main.1.1')])
+        changes = [(status, (before or after).name) for status, before, after in
+            diff_hashes(new, old)]
+        self.assertEqual(changes[-3:], [(STATUS_ADDED, 'main.1'), (STATUS_ADDED, 'main.1.0'),
+            (STATUS_ADDED, 'main.1.1')])
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp_dir, 'test.luac')
+        self.dest = os.path.join(self.tmp_dir, 'test.out')
+        self.manifest = os.path.join(self.tmp_dir, 'test.manifest')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, lua_file, path=None):
+        with open(path or self.source, 'wb') as out:
+            out.write(Lua4File.build(lua_file))
+
+    def _run(self):
+        formatter = decompile_incremental(self.source, self.dest, self.manifest, 'fast')
+        with open(self.dest) as out:
+            return formatter, out.read()
+
+    def _expected(self):
+        with open(self.source, 'rb') as lua_file:
+            lua_obj = load_stream(lua_file, 'fast')
+        out = io.StringIO()
+        Lua4DebugFormatter().dump(lua_obj, out)
+        return out.getvalue()
+
+    def test_reuse(self):
+        self._write(sample_file())
+        formatter, output = self._run()
+        self.assertEqual((formatter.reused, formatter.rendered), (0, 7))
+        self.assertEqual(output, self._expected())
+        formatter, output = self._run()
+        self.assertEqual((formatter.reused, formatter.rendered), (7, 0))
+        self.assertEqual(output, self._expected())
+
+    def test_changed(self):
+        self._write(sample_file())
+        self._run()
+        lua_file = sample_file()
+        _nested(lua_file, 1, 0).local_var[0].name = b'renamed'
+        self._write(lua_file)
+        formatter, output = self._run()
+        self.assertEqual((formatter.reused, formatter.rendered), (6, 1))
+        self.assertEqual(output, self._expected())
+        self.assertIn('renamed', output)
+
+    def test_manifest(self):
+        self._write(sample_file())
+        self._run()
+        manifest = Lua4Manifest.load(self.manifest, Lua4IncrementalFormatter)
+        self.assertEqual([h.as_dict() for h in manifest.chunks],
+            [h.as_dict() for h in hash_chunks(sample_file().code_chunk)])
+        self.assertEqual(len(manifest.sections), 7)
+        # sections rendered by another formatter are not used
+        self.assertEqual(Lua4Manifest.load(self.manifest, Lua4PrettyFormatter).sections, {})
+        with open(self.manifest, 'w') as out:
+            out.write('{')
+        self.assertEqual(Lua4Manifest.load(self.manifest, Lua4IncrementalFormatter).chunks, [])
+        formatter, output = self._run()
+        self.assertEqual((formatter.reused, formatter.rendered), (0, 7))
+
+    def test_identical_prototypes(self):
+        lua_file = sample_file(depth=1, fanout=1)
+        functions = lua_file.code_chunk.constants.function
+        functions.append(functions[0])
+        self._write(lua_file)
+        formatter, output = self._run()
+        self.assertEqual((formatter.reused, formatter.rendered), (1, 2))
+        self.assertEqual(output, self._expected())
+
+    def test_diff_files(self):
+        old = os.path.join(self.tmp_dir, 'old.luac')
+        self._write(sample_file(), old)
+        lua_file = sample_file()
+        _nested(lua_file, 0).line_number += 1
+        self._write(lua_file)
+        lines = format_changes(diff_files(old, self.source, 'fast'))
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0].split()[:2], [STATUS_CHANGED, 'main.0'])
+        self.assertEqual(diff_files(old, old, 'fast'), [])
+
+if __name__ == '__main__':
+    unittest.main()
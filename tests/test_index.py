@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from lua4dec.incremental import hash_chunks
+from lua4dec.index import Lua4Index, extract_refs, KIND_GET_GLOBAL, KIND_SET_GLOBAL, \
+    KIND_CONSTANT
+from lua4dec.parser import Lua4File
+
+from tests.samples import program_chunk, program_file
+
+def _program_file(name, fanout=12):
+    # main sets `name`, every nested prototype gets it and main.1 has one
+    # more level below it
+    functions = [program_chunk([('GETGLOBAL', name)]) for i in range(fanout)]
+    functions[1].constants.function.append(program_chunk([('GETGLOBAL', name)]))
+    return program_file([('SETGLOBAL', name)], functions=functions)
+
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.tmp_dir, 'index.db')
+        self.sources = os.path.join(self.tmp_dir, 'src')
+        os.mkdir(self.sources)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, name, data, mtime=1000000000):
+        path = os.path.join(self.sources, name)
+        with open(path, 'wb') as out:
+            out.write(data)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def _update(self, index):
+        return index.update([self.sources], workers=1)
+
+    def test_extract_refs(self):
+        lua_file = _program_file(b'x')
+        refs = extract_refs(lua_file.code_chunk)
+        names = [h.name for h in hash_chunks(lua_file.code_chunk)]
+        self.assertEqual([(chunk, index) for _, chunk, index, pc, _ in refs if pc is None],
+            list(zip(names, range(len(names)))))
+        self.assertEqual(refs[:2], [('x', 'main', 0, None, KIND_CONSTANT),
+            ('x', 'main', 0, 0, KIND_SET_GLOBAL)])
+
+    def test_order(self):
+        self._write('a.luac', Lua4File.build(_program_file(b'x')))
+        with Lua4Index(self.index_path) as index:
+            self._update(index)
+            hits = index.query('x', [KIND_GET_GLOBAL])
+        self.assertEqual([hit.chunk for hit in hits], ['main.0', 'main.1', 'main.1.0'] +
+            ['main.{0:d}'.format(i) for i in range(2, 12)])
+        self.assertEqual(set(hit.pc for hit in hits), set([0]))
+
+    def test_update(self):
+        data = Lua4File.build(_program_file(b'x', 2))
+        path = self._write('a.luac', data)
+        self._write('b.luac', Lua4File.build(_program_file(b'y', 2)))
+        with Lua4Index(self.index_path) as index:
+            self.assertEqual(self._update(index),
+                {'indexed': 2, 'unchanged': 0, 'removed': 0, 'failed': 0})
+            self.assertEqual(len(index.query('x')), 8)
+            self.assertEqual(self._update(index),
+                {'indexed': 0, 'unchanged': 2, 'removed': 0, 'failed': 0})
+
+            # same content, new mtime
+            self._write('a.luac', data, 1000000001)
+            self.assertEqual(self._update(index)['unchanged'], 2)
+
+            self._write('a.luac', Lua4File.build(_program_file(b'z', 2)), 1000000002)
+            self.assertEqual(self._update(index)['indexed'], 1)
+            self.assertEqual(index.query('x'), [])
+            self.assertEqual(len(index.query('z')), 8)
+
+            # a file that no longer parses keeps nothing from before
+            self._write('a.luac', data[:40], 1000000003)
+            self.assertEqual(self._update(index)['failed'], 1)
+            self.assertEqual(index.query('z'), [])
+            self.assertEqual(index.stats()['files'], 1)
+            self.assertEqual(self._update(index)['failed'], 1)
+
+            self._write('a.luac', data, 1000000004)
+            self.assertEqual(self._update(index)['indexed'], 1)
+            self.assertEqual(set(hit.path for hit in index.query('x')), set([path]))
+
+            os.unlink(path)
+            self.assertEqual(self._update(index)['removed'], 1)
+            self.assertEqual(index.query('x'), [])
+            self.assertEqual(len(index.query('y')), 8)
+
+    def test_old_format(self):
+        db = sqlite3.connect(self.index_path)
+        db.executescript('CREATE TABLE refs (symbol_id INTEGER NOT NULL, '
+            'file_id INTEGER NOT NULL, chunk TEXT NOT NULL, pc INTEGER, kind INTEGER NOT NULL);')
+        db.close()
+        self._write('a.luac', Lua4File.build(_program_file(b'x', 2)))
+        with Lua4Index(self.index_path) as index:
+            self.assertEqual(self._update(index)['indexed'], 1)
+            self.assertEqual(len(index.query('x')), 8)
+
+if __name__ == '__main__':
+    unittest.main()
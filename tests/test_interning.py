@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from lua4dec.batch import run_batch
+from lua4dec.interning import StringTable
+from lua4dec.loader import load_stream, BYTECODE_ENGINES
+
+from tests.samples import sample_bytes, chunk_fields
+
+class TestStringTable(unittest.TestCase):
+    def test_table(self):
+        table = StringTable()
+        first = b'name'
+        self.assertIs(table.intern(first), first)
+        self.assertIs(table.intern(bytes(bytearray(b'name'))), first)
+        self.assertEqual(table.id_of(b'other'), 1)
+        self.assertEqual(table.id_of(b'name'), 0)
+        self.assertEqual(table.lookup(1), b'other')
+        self.assertIn(b'other', table)
+        self.assertEqual(len(table), 2)
+
+    def test_engines(self):
+        data = sample_bytes(instructions=20, depth=1, fanout=2, strings=4)
+        reference = chunk_fields(load_stream(io.BytesIO(data), 'fast').code_chunk)
+        for engine in BYTECODE_ENGINES:
+            table = StringTable()
+            chunk = load_stream(io.BytesIO(data), engine, strings=table).code_chunk
+            first, second = chunk.constants.function
+            self.assertEqual(chunk_fields(chunk), reference, engine)
+            # every chunk has the same source and string constants
+            self.assertIs(first.source, chunk.source, engine)
+            for value, other in zip(first.constants.string, second.constants.string):
+                self.assertIs(value, other, engine)
+            self.assertIs(first.local_var[0].name, second.local_var[0].name, engine)
+            self.assertEqual(len(table), 1 + 2 + 4, engine)
+
+class TestBatchInterning(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_dir = os.path.join(self.tmp_dir, 'src')
+        os.mkdir(self.src_dir)
+        for i in range(3):
+            with open(os.path.join(self.src_dir, '{0}.luac'.format(i)), 'wb') as out:
+                out.write(sample_bytes(depth=1, seed=i))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _outputs(self, name, **kwargs):
+        dest = os.path.join(self.tmp_dir, name)
+        results = run_batch([self.src_dir], dest, engine='fast', **kwargs)
+        self.assertTrue(all(r.error is None for r in results))
+        outputs = {}
+        for result in results:
+            with open(result.dest) as in_f:
+                outputs[os.path.basename(result.dest)] = in_f.read()
+        return outputs
+
+    def test_same_output(self):
+        expected = self._outputs('plain', workers=1)
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(self._outputs('serial', workers=1, intern_strings=True), expected)
+        self.assertEqual(self._outputs('pool', workers=2, intern_strings=True), expected)
+
+if __name__ == '__main__':
+    unittest.main()
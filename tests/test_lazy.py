@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from lua4dec import lazy
+from lua4dec.fast_parser import Lua4FormatError, parse_bytes
+from lua4dec.lazy import open_lazy
+
+from tests.samples import sample_bytes, chunk_fields
+
+class TestLazyFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = sample_bytes(instructions=20, depth=2, fanout=2, strings=4, seed=5)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, data):
+        path = os.path.join(self.tmp_dir, 'test.luac')
+        with open(path, 'wb') as out:
+            out.write(data)
+        return path
+
+    def test_chunks(self):
+        reference = parse_bytes(self.data).code_chunk
+        with open_lazy(self._write(self.data)) as lua_file:
+            self.assertEqual(chunk_fields(lua_file.chunk((1, 0))),
+                chunk_fields(reference.constants.function[1].constants.function[0]))
+            self.assertEqual([chunk_fields(c) for c in lua_file.iter_chunks()][0],
+                chunk_fields(reference))
+            self.assertEqual(chunk_fields(lua_file.materialize().code_chunk),
+                chunk_fields(reference))
+            chunk = lua_file.chunk((0,))
+        with self.assertRaises(ValueError):
+            chunk.instruction
+
+    def test_empty_file(self):
+        path = self._write(b'')
+        with self.assertRaises(Lua4FormatError) as cm:
+            open_lazy(path)
+        self.assertEqual(cm.exception.offset, 0)
+        with open(path, 'rb') as stream:
+            self.assertRaises(Lua4FormatError, open_lazy, stream)
+        self.assertRaises(Lua4FormatError, open_lazy, io.BytesIO())
+
+    def test_released_on_error(self):
+        maps = []
+
+        class RecordingMap(lazy.mmap.mmap):
+            def __init__(self, *args, **kwargs):
+                maps.append(self)
+
+        path = self._write(self.data[:len(self.data) // 2])
+        original = lazy.mmap.mmap
+        lazy.mmap.mmap = RecordingMap
+        try:
+            self.assertRaises(Lua4FormatError, open_lazy, path)
+        finally:
+            lazy.mmap.mmap = original
+        self.assertEqual(len(maps), 1)
+        self.assertTrue(maps[0].closed)
+
+if __name__ == '__main__':
+    unittest.main()
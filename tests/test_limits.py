@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import struct
+import unittest
+
+from lua4dec.defaults import DEFAULT_MAX_DEPTH
+from lua4dec.fast_parser import Lua4FormatError, Lua4LimitError, Lua4Limits, NO_LIMITS, \
+    validate_bytes
+from lua4dec.formatter import Lua4DebugFormatter
+from lua4dec.loader import load_stream, ENGINE_CONSTRUCT, ENGINE_FAST, ENGINE_LAZY, \
+    ENGINE_SNAPSHOT
+from lua4dec.parser import Lua4File
+from lua4dec.snapshot import snapshot_bytes
+from lua4dec.stream import iter_events
+
+from tests.samples import sample_file, sample_bytes, nested_bytes
+
+# Every way of reading byte code has to stop at the same limits and reject
+# the same malformed input.
+
+SAMPLE = dict(instructions=20, depth=3, fanout=2, strings=4, seed=9)
+
+def _totals(lua_file):
+    # (deepest nesting, instructions, string bytes as charged to the limits:
+    # the stored lengths, terminating null included)
+    depth = instructions = string_bytes = 0
+    pending = [(lua_file.code_chunk, 0)]
+    while pending:
+        chunk, level = pending.pop()
+        depth = max(depth, level)
+        instructions += len(chunk.instruction)
+        strings = [chunk.source] + [lv.name for lv in chunk.local_var] + \
+            list(chunk.constants.string)
+        string_bytes += sum(len(s) + 1 for s in strings)
+        pending.extend((f, level + 1) for f in chunk.constants.function)
+    return depth, instructions, string_bytes
+
+def _read_all(data, limits, how):
+    if how == 'validate':
+        return validate_bytes(data, limits=limits)
+    if how == 'stream':
+        return list(iter_events(data, limits=limits))
+    lua_file = load_stream(io.BytesIO(data), how, limits=limits)
+    if how == ENGINE_LAZY:
+        lua_file.close()
+    return lua_file
+
+READERS = (ENGINE_CONSTRUCT, ENGINE_FAST, ENGINE_LAZY, 'stream', 'validate')
+
+class TestLimits(unittest.TestCase):
+    def setUp(self):
+        self.data = sample_bytes(**SAMPLE)
+        self.depth, self.instructions, self.string_bytes = _totals(sample_file(**SAMPLE))
+
+    def _check(self, within, beyond):
+        for how in READERS:
+            _read_all(self.data, within, how)
+            with self.assertRaises(Lua4LimitError, msg=how) as context:
+                _read_all(self.data, beyond, how)
+            self.assertIsNotNone(context.exception.offset, how)
+
+    def test_depth(self):
+        self._check(Lua4Limits(max_depth=self.depth),
+            Lua4Limits(max_depth=self.depth - 1))
+
+    def test_instructions(self):
+        self._check(Lua4Limits(max_instructions=self.instructions),
+            Lua4Limits(max_instructions=self.instructions - 1))
+
+    def test_string_bytes(self):
+        self._check(Lua4Limits(max_string_bytes=self.string_bytes),
+            Lua4Limits(max_string_bytes=self.string_bytes - 1))
+
+    def test_no_limits(self):
+        for how in READERS:
+            _read_all(self.data, NO_LIMITS, how)
+
+class TestDefaultDepth(unittest.TestCase):
+    def _listing(self, lua_file):
+        out = io.StringIO()
+        Lua4DebugFormatter().dump(lua_file, out)
+        return out.getvalue()
+
+    def test_max_depth(self):
+        # every engine reads and renders the deepest file the defaults allow
+        data = nested_bytes(DEFAULT_MAX_DEPTH)
+        expected = self._listing(load_stream(io.BytesIO(data), ENGINE_FAST))
+        for how in READERS:
+            _read_all(data, None, how)
+        for engine in (ENGINE_CONSTRUCT, ENGINE_LAZY):
+            lua_file = load_stream(io.BytesIO(data), engine)
+            self.assertEqual(self._listing(lua_file), expected, engine)
+        snapshot = snapshot_bytes(load_stream(io.BytesIO(data), ENGINE_FAST))
+        lua_file = load_stream(io.BytesIO(snapshot), ENGINE_SNAPSHOT)
+        self.assertEqual(self._listing(lua_file), expected)
+
+    def test_beyond_max_depth(self):
+        data = nested_bytes(DEFAULT_MAX_DEPTH + 1)
+        for how in READERS:
+            with self.assertRaises(Lua4LimitError, msg=how):
+                _read_all(data, None, how)
+        _read_all(data, NO_LIMITS, ENGINE_FAST)
+        # construct recurses for every level, it keeps to the default depth
+        with self.assertRaises(Lua4LimitError):
+            _read_all(data, NO_LIMITS, ENGINE_CONSTRUCT)
+
+class TestMalformed(unittest.TestCase):
+    def _check(self, data):
+        for how in READERS:
+            with self.assertRaises(Lua4FormatError, msg=how) as context:
+                _read_all(data, None, how)
+            self.assertNotIsInstance(context.exception, Lua4LimitError, how)
+
+    def test_truncated(self):
+        data = sample_bytes(**SAMPLE)
+        for size in (0, 10, len(data) // 3, len(data) - 1):
+            self._check(data[:size])
+
+    def test_length_beyond_input(self):
+        lua_file = sample_file(**SAMPLE)
+        lua_file.code_chunk.source = b'\xa5' * 8
+        data = Lua4File.build(lua_file)
+        # the length prefix of the main chunk's source, its bytes follow it
+        offset = data.index(b'\xa5' * 8) - 4
+        for length in (len(data), 0x7fffffff, -2):
+            self._check(data[:offset] + struct.pack('<i', length) + data[offset + 4:])
+
+    def test_negative_string_length(self):
+        data = sample_bytes(**SAMPLE)
+        # the main chunk's source, then a local name and a constant string
+        # only skipped over by the scans
+        lua_file = sample_file(**SAMPLE)
+        chunk = lua_file.code_chunk.constants.function[1]
+        chunk.local_var[0].name = b'\xa5' * 8
+        chunk.constants.string[0] = b'\xa6' * 8
+        named = Lua4File.build(lua_file)
+        for data, offset in ((data, 0x15), (named, named.index(b'\xa5' * 8) - 4),
+                (named, named.index(b'\xa6' * 8) - 4)):
+            data = data[:offset] + struct.pack('<I', 0xFFFFFFF0) + data[offset + 4:]
+            for how in READERS:
+                with self.assertRaises(Lua4FormatError, msg=how) as context:
+                    _read_all(data, None, how)
+                self.assertEqual(str(context.exception),
+                    'negative string length -16 (at offset 0x{0:X})'.format(offset), how)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+import io
+import pickle
+import unittest
+
+import construct
+
+from lua4dec.loader import load_stream, ENGINE_CONSTRUCT, ENGINE_FAST
+from lua4dec.model import Container, Lua4Chunk, Lua4LocalVar, to_model
+
+from tests.samples import sample_bytes, chunk_fields
+
+class TestModel(unittest.TestCase):
+    def setUp(self):
+        self.data = sample_bytes(instructions=20, depth=2, fanout=2)
+
+    def test_to_model(self):
+        reference = load_stream(io.BytesIO(self.data), ENGINE_CONSTRUCT).code_chunk
+        fast = load_stream(io.BytesIO(self.data), ENGINE_FAST).code_chunk
+        chunk = to_model(reference)
+        self.assertIsInstance(chunk, Lua4Chunk)
+        self.assertIsInstance(chunk.instruction, array.array)
+        self.assertIsInstance(chunk.constants.function[1].local_var[0], Lua4LocalVar)
+        self.assertEqual(chunk, fast)
+        self.assertEqual(chunk_fields(chunk), chunk_fields(reference))
+        self.assertIs(to_model(fast), fast)
+
+    def test_pickle(self):
+        chunk = load_stream(io.BytesIO(self.data), ENGINE_FAST).code_chunk
+        copy = pickle.loads(pickle.dumps(chunk, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(copy, chunk)
+        self.assertIsNot(copy, chunk)
+        header = Container(format_id=0x1B, version=0x40)
+        self.assertEqual(pickle.loads(pickle.dumps(header)), header)
+
+    def test_access(self):
+        local = Lua4LocalVar(b'x', start_pc=1, end_pc=4)
+        self.assertEqual(local['name'], b'x')
+        self.assertEqual(local.keys(), ['name', 'start_pc', 'end_pc'])
+        self.assertRaises(KeyError, lambda: local['missing'])
+        self.assertNotEqual(local, Lua4LocalVar(b'x', 1, 5))
+        self.assertRaises(TypeError, hash, local)
+        self.assertEqual(repr(local), "Lua4LocalVar(name=b'x', start_pc=1, end_pc=4)")
+
+        header = Container(format_id=0x1B, version=0x40)
+        self.assertEqual(header.version, 0x40)
+        self.assertRaises(AttributeError, getattr, header, 'missing')
+        self.assertEqual(repr(header), repr(construct.Container(format_id=0x1B, version=0x40)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import unittest
+from unittest import mock
+
+from lua4dec.formatter import Lua4DebugFormatter
+from lua4dec.loader import load_stream
+from lua4dec.parallel import dump_parallel, _batches, _flatten
+from lua4dec.stats import Stats
+
+from tests.samples import sample_bytes
+
+def _load(*args, **kwargs):
+    return load_stream(io.BytesIO(sample_bytes(*args, **kwargs)), 'fast')
+
+def _render(lua_file, jobs, stats=None):
+    out = io.StringIO()
+    formatter = Lua4DebugFormatter(stats or Stats(), jobs)
+    formatter.dump(lua_file, out)
+    return out.getvalue()
+
+class TestParallel(unittest.TestCase):
+    def test_flatten(self):
+        chunks = _flatten(_load(depth=2, fanout=2).code_chunk)
+        self.assertEqual([level for _, level in chunks], [0, 1, 2, 2, 1, 2, 2])
+
+    def test_batches(self):
+        chunks = [chunk for chunk, _ in _flatten(_load(depth=3, fanout=3).code_chunk)]
+        for count in (1, 2, 5, 40, 100):
+            batches = _batches(chunks, count)
+            self.assertEqual(sum(batches, []), chunks)
+            self.assertTrue(all(batches))
+            self.assertLessEqual(len(batches), max(count, 1) + 1)
+
+    @mock.patch('lua4dec.parallel.PARALLEL_MIN_INSTRUCTIONS', 0)
+    def test_same_output(self):
+        # nesting that closes several levels at once, a single chunk and
+        # chunks without nested prototypes between deeper ones
+        for depth, fanout in ((0, 0), (1, 3), (3, 2), (4, 1)):
+            lua_file = _load(instructions=30, depth=depth, fanout=fanout)
+            serial_stats, parallel_stats = Stats(), Stats()
+            expected = _render(lua_file, 1, serial_stats)
+            self.assertEqual(_render(lua_file, 2, parallel_stats), expected)
+            self.assertEqual(_render(lua_file, 3), expected)
+            self.assertEqual(parallel_stats.histogram, serial_stats.histogram)
+            self.assertEqual(parallel_stats.counters, serial_stats.counters)
+
+    def test_small_in_process(self):
+        lua_file = _load(depth=1, fanout=2)
+        with mock.patch('concurrent.futures.ProcessPoolExecutor',
+                side_effect=AssertionError):
+            self.assertEqual(_render(lua_file, 2), _render(lua_file, 1))
+
+    @mock.patch('lua4dec.parallel.PARALLEL_MIN_INSTRUCTIONS', 0)
+    def test_dump_parallel(self):
+        lua_file = _load(depth=2, fanout=2)
+        out = io.StringIO()
+        Lua4DebugFormatter()._dump_chunk(lua_file.code_chunk, out)
+        parallel = io.StringIO()
+        dump_parallel(Lua4DebugFormatter(jobs=2), lua_file.code_chunk, parallel)
+        self.assertEqual(parallel.getvalue(), out.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
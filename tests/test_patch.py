@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import tempfile
+import unittest
+
+from lua4dec.parser import Lua4File
+from lua4dec.patch import Lua4Patcher, Lua4PatchError
+
+from tests.samples import sample_file
+
+# Every edit of a Lua4Patcher has to give the same bytes as making the edit
+# on the model and rebuilding the whole file with the construct definitions.
+
+def _chunk(lua_file, path):
+    chunk = lua_file.code_chunk
+    for i in path:
+        chunk = chunk.constants.function[i]
+    return chunk
+
+class TestPatcher(unittest.TestCase):
+    def setUp(self):
+        self.model = sample_file(depth=2, fanout=2, seed=4)
+        self.data = Lua4File.build(self.model)
+
+    def test_no_edits(self):
+        with Lua4Patcher(self.data) as patcher:
+            self.assertEqual(patcher.edits, 0)
+            self.assertEqual(patcher.to_bytes(), self.data)
+
+    def test_edits_match_rebuild(self):
+        other = sample_file(instructions=12, depth=1, fanout=1, seed=5)
+        with Lua4Patcher(self.data) as patcher:
+            patcher.set_instruction((0,), 3, 0x12345 << 6)
+            patcher.set_string((), 1, b'a longer replacement string')
+            patcher.set_strings((1,), [b'x', b'', b'yyy'])
+            patcher.set_instructions((0, 1), [1, 2, 3])
+            patcher.replace_chunk((1, 0), other.code_chunk)
+            patched = patcher.to_bytes()
+
+        model = self.model
+        _chunk(model, (0,)).instruction[3] = 0x12345 << 6
+        model.code_chunk.constants.string[1] = b'a longer replacement string'
+        _chunk(model, (1,)).constants.string = [b'x', b'', b'yyy']
+        _chunk(model, (0, 1)).instruction = [1, 2, 3]
+        _chunk(model, (1,)).constants.function[0] = other.code_chunk
+        self.assertEqual(patched, Lua4File.build(model))
+
+    def test_replace_with_chunk_bytes(self):
+        other = sample_file(instructions=12, depth=1, fanout=1, seed=6)
+        with Lua4Patcher(Lua4File.build(other)) as source:
+            chunk_bytes = source.chunk_bytes((0,))
+            with Lua4Patcher(self.data) as patcher:
+                patcher.replace_chunk((1, 1), chunk_bytes)
+                patched = patcher.to_bytes()
+        _chunk(self.model, (1,)).constants.function[1] = _chunk(other, (0,))
+        self.assertEqual(patched, Lua4File.build(self.model))
+
+    def test_file_to_file(self):
+        # mmapped source and file target take the sendfile path
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = os.path.join(tmp_dir, 'in.luac')
+            dest = os.path.join(tmp_dir, 'out.luac')
+            with open(source, 'wb') as out_f:
+                out_f.write(self.data)
+            with Lua4Patcher(source) as patcher:
+                patcher.set_string((0, 0), 0, b'renamed')
+                size = patcher.save(dest)
+            with open(dest, 'rb') as in_f:
+                patched = in_f.read()
+        _chunk(self.model, (0, 0)).constants.string[0] = b'renamed'
+        self.assertEqual(size, len(patched))
+        self.assertEqual(patched, Lua4File.build(self.model))
+
+    def test_later_edit_of_same_range_wins(self):
+        with Lua4Patcher(self.data) as patcher:
+            patcher.set_instruction((), 0, 1)
+            patcher.set_instruction((), 0, 2)
+            self.assertEqual(patcher.edits, 1)
+            patched = patcher.to_bytes()
+        self.model.code_chunk.instruction[0] = 2
+        self.assertEqual(patched, Lua4File.build(self.model))
+
+    def test_errors(self):
+        with Lua4Patcher(self.data) as patcher:
+            count = len(self.model.code_chunk.instruction)
+            with self.assertRaises(Lua4PatchError):
+                patcher.set_instruction((), count, 0)
+            with self.assertRaises(Lua4PatchError):
+                patcher.set_string((), len(self.model.code_chunk.constants.string), b'')
+            with self.assertRaises(Lua4PatchError):
+                patcher.layout((2,))
+            patcher.set_strings((1,), [b'x'])
+            with self.assertRaises(Lua4PatchError):
+                patcher.set_string((1,), 0, b'overlaps')
+            patcher.set_instructions((1,), [0])
+            with self.assertRaises(Lua4PatchError):
+                patcher.replace_chunk((1,), b'')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import base64
+import os
+import signal
+import tempfile
+import unittest
+
+from lua4dec.server import Lua4DecompileServer
+
+from tests.samples import sample_bytes
+
+def _decompile(data):
+    return {'op': 'decompile', 'data': base64.b64encode(data).decode('ascii')}
+
+class TestServer(unittest.TestCase):
+    def _run(self, coroutine_function):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            server = Lua4DecompileServer(os.path.join(tmp_dir, 'lua4dec.sock'), workers=1)
+
+            async def main():
+                await server.start()
+                try:
+                    return await coroutine_function(server)
+                finally:
+                    await server.close()
+            return asyncio.run(main())
+
+    def test_bad_file_keeps_pool_usable(self):
+        async def requests(server):
+            bad = await server.handle_request(_decompile(b'not byte code'))
+            good = await server.handle_request(_decompile(sample_bytes()))
+            return bad, good
+        bad, good = self._run(requests)
+        self.assertFalse(bad['ok'])
+        self.assertIn('Lua4FormatError', bad['error'])
+        self.assertTrue(good['ok'], good.get('error'))
+
+    def test_dead_worker_restarts_pool(self):
+        async def requests(server):
+            await server.handle_request(_decompile(sample_bytes()))
+            for pid in list(server._executor._processes):
+                os.kill(pid, signal.SIGKILL)
+            # the first request may still see the broken pool
+            await server.handle_request(_decompile(sample_bytes()))
+            return await server.handle_request(_decompile(sample_bytes()))
+        response = self._run(requests)
+        self.assertTrue(response['ok'], response.get('error'))
+
+if __name__ == '__main__':
+    unittest.main()
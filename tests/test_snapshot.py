@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import os
+import tempfile
+import unittest
+
+from lua4dec.loader import load_stream, ENGINE_CONSTRUCT
+from lua4dec.snapshot import snapshot_bytes, save_snapshot, load_snapshot, is_snapshot, \
+    SnapshotError
+
+from tests.samples import sample_bytes, chunk_fields
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.lua_file = load_stream(io.BytesIO(sample_bytes(depth=2, fanout=3, seed=7)),
+            ENGINE_CONSTRUCT)
+        self.expected = chunk_fields(self.lua_file.code_chunk)
+
+    def _check(self, snapshot):
+        self.assertEqual(chunk_fields(snapshot.code_chunk), self.expected)
+        self.assertEqual(snapshot.self_check.test_fp_number,
+            self.lua_file.self_check.test_fp_number)
+        self.assertEqual(snapshot.header.little_endian, self.lua_file.header.little_endian)
+        self.assertEqual(snapshot.chunk_count, 1 + 3 + 9)
+        self.assertEqual(chunk_fields(snapshot.chunk_at((2, 1))),
+            chunk_fields(self.lua_file.code_chunk.constants.function[2].constants.function[1]))
+
+    def test_bytes_round_trip(self):
+        data = snapshot_bytes(self.lua_file)
+        self.assertTrue(is_snapshot(data))
+        with load_snapshot(data) as snapshot:
+            self._check(snapshot)
+            lua_file = snapshot.materialize()
+        # a snapshot of the materialized model is the same snapshot again
+        self.assertEqual(chunk_fields(lua_file.code_chunk), self.expected)
+        self.assertEqual(snapshot_bytes(lua_file), data)
+
+    def test_file_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'sample.l4s')
+            save_snapshot(self.lua_file, path)
+            with load_snapshot(path) as snapshot:
+                self._check(snapshot)
+            with open(path, 'rb') as in_f:
+                with load_snapshot(in_f) as snapshot:
+                    self._check(snapshot)
+
+    def test_strings_stored_once(self):
+        with load_snapshot(snapshot_bytes(self.lua_file)) as snapshot:
+            sources = [snapshot.chunk(i).source for i in range(snapshot.chunk_count)]
+            self.assertTrue(all(source is sources[0] for source in sources))
+
+    def test_bad_input(self):
+        data = snapshot_bytes(self.lua_file)
+        self.assertFalse(is_snapshot(sample_bytes()))
+        with self.assertRaises(SnapshotError):
+            load_snapshot(sample_bytes())
+        with self.assertRaises(SnapshotError):
+            load_snapshot(data[:16])
+        with self.assertRaises(SnapshotError):
+            load_snapshot(data[:len(data) // 2])
+        with self.assertRaises(SnapshotError):
+            load_snapshot(data[:8] + b'\xff' + data[9:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT            = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_MODULE      = 'lua4dec.scripts.decompile'
+# cumulative import time of the CLI module, generous for slow CI machines,
+# it takes a few tens of milliseconds on a desktop
+IMPORT_BUDGET_MS    = 250
+# modules the CLI only loads once it knows it needs them
+DEFERRED_MODULES    = ('construct', 'numpy', 'lua4dec.decompiler', 'lua4dec.batch',
+    'lua4dec.cache', 'concurrent.futures.process')
+
+def _import_times(module):
+    # {module name: cumulative microseconds} from python -X importtime
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (ROOT, env.get('PYTHONPATH')) if p)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        times[fields[2].strip()] = int(fields[1])
+    return times
+
+class TestStartup(unittest.TestCase):
+    def test_cli_import(self):
+        times = _import_times(CLI_MODULE)
+        self.assertIn(CLI_MODULE, times)
+        for name in DEFERRED_MODULES:
+            loaded = [m for m in times if m == name or m.startswith(name + '.')]
+            self.assertEqual(loaded, [], '{0} imports {1}'.format(CLI_MODULE, name))
+        self.assertLess(times[CLI_MODULE] / 1000.0, IMPORT_BUDGET_MS)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import pickle
+import unittest
+from unittest import mock
+
+from lua4dec import stats as stats_module
+from lua4dec.formatter import Lua4DebugFormatter
+from lua4dec.lua_lang import OPCODE
+from lua4dec.loader import load_stream, BYTECODE_ENGINES
+from lua4dec.stats import Stats, NULL_STATS, PHASE_HEADER, PHASE_CHUNK, PHASE_DECODE, \
+    PHASE_FORMAT, COUNT_BYTES, COUNT_CHUNKS, COUNT_INSTRUCTIONS
+
+from tests.samples import sample_bytes
+
+class TestStats(unittest.TestCase):
+    def test_exclusive_phases(self):
+        stats = Stats()
+        clock = iter([0.0, 1.0, 3.0, 6.0, 10.0, 15.0])
+        with mock.patch.object(stats_module.time, 'perf_counter', lambda: next(clock)):
+            with stats.phase(PHASE_FORMAT):
+                with stats.phase(PHASE_DECODE):
+                    pass
+                with stats.phase(PHASE_DECODE):
+                    pass
+        self.assertEqual(stats.timings, {PHASE_FORMAT: 1.0 + 3.0 + 5.0, PHASE_DECODE: 2.0 + 4.0})
+        self.assertEqual(stats.calls, {PHASE_FORMAT: 1, PHASE_DECODE: 2})
+
+    def test_parse_and_format(self):
+        data = sample_bytes(instructions=30, depth=2, fanout=2)
+        for engine in BYTECODE_ENGINES:
+            stats = Stats()
+            lua_file = load_stream(io.BytesIO(data), engine, stats)
+            Lua4DebugFormatter(stats).dump(lua_file, io.StringIO())
+            self.assertEqual(stats.counters, {COUNT_BYTES: len(data), COUNT_CHUNKS: 7,
+                COUNT_INSTRUCTIONS: 7 * 30}, engine)
+            self.assertEqual(stats.max_depth, 2, engine)
+            self.assertEqual(sum(stats.histogram), 7 * 30, engine)
+            self.assertEqual(stats.histogram[OPCODE.OP_END], 7, engine)
+            self.assertEqual(set(stats.timings), set([PHASE_HEADER, PHASE_CHUNK, PHASE_DECODE,
+                PHASE_FORMAT]), engine)
+
+    def test_merge_and_pickle(self):
+        first = Stats()
+        first.count(COUNT_CHUNKS, 2)
+        first.opcodes([OPCODE.OP_END, OPCODE.OP_END, 63])
+        first.depth(3)
+        with first.phase(PHASE_CHUNK):
+            copy = pickle.loads(pickle.dumps(first))
+        self.assertEqual(copy.as_dict(), dict(first.as_dict(), calls={}, timings={}))
+        second = Stats()
+        second.count(COUNT_CHUNKS)
+        second.depth(1)
+        second.merge(first)
+        second.merge(copy)
+        result = second.as_dict()
+        self.assertEqual(result['counters'], {COUNT_CHUNKS: 5})
+        self.assertEqual(result['histogram'], {'OP_END': 4, 'OP_UNKNOWN_63': 2})
+        self.assertEqual(result['max_depth'], 3)
+        self.assertEqual(result['calls'], {PHASE_CHUNK: 1})
+        report = second.report()
+        self.assertIn('OP_END           4', report)
+        self.assertIn('max_depth    3', report)
+
+    def test_null_stats(self):
+        self.assertFalse(NULL_STATS.enabled)
+        with NULL_STATS.phase(PHASE_CHUNK):
+            NULL_STATS.count(COUNT_CHUNKS)
+            NULL_STATS.opcodes([1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from lua4dec.fast_parser import Lua4FormatError, Lua4LimitError, Lua4Limits
+from lua4dec.formatter import Lua4DebugFormatter
+from lua4dec.loader import load_stream
+from lua4dec.stream import iter_events, iter_chunks, stream_dump, decompile_stream, \
+    EVENT_HEADER, EVENT_ENTER, EVENT_LOCALS, EVENT_LINE_INFO, EVENT_CONSTANTS, \
+    EVENT_INSTRUCTIONS, EVENT_EXIT
+from lua4dec.util import has_fileno
+
+from tests.samples import sample_bytes, chunk_fields
+
+CHUNK_EVENTS = [EVENT_ENTER, EVENT_LOCALS, EVENT_LINE_INFO, EVENT_CONSTANTS, EVENT_INSTRUCTIONS]
+
+def _listing_order(chunk, depth=0):
+    yield depth, chunk
+    for f in chunk.constants.function:
+        for item in _listing_order(f, depth + 1):
+            yield item
+
+class TestStream(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = sample_bytes(depth=3, fanout=2)
+        self.source = os.path.join(self.tmp_dir, 'test.luac')
+        with open(self.source, 'wb') as out:
+            out.write(self.data)
+        out = io.StringIO()
+        Lua4DebugFormatter().dump(load_stream(io.BytesIO(self.data), 'fast'), out)
+        self.expected = out.getvalue()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_events(self):
+        events = list(iter_events(self.data))
+        self.assertEqual(events[0][:2], (EVENT_HEADER, 0))
+        names = [event for event, _, _ in events[1:]]
+        self.assertEqual(names[:5], CHUNK_EVENTS)
+        self.assertEqual(names.count(EVENT_ENTER), 15)
+        self.assertEqual(names.count(EVENT_EXIT), 15)
+        # enter and exit nest, the events of a chunk are at its depth
+        depth = -1
+        for event, event_depth, _ in events[1:]:
+            if event == EVENT_ENTER:
+                depth += 1
+            self.assertEqual(event_depth, depth)
+            if event == EVENT_EXIT:
+                depth -= 1
+        self.assertEqual(depth, -1)
+
+    def test_chunks(self):
+        lua_file = load_stream(io.BytesIO(self.data), 'fast')
+        chunks = [(depth, chunk) for depth, chunk in iter_chunks(iter_events(self.data))
+            if depth is not None and chunk is not None]
+        expected = list(_listing_order(lua_file.code_chunk))
+        self.assertEqual([depth for depth, _ in chunks], [depth for depth, _ in expected])
+        for (_, chunk), (_, model) in zip(chunks, expected):
+            # the nested functions are only placeholders in the stream
+            self.assertEqual(len(chunk.constants.function), len(model.constants.function))
+            chunk.constants.function = []
+            self.assertEqual(chunk_fields(chunk)[:-1], chunk_fields(model)[:-1])
+
+    def test_stream_dump(self):
+        sources = [self.data, bytearray(self.data), io.BytesIO(self.data), self.source]
+        for source in sources:
+            out = io.StringIO()
+            stream_dump(source, out)
+            self.assertEqual(out.getvalue(), self.expected)
+        with open(self.source, 'rb') as lua_file:
+            out = io.StringIO()
+            stream_dump(lua_file, out, buffer_size=16)
+            self.assertEqual(out.getvalue(), self.expected)
+
+    def test_decompile_stream(self):
+        dest = os.path.join(self.tmp_dir, 'test.out')
+        decompile_stream(self.source, dest, buffer_size=64)
+        with open(dest) as out:
+            self.assertEqual(out.read(), self.expected)
+
+    def test_errors(self):
+        with self.assertRaises(Lua4FormatError):
+            stream_dump(self.data[:len(self.data) // 2], io.StringIO())
+        with self.assertRaises(Lua4LimitError):
+            stream_dump(self.data, io.StringIO(), limits=Lua4Limits(max_depth=2))
+        out = io.StringIO()
+        stream_dump(self.data, out, limits=Lua4Limits(max_depth=3))
+        self.assertEqual(out.getvalue(), self.expected)
+
+    def test_has_fileno(self):
+        self.assertFalse(has_fileno(io.BytesIO(self.data)))
+        self.assertFalse(has_fileno(self.data))
+        with open(self.source, 'rb') as lua_file:
+            self.assertTrue(has_fileno(lua_file))
+
+if __name__ == '__main__':
+    unittest.main()
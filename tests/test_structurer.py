@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import time
+import unittest
+
+from lua4dec.cfg import build_cfg, LOOP_WHILE
+from lua4dec.formatter import Lua4PrettyFormatter
+from lua4dec.loader import load_stream, ENGINE_FAST
+from lua4dec.parser import Lua4File
+
+from tests.samples import program_chunk, program_file
+
+# Control flow rebuilt by lua4dec.decompiler.Lua4Structurer from small
+# hand assembled chunks, with the output the Lua 4 compiler's input would
+# have had.
+
+def decompile(program):
+    out = io.StringIO()
+    data = Lua4File.build(program_file(program))
+    Lua4PrettyFormatter().dump(load_stream(io.BytesIO(data), ENGINE_FAST), out)
+    return out.getvalue()
+
+def compare(name, value, target):
+    # jump to `target` unless global `name` equals `value`
+    return [('GETGLOBAL', name), ('PUSHINT', value), ('JMPNE', target)]
+
+def assign(name, value):
+    return [('PUSHINT', value), ('SETGLOBAL', name)]
+
+def elseif_chain(count, else_value=None, end='end'):
+    program = []
+    for i in range(count):
+        program += ['c{0}'.format(i)] + compare(b'a', i, 'c{0}'.format(i + 1)) + assign(b'x', i)
+        if i < count - 1 or else_value is not None:
+            program.append(('JMP', end))
+    program.append('c{0}'.format(count))
+    if else_value is not None:
+        program += assign(b'x', else_value)
+    return program + [end]
+
+def lines(*text):
+    return ''.join(line + '\n' for line in text)
+
+class TestStructurer(unittest.TestCase):
+    def test_elseif_else(self):
+        self.assertEqual(decompile(elseif_chain(3, -1)), lines(
+            'if a == 0 then',
+            '    x = 0',
+            'elseif a == 1 then',
+            '    x = 1',
+            'elseif a == 2 then',
+            '    x = 2',
+            'else',
+            '    x = -1',
+            'end'))
+
+    def test_elseif_without_else(self):
+        self.assertEqual(decompile(elseif_chain(2)), lines(
+            'if a == 0 then',
+            '    x = 0',
+            'elseif a == 1 then',
+            '    x = 1',
+            'end'))
+
+    def test_long_elseif_chain(self):
+        # deeper than the recursion limit, in about linear time
+        start = time.time()
+        text = decompile(elseif_chain(3000, -1))
+        self.assertLess(time.time() - start, 30)
+        self.assertEqual(text.count('\nelseif a == '), 2999)
+        self.assertNotIn('goto', text)
+        self.assertTrue(text.endswith(lines('elseif a == 2999 then', '    x = 2999', 'else',
+            '    x = -1', 'end')))
+
+    def test_if_else_in_then_branch(self):
+        program = compare(b'a', 0, 'c1') + compare(b'b', 0, 'n1') + assign(b'x', 5) + \
+            [('JMP', 'n2'), 'n1'] + assign(b'x', 6) + ['n2', ('JMP', 'end'), 'c1'] + \
+            compare(b'a', 1, 'c2') + assign(b'x', 1) + [('JMP', 'end'), 'c2'] + \
+            assign(b'x', 2) + ['end']
+        self.assertEqual(decompile(program), lines(
+            'if a == 0 then',
+            '    if b == 0 then',
+            '        x = 5',
+            '    else',
+            '        x = 6',
+            '    end',
+            'elseif a == 1 then',
+            '    x = 1',
+            'else',
+            '    x = 2',
+            'end'))
+
+    def test_if_else_not_alone_in_else_branch(self):
+        # not an elseif: the else branch goes on after the inner if
+        program = compare(b'a', 0, 'c1') + assign(b'x', 0) + [('JMP', 'end'), 'c1'] + \
+            compare(b'b', 1, 'd1') + assign(b'x', 1) + [('JMP', 'd2'), 'd1'] + assign(b'x', 2) + \
+            ['d2'] + assign(b'y', 3) + ['end']
+        self.assertEqual(decompile(program), lines(
+            'if a == 0 then',
+            '    x = 0',
+            'else',
+            '    if b == 1 then',
+            '        x = 1',
+            '    else',
+            '        x = 2',
+            '    end',
+            '    y = 3',
+            'end'))
+
+    def test_loops_around_chain(self):
+        program = ['top'] + compare(b'w', 1, 'out') + elseif_chain(2, 2) + \
+            [('JMP', 'top'), 'out']
+        self.assertEqual(decompile(program), lines(
+            'while w == 1 do',
+            '    if a == 0 then',
+            '        x = 0',
+            '    elseif a == 1 then',
+            '        x = 1',
+            '    else',
+            '        x = 2',
+            '    end',
+            'end'))
+
+        program = ['top'] + elseif_chain(2, 2) + compare(b'z', 0, 'top')
+        self.assertEqual(decompile(program), lines(
+            'repeat',
+            '    if a == 0 then',
+            '        x = 0',
+            '    elseif a == 1 then',
+            '        x = 1',
+            '    else',
+            '        x = 2',
+            '    end',
+            'until z == 0'))
+
+class TestControlFlowGraph(unittest.TestCase):
+    def test_loop_around_branch(self):
+        # while w == 1 do if a == 0 then x = 0 else x = 1 end end
+        cfg = build_cfg(program_chunk(['top'] + compare(b'w', 1, 'out') +
+            compare(b'a', 0, 'else') + assign(b'x', 0) + [('JMP', 'join'), 'else'] +
+            assign(b'x', 1) + ['join', ('JMP', 'top'), 'out']))
+        self.assertEqual([(b.start, b.end, b.succs) for b in cfg.blocks],
+            [(0, 3, [1, 5]), (3, 6, [2, 3]), (6, 9, [4]), (9, 11, [4]), (11, 12, [0]),
+            (12, 13, [])])
+        self.assertEqual(list(cfg.idom[1:]), [0, 1, 1, 1, 0])
+        self.assertTrue(cfg.dominates(1, 3))
+        self.assertFalse(cfg.dominates(2, 4))
+        self.assertTrue(cfg.post_dominates(4, 2))
+        self.assertTrue(cfg.is_back_edge(4, 0))
+        self.assertEqual(cfg.merge_pc(3), 11)
+
+        [loop] = cfg.loops
+        self.assertEqual((loop.kind, loop.header, loop.latches, sorted(loop.body), loop.exit),
+            (LOOP_WHILE, 0, [4], [0, 1, 2, 3, 4], 5))
+        self.assertEqual(sorted(cfg.branches), [0, 1])
+        self.assertEqual(cfg.branches[1].merge, 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+
+from lua4dec.decoder import decode_instructions
+from lua4dec.lua_lang import OPCODE, MAXARG_S, CREATE_S
+from lua4dec.transform import PassManager, AnalysisManager, NoopTransform, ConstantFolding, \
+    PushNilJmpPeephole, DeadCodeElimination, StripNops, default_pipeline, \
+    ANALYSIS_DECODED, ANALYSIS_TARGETS, ANALYSIS_CFG
+from lua4dec.vm import Lua4VirtualMachine
+
+from tests.samples import program_chunk, program_file, sample_file, chunk_fields
+
+def _ops(chunk):
+    code = decode_instructions(chunk.instruction).tolists()
+    return [(OPCODE(op).name[3:], code.S[pc] if op in (OPCODE.OP_PUSHINT, OPCODE.OP_ADDI,
+        OPCODE.OP_JMP, OPCODE.OP_JMPLT, OPCODE.OP_JMPGE) else code.U[pc])
+        for pc, op in enumerate(code.opcode)]
+
+def _run(passes, program, **kwargs):
+    return PassManager(passes).transform(program_chunk(program, **kwargs))
+
+class TestPasses(unittest.TestCase):
+    def test_constant_folding(self):
+        chunk = _run([ConstantFolding(), StripNops()], [('PUSHINT', 5), ('ADDI', 3),
+            ('MINUS', 0), ('PUSHNUM', 0), ('MINUS', 0), ('PUSHNEGNUM', 0), ('MINUS', 0),
+            ('RETURN', 0)], numbers=[1.5])
+        self.assertEqual(_ops(chunk), [('PUSHINT', -8), ('PUSHNEGNUM', 0), ('PUSHNUM', 0),
+            ('RETURN', 0), ('END', 0)])
+
+    def test_constant_folding_bounds(self):
+        # -(MAXARG_S + 1) is below the smallest S
+        program = [('PUSHINT', MAXARG_S + 1), ('MINUS', 0), ('PUSHINT', MAXARG_S),
+            ('ADDI', 1), ('PUSHINT', -MAXARG_S), ('MINUS', 0), ('RETURN', 0)]
+        chunk = _run(default_pipeline().passes, program)
+        self.assertEqual(_ops(chunk), [('PUSHINT', MAXARG_S + 1), ('MINUS', 0),
+            ('PUSHINT', MAXARG_S), ('ADDI', 1), ('PUSHINT', MAXARG_S), ('RETURN', 0),
+            ('END', 0)])
+        vm = Lua4VirtualMachine()
+        self.assertEqual(vm.run(program_file(program)),
+            [-(MAXARG_S + 1.0), MAXARG_S + 1.0, float(MAXARG_S)])
+
+    def test_pushniljmp(self):
+        # if a < b then x = 1 end, with the comparison materialized
+        program = [('GETGLOBAL', b'a'), ('GETGLOBAL', b'b'), ('JMPLT', 'true'),
+            ('PUSHNILJMP', 0), 'true', ('PUSHINT', 1), ('JMPF', 'out'), ('PUSHINT', 1),
+            ('SETGLOBAL', b'x'), 'out']
+        chunk = _run([PushNilJmpPeephole(), StripNops()], program)
+        self.assertEqual(_ops(chunk), [('GETGLOBAL', 0), ('GETGLOBAL', 1), ('JMPGE', 2),
+            ('PUSHINT', 1), ('SETGLOBAL', 2), ('END', 0)])
+
+    def test_dead_code(self):
+        chunk = _run([DeadCodeElimination(), StripNops()], [('JMP', 'out'), ('PUSHINT', 1),
+            ('SETGLOBAL', b'x'), 'out', ('PUSHINT', 2), ('RETURN', 0), ('PUSHINT', 3)])
+        self.assertEqual(_ops(chunk), [('JMP', 0), ('PUSHINT', 2), ('RETURN', 0), ('END', 0)])
+
+    def test_strip_nops_remaps(self):
+        chunk = program_chunk([('POP', 0), ('JMP', 'end'), ('POP', 0), 'end'],
+            local_names=[b'l'])
+        # jumps and pcs before the start are clamped to it
+        chunk.instruction.insert(3, CREATE_S(OPCODE.OP_JMP, -10))
+        chunk.local_var[0].start_pc = -3
+        chunk.local_var[0].end_pc = len(chunk.instruction)
+        chunk.line_info = [-2, 0, 2, 3]
+        chunk = PassManager([StripNops()]).transform(chunk)
+        self.assertEqual(_ops(chunk), [('JMP', 0), ('JMP', -2), ('END', 0)])
+        self.assertEqual((chunk.local_var[0].start_pc, chunk.local_var[0].end_pc), (0, 3))
+        self.assertEqual(list(chunk.line_info), [-2, 0, 1, 1])
+
+class TestPassManager(unittest.TestCase):
+    def test_analyses_cached(self):
+        analyses = AnalysisManager()
+        pipeline = default_pipeline(analyses)
+        pipeline.transform(program_chunk([('PUSHINT', 1), ('MINUS', 0), ('RETURN', 0)]))
+        # folding keeps the jump targets, only the decoded fields are redone
+        self.assertEqual(analyses.computed, {ANALYSIS_DECODED: 2, ANALYSIS_TARGETS: 1,
+            ANALYSIS_CFG: 1})
+        self.assertEqual(pipeline.changes, {'pushniljmp': 0, 'fold': 1, 'dead-code': 0,
+            'strip-nops': 1})
+
+    def test_source_unchanged(self):
+        for transform in (NoopTransform(), default_pipeline()):
+            lua_file = sample_file(depth=2)
+            chunk = lua_file.code_chunk
+            constants = chunk.constants
+            functions = list(constants.function)
+            expected = chunk_fields(chunk)
+            result = transform.transform_file(lua_file)
+            self.assertIsNot(result.code_chunk, chunk)
+            self.assertIs(chunk.constants, constants)
+            self.assertEqual(constants.function, functions)
+            self.assertEqual(chunk_fields(chunk), expected)
+        self.assertEqual(chunk_fields(NoopTransform().transform_file(lua_file).code_chunk),
+            expected)
+
+if __name__ == '__main__':
+    unittest.main()
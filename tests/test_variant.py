@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import struct
+import unittest
+
+from construct import Container
+
+from lua4dec.decoder import decode_instructions
+from lua4dec.loader import load_stream, ENGINE_CONSTRUCT, ENGINE_FAST, ENGINE_LAZY
+from lua4dec.opcodes import S_OPCODES, AB_OPCODES, OP_PUSHINT, MAXARG_S, POS_U
+from lua4dec.parser import Lua4File, variant_structs
+from lua4dec.variant import Lua4Variant, Lua4VariantError
+
+from tests.samples import sample_file, chunk_fields
+
+# Files of other builds have to decode into the same model as the default
+# build: the sample is re-encoded for each variant and every byte code
+# engine has to give back the original (numbers rounded to the variant).
+
+VARIANTS = [
+    Lua4Variant(little_endian=False),
+    Lua4Variant(size_int=8, size_t=8),
+    Lua4Variant(little_endian=False, size_t=2, size_number=4),
+    Lua4Variant(size_op=7, size_b=8),
+    Lua4Variant(size_instruction=2, size_b=5),
+    Lua4Variant(little_endian=False, size_instruction=2, size_op=6, size_b=4, size_number=4),
+]
+
+def _encode(instruction, variant):
+    # one default layout instruction in the field layout of `variant`
+    code = decode_instructions([instruction], use_numpy=False).tolists()
+    op = code.opcode[0]
+    if op in S_OPCODES:
+        return op | ((code.S[0] + variant.maxarg_s) << variant.size_op)
+    if op in AB_OPCODES:
+        # MULT_RET becomes the largest B a narrower field holds
+        b = min(code.B[0], (1 << variant.size_b) - 1)
+        return op | (code.A[0] << (variant.size_op + variant.size_b)) | (b << variant.size_op)
+    return op | (code.U[0] << variant.size_op)
+
+def _round(number, variant):
+    if variant.size_number == 4:
+        return struct.unpack('<f', struct.pack('<f', number))[0]
+    return number
+
+# small enough for the 16 bit instruction fields, B stays below 16
+SAMPLE = dict(instructions=30, depth=1, fanout=2, strings=6, seed=8)
+
+def _sample():
+    # sample_file() with the PUSHINT operands narrowed to what a 10 bit S
+    # can hold
+    lua_file = sample_file(**SAMPLE)
+    pending = [lua_file.code_chunk]
+    while pending:
+        chunk = pending.pop()
+        code = decode_instructions(chunk.instruction, use_numpy=False).tolists()
+        chunk.instruction = [OP_PUSHINT | ((code.S[pc] % 500 + MAXARG_S) << POS_U)
+            if op == OP_PUSHINT else chunk.instruction[pc] for pc, op in enumerate(code.opcode)]
+        pending.extend(chunk.constants.function)
+    return lua_file
+
+def variant_bytes(lua_file, variant):
+    # re-encodes `lua_file` in place
+    pending = [lua_file.code_chunk]
+    while pending:
+        chunk = pending.pop()
+        chunk.instruction = [_encode(i, variant) for i in chunk.instruction]
+        chunk.constants.number = [_round(n, variant) for n in chunk.constants.number]
+        pending.extend(chunk.constants.function)
+    lua_file.header.little_endian = variant.little_endian
+    lua_file.self_check = Container(size_int=variant.size_int, size_t=variant.size_t,
+        size_instruction=variant.size_instruction,
+        test_size_instruction=variant.bits_instruction, test_size_op=variant.size_op,
+        test_size_b=variant.size_b, size_number=variant.size_number,
+        test_fp_number=lua_file.self_check.test_fp_number)
+    return variant_structs(variant).file.build(lua_file)
+
+class TestVariants(unittest.TestCase):
+    def test_decoding(self):
+        for variant in VARIANTS:
+            expected = _sample()
+            pending = [expected.code_chunk]
+            while pending:
+                chunk = pending.pop()
+                chunk.constants.number = [_round(n, variant) for n in chunk.constants.number]
+                pending.extend(chunk.constants.function)
+            expected = chunk_fields(expected.code_chunk)
+
+            data = variant_bytes(_sample(), variant)
+            for engine in (ENGINE_CONSTRUCT, ENGINE_FAST, ENGINE_LAZY):
+                lua_file = load_stream(io.BytesIO(data), engine)
+                try:
+                    self.assertEqual(chunk_fields(lua_file.code_chunk), expected,
+                        '{0!r} {1}'.format(variant, engine))
+                    self.assertEqual(Lua4Variant.from_header(lua_file.header,
+                        lua_file.self_check), variant)
+                finally:
+                    if engine == ENGINE_LAZY:
+                        lua_file.close()
+
+    def test_default_layout_unchanged(self):
+        self.assertEqual(variant_bytes(_sample(), Lua4Variant()),
+            Lua4File.build(_sample()))
+
+    def test_unsupported(self):
+        for variant in (Lua4Variant(size_int=3), Lua4Variant(size_number=2),
+                Lua4Variant(size_op=5), Lua4Variant(size_instruction=2, size_b=10)):
+            with self.assertRaises(Lua4VariantError):
+                variant.check()
+
+if __name__ == '__main__':
+    unittest.main()
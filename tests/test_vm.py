@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Alex Headley <aheadley@waysaboutstuff.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import unittest
+
+from lua4dec.vm import Lua4VirtualMachine, Lua4RuntimeError, Lua4BudgetExceeded, LuaTable
+
+from tests.samples import program_chunk, program_file
+
+def _constant(value):
+    return lambda vm, args: [value]
+
+class TestVirtualMachine(unittest.TestCase):
+    def setUp(self):
+        self.out = io.StringIO()
+        self.vm = Lua4VirtualMachine(stdout=self.out)
+
+    def run_program(self, program, **kwargs):
+        return self.vm.run(program_file(program, **kwargs))
+
+    def test_arithmetic(self):
+        # x = (2 + 3) * 4 - 1 / 2 .. ""
+        self.run_program([('PUSHINT', 2), ('ADDI', 3), ('PUSHINT', 4), ('MULT', 0),
+            ('PUSHINT', 1), ('PUSHNUM', 0), ('DIV', 0), ('SUB', 0), ('PUSHSTRING', b''),
+            ('CONCAT', 2), ('SETGLOBAL', b'x'), ('PUSHNEGNUM', 0), ('MINUS', 0),
+            ('SETGLOBAL', b'y')], numbers=[2.0])
+        self.assertEqual(self.vm.globals.get(b'x'), b'19.5')
+        self.assertEqual(self.vm.globals.get(b'y'), 2.0)
+
+    def test_return(self):
+        self.assertEqual(self.run_program([('PUSHINT', 1), ('PUSHSTRING', b'a'),
+            ('RETURN', 0)]), [1.0, b'a'])
+        self.assertEqual(self.run_program([]), [])
+
+    def test_tailcall(self):
+        self.vm.globals.set(b'f', _constant(2.0))
+        # return f(7)
+        self.assertEqual(self.run_program([('GETGLOBAL', b'f'), ('PUSHINT', 7),
+            ('TAILCALL', (0, 0))]), [2.0])
+        # return 1, f()
+        self.assertEqual(self.run_program([('PUSHINT', 1), ('GETGLOBAL', b'f'),
+            ('TAILCALL', (1, 0))]), [1.0, 2.0])
+        # function (a) return a, "s", g(a) end with g returning its arguments twice
+        self.vm.globals.set(b'g', lambda vm, args: args + args)
+        inner = program_chunk([('GETLOCAL', 0), ('PUSHSTRING', b's'), ('GETGLOBAL', b'g'),
+            ('GETLOCAL', 0), ('TAILCALL', (3, 1))], num_params=1, local_names=[b'a'])
+        self.assertEqual(self.run_program([('CLOSURE', (0, 0)), ('PUSHINT', 5),
+            ('TAILCALL', (0, 0))], functions=[inner]), [5.0, b's', 5.0, 5.0])
+
+    def test_calls(self):
+        self.vm.globals.set(b'pair', _constant(1.0))
+        # local a, b = pair(); print(a, b, type(b))
+        self.run_program([('GETGLOBAL', b'pair'), ('CALL', (0, 2)), ('GETGLOBAL', b'print'),
+            ('GETLOCAL', 0), ('GETLOCAL', 1), ('GETGLOBAL', b'type'), ('GETLOCAL', 1),
+            ('CALL', (5, 255)), ('CALL', (2, 0))], local_names=[b'a', b'b'])
+        self.assertEqual(self.out.getvalue(), '1\tnil\tnil\n')
+
+    def test_closures(self):
+        # local k = 10; function add(v) return v + %k end; x = add(5)
+        inner = program_chunk([('GETLOCAL', 0), ('PUSHUPVALUE', 0), ('ADD', 0), ('RETURN', 1)],
+            num_params=1, local_names=[b'v'])
+        self.run_program([('PUSHINT', 10), ('GETLOCAL', 0), ('CLOSURE', (0, 1)),
+            ('SETGLOBAL', b'add'), ('GETGLOBAL', b'add'), ('PUSHINT', 5), ('CALL', (1, 1)),
+            ('SETGLOBAL', b'x')], local_names=[b'k'], functions=[inner])
+        self.assertEqual(self.vm.globals.get(b'x'), 15.0)
+
+    def test_loops(self):
+        # s = 0; for i = 1, 10 do s = s + i end
+        self.run_program([('PUSHINT', 0), ('SETGLOBAL', b's'), ('PUSHINT', 1),
+            ('PUSHINT', 10), ('PUSHINT', 1), ('FORPREP', 'done'), 'body',
+            ('GETGLOBAL', b's'), ('GETLOCAL', 0), ('ADD', 0), ('SETGLOBAL', b's'),
+            ('FORLOOP', 'body'), 'done'])
+        self.assertEqual(self.vm.globals.get(b's'), 55.0)
+        # n = 0; while n < 5 do n = n + 1 end
+        self.run_program([('PUSHINT', 0), ('SETGLOBAL', b'n'), 'top', ('GETGLOBAL', b'n'),
+            ('PUSHINT', 5), ('JMPGE', 'out'), ('GETGLOBAL', b'n'), ('ADDI', 1),
+            ('SETGLOBAL', b'n'), ('JMP', 'top'), 'out'])
+        self.assertEqual(self.vm.globals.get(b'n'), 5.0)
+
+    def test_tables(self):
+        # t = {4, 5; k = "v"}; t.k2 = t.k .. getn(t)
+        self.run_program([('CREATETABLE', 3), ('PUSHINT', 4), ('PUSHINT', 5),
+            ('SETLIST', (0, 2)), ('PUSHSTRING', b'k'), ('PUSHSTRING', b'v'), ('SETMAP', 1),
+            ('SETGLOBAL', b't'), ('GETGLOBAL', b't'), ('PUSHSTRING', b'k2'), ('GETGLOBAL', b't'),
+            ('GETDOTTED', b'k'), ('GETGLOBAL', b'getn'), ('GETGLOBAL', b't'), ('CALL', (3, 1)),
+            ('CONCAT', 2), ('SETTABLE', (3, 3))])
+        table = self.vm.globals.get(b't')
+        self.assertIsInstance(table, LuaTable)
+        self.assertEqual(table.hash, {1.0: 4.0, 2.0: 5.0, b'k': b'v', b'k2': b'v2'})
+
+    def test_errors(self):
+        with self.assertRaises(Lua4RuntimeError) as cm:
+            self.run_program([('GETGLOBAL', b'nothing'), ('CALL', (0, 0))])
+        self.assertIn('attempt to call a nil value', str(cm.exception))
+        self.assertRaises(Lua4RuntimeError, self.run_program, [('PUSHSTRING', b'a'),
+            ('PUSHNIL', 1), ('ADD', 0)])
+
+    def test_unknown_opcode(self):
+        lua_file = program_file([('PUSHINT', 1), ('RETURN', 0)])
+        instruction = lua_file.code_chunk.instruction
+        # after the RETURN it is never executed
+        instruction.insert(2, 55 | (3 << 6))
+        self.assertEqual(self.vm.run(lua_file), [1.0])
+        instruction.insert(0, 55 | (3 << 6))
+        with self.assertRaises(Lua4RuntimeError) as cm:
+            self.vm.run(lua_file)
+        self.assertEqual(str(cm.exception), 'unknown opcode 55 at pc 0')
+
+    def test_bad_constant(self):
+        lua_file = program_file([('PUSHSTRING', b'a')])
+        lua_file.code_chunk.constants.string = []
+        self.assertRaises(Lua4RuntimeError, self.vm.run, lua_file)
+
+    def test_budgets(self):
+        vm = Lua4VirtualMachine(max_instructions=5000)
+        with self.assertRaises(Lua4BudgetExceeded):
+            vm.run(program_file(['top', ('JMP', 'top')]))
+        # function f() return f() end; f()
+        inner = program_chunk([('GETGLOBAL', b'f'), ('CALL', (0, 255)), ('RETURN', 0)])
+        with self.assertRaises(Lua4RuntimeError) as cm:
+            self.run_program([('CLOSURE', (0, 0)), ('SETGLOBAL', b'f'), ('GETGLOBAL', b'f'),
+                ('CALL', (0, 0))], functions=[inner])
+        self.assertEqual(str(cm.exception), 'stack overflow')
+
+if __name__ == '__main__':
+    unittest.main()